@@ -0,0 +1,46 @@
+"""add patient search token array  v1.1.28
+
+Revision ID: 3a8b0f6d2c59
+Revises: d7a3e5c91f24
+Create Date: 2025-10-24 10:05:33.640182
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a8b0f6d2c59'
+down_revision: Union[str, None] = 'd7a3e5c91f24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'patients',
+        sa.Column(
+            'search_token_array',
+            sa.ARRAY(sa.Text()),
+            sa.Computed("string_to_array(search_tokens, ' ')", persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        'idx_patients_search_token_array',
+        'patients',
+        ['search_token_array'],
+        unique=False,
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'idx_patients_search_token_array',
+        table_name='patients',
+        postgresql_using='gin',
+    )
+    op.drop_column('patients', 'search_token_array')
@@ -0,0 +1,50 @@
+"""add natural sort keys for samples and cassettes  v1.1.25
+
+Revision ID: 5e8d13f0c7ab
+Revises: b41c7e2d9a10
+Create Date: 2025-10-21 11:03:17.224610
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8d13f0c7ab'
+down_revision: Union[str, None] = 'b41c7e2d9a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SORT_LETTERS_SQL = "coalesce(substring({column} from '^([A-Z]+)[0-9]+'), {column})"
+SORT_NUMBER_SQL = "coalesce(substring({column} from '^[A-Z]+([0-9]+)')::integer, 0)"
+
+
+def upgrade() -> None:
+    for table, column in (('samples', 'sample_number'), ('cassettes', 'cassette_number')):
+        op.add_column(
+            table,
+            sa.Column(
+                'sort_letters',
+                sa.String(length=50),
+                sa.Computed(SORT_LETTERS_SQL.format(column=column), persisted=True),
+                nullable=True,
+            ),
+        )
+        op.add_column(
+            table,
+            sa.Column(
+                'sort_number',
+                sa.Integer(),
+                sa.Computed(SORT_NUMBER_SQL.format(column=column), persisted=True),
+                nullable=True,
+            ),
+        )
+
+
+def downgrade() -> None:
+    for table in ('cassettes', 'samples'):
+        op.drop_column(table, 'sort_number')
+        op.drop_column(table, 'sort_letters')
@@ -0,0 +1,38 @@
+"""add patient blind indexes  v1.1.29
+
+Revision ID: 6e1d4b8a7f02
+Revises: 3a8b0f6d2c59
+Create Date: 2025-10-27 11:18:04.271935
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6e1d4b8a7f02'
+down_revision: Union[str, None] = '3a8b0f6d2c59'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Значения заполняются отдельно: python -m cor_pass.services.blind_index
+    op.add_column('patients', sa.Column('blind_full_name', sa.String(length=64), nullable=True))
+    op.add_column('patients', sa.Column('blind_surname', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_patients_blind_surname'), 'patients', ['blind_surname'], unique=False)
+    op.create_index(
+        'idx_patients_blind_full_name_birth_date',
+        'patients',
+        ['blind_full_name', 'birth_date'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_patients_blind_full_name_birth_date', table_name='patients')
+    op.drop_index(op.f('ix_patients_blind_surname'), table_name='patients')
+    op.drop_column('patients', 'blind_surname')
+    op.drop_column('patients', 'blind_full_name')
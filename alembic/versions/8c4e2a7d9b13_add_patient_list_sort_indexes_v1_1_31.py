@@ -0,0 +1,38 @@
+"""add patient list sort indexes  v1.1.31
+
+Revision ID: 8c4e2a7d9b13
+Revises: f2b9c47e1a63
+Create Date: 2025-10-30 11:02:44.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4e2a7d9b13'
+down_revision: Union[str, None] = 'f2b9c47e1a63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'idx_patients_change_date_sort',
+        'patients',
+        [sa.text("coalesce(change_date, 'infinity'::timestamp)")],
+        unique=False,
+    )
+    op.create_index(
+        'idx_patients_birth_date_sort',
+        'patients',
+        [sa.text("coalesce(birth_date, 'infinity'::date)")],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_patients_birth_date_sort', table_name='patients')
+    op.drop_index('idx_patients_change_date_sort', table_name='patients')
@@ -0,0 +1,29 @@
+"""add case owner lease  v1.1.26
+
+Revision ID: 9c2f6a4e1b37
+Revises: 5e8d13f0c7ab
+Create Date: 2025-10-22 09:41:05.318274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2f6a4e1b37'
+down_revision: Union[str, None] = '5e8d13f0c7ab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'cases',
+        sa.Column('owner_lease_expires_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('cases', 'owner_lease_expires_at')
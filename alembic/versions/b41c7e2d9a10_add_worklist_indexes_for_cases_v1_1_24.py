@@ -0,0 +1,73 @@
+"""add worklist indexes for cases  v1.1.24
+
+Revision ID: b41c7e2d9a10
+Revises: 0795a77bf44c
+Create Date: 2025-10-20 10:12:41.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41c7e2d9a10'
+down_revision: Union[str, None] = '0795a77bf44c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'cases',
+        sa.Column(
+            'urgency_prefix',
+            sa.String(length=1),
+            sa.Computed('substr(case_code, 1, 1)', persisted=True),
+            nullable=True,
+        ),
+    )
+    op.add_column(
+        'cases',
+        sa.Column(
+            'has_scanned_glass',
+            sa.Boolean(),
+            server_default=sa.false(),
+            nullable=False,
+        ),
+    )
+    op.execute(
+        """
+        UPDATE cases SET has_scanned_glass = true
+        WHERE EXISTS (
+            SELECT 1 FROM samples
+            JOIN cassettes ON cassettes.sample_id = samples.id
+            JOIN glasses ON glasses.cassette_id = cassettes.id
+            WHERE samples.case_id = cases.id AND glasses.scan_url IS NOT NULL
+        )
+        """
+    )
+    op.create_index(
+        'idx_cases_open_worklist',
+        'cases',
+        ['urgency_prefix', 'creation_date', 'id'],
+        unique=False,
+        postgresql_where=sa.text("grossing_status <> 'COMPLETED'"),
+    )
+    op.create_index(op.f('ix_samples_case_id'), 'samples', ['case_id'], unique=False)
+    op.create_index(op.f('ix_cassettes_sample_id'), 'cassettes', ['sample_id'], unique=False)
+    op.create_index(op.f('ix_glasses_cassette_id'), 'glasses', ['cassette_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_glasses_cassette_id'), table_name='glasses')
+    op.drop_index(op.f('ix_cassettes_sample_id'), table_name='cassettes')
+    op.drop_index(op.f('ix_samples_case_id'), table_name='samples')
+    op.drop_index(
+        'idx_cases_open_worklist',
+        table_name='cases',
+        postgresql_where=sa.text("grossing_status <> 'COMPLETED'"),
+    )
+    op.drop_column('cases', 'has_scanned_glass')
+    op.drop_column('cases', 'urgency_prefix')
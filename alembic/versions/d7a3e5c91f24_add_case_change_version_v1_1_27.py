@@ -0,0 +1,29 @@
+"""add case change version  v1.1.27
+
+Revision ID: d7a3e5c91f24
+Revises: 9c2f6a4e1b37
+Create Date: 2025-10-23 14:26:52.107431
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3e5c91f24'
+down_revision: Union[str, None] = '9c2f6a4e1b37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'cases',
+        sa.Column('change_version', sa.Integer(), server_default='0', nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('cases', 'change_version')
@@ -0,0 +1,42 @@
+"""add patient list indexes  v1.1.30
+
+Revision ID: f2b9c47e1a63
+Revises: 6e1d4b8a7f02
+Create Date: 2025-10-28 09:41:17.905316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b9c47e1a63'
+down_revision: Union[str, None] = '6e1d4b8a7f02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'idx_doctor_patient_statuses_doctor_status',
+        'doctor_patient_statuses',
+        ['doctor_id', 'status'],
+        unique=False,
+    )
+    op.create_index(
+        op.f('ix_clinic_patient_statuses_patient_id'),
+        'clinic_patient_statuses',
+        ['patient_id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f('ix_clinic_patient_statuses_patient_id'), table_name='clinic_patient_statuses'
+    )
+    op.drop_index(
+        'idx_doctor_patient_statuses_doctor_status', table_name='doctor_patient_statuses'
+    )
@@ -26,6 +26,7 @@ class Settings(BaseSettings):
     debug: bool = "FALSE"
     reload: bool = "False"
     aes_key: str = "key"
+    blind_index_key: str = "BLIND_INDEX_KEY"
     basic_account_records: int = "NUMBER_OF_RECORDS"
     corid_facility_key: int = "1"
     admin_accounts: list = json.loads(os.getenv("ETERNAL_ACCOUNTS", "[]"))
@@ -48,6 +49,8 @@ class Settings(BaseSettings):
     allowed_redirect_urls: list = json.loads(os.getenv("ALLOWED_REDIRECT_URLS", "[]"))
     lawyer_accounts: list = json.loads(os.getenv("LAWYER_ACCOUNTS", "[]"))
     allowed_hosts: list = json.loads(os.getenv("ALLOWED_HOSTS", "[]"))
+    # Число обратных прокси перед API, дописывающих X-Forwarded-For (0 — заголовку не верить)
+    trusted_proxy_count: int = 0
     marketing_email: str = "MARKETING_EMAIL"
     smb_user: str = "SMB_USER"
     smb_pass: str = "SMB_PASS"
@@ -55,8 +58,29 @@ class Settings(BaseSettings):
     smb_share: str ="SMB_SHARE"
     remote_name: str ="REMOTE_NAME"
     scan_interval_seconds: int = 60
+    scan_preview_retry_max_seconds: int = 6 * 3600
     base_path: str = "BASE_PATH"
     smb_enabled: bool = False
+    case_claim_lease_minutes: int = 30
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 4
+    password_hash_max_pending: int = 64
+    tile_cache_dir: str = "tile_cache"
+    tile_cache_max_bytes: int = 2 * 1024**3
+    tile_cache_memory_bytes: int = 64 * 1024**2
+    tile_executor_workers: int = 4
+    tile_executor_max_pending: int = 256
+    # Общий том API и сканера (slide-data в docker-compose.yml): сканер строит
+    # пирамиды тайлов, API читает их и кэш слайдов
+    slide_cache_dir: str = "/data/slides/slide_cache"
+    slide_cache_max_bytes: int = 50 * 1024**3
+    tile_pyramid_enabled: bool = False
+    tile_pyramid_dir: str = "/data/slides/tile_pyramids"
+    tile_pyramid_workers: int = 2
+    tile_pyramid_all_levels: bool = False
+    volume_cache_dir: str = "volume_cache"
+    volume_cache_max_bytes: int = 20 * 1024**3
+    dicom_decode_workers: int = 4
 
     class Config:
 
@@ -4,6 +4,7 @@ import uuid
 from sqlalchemy import (
     ARRAY,
     Column,
+    Computed,
     Float,
     Integer,
     Interval,
@@ -15,7 +16,9 @@ from sqlalchemy import (
     Index,
     Time,
     UniqueConstraint,
+    false,
     func,
+    text,
     Boolean,
     LargeBinary,
 )
@@ -171,6 +174,12 @@ class StainingType(enum.Enum):
         return abbr[:3]
 
 
+# Натуральная сортировка номеров вида "<буквы><цифры>": буквенная и числовая части.
+# Если номер не соответствует формату, сортируем по нему целиком с числом 0.
+NATURAL_SORT_LETTERS_SQL = "coalesce(substring({column} from '^([A-Z]+)[0-9]+'), {column})"
+NATURAL_SORT_NUMBER_SQL = "coalesce(substring({column} from '^[A-Z]+([0-9]+)')::integer, 0)"
+
+
 class Grossing_status(enum.Enum):
     PROCESSING = "PROCESSING"
     COMPLETED = "COMPLETED"
@@ -561,6 +570,35 @@ class Patient(Base):
     clinic_statuses = relationship("PatientClinicStatusModel", back_populates="patient")
 
     search_tokens = Column(Text, default="", nullable=False)
+    # Те же n-граммы массивом — для поиска по GIN-индексу (оператор &&)
+    search_token_array = Column(
+        ARRAY(Text), Computed("string_to_array(search_tokens, ' ')", persisted=True)
+    )
+    # Слепые индексы (HMAC) нормализованных ФИО и фамилии — см. services.blind_index
+    blind_full_name = Column(String(64), nullable=True)
+    blind_surname = Column(String(64), nullable=True, index=True)
+
+    __table_args__ = (
+        Index(
+            "idx_patients_search_token_array",
+            "search_token_array",
+            postgresql_using="gin",
+        ),
+        Index(
+            "idx_patients_blind_full_name_birth_date",
+            "blind_full_name",
+            "birth_date",
+        ),
+        # Ключи сортировки списка пациентов (repository.doctor._PATIENT_LIST_SORT_KEYS)
+        Index(
+            "idx_patients_change_date_sort",
+            func.coalesce(change_date, text("'infinity'::timestamp")),
+        ),
+        Index(
+            "idx_patients_birth_date_sort",
+            func.coalesce(birth_date, text("'infinity'::date")),
+        ),
+    )
 
     def __repr__(self):
         return f"<Patient(id='{self.id}', patient_cor_id='{self.patient_cor_id}')>"
@@ -569,7 +607,9 @@ class Patient(Base):
 class PatientClinicStatusModel(Base):
     __tablename__ = "clinic_patient_statuses"
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    patient_id = Column(String(36), ForeignKey("patients.id"), nullable=False)
+    patient_id = Column(
+        String(36), ForeignKey("patients.id"), nullable=False, index=True
+    )
     patient_status_for_clinic = Column(
         Enum(PatientClinicStatus), default=PatientClinicStatus.registered
     )
@@ -596,6 +636,8 @@ class DoctorPatientStatus(Base):
         UniqueConstraint(
             "patient_id", "doctor_id", name="unique_patient_doctor_status"
         ),
+        # Список пациентов врача с фильтром по статусу
+        Index("idx_doctor_patient_statuses_doctor_status", "doctor_id", "status"),
     )
 
 
@@ -615,13 +657,28 @@ class Case(Base):
     microdescription = Column(Text, nullable=True)
     general_macrodescription = Column(Text, nullable=True)
     case_owner = Column(String(36), ForeignKey("doctors.doctor_id"), nullable=True)
+    # Срок аренды кейса, взятого из очереди; NULL — владение без срока
+    owner_lease_expires_at = Column(DateTime, nullable=True)
     closing_date = Column(DateTime, nullable=True)
     is_printed_cassette = Column(Boolean, nullable=True, default=False)
     is_printed_glass = Column(Boolean, nullable=True, default=False)
     is_printed_qr = Column(Boolean, nullable=True, default=False)
+    # Первая буква case_code (срочность), хранится для индексируемых фильтров
+    urgency_prefix = Column(
+        String(1), Computed("substr(case_code, 1, 1)", persisted=True)
+    )
+    # Есть ли у кейса хотя бы одно отсканированное стекло (scan_url задан)
+    has_scanned_glass = Column(
+        Boolean, nullable=False, default=False, server_default=false()
+    )
+    # Версия кейса для ленты изменений (растёт при каждом опубликованном изменении)
+    change_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     samples = relationship(
-        "Sample", back_populates="case", cascade="all, delete-orphan"
+        "Sample",
+        back_populates="case",
+        cascade="all, delete-orphan",
+        order_by="[Sample.sort_letters, Sample.sort_number]",
     )
     referral = relationship(
         "Referral", back_populates="case", cascade="all, delete-orphan"
@@ -639,14 +696,35 @@ class Case(Base):
         "Doctor", back_populates="owned_cases", foreign_keys=[case_owner]
     )
 
+    # Индексы
+    __table_args__ = (
+        # Частичный индекс для списка "Текущие кейсы": только открытые кейсы
+        Index(
+            "idx_cases_open_worklist",
+            "urgency_prefix",
+            "creation_date",
+            "id",
+            postgresql_where=text("grossing_status <> 'COMPLETED'"),
+        ),
+    )
+
 
 # Банка
 class Sample(Base):
     __tablename__ = "samples"
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    case_id = Column(String(36), ForeignKey("cases.id"), nullable=False)
+    case_id = Column(String(36), ForeignKey("cases.id"), nullable=False, index=True)
     sample_number = Column(String(50))
+    # Ключи натуральной сортировки ("A", "Z2" -> ("Z", 2)), считаются при записи
+    sort_letters = Column(
+        String(50),
+        Computed(NATURAL_SORT_LETTERS_SQL.format(column="sample_number"), persisted=True),
+    )
+    sort_number = Column(
+        Integer,
+        Computed(NATURAL_SORT_NUMBER_SQL.format(column="sample_number"), persisted=True),
+    )
     cassette_count = Column(Integer, default=0)
     glass_count = Column(Integer, default=0)
     archive = Column(Boolean, default=False)
@@ -656,7 +734,10 @@ class Sample(Base):
 
     case = relationship("Case", back_populates="samples")
     cassette = relationship(
-        "Cassette", back_populates="sample", cascade="all, delete-orphan"
+        "Cassette",
+        back_populates="sample",
+        cascade="all, delete-orphan",
+        order_by="[Cassette.sort_letters, Cassette.sort_number]",
     )
 
 
@@ -665,15 +746,33 @@ class Cassette(Base):
     __tablename__ = "cassettes"
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    sample_id = Column(String(36), ForeignKey("samples.id"), nullable=False)
+    sample_id = Column(
+        String(36), ForeignKey("samples.id"), nullable=False, index=True
+    )
     cassette_number = Column(
         String(50)
     )  # Порядковый номер кассеты в рамках конкретной банки
+    # Ключи натуральной сортировки ("A10" -> ("A", 10)), считаются при записи
+    sort_letters = Column(
+        String(50),
+        Computed(
+            NATURAL_SORT_LETTERS_SQL.format(column="cassette_number"), persisted=True
+        ),
+    )
+    sort_number = Column(
+        Integer,
+        Computed(
+            NATURAL_SORT_NUMBER_SQL.format(column="cassette_number"), persisted=True
+        ),
+    )
     comment = Column(String(500), nullable=True)
     glass_count = Column(Integer, default=0)
     is_printed = Column(Boolean, nullable=True, default=False)
     glass = relationship(
-        "Glass", back_populates="cassette", cascade="all, delete-orphan"
+        "Glass",
+        back_populates="cassette",
+        cascade="all, delete-orphan",
+        order_by="Glass.glass_number",
     )
     sample = relationship("Sample", back_populates="cassette")
 
@@ -683,7 +782,9 @@ class Glass(Base):
     __tablename__ = "glasses"
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    cassette_id = Column(String(36), ForeignKey("cassettes.id"), nullable=False)
+    cassette_id = Column(
+        String(36), ForeignKey("cassettes.id"), nullable=False, index=True
+    )
     glass_number = Column(Integer)  # Порядковый номер стекла
     staining = Column(Enum(StainingType), nullable=True)
     glass_data = Column(LargeBinary, nullable=True)
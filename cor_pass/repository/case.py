@@ -3,7 +3,19 @@ from enum import Enum
 import re
 from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, HTTPException, Request, UploadFile, status
-from sqlalchemy import and_, func, literal_column, select
+from sqlalchemy import (
+    and_,
+    column,
+    delete,
+    func,
+    literal_column,
+    or_,
+    select,
+    tuple_,
+    union_all,
+    update,
+    values,
+)
 import sqlalchemy
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
@@ -68,13 +80,18 @@ from cor_pass.schemas import (
 )
 from cor_pass.database import models as db_models
 import uuid
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from cor_pass.services.cipher import decrypt_data
 from loguru import logger
 from cor_pass.config.config import settings
 from string import ascii_uppercase
 
 from cor_pass.services.websocket import DEEP_LINK_SCHEME, _is_expired
+from cor_pass.services.case_change_feed import (
+    case_deletion_events,
+    emit_case_changes,
+    notify_case_events,
+)
 
 
 class ErrorCode(str, Enum):
@@ -226,6 +243,7 @@ async def create_cases_with_initial_data(
         )
         db.add(db_case_parameters)
 
+        await emit_case_changes(db, [db_case.id], "case")
         await db.commit()
         await db.refresh(db_case_parameters)
         await db.refresh(db_case)
@@ -255,7 +273,7 @@ async def create_cases_with_initial_data(
         samples_result = await db.execute(
             select(db_models.Sample)
             .where(db_models.Sample.case_id == first_case_db.id)
-            .order_by(db_models.Sample.sample_number)
+            .order_by(db_models.Sample.sort_letters, db_models.Sample.sort_number)
         )
         first_case_samples_db = samples_result.scalars().all()
         first_case_samples = []
@@ -308,7 +326,7 @@ async def get_case(db: AsyncSession, case_id: str) -> Optional[Dict[str, Any]]:
         select(db_models.Sample)
         .where(db_models.Sample.case_id == case_db.id)
         .options(selectinload(db_models.Sample.cassette))
-        .order_by(db_models.Sample.sample_number)
+        .order_by(db_models.Sample.sort_letters, db_models.Sample.sort_number)
     )
     first_case_samples_db = samples_result.scalars().all()
     first_case_samples: List[Dict[str, Any]] = []
@@ -320,29 +338,13 @@ async def get_case(db: AsyncSession, case_id: str) -> Optional[Dict[str, Any]]:
         if i == 0 and sample_db:
             await db.refresh(sample_db, attribute_names=["cassette"])
 
-            def sort_cassettes(cassette: db_models.Cassette):
-                match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-                if match:
-                    letter_part = match.group(1)
-                    number_part = int(match.group(2))
-                    return (letter_part, number_part)
-                return (
-                    cassette.cassette_number,
-                    0,
-                )  # Для случаев, если формат не совпадает
-
-            sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
-
-            for cassette_db in sorted_cassettes_db:
+            for cassette_db in sample_db.cassette:
                 await db.refresh(cassette_db, attribute_names=["glass"])
                 cassette = CassetteModelScheema.model_validate(cassette_db).model_dump()
-                cassette["glasses"] = sorted(
-                    [
-                        GlassModelScheema.model_validate(glass).model_dump()
-                        for glass in cassette_db.glass
-                    ],
-                    key=lambda glass: glass["glass_number"],
-                )
+                cassette["glasses"] = [
+                    GlassModelScheema.model_validate(glass).model_dump()
+                    for glass in cassette_db.glass
+                ]
                 sample["cassettes"].append(cassette)
         first_case_samples.append(sample)
 
@@ -528,6 +530,26 @@ async def get_patient_list_cases(
     return all_cases_schematized
 
 
+async def get_patients_list_cases(
+    db: AsyncSession,
+    patient_ids: List[str],
+) -> Dict[str, List[str]]:
+    """Коды кейсов нескольких пациентов одним запросом (новые первыми)."""
+    cases_by_patient: Dict[str, List[str]] = {
+        patient_id: [] for patient_id in patient_ids
+    }
+    if not patient_ids:
+        return cases_by_patient
+    cases_result = await db.execute(
+        select(db_models.Case.patient_id, db_models.Case.case_code)
+        .where(db_models.Case.patient_id.in_(patient_ids))
+        .order_by(db_models.Case.creation_date.desc())
+    )
+    for patient_id, case_code in cases_result.all():
+        cases_by_patient[patient_id].append(case_code)
+    return cases_by_patient
+
+
 async def get_single_case_by_case_code(db: AsyncSession, case_code: str) -> db_models.Case | None:
     """Асинхронно получает информацию о кейсе по его case_code, включая связанные банки."""
     result = await db.execute(
@@ -543,22 +565,53 @@ async def get_single_case_by_case_id(db: AsyncSession, case_id: str) -> db_model
     return result.scalar_one_or_none()
 
 async def delete_cases(db: AsyncSession, case_ids: List[str]) -> Dict[str, Any]:
-    """Асинхронно удаляет кейс."""
-    deleted_count = 0
-    not_found_ids: List[str] = []
-    for case_id in case_ids:
-        result = await db.execute(
-            select(db_models.Case).where(db_models.Case.id == case_id)
-        )
-        db_case = result.scalar_one_or_none()
-
-        if db_case:
-            await db.delete(db_case)
-            deleted_count += 1
-            await db.commit()
-        else:
-            not_found_ids.append(case_id)
+    """
+    Асинхронно удаляет кейсы вместе со всем поддеревом (банки, кассеты, стёкла,
+    направления, параметры, заключения) набором DELETE в одной транзакции.
+    """
+    found_ids = set(
+        (
+            await db.scalars(
+                select(db_models.Case.id).where(db_models.Case.id.in_(case_ids))
+            )
+        ).all()
+    )
+    not_found_ids = [case_id for case_id in dict.fromkeys(case_ids) if case_id not in found_ids]
+
+    if found_ids:
+        ids = list(found_ids)
+        deletion_events = await case_deletion_events(db, ids)
+        await _delete_sample_subtrees(db, db_models.Sample.case_id.in_(ids))
+
+        referral_ids = select(db_models.Referral.id).where(
+            db_models.Referral.case_id.in_(ids)
+        )
+        report_ids = select(db_models.Report.id).where(db_models.Report.case_id.in_(ids))
+        diagnosis_ids = select(db_models.DoctorDiagnosis.id).where(
+            db_models.DoctorDiagnosis.report_id.in_(report_ids)
+        )
+        for statement in (
+            delete(db_models.ReferralAttachment).where(
+                db_models.ReferralAttachment.referral_id.in_(referral_ids)
+            ),
+            delete(db_models.Referral).where(db_models.Referral.case_id.in_(ids)),
+            delete(db_models.CaseParameters).where(
+                db_models.CaseParameters.case_id.in_(ids)
+            ),
+            delete(db_models.ReportSignature).where(
+                db_models.ReportSignature.diagnosis_entry_id.in_(diagnosis_ids)
+            ),
+            delete(db_models.DoctorDiagnosis).where(
+                db_models.DoctorDiagnosis.report_id.in_(report_ids)
+            ),
+            delete(db_models.Report).where(db_models.Report.case_id.in_(ids)),
+            delete(db_models.Case).where(db_models.Case.id.in_(ids)),
+        ):
+            await db.execute(statement.execution_options(synchronize_session=False))
+        await notify_case_events(db, deletion_events)
+        await db.commit()
 
+    deleted_count = len(found_ids)
     response = {
         "deleted_count": deleted_count,
         "message": f"Успешно удалено {deleted_count} кейсов.",
@@ -594,7 +647,7 @@ async def get_patient_first_case_details(
             select(db_models.Sample)
             .where(db_models.Sample.case_id == first_case_db.id)
             .options(selectinload(db_models.Sample.cassette))
-            .order_by(db_models.Sample.sample_number)
+            .order_by(db_models.Sample.sort_letters, db_models.Sample.sort_number)
         )
         first_case_samples_db = samples_result.scalars().all()
         first_case_samples: List[Dict[str, Any]] = []
@@ -606,31 +659,15 @@ async def get_patient_first_case_details(
             if i == 0 and sample_db:
                 await db.refresh(sample_db, attribute_names=["cassette"])
 
-                def sort_cassettes(cassette: db_models.Cassette):
-                    match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-                    if match:
-                        letter_part = match.group(1)
-                        number_part = int(match.group(2))
-                        return (letter_part, number_part)
-                    return (
-                        cassette.cassette_number,
-                        0,
-                    )
-
-                sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
-
-                for cassette_db in sorted_cassettes_db:
+                for cassette_db in sample_db.cassette:
                     await db.refresh(cassette_db, attribute_names=["glass"])
                     cassette = CassetteModelScheema.model_validate(
                         cassette_db
                     ).model_dump()
-                    cassette["glasses"] = sorted(
-                        [
-                            GlassModelScheema.model_validate(glass).model_dump()
-                            for glass in cassette_db.glass
-                        ],
-                        key=lambda glass: glass["glass_number"],
-                    )
+                    cassette["glasses"] = [
+                        GlassModelScheema.model_validate(glass).model_dump()
+                        for glass in cassette_db.glass
+                    ]
                     sample["cassettes"].append(cassette)
             first_case_samples.append(sample)
 
@@ -703,6 +740,7 @@ async def update_case_code_suffix(db: AsyncSession, case_id: str, new_suffix: st
         )
 
     db_case.case_code = new_full_case_code
+    await emit_case_changes(db, [db_case.id], "case")
     await db.commit()
     await db.refresh(db_case)
 
@@ -1102,7 +1140,7 @@ async def get_patient_case_details_for_glass_page(
                     db_models.Cassette.glass
                 )
             )
-            .order_by(db_models.Sample.sample_number)
+            .order_by(db_models.Sample.sort_letters, db_models.Sample.sort_number)
         )
         first_case_samples_db = samples_result.scalars().all()
 
@@ -1110,25 +1148,11 @@ async def get_patient_case_details_for_glass_page(
 
         for sample_db in first_case_samples_db:
 
-            def sort_cassettes(cassette: db_models.Cassette):
-                match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-                if match:
-                    letter_part = match.group(1)
-                    number_part = int(match.group(2))
-                    return (letter_part, number_part)
-                return (cassette.cassette_number, 0)
-
-            sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
-
             cassettes_for_sample = []
-            for cassette_db in sorted_cassettes_db:
-                sorted_glasses_db = sorted(
-                    cassette_db.glass, key=lambda glass: glass.glass_number
-                )
-
+            for cassette_db in sample_db.cassette:
                 glasses_for_cassette = [
                     GlassModelScheema.model_validate(glass).model_dump()
-                    for glass in sorted_glasses_db
+                    for glass in cassette_db.glass
                 ]
 
                 cassette_schematized = CassetteForGlassPage.model_validate(
@@ -1169,29 +1193,67 @@ async def get_patient_case_details_for_glass_page(
     )
 
 
-async def get_current_cases_glass_details(
-    db: AsyncSession,
-    current_doctor_id: str,
-    router: APIRouter,
-    case_id=Optional[str],
-    skip: int = 0,
-    limit: int = 10,
-) -> PatientGlassPageResponse:
+# --- Список "Текущие кейсы" ---
+
+WORKLIST_URGENT_PREFIXES = ("F", "U")
+WORKLIST_STANDARD_PREFIX = "S"
+
+
+def encode_worklist_cursor(
+    sort_priority: int, creation_date: datetime, case_id: str
+) -> str:
+    """Кодирует позицию в списке текущих кейсов в непрозрачный курсор."""
+    raw = f"{sort_priority}|{creation_date.isoformat()}|{case_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_worklist_cursor(cursor: str) -> tuple[int, datetime, str]:
+    """Разбирает курсор, выданный encode_worklist_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        sort_priority, creation_date, case_id = raw.split("|", 2)
+        return int(sort_priority), datetime.fromisoformat(creation_date), case_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор пагинации.",
+        )
+
+
+async def _fetch_current_worklist_page(
+    db: AsyncSession, skip: int, limit: int, cursor: Optional[str] = None
+) -> tuple[list, Optional[str]]:
     """
-    Получает список "текущих кейсов + стёкла" для страницы "Текущие кейсы" вкладка "Стёкла".
+    Возвращает страницу списка "Текущие кейсы" и курсор следующей страницы.
 
-    Условия включения кейса:
-    - Маркировка "F" или "U": grossing_status не "Завершено".
-    - Маркировка "S": grossing_status не "Завершено" И есть хотя бы одно отсканированное стекло.
+    - Кейсы "F"/"U" (sort_priority=1): grossing_status не "Завершено".
+    - Кейсы "S" (sort_priority=2): grossing_status не "Завершено" и has_scanned_glass.
+    Внутри группы сортировка по creation_date DESC, id DESC.
 
-    Сортировка:
-    - Сначала кейсы "F"/"U" (по creation_date DESC).
-    - Затем кейсы "S" (по creation_date DESC).
+    Обе ветки читаются по частичному индексу idx_cases_open_worklist и
+    ограничиваются LIMIT до объединения. Если передан cursor, используется
+    keyset-пагинация по (sort_priority, creation_date, id), иначе — skip.
     """
-    
-    case_id_query = case_id
-    cases_fu_subquery = (
-        select(
+    position = decode_worklist_cursor(cursor) if cursor else None
+    page_size = limit + 1
+    branch_limit = page_size if position else skip + page_size
+
+    branches = [
+        (1, [db_models.Case.urgency_prefix.in_(WORKLIST_URGENT_PREFIXES)]),
+        (
+            2,
+            [
+                db_models.Case.urgency_prefix == WORKLIST_STANDARD_PREFIX,
+                db_models.Case.has_scanned_glass.is_(True),
+            ],
+        ),
+    ]
+
+    branch_queries = []
+    for sort_priority, conditions in branches:
+        if position and sort_priority < position[0]:
+            continue
+        branch_query = select(
             db_models.Case.id,
             db_models.Case.case_code,
             db_models.Case.creation_date,
@@ -1206,95 +1268,79 @@ async def get_current_cases_glass_details(
             db_models.Case.is_printed_glass,
             db_models.Case.is_printed_qr,
             db_models.Case.case_owner,
-            literal_column("1").label("sort_priority"),
+            literal_column(str(sort_priority)).label("sort_priority"),
         ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1).in_(["F", "U"]),
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
+            db_models.Case.grossing_status
+            != db_models.Grossing_status.COMPLETED.value,
+            *conditions,
+        )
+        if position and sort_priority == position[0]:
+            branch_query = branch_query.where(
+                tuple_(db_models.Case.creation_date, db_models.Case.id)
+                < tuple_(position[1], position[2])
             )
+        branch_subquery = (
+            branch_query.order_by(
+                db_models.Case.creation_date.desc(), db_models.Case.id.desc()
+            )
+            .limit(branch_limit)
+            .subquery(f"worklist_{sort_priority}")
         )
-    ).subquery("cases_fu")
+        branch_queries.append(select(branch_subquery))
 
-    scanned_glass_exists_clause = (
-        select(1)
-        .select_from(db_models.Sample)
-        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
-        .join(db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id)
-        .where(db_models.Sample.case_id == db_models.Case.id)
-        .exists()
-    )
+    if not branch_queries:
+        return [], None
 
-    cases_s_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("2").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1) == "S",
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-                scanned_glass_exists_clause,
-            )
-        )
-    ).subquery("cases_s")
-
-    combined_query_for_data = select(
-        cases_fu_subquery.c.id,
-        cases_fu_subquery.c.case_code,
-        cases_fu_subquery.c.creation_date,
-        cases_fu_subquery.c.patient_id,
-        cases_fu_subquery.c.grossing_status,
-        cases_fu_subquery.c.bank_count,
-        cases_fu_subquery.c.cassette_count,
-        cases_fu_subquery.c.glass_count,
-        cases_fu_subquery.c.pathohistological_conclusion,
-        cases_fu_subquery.c.microdescription,
-        cases_fu_subquery.c.sort_priority,
-        cases_fu_subquery.c.is_printed_cassette,
-        cases_fu_subquery.c.is_printed_glass,
-        cases_fu_subquery.c.is_printed_qr,
-        cases_fu_subquery.c.case_owner,
-    ).union_all(
-        select(
-            cases_s_subquery.c.id,
-            cases_s_subquery.c.case_code,
-            cases_s_subquery.c.creation_date,
-            cases_s_subquery.c.patient_id,
-            cases_s_subquery.c.grossing_status,
-            cases_s_subquery.c.bank_count,
-            cases_s_subquery.c.cassette_count,
-            cases_s_subquery.c.glass_count,
-            cases_s_subquery.c.pathohistological_conclusion,
-            cases_s_subquery.c.microdescription,
-            cases_s_subquery.c.sort_priority,
-            cases_s_subquery.c.is_printed_cassette,
-            cases_s_subquery.c.is_printed_glass,
-            cases_s_subquery.c.is_printed_qr,
-            cases_s_subquery.c.case_owner,
+    combined = union_all(*branch_queries).subquery("worklist")
+    final_query = (
+        select(combined)
+        .order_by(
+            combined.c.sort_priority.asc(),
+            combined.c.creation_date.desc(),
+            combined.c.id.desc(),
         )
+        .limit(page_size)
     )
+    if not position:
+        final_query = final_query.offset(skip)
 
-    final_ordered_query = combined_query_for_data.order_by(
-        combined_query_for_data.c.sort_priority.asc(),
-        combined_query_for_data.c.creation_date.desc(),
-    )
+    rows = (await db.execute(final_query)).all()
+
+    next_cursor = None
+    if limit > 0 and len(rows) > limit:
+        rows = rows[:limit]
+        last_row = rows[-1]
+        next_cursor = encode_worklist_cursor(
+            int(last_row.sort_priority), last_row.creation_date, last_row.id
+        )
+    return rows, next_cursor
+
+
+async def get_current_cases_glass_details(
+    db: AsyncSession,
+    current_doctor_id: str,
+    router: APIRouter,
+    case_id=Optional[str],
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+) -> PatientGlassPageResponse:
+    """
+    Получает список "текущих кейсов + стёкла" для страницы "Текущие кейсы" вкладка "Стёкла".
+
+    Условия включения кейса:
+    - Маркировка "F" или "U": grossing_status не "Завершено".
+    - Маркировка "S": grossing_status не "Завершено" И есть хотя бы одно отсканированное стекло.
 
-    paginated_results = await db.execute(final_ordered_query.offset(skip).limit(limit))
-    all_current_cases_raw = paginated_results.all()
+    Сортировка:
+    - Сначала кейсы "F"/"U" (по creation_date DESC).
+    - Затем кейсы "S" (по creation_date DESC).
+    """
+    
+    case_id_query = case_id
+    all_current_cases_raw, next_cursor = await _fetch_current_worklist_page(
+        db=db, skip=skip, limit=limit, cursor=cursor
+    )
 
     current_cases_list: List[CaseModelScheema] = []
     first_case_details_for_glass: Optional[FirstCaseGlassDetailsSchema] = None
@@ -1391,32 +1437,18 @@ async def get_current_cases_glass_details(
                     db_models.Cassette.glass
                 )
             )
-            .order_by(db_models.Sample.sample_number)
+            .order_by(db_models.Sample.sort_letters, db_models.Sample.sort_number)
         )
         first_case_samples_db = samples_result.scalars().all()
 
         first_case_samples_schematized: List[SampleForGlassPage] = []
         for sample_db in first_case_samples_db:
 
-            def sort_cassettes(cassette: db_models.Cassette):
-                match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-                if match:
-                    letter_part = match.group(1)
-                    number_part = int(match.group(2))
-                    return (letter_part, number_part)
-                return (cassette.cassette_number, 0)
-
-            sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
-
             cassettes_for_sample = []
-            for cassette_db in sorted_cassettes_db:
-                sorted_glasses_db = sorted(
-                    cassette_db.glass, key=lambda glass: glass.glass_number
-                )
-
+            for cassette_db in sample_db.cassette:
                 glasses_for_cassette = [
                     GlassModelScheema.model_validate(glass).model_dump()
-                    for glass in sorted_glasses_db
+                    for glass in cassette_db.glass
                 ]
 
                 cassette_schematized = CassetteForGlassPage.model_validate(
@@ -1456,6 +1488,7 @@ async def get_current_cases_glass_details(
         first_case_details_for_glass=first_case_details_for_glass,
         case_owner=case_owner,
         report_details=report_details,
+        next_cursor=next_cursor,
     )
 
 
@@ -1526,7 +1559,7 @@ async def get_single_case_details_for_glass_page(
                     db_models.Cassette.glass
                 )
             )
-            .order_by(db_models.Sample.sample_number)
+            .order_by(db_models.Sample.sort_letters, db_models.Sample.sort_number)
         )
         first_case_samples_db = samples_result.scalars().all()
 
@@ -1534,25 +1567,11 @@ async def get_single_case_details_for_glass_page(
 
         for sample_db in first_case_samples_db:
 
-            def sort_cassettes(cassette: db_models.Cassette):
-                match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-                if match:
-                    letter_part = match.group(1)
-                    number_part = int(match.group(2))
-                    return (letter_part, number_part)
-                return (cassette.cassette_number, 0)
-
-            sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
-
             cassettes_for_sample = []
-            for cassette_db in sorted_cassettes_db:
-                sorted_glasses_db = sorted(
-                    cassette_db.glass, key=lambda glass: glass.glass_number
-                )
-
+            for cassette_db in sample_db.cassette:
                 glasses_for_cassette = [
                     GlassModelScheema.model_validate(glass).model_dump()
-                    for glass in sorted_glasses_db
+                    for glass in cassette_db.glass
                 ]
 
                 cassette_schematized = CassetteForGlassPage.model_validate(
@@ -1606,6 +1625,7 @@ async def update_case_pathohistological_conclusion(
                 detail=f"Запрещено редактировать закрытый кейс",
             )
         case_db.pathohistological_conclusion = body.pathohistological_conclusion
+        await emit_case_changes(db, [case_db.id], "case")
         await db.commit()
         await db.refresh(case_db)
         response = PathohistologicalConclusionResponse(
@@ -1631,6 +1651,7 @@ async def update_case_microdescription(
                 detail=f"Запрещено редактировать закрытый кейс",
             )
         case_db.microdescription = body.microdescription
+        await emit_case_changes(db, [case_db.id], "case")
         await db.commit()
         await db.refresh(case_db)
         response = MicrodescriptionResponse(microdescription=body.microdescription)
@@ -1706,11 +1727,7 @@ async def get_patient_case_details_for_excision_page(
 
             samples_for_excision_page: List[SampleForExcisionPage] = []
 
-            sorted_samples = sorted(
-                last_case_with_relations.samples, key=lambda s: s.sample_number
-            )
-
-            for sample_db in sorted_samples:
+            for sample_db in last_case_with_relations.samples:
 
                 samples_for_excision_page.append(
                     SampleForExcisionPage(
@@ -1775,11 +1792,7 @@ async def get_single_case_details_for_excision_page(
 
         samples_for_excision_page: List[SampleForExcisionPage] = []
 
-        sorted_samples = sorted(
-            last_case_with_relations.samples, key=lambda s: s.sample_number
-        )
-
-        for sample_db in sorted_samples:
+        for sample_db in last_case_with_relations.samples:
             samples_for_excision_page.append(
                 SampleForExcisionPage(
                     id=sample_db.id,
@@ -1983,23 +1996,10 @@ async def get_report_by_case_id(
 
         for sample_db in case_db.samples:
 
-            def sort_cassettes(cassette: db_models.Cassette):
-                match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-                if match:
-                    letter_part = match.group(1)
-                    number_part = int(match.group(2))
-                    return (letter_part, number_part)
-                return (cassette.cassette_number, 0)
-
-            sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
-
             cassettes_for_sample: List[CassetteTestForGlassPage] = []
-            for cassette_db in sorted_cassettes_db:
-                sorted_glasses_db = sorted(
-                    cassette_db.glass, key=lambda glass: glass.glass_number
-                )
+            for cassette_db in sample_db.cassette:
                 glasses_for_cassette: List[GlassTestModelScheema] = []
-                for glass in sorted_glasses_db:
+                for glass in cassette_db.glass:
                     glass = GlassTestModelScheema(
                         id=glass.id,
                         glass_number=glass.glass_number,
@@ -2169,23 +2169,10 @@ async def get_patient_report_page_data(
 
             for sample_db in last_case_with_relations.samples:
 
-                def sort_cassettes(cassette: db_models.Cassette):
-                    match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-                    if match:
-                        letter_part = match.group(1)
-                        number_part = int(match.group(2))
-                        return (letter_part, number_part)
-                    return (cassette.cassette_number, 0)
-
-                sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
-
                 cassettes_for_sample: List[CassetteTestForGlassPage] = []
-                for cassette_db in sorted_cassettes_db:
-                    sorted_glasses_db = sorted(
-                        cassette_db.glass, key=lambda glass: glass.glass_number
-                    )
+                for cassette_db in sample_db.cassette:
                     glasses_for_cassette: List[GlassTestModelScheema] = []
-                    for glass in sorted_glasses_db:
+                    for glass in cassette_db.glass:
                         glass = GlassTestModelScheema(
                             id=glass.id,
                             glass_number=glass.glass_number,
@@ -2496,6 +2483,7 @@ async def change_case_status_after_signing(
 
     case_db.grossing_status = db_models.Grossing_status.IN_SIGNING_STATUS
 
+    await emit_case_changes(db, [case_db.id], "case")
     await db.commit()
     await db.refresh(case_db)
 
@@ -2935,6 +2923,7 @@ async def get_current_case_details_for_excision_page(
     case_id=Optional[str],
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
 ) -> PatientExcisionPageResponse:
     """
     Асинхронно получает список всех кейсов пациента и полную детализацию
@@ -2942,112 +2931,10 @@ async def get_current_case_details_for_excision_page(
     Используется для вкладки "Excision" (удаление/макроописание) на странице врача.
     """
     case_id_query = case_id
-    cases_fu_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("1").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1).in_(["F", "U"]),
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-            )
-        )
-    ).subquery("cases_fu")
-
-    scanned_glass_exists_clause = (
-        select(1)
-        .select_from(db_models.Sample)
-        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
-        .join(db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id)
-        .where(db_models.Sample.case_id == db_models.Case.id)
-        .exists()
-    )
-
-    cases_s_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("2").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1) == "S",
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-                scanned_glass_exists_clause,
-            )
-        )
-    ).subquery("cases_s")
-
-    combined_query_for_data = select(
-        cases_fu_subquery.c.id,
-        cases_fu_subquery.c.case_code,
-        cases_fu_subquery.c.creation_date,
-        cases_fu_subquery.c.patient_id,
-        cases_fu_subquery.c.grossing_status,
-        cases_fu_subquery.c.bank_count,
-        cases_fu_subquery.c.cassette_count,
-        cases_fu_subquery.c.glass_count,
-        cases_fu_subquery.c.pathohistological_conclusion,
-        cases_fu_subquery.c.microdescription,
-        cases_fu_subquery.c.is_printed_cassette,
-        cases_fu_subquery.c.is_printed_glass,
-        cases_fu_subquery.c.is_printed_qr,
-        cases_fu_subquery.c.sort_priority,
-        cases_fu_subquery.c.case_owner,
-    ).union_all(
-        select(
-            cases_s_subquery.c.id,
-            cases_s_subquery.c.case_code,
-            cases_s_subquery.c.creation_date,
-            cases_s_subquery.c.patient_id,
-            cases_s_subquery.c.grossing_status,
-            cases_s_subquery.c.bank_count,
-            cases_s_subquery.c.cassette_count,
-            cases_s_subquery.c.glass_count,
-            cases_s_subquery.c.pathohistological_conclusion,
-            cases_s_subquery.c.microdescription,
-            cases_s_subquery.c.is_printed_cassette,
-            cases_s_subquery.c.is_printed_glass,
-            cases_s_subquery.c.is_printed_qr,
-            cases_s_subquery.c.sort_priority,
-            cases_s_subquery.c.case_owner,
-        )
-    )
-
-    final_ordered_query = combined_query_for_data.order_by(
-        combined_query_for_data.c.sort_priority.asc(),
-        combined_query_for_data.c.creation_date.desc(),
+    all_current_cases_raw, next_cursor = await _fetch_current_worklist_page(
+        db=db, skip=skip, limit=limit, cursor=cursor
     )
 
-    paginated_results = await db.execute(final_ordered_query.offset(skip).limit(limit))
-    all_current_cases_raw = paginated_results.all()
-
     current_cases_list: List[CaseModelScheema] = []
     is_case_owner = False
 
@@ -3117,11 +3004,7 @@ async def get_current_case_details_for_excision_page(
 
             samples_for_excision_page: List[SampleForExcisionPage] = []
 
-            sorted_samples = sorted(
-                last_case_with_relations.samples, key=lambda s: s.sample_number
-            )
-
-            for sample_db in sorted_samples:
+            for sample_db in last_case_with_relations.samples:
 
                 samples_for_excision_page.append(
                     SampleForExcisionPage(
@@ -3157,6 +3040,7 @@ async def get_current_case_details_for_excision_page(
         all_cases=current_cases_list,
         last_case_details_for_excision=last_case_details_for_excision,
         case_owner=case_owner,
+        next_cursor=next_cursor,
     )
 
 
@@ -3167,6 +3051,7 @@ async def get_current_cases_report_page_data(
     case_id=Optional[str],
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
 ) -> PatientTestReportPageResponse:
     """
     Получает данные для вкладки "Заключение" на странице врача:
@@ -3176,116 +3061,10 @@ async def get_current_cases_report_page_data(
     - Все стёкла последнего кейса (для выбора, какие прикрепить).
     """
     case_id_query = case_id
-    cases_fu_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.case_owner,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("1").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1).in_(["F", "U"]),
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-            )
-        )
-    ).subquery("cases_fu")
-
-    scanned_glass_exists_clause = (
-        select(1)
-        .select_from(db_models.Sample)
-        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
-        .join(db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id)
-        .where(db_models.Sample.case_id == db_models.Case.id)
-        .exists()
-    )
-
-    cases_s_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.case_owner,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("2").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1) == "S",
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-                scanned_glass_exists_clause,
-            )
-        )
-    ).subquery("cases_s")
-
-    combined_query_for_data = select(
-        cases_fu_subquery.c.id,
-        cases_fu_subquery.c.case_code,
-        cases_fu_subquery.c.creation_date,
-        cases_fu_subquery.c.patient_id,
-        cases_fu_subquery.c.grossing_status,
-        cases_fu_subquery.c.bank_count,
-        cases_fu_subquery.c.cassette_count,
-        cases_fu_subquery.c.glass_count,
-        cases_fu_subquery.c.pathohistological_conclusion,
-        cases_fu_subquery.c.microdescription,
-        cases_fu_subquery.c.sort_priority,
-        cases_fu_subquery.c.case_owner,
-        cases_fu_subquery.c.is_printed_cassette,
-        cases_fu_subquery.c.is_printed_glass,
-        cases_fu_subquery.c.is_printed_qr,
-        cases_fu_subquery.c.case_owner,
-    ).union_all(
-        select(
-            cases_s_subquery.c.id,
-            cases_s_subquery.c.case_code,
-            cases_s_subquery.c.creation_date,
-            cases_s_subquery.c.patient_id,
-            cases_s_subquery.c.grossing_status,
-            cases_s_subquery.c.bank_count,
-            cases_s_subquery.c.cassette_count,
-            cases_s_subquery.c.glass_count,
-            cases_s_subquery.c.pathohistological_conclusion,
-            cases_s_subquery.c.microdescription,
-            cases_s_subquery.c.sort_priority,
-            cases_s_subquery.c.case_owner,
-            cases_s_subquery.c.is_printed_cassette,
-            cases_s_subquery.c.is_printed_glass,
-            cases_s_subquery.c.is_printed_qr,
-            cases_s_subquery.c.case_owner,
-        )
+    all_current_cases_raw, next_cursor = await _fetch_current_worklist_page(
+        db=db, skip=skip, limit=limit, cursor=cursor
     )
 
-    final_ordered_query = combined_query_for_data.order_by(
-        combined_query_for_data.c.sort_priority.asc(),
-        combined_query_for_data.c.creation_date.desc(),
-    )
-
-    paginated_results = await db.execute(final_ordered_query.offset(skip).limit(limit))
-    all_current_cases_raw = paginated_results.all()
-
     current_cases_list: List[CaseWithOwner] = []
     is_case_owner = False
 
@@ -3395,23 +3174,10 @@ async def get_current_cases_report_page_data(
 
             for sample_db in last_case_with_relations.samples:
 
-                def sort_cassettes(cassette: db_models.Cassette):
-                    match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-                    if match:
-                        letter_part = match.group(1)
-                        number_part = int(match.group(2))
-                        return (letter_part, number_part)
-                    return (cassette.cassette_number, 0)
-
-                sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
-
                 cassettes_for_sample: List[CassetteTestForGlassPage] = []
-                for cassette_db in sorted_cassettes_db:
-                    sorted_glasses_db = sorted(
-                        cassette_db.glass, key=lambda glass: glass.glass_number
-                    )
+                for cassette_db in sample_db.cassette:
                     glasses_for_cassette: List[GlassTestModelScheema] = []
-                    for glass in sorted_glasses_db:
+                    for glass in cassette_db.glass:
                         glass_schematized = GlassTestModelScheema(
                             id=glass.id,
                             glass_number=glass.glass_number,
@@ -3454,6 +3220,7 @@ async def get_current_cases_report_page_data(
         case_owner=case_owner,
         report_details=report_details,
         all_glasses_for_last_case=first_case_details_for_glass,
+        next_cursor=next_cursor,
     )
 
 
@@ -3463,6 +3230,7 @@ async def get_current_cases_with_directions(
     case_id=Optional[str],
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
 ) -> PatientCasesWithReferralsResponse:
     """
     Асинхронно получает список всех кейсов пациента и детализацию первого из них:
@@ -3470,112 +3238,10 @@ async def get_current_cases_with_directions(
     Включает ссылки на файлы направлений для первого кейса.
     """
     case_id_query = case_id
-    cases_fu_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("1").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1).in_(["F", "U"]),
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-            )
-        )
-    ).subquery("cases_fu")
-
-    scanned_glass_exists_clause = (
-        select(1)
-        .select_from(db_models.Sample)
-        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
-        .join(db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id)
-        .where(db_models.Sample.case_id == db_models.Case.id)
-        .exists()
+    all_current_cases_raw, next_cursor = await _fetch_current_worklist_page(
+        db=db, skip=skip, limit=limit, cursor=cursor
     )
 
-    cases_s_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("2").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1) == "S",
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-                scanned_glass_exists_clause,
-            )
-        )
-    ).subquery("cases_s")
-
-    combined_query_for_data = select(
-        cases_fu_subquery.c.id,
-        cases_fu_subquery.c.case_code,
-        cases_fu_subquery.c.creation_date,
-        cases_fu_subquery.c.patient_id,
-        cases_fu_subquery.c.grossing_status,
-        cases_fu_subquery.c.bank_count,
-        cases_fu_subquery.c.cassette_count,
-        cases_fu_subquery.c.glass_count,
-        cases_fu_subquery.c.pathohistological_conclusion,
-        cases_fu_subquery.c.microdescription,
-        cases_fu_subquery.c.sort_priority,
-        cases_fu_subquery.c.is_printed_cassette,
-        cases_fu_subquery.c.is_printed_glass,
-        cases_fu_subquery.c.is_printed_qr,
-        cases_fu_subquery.c.case_owner,
-    ).union_all(
-        select(
-            cases_s_subquery.c.id,
-            cases_s_subquery.c.case_code,
-            cases_s_subquery.c.creation_date,
-            cases_s_subquery.c.patient_id,
-            cases_s_subquery.c.grossing_status,
-            cases_s_subquery.c.bank_count,
-            cases_s_subquery.c.cassette_count,
-            cases_s_subquery.c.glass_count,
-            cases_s_subquery.c.pathohistological_conclusion,
-            cases_s_subquery.c.microdescription,
-            cases_s_subquery.c.sort_priority,
-            cases_s_subquery.c.is_printed_cassette,
-            cases_s_subquery.c.is_printed_glass,
-            cases_s_subquery.c.is_printed_qr,
-            cases_s_subquery.c.case_owner,
-        )
-    )
-
-    final_ordered_query = combined_query_for_data.order_by(
-        combined_query_for_data.c.sort_priority.asc(),
-        combined_query_for_data.c.creation_date.desc(),
-    )
-
-    paginated_results = await db.execute(final_ordered_query.offset(skip).limit(limit))
-    all_current_cases_raw = paginated_results.all()
-
     current_cases_list: List[CaseWithOwner] = []
     is_case_owner = False
 
@@ -3714,6 +3380,7 @@ async def get_current_cases_with_directions(
         case_details=case_details,
         case_owner=case_owner,
         first_case_direction=first_case_direction_details,
+        next_cursor=next_cursor,
     )
 
 
@@ -3724,6 +3391,7 @@ async def get_current_cases_final_report_page_data(
     case_id=Optional[str],
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
 ) -> PatientFinalReportPageResponse:
     """
     Получает данные для вкладки "Заключение" на странице врача:
@@ -3732,112 +3400,10 @@ async def get_current_cases_final_report_page_data(
       и его заключение (если есть). Если заключения нет, оно будет создано.
     - Все стёкла последнего кейса (для выбора, какие прикрепить).
     """
-    cases_fu_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("1").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1).in_(["F", "U"]),
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-            )
-        )
-    ).subquery("cases_fu")
-
-    scanned_glass_exists_clause = (
-        select(1)
-        .select_from(db_models.Sample)
-        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
-        .join(db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id)
-        .where(db_models.Sample.case_id == db_models.Case.id)
-        .exists()
-    )
-
-    cases_s_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("2").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1) == "S",
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-                scanned_glass_exists_clause,
-            )
-        )
-    ).subquery("cases_s")
-
-    combined_query_for_data = select(
-        cases_fu_subquery.c.id,
-        cases_fu_subquery.c.case_code,
-        cases_fu_subquery.c.creation_date,
-        cases_fu_subquery.c.patient_id,
-        cases_fu_subquery.c.grossing_status,
-        cases_fu_subquery.c.bank_count,
-        cases_fu_subquery.c.cassette_count,
-        cases_fu_subquery.c.glass_count,
-        cases_fu_subquery.c.pathohistological_conclusion,
-        cases_fu_subquery.c.microdescription,
-        cases_fu_subquery.c.is_printed_cassette,
-        cases_fu_subquery.c.is_printed_glass,
-        cases_fu_subquery.c.is_printed_qr,
-        cases_fu_subquery.c.sort_priority,
-        cases_fu_subquery.c.case_owner,
-    ).union_all(
-        select(
-            cases_s_subquery.c.id,
-            cases_s_subquery.c.case_code,
-            cases_s_subquery.c.creation_date,
-            cases_s_subquery.c.patient_id,
-            cases_s_subquery.c.grossing_status,
-            cases_s_subquery.c.bank_count,
-            cases_s_subquery.c.cassette_count,
-            cases_s_subquery.c.glass_count,
-            cases_s_subquery.c.pathohistological_conclusion,
-            cases_s_subquery.c.microdescription,
-            cases_s_subquery.c.is_printed_cassette,
-            cases_s_subquery.c.is_printed_glass,
-            cases_s_subquery.c.is_printed_qr,
-            cases_s_subquery.c.sort_priority,
-            cases_s_subquery.c.case_owner,
-        )
+    all_current_cases_raw, next_cursor = await _fetch_current_worklist_page(
+        db=db, skip=skip, limit=limit, cursor=cursor
     )
 
-    final_ordered_query = combined_query_for_data.order_by(
-        combined_query_for_data.c.sort_priority.asc(),
-        combined_query_for_data.c.creation_date.desc(),
-    )
-
-    paginated_results = await db.execute(final_ordered_query.offset(skip).limit(limit))
-    all_current_cases_raw = paginated_results.all()
-
     current_cases_list: List[CaseModelScheema] = []
     last_case_details: Optional[CaseModelScheema] = None
     report_details: Optional[FinalReportResponseSchema] = None
@@ -3957,19 +3523,49 @@ async def get_current_cases_final_report_page_data(
         last_case_details=last_case_details,
         case_owner=case_owner,
         report_details=report_details,
-        current_signings=signing_session if signing_session else None
+        current_signings=signing_session if signing_session else None,
+        next_cursor=next_cursor,
     )
 
 
-async def take_case_ownership(
-    db: AsyncSession, case_id: str, doctor_id: str
-) -> db_models.Case:
+# --- Владение кейсом и очередь патологоанатома ---
+
+
+def _case_is_claimable(now: datetime):
     """
-    Позволяет доктору взять на себя владение кейсом.
+    Условие "кейс можно взять": кейс не завершён и у него нет владельца
+    либо аренда предыдущего владельца истекла.
     """
-    case_db = await db.scalar(
-        select(db_models.Case).where(db_models.Case.id == case_id)
+    return and_(
+        db_models.Case.grossing_status != db_models.Grossing_status.COMPLETED,
+        or_(
+            db_models.Case.case_owner.is_(None),
+            db_models.Case.owner_lease_expires_at < now,
+        ),
     )
+
+
+async def _get_case_for_ownership(
+    db: AsyncSession, case_id: str
+) -> Optional[db_models.Case]:
+    """
+    Перечитывает кейс из БД поверх объекта в сессии (после UPDATE без синхронизации).
+    """
+    return await db.scalar(
+        select(db_models.Case)
+        .where(db_models.Case.id == case_id)
+        .execution_options(populate_existing=True)
+    )
+
+
+async def _raise_case_ownership_error(
+    db: AsyncSession, case_id: str, doctor_id: str, owner_required: bool
+) -> None:
+    """
+    Определяет, почему условный UPDATE владения не затронул кейс,
+    и выбрасывает соответствующую ошибку.
+    """
+    case_db = await _get_case_for_ownership(db, case_id)
     if not case_db:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -3980,39 +3576,46 @@ async def take_case_ownership(
             status_code=status.HTTP_406_NOT_ACCEPTABLE,
             detail=f"Запрещено редактировать закрытый кейс",
         )
-
-    doctor_db = await db.scalar(
-        select(db_models.Doctor).where(db_models.Doctor.doctor_id == doctor_id)
-    )
-    if not doctor_db:
+    if owner_required:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Доктор с ID '{doctor_id}' не найден.",
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Вы не являетесь владельцем этого кейса и не можете его освободить.",
         )
-
     if case_db.case_owner == doctor_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Вы уже являетесь владельцем этого кейса.",
         )
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Кейс уже занят другим доктором.",
+    )
 
-    if case_db.case_owner is not None and case_db.case_owner != doctor_id:
+
+async def _ensure_doctor_exists(db: AsyncSession, doctor_id: str) -> None:
+    doctor_db = await db.scalar(
+        select(db_models.Doctor).where(db_models.Doctor.doctor_id == doctor_id)
+    )
+    if not doctor_db:
         raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="Кейс уже занят другим доктором.",
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Доктор с ID '{doctor_id}' не найден.",
         )
 
-    case_db.case_owner = doctor_id
-    case_db.grossing_status = db_models.Grossing_status.PROCESSING
-    await db.commit()
-    await db.refresh(case_db)
 
+async def _build_case_ownership_response(
+    db: AsyncSession, case_db: db_models.Case, is_case_owner: bool
+) -> CaseOwnershipResponse:
+    """
+    Собирает ответ с деталями кейса (кассеты и стёкла — только для первой банки)
+    и данными владельца.
+    """
     doctor = await get_doctor(db=db, doctor_id=case_db.case_owner)
     samples_result = await db.execute(
         select(db_models.Sample)
         .where(db_models.Sample.case_id == case_db.id)
         .options(selectinload(db_models.Sample.cassette))
-        .order_by(db_models.Sample.sample_number)
+        .order_by(db_models.Sample.sort_letters, db_models.Sample.sort_number)
     )
     first_case_samples_db = samples_result.scalars().all()
     first_case_samples: List[Dict[str, Any]] = []
@@ -4024,29 +3627,13 @@ async def take_case_ownership(
         if i == 0 and sample_db:
             await db.refresh(sample_db, attribute_names=["cassette"])
 
-            def sort_cassettes(cassette: db_models.Cassette):
-                match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-                if match:
-                    letter_part = match.group(1)
-                    number_part = int(match.group(2))
-                    return (letter_part, number_part)
-                return (
-                    cassette.cassette_number,
-                    0,
-                )
-
-            sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
-
-            for cassette_db in sorted_cassettes_db:
+            for cassette_db in sample_db.cassette:
                 await db.refresh(cassette_db, attribute_names=["glass"])
                 cassette = CassetteModelScheema.model_validate(cassette_db).model_dump()
-                cassette["glasses"] = sorted(
-                    [
-                        GlassModelScheema.model_validate(glass).model_dump()
-                        for glass in cassette_db.glass
-                    ],
-                    key=lambda glass: glass["glass_number"],
-                )
+                cassette["glasses"] = [
+                    GlassModelScheema.model_validate(glass).model_dump()
+                    for glass in cassette_db.glass
+                ]
                 sample["cassettes"].append(cassette)
         first_case_samples.append(sample)
     response = CaseDetailsResponse(
@@ -4071,7 +3658,8 @@ async def take_case_ownership(
         first_name=doctor.first_name if case_db.case_owner else None,
         middle_name=doctor.middle_name if case_db.case_owner else None,
         last_name=doctor.last_name if case_db.case_owner else None,
-        is_case_owner=True,
+        is_case_owner=is_case_owner,
+        lease_expires_at=case_db.owner_lease_expires_at if case_db.case_owner else None,
     )
     general_response = CaseOwnershipResponse(
         case_details=response, case_owner=case_owner_response
@@ -4079,109 +3667,167 @@ async def take_case_ownership(
     return general_response
 
 
+async def take_case_ownership(
+    db: AsyncSession, case_id: str, doctor_id: str
+) -> CaseOwnershipResponse:
+    """
+    Позволяет доктору взять на себя владение кейсом.
+    Владелец назначается одним условным UPDATE, поэтому из двух одновременных
+    запросов кейс получит только один доктор. Кейс с истёкшей арендой
+    считается свободным.
+    """
+    await _ensure_doctor_exists(db, doctor_id)
+
+    result = await db.execute(
+        update(db_models.Case)
+        .where(db_models.Case.id == case_id, _case_is_claimable(datetime.now()))
+        .values(
+            case_owner=doctor_id,
+            grossing_status=db_models.Grossing_status.PROCESSING,
+            owner_lease_expires_at=None,
+        )
+        .returning(db_models.Case.id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.scalar_one_or_none() is None:
+        await db.rollback()
+        await _raise_case_ownership_error(db, case_id, doctor_id, owner_required=False)
+    await emit_case_changes(db, [case_id], "case_owner")
+    await db.commit()
+
+    case_db = await _get_case_for_ownership(db, case_id)
+    return await _build_case_ownership_response(db, case_db, is_case_owner=True)
+
+
 async def release_case_ownership(
     db: AsyncSession, case_id: str, doctor_id: str
 ) -> CaseOwnershipResponse:
     """
     Позволяет доктору отказаться от владения кейсом.
     """
-    case_db = await db.scalar(
-        select(db_models.Case).where(db_models.Case.id == case_id)
+    result = await db.execute(
+        update(db_models.Case)
+        .where(
+            db_models.Case.id == case_id,
+            db_models.Case.case_owner == doctor_id,
+            db_models.Case.grossing_status != db_models.Grossing_status.COMPLETED,
+        )
+        .values(
+            case_owner=None,
+            grossing_status=db_models.Grossing_status.CREATED,
+            owner_lease_expires_at=None,
+        )
+        .returning(db_models.Case.id)
+        .execution_options(synchronize_session=False)
     )
-    if not case_db:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Кейс с ID '{case_id}' не найден.",
+    if result.scalar_one_or_none() is None:
+        await db.rollback()
+        await _raise_case_ownership_error(db, case_id, doctor_id, owner_required=True)
+    await emit_case_changes(db, [case_id], "case_owner")
+    await db.commit()
+
+    case_db = await _get_case_for_ownership(db, case_id)
+    return await _build_case_ownership_response(db, case_db, is_case_owner=False)
+
+
+async def claim_next_case(db: AsyncSession, doctor_id: str) -> CaseOwnershipResponse:
+    """
+    Выдаёт доктору следующий свободный кейс из очереди и берёт его в аренду
+    на settings.case_claim_lease_minutes минут.
+
+    Очередь — те же кейсы, что в списке "Текущие кейсы" ("F"/"U" раньше "S"
+    со сканами), внутри группы самые старые первыми. Кандидат выбирается
+    с FOR UPDATE SKIP LOCKED: строки, которые прямо сейчас забирает
+    другой доктор, пропускаются без ожидания блокировки.
+    """
+    await _ensure_doctor_exists(db, doctor_id)
+
+    now = datetime.now()
+    urgency_order = sqlalchemy.case(
+        (db_models.Case.urgency_prefix.in_(WORKLIST_URGENT_PREFIXES), 1), else_=2
+    )
+    case_id = await db.scalar(
+        select(db_models.Case.id)
+        .where(
+            _case_is_claimable(now),
+            or_(
+                db_models.Case.urgency_prefix.in_(WORKLIST_URGENT_PREFIXES),
+                and_(
+                    db_models.Case.urgency_prefix == WORKLIST_STANDARD_PREFIX,
+                    db_models.Case.has_scanned_glass.is_(True),
+                ),
+            ),
         )
-    if case_db.grossing_status == db_models.Grossing_status.COMPLETED:
-        raise HTTPException(
-            status_code=status.HTTP_406_NOT_ACCEPTABLE,
-            detail=f"Запрещено редактировать закрытый кейс",
+        .order_by(
+            urgency_order,
+            db_models.Case.creation_date.asc(),
+            db_models.Case.id.asc(),
         )
-    if case_db.case_owner != doctor_id:
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    if case_id is None:
+        await db.rollback()
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Вы не являетесь владельцем этого кейса и не можете его освободить.",
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="В очереди нет свободных кейсов.",
         )
 
-    case_db.case_owner = None
-    case_db.grossing_status = db_models.Grossing_status.CREATED
-    await db.commit()
-    await db.refresh(case_db)
-
-    await db.commit()
-    await db.refresh(case_db)
-    doctor = await get_doctor(db=db, doctor_id=case_db.case_owner)
-
-    samples_result = await db.execute(
-        select(db_models.Sample)
-        .where(db_models.Sample.case_id == case_db.id)
-        .options(selectinload(db_models.Sample.cassette))
-        .order_by(db_models.Sample.sample_number)
+    lease_expires_at = now + timedelta(minutes=settings.case_claim_lease_minutes)
+    await db.execute(
+        update(db_models.Case)
+        .where(db_models.Case.id == case_id)
+        .values(
+            case_owner=doctor_id,
+            grossing_status=db_models.Grossing_status.PROCESSING,
+            owner_lease_expires_at=lease_expires_at,
+        )
+        .execution_options(synchronize_session=False)
     )
-    first_case_samples_db = samples_result.scalars().all()
-    first_case_samples: List[Dict[str, Any]] = []
-
-    for i, sample_db in enumerate(first_case_samples_db):
-        sample = SampleModelScheema.model_validate(sample_db).model_dump()
-        sample["cassettes"] = []
-
-        if i == 0 and sample_db:
-            await db.refresh(sample_db, attribute_names=["cassette"])
+    await emit_case_changes(db, [case_id], "case_owner")
+    await db.commit()
 
-            def sort_cassettes(cassette: db_models.Cassette):
-                match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-                if match:
-                    letter_part = match.group(1)
-                    number_part = int(match.group(2))
-                    return (letter_part, number_part)
-                return (
-                    cassette.cassette_number,
-                    0,
-                )
+    case_db = await _get_case_for_ownership(db, case_id)
+    return await _build_case_ownership_response(db, case_db, is_case_owner=True)
 
-            sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
 
-            for cassette_db in sorted_cassettes_db:
-                await db.refresh(cassette_db, attribute_names=["glass"])
-                cassette = CassetteModelScheema.model_validate(cassette_db).model_dump()
-                cassette["glasses"] = sorted(
-                    [
-                        GlassModelScheema.model_validate(glass).model_dump()
-                        for glass in cassette_db.glass
-                    ],
-                    key=lambda glass: glass["glass_number"],
-                )
-                sample["cassettes"].append(cassette)
-        first_case_samples.append(sample)
-    response = CaseDetailsResponse(
-        id=case_db.id,
-        case_code=case_db.case_code,
-        creation_date=case_db.creation_date,
-        bank_count=case_db.bank_count,
-        cassette_count=case_db.cassette_count,
-        glass_count=case_db.glass_count,
-        pathohistological_conclusion=case_db.pathohistological_conclusion,
-        microdescription=case_db.microdescription,
-        samples=first_case_samples,
-        is_printed_cassette=case_db.is_printed_cassette,
-        is_printed_glass=case_db.is_printed_glass,
-        is_printed_qr=case_db.is_printed_qr,
-    )
-    case_owner_response = CaseOwnerResponse(
-        id=doctor.id if case_db.case_owner else None,
-        doctor_id=doctor.doctor_id if case_db.case_owner else None,
-        work_email=doctor.work_email if case_db.case_owner else None,
-        phone_number=doctor.phone_number if case_db.case_owner else None,
-        first_name=doctor.first_name if case_db.case_owner else None,
-        middle_name=doctor.middle_name if case_db.case_owner else None,
-        last_name=doctor.last_name if case_db.case_owner else None,
-        is_case_owner=False,
+async def renew_case_lease(
+    db: AsyncSession, case_id: str, doctor_id: str
+) -> CaseOwnershipResponse:
+    """
+    Продлевает аренду кейса, взятого из очереди, на settings.case_claim_lease_minutes.
+    Владение без срока (взятое через take) не меняется.
+    """
+    lease_expires_at = datetime.now() + timedelta(
+        minutes=settings.case_claim_lease_minutes
     )
-    general_response = CaseOwnershipResponse(
-        case_details=response, case_owner=case_owner_response
+    result = await db.execute(
+        update(db_models.Case)
+        .where(
+            db_models.Case.id == case_id,
+            db_models.Case.case_owner == doctor_id,
+            db_models.Case.grossing_status != db_models.Grossing_status.COMPLETED,
+            db_models.Case.owner_lease_expires_at.is_not(None),
+        )
+        .values(owner_lease_expires_at=lease_expires_at)
+        .returning(db_models.Case.id)
+        .execution_options(synchronize_session=False)
     )
-    return general_response
+    if result.scalar_one_or_none() is None:
+        await db.rollback()
+        case_db = await _get_case_for_ownership(db, case_id)
+        if (
+            case_db
+            and case_db.case_owner == doctor_id
+            and case_db.grossing_status != db_models.Grossing_status.COMPLETED
+        ):
+            return await _build_case_ownership_response(db, case_db, is_case_owner=True)
+        await _raise_case_ownership_error(db, case_id, doctor_id, owner_required=True)
+    await emit_case_changes(db, [case_id], "case_owner")
+    await db.commit()
+
+    case_db = await _get_case_for_ownership(db, case_id)
+    return await _build_case_ownership_response(db, case_db, is_case_owner=True)
 
 
 async def close_case_service(
@@ -4251,6 +3897,7 @@ async def close_case_service(
     case_to_close.closing_date = datetime.now()
 
     db.add(case_to_close)
+    await emit_case_changes(db, [case_to_close.id], "case")
     await db.commit()
     await db.refresh(case_to_close)
 
@@ -4293,6 +3940,7 @@ async def auto_close_case_service(
     case_db.closing_date = datetime.now()
 
     db.add(case_db)
+    await emit_case_changes(db, [case_db.id], "case")
     await db.commit()
     await db.refresh(case_db)
     logger.debug("Case closed")
@@ -4407,6 +4055,7 @@ async def print_all_case_glasses(
     #     for cassette_schema in sample_schema.cassettes:
     #         cassette_schema.glasses.sort(key=lambda glass_s: glass_s.glass_number)
 
+    await emit_case_changes(db, [case_db.id], "glass")
     await db.commit()
     await db.refresh(case_db)
 
@@ -4452,6 +4101,7 @@ async def print_all_case_cassette(
             await print_cassette_data(db=db, data=cassette_data, request=request)
             cassette_db.is_printed = printing
 
+    await emit_case_changes(db, [case_db.id], "cassette")
     await db.commit()
     await db.refresh(case_db)
 
@@ -4479,6 +4129,7 @@ async def print_case_qr(
         return None
     case_db.is_printed_qr = printing
 
+    await emit_case_changes(db, [case_db.id], "case")
     await db.commit()
     await db.refresh(case_db)
 
@@ -4575,6 +4226,158 @@ async def _update_case_cassette_status(db: AsyncSession, case: db_models.Case):
         db.add(case)
 
 
+async def _get_case_id_for_cassette(
+    db: AsyncSession, cassette_id: str
+) -> Optional[str]:
+    """Возвращает ID кейса, которому принадлежит кассета."""
+    return await db.scalar(
+        select(db_models.Sample.case_id)
+        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
+        .where(db_models.Cassette.id == cassette_id)
+    )
+
+
+async def _sync_case_scanned_glass_flag(
+    db: AsyncSession,
+    case_ids: Optional[List[str]] = None,
+    glass_ids: Optional[List[str]] = None,
+):
+    """
+    Пересчитывает Case.has_scanned_glass для кейсов из case_ids
+    и для кейсов, которым принадлежат стёкла из glass_ids.
+    Флаг True, если у кейса есть хотя бы одно стекло с заданным scan_url.
+    """
+    case_filters = []
+    if case_ids:
+        case_filters.append(db_models.Case.id.in_(case_ids))
+    if glass_ids:
+        case_filters.append(
+            db_models.Case.id.in_(
+                select(db_models.Sample.case_id)
+                .join(
+                    db_models.Cassette,
+                    db_models.Sample.id == db_models.Cassette.sample_id,
+                )
+                .join(
+                    db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id
+                )
+                .where(db_models.Glass.id.in_(glass_ids))
+            )
+        )
+    if not case_filters:
+        return
+
+    scanned_glass_exists = (
+        select(1)
+        .select_from(db_models.Sample)
+        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
+        .join(db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id)
+        .where(
+            db_models.Sample.case_id == db_models.Case.id,
+            db_models.Glass.scan_url.isnot(None),
+        )
+        .exists()
+    )
+    await db.execute(
+        update(db_models.Case)
+        .where(sqlalchemy.or_(*case_filters))
+        .values(has_scanned_glass=scanned_glass_exists)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _decrement_counters(
+    db: AsyncSession, model, deltas: Dict[str, Dict[str, int]]
+) -> None:
+    """
+    Уменьшает счётчики записей model одним UPDATE ... FROM (VALUES ...).
+    deltas: {id записи: {"glass_count": n, ...}}, набор счётчиков у всех записей одинаковый.
+    """
+    if not deltas:
+        return
+    counters = list(next(iter(deltas.values())).keys())
+    delta_rows = values(
+        column("id", sqlalchemy.String),
+        *[column(counter, sqlalchemy.Integer) for counter in counters],
+        name="deltas",
+    ).data(
+        [
+            (entity_id, *[entity_deltas[counter] for counter in counters])
+            for entity_id, entity_deltas in deltas.items()
+        ]
+    )
+    await db.execute(
+        update(model)
+        .where(model.id == delta_rows.c.id)
+        .values(
+            {
+                counter: getattr(model, counter) - delta_rows.c[counter]
+                for counter in counters
+            }
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _refresh_glass_print_flags(
+    db: AsyncSession, sample_ids: List[str], case_ids: List[str]
+) -> None:
+    """
+    Пересчитывает is_printed_glass банок и кейсов по оставшимся стёклам
+    (True, если все стёкла напечатаны или стёкол нет) — двумя UPDATE.
+    """
+    if sample_ids:
+        unprinted_glass_exists = (
+            select(1)
+            .select_from(db_models.Glass)
+            .join(db_models.Cassette, db_models.Cassette.id == db_models.Glass.cassette_id)
+            .where(
+                db_models.Cassette.sample_id == db_models.Sample.id,
+                db_models.Glass.is_printed.is_not(True),
+            )
+            .exists()
+        )
+        await db.execute(
+            update(db_models.Sample)
+            .where(db_models.Sample.id.in_(sample_ids))
+            .values(is_printed_glass=~unprinted_glass_exists)
+            .execution_options(synchronize_session=False)
+        )
+    if case_ids:
+        unprinted_sample_exists = (
+            select(1)
+            .select_from(db_models.Sample)
+            .where(
+                db_models.Sample.case_id == db_models.Case.id,
+                db_models.Sample.is_printed_glass.is_not(True),
+            )
+            .exists()
+        )
+        await db.execute(
+            update(db_models.Case)
+            .where(db_models.Case.id.in_(case_ids))
+            .values(is_printed_glass=~unprinted_sample_exists)
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def _delete_sample_subtrees(db: AsyncSession, sample_filter) -> None:
+    """
+    Удаляет банки, отобранные условием sample_filter, вместе с их кассетами
+    и стёклами — тремя DELETE без загрузки объектов.
+    """
+    sample_ids = select(db_models.Sample.id).where(sample_filter)
+    cassette_ids = select(db_models.Cassette.id).where(
+        db_models.Cassette.sample_id.in_(sample_ids)
+    )
+    for statement in (
+        delete(db_models.Glass).where(db_models.Glass.cassette_id.in_(cassette_ids)),
+        delete(db_models.Cassette).where(db_models.Cassette.sample_id.in_(sample_ids)),
+        delete(db_models.Sample).where(sample_filter),
+    ):
+        await db.execute(statement.execution_options(synchronize_session=False))
+
+
 async def _update_ancestor_statuses_from_glass(
     db: AsyncSession, glass: db_models.Glass
 ):
@@ -4614,6 +4417,7 @@ async def _update_ancestor_statuses_from_glass(
 
     # await _update_case_cassette_status(db, case)
 
+    await emit_case_changes(db, [case.id], "glass")
     await db.commit()
     await db.refresh(glass)
     await db.refresh(cassette)
@@ -4642,6 +4446,7 @@ async def _update_ancestor_statuses_from_cassette(
 
     await _update_case_cassette_status(db, case)
 
+    await emit_case_changes(db, [case.id], "cassette")
     await db.commit()
     await db.refresh(cassette)
     await db.refresh(sample)
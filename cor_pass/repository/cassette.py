@@ -14,6 +14,7 @@ from typing import Any, Dict, List, Optional
 from sqlalchemy.orm import selectinload
 from cor_pass.database import models as db_models
 from cor_pass.repository import case as repository_cases
+from cor_pass.services.case_change_feed import emit_case_changes
 from cor_pass.services.glass_and_cassette_printing import print_labels
 
 
@@ -30,11 +31,10 @@ async def get_cassette(
 
     if cassette_db:
         cassette_schema = CassetteModelScheema.model_validate(cassette_db)
-        # Сортируем стекла по glass_number
-        cassette_schema.glasses = sorted(
-            [GlassModelScheema.model_validate(glass) for glass in cassette_db.glass],
-            key=lambda glass_schema: glass_schema.glass_number,
-        )
+        # Стекла приходят отсортированными по glass_number (order_by связи)
+        cassette_schema.glasses = [
+            GlassModelScheema.model_validate(glass) for glass in cassette_db.glass
+        ]
         return cassette_schema
     return None
 
@@ -96,10 +96,9 @@ async def create_cassette(
     for cassette_db in created_cassettes_db:
         await db.refresh(cassette_db, attribute_names=["glass"])
         cassette_schema = CassetteModelScheema.model_validate(cassette_db)
-        cassette_schema.glasses = sorted(
-            [GlassModelScheema.model_validate(glass) for glass in cassette_db.glass],
-            key=lambda glass_schema: glass_schema.glass_number,
-        )
+        cassette_schema.glasses = [
+            GlassModelScheema.model_validate(glass) for glass in cassette_db.glass
+        ]
         created_cassettes_with_glasses.append(cassette_schema.model_dump())
 
         await repository_cases._update_ancestor_statuses_from_cassette(
@@ -119,6 +118,11 @@ async def update_cassette_comment(
     if cassette_db:
         if comment_update.comment is not None:
             cassette_db.comment = comment_update.comment
+        await emit_case_changes(
+            db,
+            [await repository_cases._get_case_id_for_cassette(db, cassette_db.id)],
+            "cassette",
+        )
         await db.commit()
         await db.refresh(cassette_db)
         return CassetteModelScheema.model_validate(cassette_db)
@@ -131,6 +135,7 @@ async def delete_cassettes(
     """Асинхронно удаляет несколько кассет по их ID и корректно обновляет счетчики."""
     deleted_count = 0
     not_found_ids: List[str] = []
+    affected_case_ids = set()
 
     for cassette_id in cassettes_ids:
         result = await db.execute(
@@ -165,6 +170,7 @@ async def delete_cassettes(
 
             db_case.glass_count -= num_glasses_to_decrement
             db_case.cassette_count -= 1
+            affected_case_ids.add(db_case.id)
 
             await db.commit()
 
@@ -174,6 +180,12 @@ async def delete_cassettes(
         else:
             not_found_ids.append(cassette_id)
 
+    if affected_case_ids:
+        await repository_cases._sync_case_scanned_glass_flag(
+            db=db, case_ids=list(affected_case_ids)
+        )
+        await db.commit()
+
     response = {"deleted_count": deleted_count}
     if not_found_ids:
         response["message"] = (
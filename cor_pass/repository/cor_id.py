@@ -1,12 +1,12 @@
+from typing import List, Optional, Sequence
+from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
-import datetime
-from datetime import datetime
+from datetime import date, datetime
 from cor_pass.database.models import User
 from loguru import logger
 from cor_pass.database.redis_db import redis_client
 from sqlalchemy.ext.asyncio import AsyncSession
 from cor_pass.config.config import settings
-from datetime import datetime
 
 # Исходные данные
 
@@ -87,12 +87,26 @@ def decode_corid(cor_id):
     }
 
 
-# Создание cor_id
-async def create_new_corid(user: User, db: AsyncSession):
-    birth_year_gender = f"{user.birth}{user.user_sex}"
-    jan_first_2024 = datetime(2024, 1, 1).date()
-    today = datetime.now().date()
-    n_days_since_first_jan_2024 = (today - jan_first_2024).days
+# Lua: резервирует count номеров одним INCRBY; TTL ставится при создании ключа.
+# Возвращает последний номер зарезервированного блока.
+_RESERVE_REGISTER_NUMBERS_LUA = """
+local last = redis.call('INCRBY', KEYS[1], ARGV[1])
+if last == tonumber(ARGV[1]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return last
+"""
+
+_reserve_register_numbers_script = redis_client.register_script(
+    _RESERVE_REGISTER_NUMBERS_LUA
+)
+
+REGISTER_KEY_TTL_SECONDS = 48 * 60 * 60
+
+
+def _corid_prefix(day: date) -> int:
+    """Старшие разряды cor_id: версия, дни с 01.01.2024 и учреждение."""
+    n_days_since_first_jan_2024 = (day - date(2024, 1, 1)).days
     term1 = (
         version
         * (2 ** (days_since_bit + facility_bit + patient_bit))
@@ -100,51 +114,82 @@ async def create_new_corid(user: User, db: AsyncSession):
     )
     term2 = n_days_since_first_jan_2024 * (2 ** (patient_bit + facility_bit))
     term3 = n_facility * (2**patient_bit)
-    term4 = await get_register_per_day(n_facility)
+    return term1 + term2 + term3
+
+
+def _build_corid(prefix: int, register_number: int, birth, user_sex) -> str:
+    new_corid_encoded = custom_base32_encode(prefix + register_number, charset)
+    return f"{new_corid_encoded}-{birth}{user_sex}"
+
+
+async def reserve_register_numbers(
+    facility_number: int, count: int = 1, day: Optional[date] = None
+) -> range:
+    """
+    Атомарно резервирует count последовательных номеров регистрации за день
+    для учреждения (один вызов Lua-скрипта). Номера начинаются с 1.
+    """
+    if count < 1:
+        raise ValueError("count must be positive")
+    day = day or datetime.now().date()
+    register_key = f"register:{facility_number}:{day.isoformat()}"
+    last = int(
+        await _reserve_register_numbers_script(
+            keys=[register_key], args=[count, REGISTER_KEY_TTL_SECONDS]
+        )
+    )
+    if last >= 2**patient_bit:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Исчерпан дневной лимит номеров COR-ID для учреждения.",
+        )
+    return range(last - count + 1, last + 1)
+
 
-    new_corid_decimal = term1 + term2 + term3 + term4
-    new_corid_encoded = custom_base32_encode(new_corid_decimal, charset)
-    new_corid = new_corid_encoded + "-" + birth_year_gender
-    user.cor_id = new_corid
+# Создание cor_id
+async def create_new_corid(user: User, db: AsyncSession):
+    """
+    Назначает пользователю новый cor_id. Изменения только отправляются в БД
+    (flush) — фиксирует транзакцию вызывающий код.
+    """
+    today = datetime.now().date()
+    register_number = (await reserve_register_numbers(n_facility, day=today))[0]
+    user.cor_id = _build_corid(
+        _corid_prefix(today), register_number, user.birth, user.user_sex
+    )
     logger.debug(f"For {user.email} created {user.cor_id}")
-    try:
-        await db.commit()
-    except Exception as e:
-        await db.rollback()
-        raise e
+    await db.flush()
 
 
 async def create_only_corid(birth: int, user_sex: str, db: AsyncSession):
-    birth_year_gender = f"{birth}{user_sex}"
-    jan_first_2024 = datetime(2024, 1, 1).date()
     today = datetime.now().date()
-    n_days_since_first_jan_2024 = (today - jan_first_2024).days
-    term1 = (
-        version
-        * (2 ** (days_since_bit + facility_bit + patient_bit))
-        * (1 if version_bit > 0 else 0)
-    )
-    term2 = n_days_since_first_jan_2024 * (2 ** (patient_bit + facility_bit))
-    term3 = n_facility * (2**patient_bit)
-    term4 = await get_register_per_day(n_facility)
-
-    new_corid_decimal = term1 + term2 + term3 + term4
-    new_corid_encoded = custom_base32_encode(new_corid_decimal, charset)
-    new_corid = new_corid_encoded + "-" + birth_year_gender
-    return new_corid
+    register_number = (await reserve_register_numbers(n_facility, day=today))[0]
+    return _build_corid(_corid_prefix(today), register_number, birth, user_sex)
+
+
+async def create_corids_bulk(
+    n: int,
+    birth_years: Sequence[int],
+    sexes: Sequence[str],
+    day: Optional[date] = None,
+) -> List[str]:
+    """
+    Генерирует n cor_id для массового импорта пациентов: все номера
+    резервируются одним обращением к Redis.
+    """
+    if len(birth_years) != n or len(sexes) != n:
+        raise ValueError("birth_years and sexes must contain n items")
+    if n == 0:
+        return []
+    day = day or datetime.now().date()
+    numbers = await reserve_register_numbers(n_facility, count=n, day=day)
+    prefix = _corid_prefix(day)
+    return [
+        _build_corid(prefix, register_number, birth, user_sex)
+        for register_number, birth, user_sex in zip(numbers, birth_years, sexes)
+    ]
 
 
 async def get_register_per_day(facility_number):
     """Получить номер регистрации за день для указанного учреждения."""
-    # Генерируем уникальный ключ на основе facility_number и текущей даты
-    date_str = datetime.now().strftime("%Y-%m-%d")  # Текущая дата в формате ГГГГ-ММ-ДД
-    register_key = f"register:{facility_number}:{date_str}"
-
-    if await redis_client.exists(register_key):
-        register_number = await redis_client.incr(register_key)
-    else:
-        await redis_client.set(register_key, 1)
-        await redis_client.expire(register_key, 24 * 60 * 60)
-        register_number = 1
-
-    return register_number
+    return (await reserve_register_numbers(facility_number))[0]
@@ -2,8 +2,8 @@ import base64
 from datetime import date, datetime, timedelta
 import re
 from fastapi import APIRouter, HTTPException, UploadFile, status
-from sqlalchemy import asc, desc, func, select
-from typing import List, Optional, Tuple, List
+from sqlalchemy import func, select
+from typing import List, Optional, Sequence, Tuple, List
 
 import sqlalchemy
 
@@ -25,7 +25,7 @@ from cor_pass.database.models import (
 )
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from cor_pass.repository.case import get_patient_list_cases
+from cor_pass.repository.case import get_patients_list_cases
 from cor_pass.repository.patient import get_patient_by_corid
 from cor_pass.repository.person import get_user_by_corid
 from cor_pass.schemas import (
@@ -37,9 +37,10 @@ from cor_pass.schemas import (
     PatientResponseForGetPatients,
     StatusResponse,
 )
-from cor_pass.services.cipher import decrypt_data
+from cor_pass.services.cipher import decrypt_data, decrypt_data_batch
 from cor_pass.config.config import settings
 from cor_pass.services.websocket import _is_expired
+from cor_pass.services.role_cache import invalidate_user_roles
 
 
 async def create_doctor(
@@ -70,6 +71,7 @@ async def create_doctor(
 
     await db.commit()
     await db.refresh(doctor)
+    await invalidate_user_roles(doctor.doctor_id)
 
     return doctor
 
@@ -172,6 +174,154 @@ async def create_doctor_service(
     return certificates, diploma, clinic_aff
 
 
+# --- Список пациентов ---
+
+# Ключи сортировки списка пациентов: выражение и разбор значения из курсора.
+# NULL заменяется на 'infinity' — порядок тот же, что у самого столбца в Postgres
+# (NULL больше любого значения), но ключ не NULL и годится для keyset-сравнения.
+# Выражения совпадают с индексами idx_patients_*_sort (models.Patient).
+# asyncpg читает 'infinity' как datetime.max / date.max и так же его записывает.
+_PATIENT_LIST_SORT_KEYS = {
+    "change_date": (
+        func.coalesce(Patient.change_date, sqlalchemy.text("'infinity'::timestamp")),
+        datetime.fromisoformat,
+    ),
+    "birth_date": (
+        func.coalesce(Patient.birth_date, sqlalchemy.text("'infinity'::date")),
+        date.fromisoformat,
+    ),
+}
+
+
+def encode_patient_list_cursor(
+    sort_by: str, sort_value: date | datetime, row_ids: Sequence[str]
+) -> str:
+    """
+    Кодирует позицию в списке пациентов в непрозрачный курсор:
+    значение ключа сортировки и идентификаторы строки (tie-breaker).
+    """
+    raw = "|".join([sort_by, sort_value.isoformat(), *row_ids])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_patient_list_cursor(
+    cursor: str, sort_by: str, id_count: int = 1
+) -> tuple:
+    """
+    Разбирает курсор, выданный encode_patient_list_cursor для той же сортировки:
+    (значение ключа сортировки, *идентификаторы строки).
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        cursor_sort_by, sort_value, *row_ids = raw.split("|")
+        if cursor_sort_by != sort_by:
+            raise ValueError("Cursor was issued for another sort field")
+        if len(row_ids) != id_count:
+            raise ValueError("Cursor was issued for another listing")
+        _, parse_value = _PATIENT_LIST_SORT_KEYS[sort_by]
+        return (parse_value(sort_value), *row_ids)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор пагинации.",
+        )
+
+
+async def _fetch_patient_list_page(
+    db: AsyncSession,
+    page_query: sqlalchemy.Select,
+    count_query: sqlalchemy.Select,
+    sort_by: Optional[str],
+    sort_order: Optional[str],
+    skip: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    tie_breakers: Sequence = (DoctorPatientStatus.id,),
+) -> Tuple[list, int, Optional[str]]:
+    """
+    Возвращает строки страницы, общее количество и курсор следующей страницы.
+
+    Общее количество считается некоррелированным подзапросом в том же запросе
+    (Postgres выполняет его один раз). Строки упорядочены по
+    (ключ сортировки, *tie_breakers); tie_breakers должны однозначно
+    определять строку запроса (и не быть NULL). Пациенты без даты сортировки
+    идут как и раньше: при desc — первыми, при asc — последними. Если передан
+    cursor, используется keyset-пагинация по этому кортежу и skip игнорируется,
+    иначе — skip (1-based номер страницы).
+    """
+    if sort_by not in _PATIENT_LIST_SORT_KEYS:
+        sort_by = "change_date"
+    sort_key, _ = _PATIENT_LIST_SORT_KEYS[sort_by]
+    descending = sort_order == "desc"
+    position = (
+        decode_patient_list_cursor(cursor, sort_by, id_count=len(tie_breakers))
+        if cursor
+        else None
+    )
+
+    total_count_column = count_query.correlate(None).scalar_subquery()
+    query = page_query.add_columns(
+        sort_key.label("sort_value"),
+        total_count_column.label("total_count"),
+        *(
+            column.label(f"tie_breaker_{i}")
+            for i, column in enumerate(tie_breakers)
+        ),
+    )
+    order_columns = (sort_key, *tie_breakers)
+    if position:
+        keyset = sqlalchemy.tuple_(*order_columns)
+        bound = sqlalchemy.tuple_(*position)
+        query = query.where(keyset < bound if descending else keyset > bound)
+    else:
+        query = query.offset((skip - 1) * limit)
+    query = query.order_by(
+        *(
+            column.desc() if descending else column.asc()
+            for column in order_columns
+        )
+    ).limit(limit + 1)
+
+    rows = (await db.execute(query)).all()
+
+    if rows:
+        total_count = rows[0].total_count
+    elif position is None and skip == 1:
+        total_count = 0
+    else:
+        # Страница за концом списка: количество нужно посчитать отдельно
+        total_count = (await db.execute(count_query)).scalar_one()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]._mapping
+        next_cursor = encode_patient_list_cursor(
+            sort_by,
+            last["sort_value"],
+            [str(last[f"tie_breaker_{i}"]) for i in range(len(tie_breakers))],
+        )
+    return rows, total_count, next_cursor
+
+
+async def _decrypt_patient_names(patients: List[Patient]) -> List[Tuple]:
+    """Расшифровывает (фамилия, имя, отчество) всех пациентов страницы одним пакетом."""
+    decoded_key = base64.b64decode(settings.aes_key)
+    decrypted = await decrypt_data_batch(
+        [
+            value
+            for patient in patients
+            for value in (
+                patient.encrypted_surname,
+                patient.encrypted_first_name,
+                patient.encrypted_middle_name,
+            )
+        ],
+        decoded_key,
+    )
+    return [tuple(decrypted[i : i + 3]) for i in range(0, len(decrypted), 3)]
+
+
 async def get_doctor_patients_with_status(
     db: AsyncSession,
     doctor: Doctor,
@@ -181,94 +331,58 @@ async def get_doctor_patients_with_status(
     sort_order: Optional[str] = "desc",
     skip: int = 1,
     limit: int = 10,
-) -> Tuple[List, int]:
+    cursor: Optional[str] = None,
+) -> Tuple[List, int, Optional[str]]:
     """
     Асинхронно получает список пациентов конкретного врача вместе с их статусами с учетом
-    фильтрации, сортировки и пагинации.
+    фильтрации, сортировки и пагинации. Возвращает (страница, общее количество, курсор).
     """
-    query = (
-        select(DoctorPatientStatus, Patient)
-        .join(Patient, DoctorPatientStatus.patient_id == Patient.id)
-        .where(DoctorPatientStatus.doctor_id == doctor.id)
-    )
+    conditions = [DoctorPatientStatus.doctor_id == doctor.id]
 
     # Фильтрация по статусу
     if status_filters:
-        query = query.where(
+        conditions.append(
             DoctorPatientStatus.status.in_([s.value for s in status_filters])
         )
 
     # Фильтрация по полу пациента
     if sex_filters:
-        query = query.where(Patient.sex.in_(sex_filters))
-
-    # Сортировка
-    order_by_clause = None
-    if sort_by == "change_date":
-        order_by_clause = (
-            desc(Patient.change_date)
-            if sort_order == "desc"
-            else asc(Patient.change_date)
-        )
-    elif sort_by == "birth_date":
-        order_by_clause = (
-            desc(Patient.birth_date)
-            if sort_order == "desc"
-            else asc(Patient.birth_date)
-        )
+        conditions.append(Patient.sex.in_(sex_filters))
 
-    if order_by_clause is not None:
-        query = query.order_by(order_by_clause)
-
-    # Пагинация
-    offset = (skip - 1) * limit
-    patients_with_status_result = await db.execute(query.offset(offset).limit(limit))
-    patients_with_status = patients_with_status_result.all()
-
-    # Получаем общее количество результатов для пагинации
+    page_query = (
+        select(DoctorPatientStatus, Patient)
+        .join(Patient, DoctorPatientStatus.patient_id == Patient.id)
+        .where(*conditions)
+    )
     count_query = (
         select(func.count())
         .select_from(DoctorPatientStatus)
         .join(Patient, DoctorPatientStatus.patient_id == Patient.id)
-        .where(DoctorPatientStatus.doctor_id == doctor.id)
+        .where(*conditions)
+    )
+    rows, total_count, next_cursor = await _fetch_patient_list_page(
+        db=db,
+        page_query=page_query,
+        count_query=count_query,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
     )
-    if status_filters:
-        count_query = count_query.where(
-            DoctorPatientStatus.status.in_([s.value for s in status_filters])
-        )
-    if sex_filters:
-        count_query = count_query.where(Patient.sex.in_(sex_filters))
-
-    total_count_result = await db.execute(count_query)
-    total_count = total_count_result.scalar_one()
 
+    names = await _decrypt_patient_names([row[1] for row in rows])
     result = []
-    decoded_key = base64.b64decode(settings.aes_key)
-    for dps, patient in patients_with_status:
-        decrypted_surname = (
-            await decrypt_data(patient.encrypted_surname, decoded_key)
-            if patient.encrypted_surname
-            else None
-        )
-        decrypted_first_name = (
-            await decrypt_data(patient.encrypted_first_name, decoded_key)
-            if patient.encrypted_first_name
-            else None
-        )
-        decrypted_middle_name = (
-            await decrypt_data(patient.encrypted_middle_name, decoded_key)
-            if patient.encrypted_middle_name
-            else None
-        )
-
+    for row, (surname, first_name, middle_name) in zip(rows, names):
+        dps, patient = row[0], row[1]
         result.append(
             {
                 "patient": {
                     "id": patient.id,
                     "patient_cor_id": patient.patient_cor_id,
-                    "surname": decrypted_surname,
-                    "first_name": decrypted_first_name,
-                    "middle_name": decrypted_middle_name,
+                    "surname": surname,
+                    "first_name": first_name,
+                    "middle_name": middle_name,
                     "birth_date": patient.birth_date,
                     "sex": patient.sex,
                     "email": patient.email,
@@ -280,7 +394,7 @@ async def get_doctor_patients_with_status(
             }
         )
 
-    return result, total_count
+    return result, total_count, next_cursor
 
 
 async def get_patients_with_optional_status(
@@ -292,113 +406,77 @@ async def get_patients_with_optional_status(
     sort_by: Optional[str] = "change_date",
     sort_order: Optional[str] = "desc",
     skip: int = 1,
-    limit: int = 30
-) -> Tuple[List, int]:
-    query = (
-        select(DoctorPatientStatus, Patient, PatientClinicStatusModel)
-        .join(Patient, DoctorPatientStatus.patient_id == Patient.id)
-        .join(
-            PatientClinicStatusModel,
-            PatientClinicStatusModel.patient_id == Patient.id,
-            isouter=True,
-        )
-    )
+    limit: int = 30,
+    cursor: Optional[str] = None,
+) -> GetAllPatientsResponce:
+    conditions = []
 
     if doctor:
-        query = query.where(DoctorPatientStatus.doctor_id == doctor.id)
+        conditions.append(DoctorPatientStatus.doctor_id == doctor.id)
 
     if doctor_status_filters:
-        query = query.where(
+        conditions.append(
             DoctorPatientStatus.status.in_([s.value for s in doctor_status_filters])
         )
 
     if clinic_status_filters:
-        query = query.where(
+        conditions.append(
             PatientClinicStatusModel.patient_status_for_clinic.in_(
                 [s.value for s in clinic_status_filters]
             )
         )
 
     if sex_filters:
-        query = query.where(Patient.sex.in_(sex_filters))
-
-    order_by_clause = None
-    if sort_by == "change_date":
-        order_by_clause = (
-            desc(Patient.change_date)
-            if sort_order == "desc"
-            else asc(Patient.change_date)
-        )
-    elif sort_by == "birth_date":
-        order_by_clause = (
-            desc(Patient.birth_date)
-            if sort_order == "desc"
-            else asc(Patient.birth_date)
-        )
-
-    if order_by_clause is not None:
-        query = query.order_by(order_by_clause)
+        conditions.append(Patient.sex.in_(sex_filters))
 
-    offset = (skip - 1) * limit
-    patients_data_result = await db.execute(query.offset(offset).limit(limit))
-
-    patients_data = patients_data_result.all()
-
-    count_query = (
-        select(func.count(Patient.id.distinct()))
-        .select_from(Patient)
+    page_query = (
+        select(DoctorPatientStatus, Patient, PatientClinicStatusModel)
+        .join(Patient, DoctorPatientStatus.patient_id == Patient.id)
         .join(
-            DoctorPatientStatus,
-            DoctorPatientStatus.patient_id == Patient.id,
+            PatientClinicStatusModel,
+            PatientClinicStatusModel.patient_id == Patient.id,
             isouter=True,
         )
+        .where(*conditions)
+    )
+    # Считаются те же строки, что и пагинируются
+    count_query = (
+        select(func.count())
+        .select_from(DoctorPatientStatus)
+        .join(Patient, DoctorPatientStatus.patient_id == Patient.id)
         .join(
             PatientClinicStatusModel,
             PatientClinicStatusModel.patient_id == Patient.id,
             isouter=True,
         )
+        .where(*conditions)
+    )
+    rows, total_count, next_cursor = await _fetch_patient_list_page(
+        db=db,
+        page_query=page_query,
+        count_query=count_query,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        # У пациента может быть несколько статусов клиники: строка списка —
+        # пара (статус у врача, статус клиники)
+        tie_breakers=(
+            DoctorPatientStatus.id,
+            func.coalesce(PatientClinicStatusModel.id, ""),
+        ),
     )
 
-    if doctor:
-        count_query = count_query.where(DoctorPatientStatus.doctor_id == doctor.id)
-
-    if doctor_status_filters:
-        count_query = count_query.where(
-            DoctorPatientStatus.status.in_([s.value for s in doctor_status_filters])
-        )
-
-    if clinic_status_filters:
-        count_query = count_query.where(
-            PatientClinicStatusModel.patient_status_for_clinic.in_(
-                [s.value for s in clinic_status_filters]
-            )
-        )
-
-    if sex_filters:
-        count_query = count_query.where(Patient.sex.in_(sex_filters))
-
-    total_count_result = await db.execute(count_query)
-    total_count = total_count_result.scalar_one()
+    patients = [row[1] for row in rows]
+    names = await _decrypt_patient_names(patients)
+    cases_by_patient = await get_patients_list_cases(
+        db=db, patient_ids=[patient.patient_cor_id for patient in patients]
+    )
 
     result = []
-    decoded_key = base64.b64decode(settings.aes_key)
-
-    for doctor_patient_status, patient, clinic_patient_status in patients_data:
-        decrypted_surname = (
-            await decrypt_data(patient.encrypted_surname, decoded_key)
-            if patient.encrypted_surname
-            else None
-        )
-        decrypted_first_name = (
-            await decrypt_data(patient.encrypted_first_name, decoded_key)
-            if patient.encrypted_first_name
-            else None
-        )
-        decrypted_middle_name = (
-            await decrypt_data(patient.encrypted_middle_name, decoded_key)
-            if patient.encrypted_middle_name
-            else None
-        )
+    for row, (surname, first_name, middle_name) in zip(rows, names):
+        doctor_patient_status, patient, clinic_patient_status = row[0], row[1], row[2]
         status_for_doctor = (
             doctor_patient_status.status if doctor_patient_status else None
         )
@@ -408,29 +486,29 @@ async def get_patients_with_optional_status(
             else None
         )
 
-        list_cases = await get_patient_list_cases(db=db, patient_id=patient.patient_cor_id)
         patient_response = PatientResponseForGetPatients(
             id=patient.id,
             patient_cor_id=patient.patient_cor_id,
-            surname=decrypted_surname,
-            first_name=decrypted_first_name,
-            middle_name=decrypted_middle_name,
-            birth_date=patient.birth_date if patient else None,
-            sex=patient.sex if patient else None,
-            email=patient.email if patient else None,
-            phone_number=patient.phone_number if patient else None,
-            address=patient.address if patient else None,
-            change_date=patient.change_date if patient else None,
+            surname=surname,
+            first_name=first_name,
+            middle_name=middle_name,
+            birth_date=patient.birth_date,
+            sex=patient.sex,
+            email=patient.email,
+            phone_number=patient.phone_number,
+            address=patient.address,
+            change_date=patient.change_date,
             doctor_status=status_for_doctor,
             clinic_status=status_for_clinic,
-            cases = list_cases
+            cases=cases_by_patient.get(patient.patient_cor_id, []),
         )
         result.append(patient_response)
- 
-    response = GetAllPatientsResponce(patients=result, total_count=total_count)
-    return response
 
- 
+    return GetAllPatientsResponce(
+        patients=result, total_count=total_count, next_cursor=next_cursor
+    )
+
+
 async def get_doctor_single_patient_with_status(
     patient_cor_id: str,
     db: AsyncSession,
@@ -2,6 +2,7 @@ from cor_pass.database.models import EnergyManager, User
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from cor_pass.schemas import EnergyManagerCreate
+from cor_pass.services.role_cache import invalidate_user_roles
 
 
 async def create_energy_manager(
@@ -23,5 +24,6 @@ async def create_energy_manager(
 
     await db.commit()
     await db.refresh(energy_manager)
+    await invalidate_user_roles(energy_manager.energy_manager_cor_id)
 
     return energy_manager
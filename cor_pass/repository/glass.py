@@ -1,4 +1,5 @@
 import asyncio
+from collections import defaultdict
 from datetime import datetime, time
 import time as t
 from io import BytesIO
@@ -7,7 +8,7 @@ import socket
 import tempfile
 from threading import Timer
 from fastapi import HTTPException, Request
-from sqlalchemy import select
+from sqlalchemy import delete, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from cor_pass.repository.printing_device import get_printing_device_by_device_class, get_printing_device_by_device_identifier
 from cor_pass.schemas import ChangeGlassStaining, Glass as GlassModelScheema, GlassPrinting, GlassResponseForPrinting, PrintLabel
@@ -15,6 +16,7 @@ from typing import Any, Dict, List
 from sqlalchemy.orm import selectinload, joinedload
 from cor_pass.database import models as db_models
 from cor_pass.repository import case as repository_cases
+from cor_pass.services.case_change_feed import emit_case_changes
 from cor_pass.services.glass_and_cassette_printing import print_labels
 from loguru import logger
 from cor_pass.config.config import settings
@@ -106,6 +108,46 @@ async def fetch_file_from_smb(path: str) -> str:
     return await loop.run_in_executor(None, _read_file)
 
 
+def retrieve_smb_file(path: str, file_obj) -> int:
+    """
+    Синхронно копирует файл с SMB-сервера в file_obj (нужен только метод write)
+    и возвращает число записанных байт. Вызывать вне event loop.
+    """
+    conn = SMBConnection(
+        settings.smb_user,
+        settings.smb_pass,
+        my_name=socket.gethostname(),
+        remote_name=settings.remote_name,
+        use_ntlm_v2=True,
+        is_direct_tcp=True,
+    )
+    if not conn.connect(settings.smb_server_ip, 445):
+        logger.error(f"Не удалось подключиться к SMB-серверу {settings.smb_server_ip}")
+        raise RuntimeError("Failed to connect to SMB server")
+
+    prefix = f"\\\\{settings.smb_server_ip}\\{settings.smb_share}\\"
+    if path.startswith(prefix):
+        relative_path = path[len(prefix):].strip("/\\")
+    else:
+        relative_path = path.strip("/\\")
+
+    try:
+        file_info = conn.getAttributes(settings.smb_share, relative_path)
+        filesize = getattr(file_info, "file_size", None)
+        if filesize is None:
+            logger.error(f"Не удалось получить размер файла для {relative_path}")
+            raise ValueError("Cannot get filesize from SMB file_info")
+        start_time = datetime.now()
+        _, written = conn.retrieveFile(settings.smb_share, relative_path, file_obj)
+        logger.debug(f"Время загрузки файла {relative_path}: {datetime.now() - start_time}")
+        if written != filesize:
+            logger.error(f"Ожидалось {filesize} байт, но записано {written} байт")
+            raise RuntimeError(f"Expected {filesize} bytes, but wrote {written} bytes")
+        return written
+    finally:
+        conn.close()
+
+
 async def fetch_file_from_smb_with_timeout(path: str) -> str:
     """
     Загружает файл с SMB-сервера во временный файл и возвращает путь к нему.
@@ -280,62 +322,62 @@ async def create_glass(
 
 
 async def delete_glasses(db: AsyncSession, glass_ids: List[str]) -> Dict[str, Any]:
-    """Асинхронно удаляет несколько стекол по их ID."""
-    deleted_count = 0
-    not_found_ids: List[str] = []
-
-    for glass_id in glass_ids:
-        result = await db.execute(
-            select(db_models.Glass).where(db_models.Glass.id == glass_id)
+    """
+    Асинхронно удаляет несколько стекол по их ID.
+    Дельты счётчиков кассет, семплов и кейсов считаются одним агрегирующим
+    запросом и применяются UPDATE ... FROM, стёкла удаляются одним DELETE,
+    всё — в одной транзакции.
+    """
+    deltas_result = await db.execute(
+        select(
+            db_models.Glass.cassette_id,
+            db_models.Cassette.sample_id,
+            db_models.Sample.case_id,
+            func.array_agg(db_models.Glass.id).label("glass_ids"),
         )
-        db_glass = result.scalar_one_or_none()
-        if db_glass:
-
-            cassette_result = await db.execute(
-                select(db_models.Cassette)
-                .where(db_models.Cassette.id == db_glass.cassette_id)
-                .options(
-                    selectinload(db_models.Cassette.sample).selectinload(
-                        db_models.Sample.case
-                    )
-                )
-            )
-            db_cassette = cassette_result.scalar_one_or_none()
-            if not db_cassette:
-                raise ValueError(f"Касету з ID {db_glass.cassette_id} не знайдено")
-
-            sample_result = await db.execute(
-                select(db_models.Sample)
-                .where(db_models.Sample.id == db_cassette.sample_id)
-                .options(selectinload(db_models.Sample.case))
-            )
-            db_sample = sample_result.scalar_one_or_none()
-            if not db_sample:
-                raise ValueError(f"Семпл с ID {db_cassette.sample_id} не найден")
-
-            db_case_id = db_sample.case_id
-            db_case = await repository_cases.get_single_case(db=db, case_id=db_case_id)
-
-            db_sample = db_sample
-            db_case = db_case
-            await repository_cases._update_ancestor_statuses_from_glass(
-                db=db, glass=db_glass
-            )
-            await db.delete(db_glass)
-            deleted_count += 1
-
-            db_cassette.glass_count -= 1
-            db_sample.glass_count -= 1
-            db_case.glass_count -= 1
-            await db.commit()
-            await db.refresh(db_cassette)
-            await db.refresh(db_sample)
-            await db.refresh(db_case)
-        else:
-            not_found_ids.append(glass_id)
+        .join(db_models.Cassette, db_models.Cassette.id == db_models.Glass.cassette_id)
+        .join(db_models.Sample, db_models.Sample.id == db_models.Cassette.sample_id)
+        .where(db_models.Glass.id.in_(glass_ids))
+        .group_by(
+            db_models.Glass.cassette_id,
+            db_models.Cassette.sample_id,
+            db_models.Sample.case_id,
+        )
+    )
+    found_ids = set()
+    cassette_deltas: Dict[str, Dict[str, int]] = {}
+    sample_deltas: Dict[str, Dict[str, int]] = defaultdict(lambda: {"glass_count": 0})
+    case_deltas: Dict[str, Dict[str, int]] = defaultdict(lambda: {"glass_count": 0})
+    for row in deltas_result.all():
+        found_ids.update(row.glass_ids)
+        glass_count = len(row.glass_ids)
+        cassette_deltas[row.cassette_id] = {"glass_count": glass_count}
+        sample_deltas[row.sample_id]["glass_count"] += glass_count
+        case_deltas[row.case_id]["glass_count"] += glass_count
+    not_found_ids = [
+        glass_id for glass_id in dict.fromkeys(glass_ids) if glass_id not in found_ids
+    ]
 
-    await db.commit()
+    if found_ids:
+        affected_case_ids = list(case_deltas)
+        await repository_cases._decrement_counters(db, db_models.Cassette, cassette_deltas)
+        await repository_cases._decrement_counters(db, db_models.Sample, sample_deltas)
+        await repository_cases._decrement_counters(db, db_models.Case, case_deltas)
+        await db.execute(
+            delete(db_models.Glass)
+            .where(db_models.Glass.id.in_(list(found_ids)))
+            .execution_options(synchronize_session=False)
+        )
+        await repository_cases._refresh_glass_print_flags(
+            db, sample_ids=list(sample_deltas), case_ids=affected_case_ids
+        )
+        await repository_cases._sync_case_scanned_glass_flag(
+            db=db, case_ids=affected_case_ids
+        )
+        await emit_case_changes(db, affected_case_ids, "glass")
+        await db.commit()
 
+    deleted_count = len(found_ids)
     response = {"deleted_count": deleted_count}
     if not_found_ids:
         response["not_found_ids"] = not_found_ids
@@ -356,6 +398,11 @@ async def change_staining(
     glass_db = result.scalar_one_or_none()
     if glass_db:
         glass_db.staining = body.staining_type
+        await emit_case_changes(
+            db,
+            [await repository_cases._get_case_id_for_cassette(db, glass_db.cassette_id)],
+            "glass",
+        )
         await db.commit()
         await db.refresh(glass_db)
         return GlassModelScheema.model_validate(glass_db)
@@ -363,6 +410,25 @@ async def change_staining(
     return None
 
 
+async def set_glass_scan_urls(
+    db: AsyncSession, glass_id: str, scan_url: str, preview_url: str
+) -> db_models.Glass | None:
+    """Привязывает скан и превью к стеклу и обновляет has_scanned_glass кейса."""
+    glass_db = await db.get(db_models.Glass, glass_id)
+    if not glass_db:
+        return None
+    glass_db.scan_url = scan_url
+    glass_db.preview_url = preview_url
+    await repository_cases._sync_case_scanned_glass_flag(db=db, glass_ids=[glass_id])
+    await emit_case_changes(
+        db,
+        [await repository_cases._get_case_id_for_cassette(db, glass_db.cassette_id)],
+        "glass",
+    )
+    await db.commit()
+    return glass_db
+
+
 async def change_printing_status(
     db: AsyncSession, glass_id: int, printing: bool
 ) -> GlassModelScheema | None:
@@ -2,6 +2,7 @@ from cor_pass.database.models import LabAssistant, User
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from cor_pass.schemas import LabAssistantCreate
+from cor_pass.services.role_cache import invalidate_user_roles
 
 
 async def create_lab_assistant(
@@ -23,5 +24,6 @@ async def create_lab_assistant(
 
     await db.commit()
     await db.refresh(lab_assistant)
+    await invalidate_user_roles(lab_assistant.lab_assistant_cor_id)
 
     return lab_assistant
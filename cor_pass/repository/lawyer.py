@@ -17,6 +17,7 @@ from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from cor_pass.schemas import LawyerCreate
+from cor_pass.services.role_cache import invalidate_user_roles
 
 
 async def create_lawyer(
@@ -38,6 +39,7 @@ async def create_lawyer(
 
     await db.commit()
     await db.refresh(lawyer)
+    await invalidate_user_roles(lawyer.lawyer_cor_id)
 
     return lawyer
 
@@ -126,6 +128,7 @@ async def approve_doctor(doctor: Doctor, db: AsyncSession, status: Doctor_Status
     except Exception as e:
         await db.rollback()
         raise e
+    await invalidate_user_roles(doctor.doctor_id)
 
 
 async def delete_doctor_by_doctor_id(db: AsyncSession, doctor_id: str):
@@ -139,6 +142,7 @@ async def delete_doctor_by_doctor_id(db: AsyncSession, doctor_id: str):
 
         await db.delete(doctor)
         await db.commit()
+        await invalidate_user_roles(doctor_id)
     except NoResultFound:
         print("Доктор не найден.")
     except Exception as e:
@@ -1,10 +1,12 @@
+import asyncio
 import base64
 from datetime import date
 import re
-from typing import Optional
+from typing import List, Optional, Tuple
 import uuid
 from fastapi import HTTPException, status
-from sqlalchemy import or_, select
+from sqlalchemy import Text, func, select
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import selectinload, joinedload
 from cor_pass.database.models import (
     Case,
@@ -38,6 +40,12 @@ from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from cor_pass.services.search_token_generator import get_patient_search_tokens
+from cor_pass.services.blind_index import (
+    full_name_blind_index,
+    full_name_query_blind_index,
+    normalize_name,
+    surname_blind_index,
+)
 
 
 async def register_new_patient(
@@ -49,7 +57,6 @@ async def register_new_patient(
     # Генерируем временный пароль
     password_settings = PasswordGeneratorSettings()
     temp_password = generate_password(password_settings)
-    hashed_password = auth_service.get_password_hash(temp_password)
 
     user_signup_data = UserModel(
         email=body.email,
@@ -57,7 +64,7 @@ async def register_new_patient(
         birth=body.birth_date.year,
         user_sex=body.sex,
     )
-    hashed_password = auth_service.get_password_hash(temp_password)
+    hashed_password = await auth_service.get_password_hash(temp_password)
     user_signup_data.password = hashed_password
 
     new_user = await repository_person.create_user(user_signup_data, db)
@@ -83,6 +90,10 @@ async def register_new_patient(
         email=body.email,
         phone_number=body.phone_number,
         address=body.address,
+        blind_full_name=full_name_blind_index(
+            body.surname, body.first_name, body.middle_name
+        ),
+        blind_surname=surname_blind_index(body.surname),
     )
     db.add(new_patient)
     await db.commit()
@@ -237,7 +248,11 @@ async def _create_patient_internal(
         email=patient_data.email,
         phone_number=patient_data.phone_number,
         address=patient_data.address,
-        search_tokens=search_tokens_str
+        search_tokens=search_tokens_str,
+        blind_full_name=full_name_blind_index(
+            patient_data.surname, patient_data.first_name, patient_data.middle_name
+        ),
+        blind_surname=surname_blind_index(patient_data.surname),
     )
     db.add(new_patient)
     await db.flush()
@@ -350,7 +365,7 @@ async def create_patient_and_user_by_email(
 
     password_settings = PasswordGeneratorSettings()
     temp_password = generate_password(password_settings)
-    hashed_password = auth_service.get_password_hash(temp_password)
+    hashed_password = await auth_service.get_password_hash(temp_password)
 
     user_signup_data = UserModel(
         email=patient_data.email,
@@ -394,53 +409,127 @@ async def create_standalone_patient(
         send_email=False,
     )
 
-async def find_patient(
-    db: AsyncSession, search_ngrams_joined: str,
-) -> Patient | None: 
-    
-    search_ngrams = search_ngrams_joined.split(' ') 
-    
+async def search_patients(
+    db: AsyncSession, search_ngrams: List[str], limit: int = 10
+) -> List[Tuple[Patient, int]]:
+    """
+    Возвращает до limit пациентов с наибольшим числом совпавших n-грамм (score).
+    Кандидаты отбираются по GIN-индексу (search_token_array && n-граммы запроса),
+    score считается и сортируется в SQL, LIMIT выполняется в БД.
+    """
+    search_ngrams = [ngram for ngram in dict.fromkeys(search_ngrams) if ngram]
     if not search_ngrams:
-        return None 
-
-    conditions = []
-    for ngram in search_ngrams:
-        conditions.append(Patient.search_tokens.ilike(f"%{ngram}%"))
-
-    patient_query = (
-        select(Patient)
-        .where(or_(*conditions))
+        return []
+
+    token = func.unnest(Patient.search_token_array).table_valued("token")
+    score = (
+        select(func.count())
+        .select_from(token)
+        .where(token.c.token.in_(search_ngrams))
+        .scalar_subquery()
+        .label("score")
     )
-    
-    logger.debug(f"Generated Candidate SQL Query: {patient_query.compile(compile_kwargs={'literal_binds': True})}")
-    pat_exec = await db.execute(patient_query)
-    candidate_patients = pat_exec.scalars().all() 
-    
-    if not candidate_patients:
-        return None 
-
-    patient_scores = []
-    for patient in candidate_patients:
-        score = 0
-        patient_tokens = patient.search_tokens.split(' ') if patient.search_tokens else []
-        
-        for search_ngram in search_ngrams:
+    query = (
+        select(Patient, score)
+        .where(
+            Patient.search_token_array.op("&&")(
+                postgresql.array(search_ngrams, type_=Text)
+            )
+        )
+        .order_by(score.desc(), Patient.change_date.desc())
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return [(patient, patient_score) for patient, patient_score in result.all()]
 
 
-            if search_ngram in patient.search_tokens: 
-                score += 1
-            
-        patient_scores.append((patient, score))
+async def get_patient_search_candidates(
+    db: AsyncSession, search_ngrams: List[str], limit: int = 10
+) -> List[dict]:
+    """
+    Топ-k кандидатов поиска по ФИО с расшифрованными именами и score.
+    Расшифровываются только строки, попавшие в выдачу.
+    """
+    candidates = await search_patients(db=db, search_ngrams=search_ngrams, limit=limit)
+    decoded_key = base64.b64decode(settings.aes_key)
 
-    patient_scores.sort(key=lambda x: x[1], reverse=True)
+    async def _decrypt(value: Optional[bytes]) -> Optional[str]:
+        return await decrypt_data(value, decoded_key) if value else None
+
+    result = []
+    for patient, score in candidates:
+        surname, first_name, middle_name = await asyncio.gather(
+            _decrypt(patient.encrypted_surname),
+            _decrypt(patient.encrypted_first_name),
+            _decrypt(patient.encrypted_middle_name),
+        )
+        result.append(
+            {
+                "patient_cor_id": patient.patient_cor_id,
+                "surname": surname,
+                "first_name": first_name,
+                "middle_name": middle_name,
+                "birth_date": patient.birth_date,
+                "sex": patient.sex,
+                "score": score,
+            }
+        )
+    return result
 
 
-    most_relevant_patient = patient_scores[0][0] 
-    
-    if patient_scores[0][1] == 0:
+async def find_patient(
+    db: AsyncSession, search_ngrams_joined: str,
+) -> Patient | None:
+    """
+    Возвращает наиболее релевантного пациента по n-граммам запроса (через пробел).
+    """
+    candidates = await search_patients(
+        db=db, search_ngrams=search_ngrams_joined.split(" "), limit=1
+    )
+    if not candidates:
         return None
-        
-    return most_relevant_patient
+    return candidates[0][0]
+
+
+async def find_patients_by_exact_name(
+    db: AsyncSession,
+    surname: str,
+    first_name: str,
+    middle_name: Optional[str] = None,
+    birth_date: Optional[date] = None,
+) -> List[Patient]:
+    """
+    Точное совпадение ФИО (и даты рождения, если указана) по слепому индексу —
+    один проход по idx_patients_blind_full_name_birth_date без расшифровки.
+    Используется для поиска дубликатов пациента.
+    """
+    blind_full_name = full_name_blind_index(surname, first_name, middle_name)
+    if not blind_full_name:
+        return []
+    query = select(Patient).where(Patient.blind_full_name == blind_full_name)
+    if birth_date is not None:
+        query = query.where(Patient.birth_date == birth_date)
+    result = await db.scalars(query.order_by(Patient.create_date))
+    return list(result.all())
+
+
+async def find_patients_by_full_name_query(
+    db: AsyncSession, query: str, limit: int = 2
+) -> List[Patient]:
+    """
+    Пациенты, чьё ФИО точно совпадает со строкой поиска "фамилия имя [отчество]"
+    (после нормализации), по слепому индексу. Запрос из одного слова
+    сравнивается с фамилией (blind_surname).
+    """
+    if len(normalize_name(query).split()) == 1:
+        condition = Patient.blind_surname == surname_blind_index(query)
+    else:
+        blind_full_name = full_name_query_blind_index(query)
+        if not blind_full_name:
+            return []
+        condition = Patient.blind_full_name == blind_full_name
+    result = await db.scalars(select(Patient).where(condition).limit(limit))
+    return list(result.all())
 
 
 async def get_single_patient_by_corid(db: AsyncSession, cor_id: str)-> Patient | None:
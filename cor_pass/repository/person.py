@@ -17,7 +17,8 @@ from cor_pass.schemas import (
     MedicalStorageSettings,
 )
 from cor_pass.services.auth import auth_service
-from cor_pass.services import roles as role_check
+from cor_pass.services.principal_cache import invalidate_principal
+from cor_pass.services.role_cache import resolve_user_roles
 from loguru import logger
 from cor_pass.services.cipher import (
     generate_aes_key,
@@ -133,6 +134,18 @@ async def get_users(skip: int, limit: int, db: AsyncSession) -> list[User]:
     return list(users)
 
 
+async def get_users_by_ids(user_ids: List[str], db: AsyncSession) -> list[User]:
+    """
+    Асинхронно возвращает пользователей по списку id одним запросом.
+
+    """
+    if not user_ids:
+        return []
+    stmt = select(User).where(User.id.in_(user_ids))
+    result = await db.execute(stmt)
+    return list(result.scalars().all())
+
+
 # переписать
 async def make_user_status(
     email: str, account_status: Status, db: AsyncSession
@@ -147,6 +160,7 @@ async def make_user_status(
         user.account_status = account_status
         try:
             await db.commit()
+            await invalidate_principal(user.id)
         except Exception as e:
             await db.rollback()
             raise e
@@ -226,7 +240,7 @@ async def change_user_password(email: str, password: str, db: AsyncSession) -> N
     """
     user = await get_user_by_email(email, db)
     if user:
-        hashed_password = auth_service.get_password_hash(password)
+        hashed_password = await auth_service.get_password_hash(password)
         user.password = hashed_password
         user.last_password_change = datetime.now()
         try:
@@ -246,6 +260,7 @@ async def change_user_email(email: str, current_user, db: AsyncSession) -> None:
     current_user.email = email
     try:
         await db.commit()
+        await invalidate_principal(current_user.id)
         logger.debug("Email has changed")
     except Exception as e:
         await db.rollback()
@@ -278,6 +293,7 @@ async def delete_user_by_email(db: AsyncSession, email: str):
 
         await db.delete(user)
         await db.commit()
+        await invalidate_principal(user.id)
     except NoResultFound:
         print("Пользователя не найдено.")
     except Exception as e:
@@ -413,6 +429,7 @@ async def deactivate_user(email: str, db: AsyncSession) -> None:
         user.is_active = False
         try:
             await db.commit()
+            await invalidate_principal(user.id)
             await db.refresh(user)
         except Exception as e:
             await db.rollback()
@@ -429,6 +446,7 @@ async def activate_user(email: str, db: AsyncSession) -> None:
         user.is_active = True
         try:
             await db.commit()
+            await invalidate_principal(user.id)
             await db.refresh(user)
         except Exception as e:
             await db.rollback()
@@ -447,31 +465,12 @@ async def get_last_password_change(email: str, db: AsyncSession) -> Optional[dat
 
 
 async def get_user_roles(email: str, db: AsyncSession) -> List[str]:
-    roles = []
+    """
+    Роли пользователя: табличные роли разрешаются одним запросом и кэшируются
+    в Redis (см. services.role_cache).
+    """
     user = await get_user_by_email(email, db)
-
-    if await role_check.admin_role_checker.is_admin(user=user):
-        roles.append("admin")
-    if await role_check.lawyer_role_checker.is_lawyer(user=user, db=db):
-        roles.append("lawyer")
-    if await role_check.cor_int_role_checker.is_cor_int(user=user):
-        roles.append("cor-int")
-    doctor = await role_check.doctor_role_checker.is_doctor(user=user, db=db)
-    if doctor:
-        roles.append("doctor")
-    lab_assistant = await role_check.lab_assistant_role_checker.is_lab_assistant(
-        user=user, db=db
-    )
-    if lab_assistant:
-        roles.append("lab_assistant")
-    energy_manager = await role_check.energy_manager_role_checker.is_energy_manager(
-        user=user, db=db
-    )
-    if energy_manager:
-        roles.append("energy_manager")
-    if user.is_active:
-        roles.append("active_user")
-    return roles
+    return await resolve_user_roles(user=user, db=db)
 
 
 async def register_new_user(db: AsyncSession, body: NewUserRegistration):
@@ -481,7 +480,6 @@ async def register_new_user(db: AsyncSession, body: NewUserRegistration):
     # Генерируем временный пароль
     password_settings = PasswordGeneratorSettings()
     temp_password = generate_password(password_settings)
-    hashed_password = auth_service.get_password_hash(temp_password)
 
     user_signup_data = UserModel(
         email=body.email,
@@ -489,7 +487,7 @@ async def register_new_user(db: AsyncSession, body: NewUserRegistration):
         birth=body.birth_date.year,
         user_sex=body.sex,
     )
-    hashed_password = auth_service.get_password_hash(temp_password)
+    hashed_password = await auth_service.get_password_hash(temp_password)
     user_signup_data.password = hashed_password
 
     new_user = await create_user(user_signup_data, db)
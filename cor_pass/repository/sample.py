@@ -1,9 +1,11 @@
-import re
 from string import ascii_uppercase
 from fastapi import Request
-from sqlalchemy import select
+from sqlalchemy import distinct, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from cor_pass.repository.case import (
+    _decrement_counters,
+    _delete_sample_subtrees,
+    _sync_case_scanned_glass_flag,
     _update_ancestor_statuses_from_cassette,
     _update_ancestor_statuses_from_glass,
 )
@@ -22,6 +24,7 @@ from typing import Any, Dict, List, Optional
 
 from sqlalchemy.orm import selectinload
 from cor_pass.database import models as db_models
+from cor_pass.services.case_change_feed import emit_case_changes
 
 
 async def get_sample(db: AsyncSession, sample_id: str) -> SampleModelScheema | None:
@@ -41,28 +44,12 @@ async def get_sample(db: AsyncSession, sample_id: str) -> SampleModelScheema | N
         sample_schema = SampleModelScheema.model_validate(sample_db)
         sample_schema.cassettes = []
 
-        def sort_cassettes(cassette):
-            match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-            if match:
-                letter_part = match.group(1)
-                number_part = int(match.group(2))
-                return (letter_part, number_part)
-            return (
-                cassette.cassette_number,
-                0,
-            )  # Для случаев, если формат не совпадает
-
-        sorted_cassettes = sorted(sample_db.cassette, key=sort_cassettes)
-
-        for cassette_db in sorted_cassettes:
+        for cassette_db in sample_db.cassette:
             cassette_schema = CassetteModelScheema.model_validate(cassette_db)
-            cassette_schema.glasses = sorted(
-                [
-                    GlassModelScheema.model_validate(glass)
-                    for glass in cassette_db.glass
-                ],
-                key=lambda glass_schema: glass_schema.glass_number,
-            )
+            cassette_schema.glasses = [
+                GlassModelScheema.model_validate(glass)
+                for glass in cassette_db.glass
+            ]
             sample_schema.cassettes.append(cassette_schema)
         return sample_schema
     return None
@@ -87,28 +74,12 @@ async def archive_sample(db: AsyncSession, sample_id: str, archive: bool):
         sample_schema = SampleModelScheema.model_validate(sample_db)
         sample_schema.cassettes = []
 
-        def sort_cassettes(cassette):
-            match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-            if match:
-                letter_part = match.group(1)
-                number_part = int(match.group(2))
-                return (letter_part, number_part)
-            return (
-                cassette.cassette_number,
-                0,
-            )  # Для случаев, если формат не совпадает
-
-        sorted_cassettes = sorted(sample_db.cassette, key=sort_cassettes)
-
-        for cassette_db in sorted_cassettes:
+        for cassette_db in sample_db.cassette:
             cassette_schema = CassetteModelScheema.model_validate(cassette_db)
-            cassette_schema.glasses = sorted(
-                [
-                    GlassModelScheema.model_validate(glass)
-                    for glass in cassette_db.glass
-                ],
-                key=lambda glass_schema: glass_schema.glass_number,
-            )
+            cassette_schema.glasses = [
+                GlassModelScheema.model_validate(glass)
+                for glass in cassette_db.glass
+            ]
             sample_schema.cassettes.append(cassette_schema)
         return sample_schema
     return None
@@ -135,28 +106,12 @@ async def update_sample_macrodescription(
         sample_schema = SampleModelScheema.model_validate(sample_db)
         sample_schema.cassettes = []
 
-        def sort_cassettes(cassette):
-            match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-            if match:
-                letter_part = match.group(1)
-                number_part = int(match.group(2))
-                return (letter_part, number_part)
-            return (
-                cassette.cassette_number,
-                0,
-            )  # Для случаев, если формат не совпадает
-
-        sorted_cassettes = sorted(sample_db.cassette, key=sort_cassettes)
-
-        for cassette_db in sorted_cassettes:
+        for cassette_db in sample_db.cassette:
             cassette_schema = CassetteModelScheema.model_validate(cassette_db)
-            cassette_schema.glasses = sorted(
-                [
-                    GlassModelScheema.model_validate(glass)
-                    for glass in cassette_db.glass
-                ],
-                key=lambda glass_schema: glass_schema.glass_number,
-            )
+            cassette_schema.glasses = [
+                GlassModelScheema.model_validate(glass)
+                for glass in cassette_db.glass
+            ]
             sample_schema.cassettes.append(cassette_schema)
         return sample_schema
     return None
@@ -280,31 +235,13 @@ async def create_sample(
 
             await db.refresh(first_sample_details_db, attribute_names=["cassette"])
 
-            def sort_cassettes(cassette):
-                match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-                if match:
-                    letter_part = match.group(1)
-                    number_part = int(match.group(2))
-                    return (letter_part, number_part)
-                return (
-                    cassette.cassette_number,
-                    0,
-                )
-
-            sorted_cassettes = sorted(
-                first_sample_details_db.cassette, key=sort_cassettes
-            )
-
-            for cassette_db in sorted_cassettes:
+            for cassette_db in first_sample_details_db.cassette:
                 await db.refresh(cassette_db, attribute_names=["glass"])
                 cassette_schema = CassetteModelScheema.model_validate(cassette_db)
-                cassette_schema.glasses = sorted(
-                    [
-                        GlassModelScheema.model_validate(glass)
-                        for glass in cassette_db.glass
-                    ],
-                    key=lambda glass_schema: glass_schema.glass_number,
-                )
+                cassette_schema.glasses = [
+                    GlassModelScheema.model_validate(glass)
+                    for glass in cassette_db.glass
+                ]
                 first_sample_details_schema.cassettes.append(cassette_schema)
 
             first_sample_details = first_sample_details_schema.model_dump()
@@ -316,44 +253,48 @@ async def create_sample(
 
 
 async def delete_samples(db: AsyncSession, samples_ids: List[str]) -> Dict[str, Any]:
-    """Асинхронно удаляет несколько семплов по их ID и корректно обновляет счетчики."""
-    deleted_count = 0
-    not_found_ids: List[str] = []
-
-    for sample_id in samples_ids:
-        result = await db.execute(
-            select(db_models.Sample)
-            .where(db_models.Sample.id == sample_id)
-            .options(
-                selectinload(db_models.Sample.cassette).selectinload(
-                    db_models.Cassette.glass
-                )
-            )
+    """
+    Асинхронно удаляет несколько семплов по их ID и корректно обновляет счетчики.
+    Дельты счётчиков кейсов считаются одним агрегирующим запросом,
+    поддерево удаляется набором DELETE, всё — в одной транзакции.
+    """
+    deltas_result = await db.execute(
+        select(
+            db_models.Sample.case_id,
+            func.array_agg(distinct(db_models.Sample.id)).label("sample_ids"),
+            func.count(distinct(db_models.Cassette.id)).label("cassette_count"),
+            func.count(db_models.Glass.id).label("glass_count"),
         )
-        db_sample = result.scalar_one_or_none()
-        if db_sample:
-            db_case = await db.get(db_models.Case, db_sample.case_id)
-            if not db_case:
-                raise ValueError(f"Кейс с ID {db_sample.case_id} не найден")
-
-            num_cassettes_to_decrement = len(db_sample.cassette)
-            num_glasses_to_decrement = sum(
-                len(cassette.glass) for cassette in db_sample.cassette
-            )
-
-            await db.delete(db_sample)
-            deleted_count += 1
-
-            db_case.bank_count -= 1
-            db_case.cassette_count -= num_cassettes_to_decrement
-            db_case.glass_count -= num_glasses_to_decrement
-
-            await db.commit()
-            await db.refresh(db_case)
+        .select_from(db_models.Sample)
+        .outerjoin(
+            db_models.Cassette, db_models.Cassette.sample_id == db_models.Sample.id
+        )
+        .outerjoin(db_models.Glass, db_models.Glass.cassette_id == db_models.Cassette.id)
+        .where(db_models.Sample.id.in_(samples_ids))
+        .group_by(db_models.Sample.case_id)
+    )
+    found_ids = set()
+    case_deltas: Dict[str, Dict[str, int]] = {}
+    for row in deltas_result.all():
+        found_ids.update(row.sample_ids)
+        case_deltas[row.case_id] = {
+            "bank_count": len(row.sample_ids),
+            "cassette_count": row.cassette_count,
+            "glass_count": row.glass_count,
+        }
+    not_found_ids = [
+        sample_id for sample_id in dict.fromkeys(samples_ids) if sample_id not in found_ids
+    ]
 
-        else:
-            not_found_ids.append(sample_id)
+    if found_ids:
+        affected_case_ids = list(case_deltas)
+        await _decrement_counters(db, db_models.Case, case_deltas)
+        await _delete_sample_subtrees(db, db_models.Sample.id.in_(list(found_ids)))
+        await _sync_case_scanned_glass_flag(db=db, case_ids=affected_case_ids)
+        await emit_case_changes(db, affected_case_ids, "sample")
+        await db.commit()
 
+    deleted_count = len(found_ids)
     response = {"deleted_count": deleted_count}
     if not_found_ids:
         response["not_found_ids"] = not_found_ids
@@ -404,28 +345,15 @@ async def print_all_sample_cassettes(
     for cassette_db in cassettes_to_update:
         cassette_db.is_printed = printing
 
-    def sort_cassettes(cassette):
-        match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-        if match:
-            letter_part = match.group(1)
-            number_part = int(match.group(2))
-            return (letter_part, number_part)
-        return (cassette.cassette_number, 0)
-
-    sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
-
     sample_schema = SampleModelScheema.model_validate(sample_db)
     sample_schema.cassettes = []
 
-    for cassette_db in sorted_cassettes_db:
+    for cassette_db in sample_db.cassette:
         cassette_schema = CassetteModelScheema.model_validate(cassette_db)
-        cassette_schema.glasses = sorted(
-            [
-                GlassModelScheema.model_validate(glass_db)
-                for glass_db in cassette_db.glass
-            ],
-            key=lambda glass_s: glass_s.glass_number,
-        )
+        cassette_schema.glasses = [
+            GlassModelScheema.model_validate(glass_db)
+            for glass_db in cassette_db.glass
+        ]
         # await _update_ancestor_statuses_from_cassette(db=db, cassette=cassette_db)
         # for glass_db in cassette_db.glass:
         #     await _update_ancestor_statuses_from_glass(db=db, glass=glass_db)
@@ -472,29 +400,17 @@ async def print_all_sample_glasses(
 
     for glass_db in glasses_to_update:
         glass_db.is_printed = printing
-    def sort_cassettes(cassette):
-        match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-        if match:
-            letter_part = match.group(1)
-            number_part = int(match.group(2))
-            return (letter_part, number_part)
-        return (cassette.cassette_number, 0)
 
     sample_schema = SampleModelScheema.model_validate(sample_db)
-
-    sorted_cassettes_db = sorted(sample_db.cassette, key=sort_cassettes)
     sample_schema.cassettes = []
 
-    for cassette_db in sorted_cassettes_db:
+    for cassette_db in sample_db.cassette:
         cassette_schema = CassetteModelScheema.model_validate(cassette_db)
 
-        cassette_schema.glasses = sorted(
-            [
-                GlassModelScheema.model_validate(glass_db)
-                for glass_db in cassette_db.glass
-            ],
-            key=lambda glass_s: glass_s.glass_number,
-        )
+        cassette_schema.glasses = [
+            GlassModelScheema.model_validate(glass_db)
+            for glass_db in cassette_db.glass
+        ]
         sample_schema.cassettes.append(cassette_schema)
 
     await db.commit()
@@ -1,15 +1,25 @@
 import base64
 from typing import Dict, List
-from fastapi import APIRouter, Body, HTTPException, Depends, Response, status
+import time
+from fastapi import APIRouter, Body, HTTPException, Depends, Query, Response, status
 from cor_pass.database.db import get_db
 from cor_pass.repository import lawyer
 from cor_pass.repository.doctor import create_doctor, create_doctor_service
 from cor_pass.repository.lawyer import get_doctor
 from cor_pass.services.websocket_events_manager import websocket_events_manager
 from cor_pass.services.auth import auth_service
-from cor_pass.database.models import Doctor_Status, User, Status
+from cor_pass.services.principal_cache import Principal
+from cor_pass.database.models import Doctor_Status, Status
 from cor_pass.services.access import admin_access
+from cor_pass.services.principal_cache import invalidate_principal
+from cor_pass.services.activity_tracker import (
+    count_active_users,
+    get_last_seen,
+    list_active_users,
+)
 from cor_pass.schemas import (
+    ActiveUserResponse,
+    ActiveUsersCountResponse,
     CertificateResponse,
     ClinicAffiliationResponse,
     DiplomaResponse,
@@ -27,7 +37,6 @@ from cor_pass.schemas import (
 )
 from cor_pass.repository import person
 from pydantic import EmailStr
-from cor_pass.database.redis_db import redis_client
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
@@ -45,7 +54,7 @@ router = APIRouter(prefix="/admin", tags=["Admin"])
 async def get_all_users(
     skip: int = 0,
     limit: int = 10,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -62,45 +71,79 @@ async def get_all_users(
     """
 
     list_users = await person.get_users(skip, limit, db)
-    users_list_with_activity = []
+    last_seen = await get_last_seen(user.id for user in list_users)
 
+    users_list_with_activity = []
     for user in list_users:
-        oid = str(user.id)
-        last_active = None
-        if await redis_client.exists(oid):
-            users_last_activity = await redis_client.get(oid)
-            user_response = UserDb(
-                id=user.id,
-                cor_id=user.cor_id,
-                email=user.email,
-                account_status=user.account_status,
-                is_active=user.is_active,
-                last_password_change=user.last_password_change,
-                user_sex=user.user_sex,
-                birth=user.birth,
-                user_index=user.user_index,
-                created_at=user.created_at,
-                last_active=users_last_activity,
-            )
-        else:
-            user_response = UserDb(
-                id=user.id,
-                cor_id=user.cor_id,
-                email=user.email,
-                account_status=user.account_status,
-                is_active=user.is_active,
-                last_password_change=user.last_password_change,
-                user_sex=user.user_sex,
-                birth=user.birth,
-                user_index=user.user_index,
-                created_at=user.created_at,
-            )
-
+        user_response = UserDb(
+            id=user.id,
+            cor_id=user.cor_id,
+            email=user.email,
+            account_status=user.account_status,
+            is_active=user.is_active,
+            last_password_change=user.last_password_change,
+            user_sex=user.user_sex,
+            birth=user.birth,
+            user_index=user.user_index,
+            created_at=user.created_at,
+            last_active=last_seen.get(str(user.id)),
+        )
         users_list_with_activity.append(user_response)
 
     return users_list_with_activity
 
 
+@router.get(
+    "/active_users/count",
+    response_model=ActiveUsersCountResponse,
+    dependencies=[Depends(admin_access)],
+)
+async def get_active_users_count(
+    minutes: int = Query(15, ge=1, le=60 * 24 * 30, description="Окно активности в минутах"),
+):
+    """
+    **Количество пользователей, активных за последние N минут**\n
+    Level of Access:
+    - Admin
+    """
+    count = await count_active_users(since=time.time() - minutes * 60)
+    return ActiveUsersCountResponse(minutes=minutes, count=count)
+
+
+@router.get(
+    "/active_users",
+    response_model=List[ActiveUserResponse],
+    dependencies=[Depends(admin_access)],
+)
+async def get_active_users(
+    minutes: int = Query(15, ge=1, le=60 * 24 * 30, description="Окно активности в минутах"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    **Пользователи, активные за последние N минут (последние активные первыми)**\n
+    Level of Access:
+    - Admin
+    """
+    active = await list_active_users(
+        since=time.time() - minutes * 60, skip=skip, limit=limit
+    )
+    users = {
+        user.id: user
+        for user in await person.get_users_by_ids([user_id for user_id, _ in active], db)
+    }
+    return [
+        ActiveUserResponse(
+            id=user_id,
+            cor_id=users[user_id].cor_id if user_id in users else None,
+            email=users[user_id].email if user_id in users else None,
+            last_active=last_seen,
+        )
+        for user_id, last_seen in active
+    ]
+
+
 async def _create_profile_response(
     db_profile, current_user, router_instance
 ) -> ProfileResponse:
@@ -136,7 +179,7 @@ async def _create_profile_response(
 )
 async def get_all_user_info(
     user_cor_id: str,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -150,14 +193,7 @@ async def get_all_user_info(
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found.")
 
-    last_active = None
-    if await redis_client.exists(str(user.id)):
-        users_last_activity_str = await redis_client.get(str(user.id))
-        try:
-            last_active = users_last_activity_str
-        except (ValueError, TypeError) as e:
-            logger.error(f"Error parsing last_active from Redis: {e}")
-            last_active = None
+    last_active = (await get_last_seen([user.id])).get(str(user.id))
 
     full_user_data["user_info"] = UserDb(
         id=user.id,
@@ -250,7 +286,7 @@ async def get_all_user_info(
 )
 async def get_user_data_info(
     user_cor_id: str,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -264,14 +300,7 @@ async def get_user_data_info(
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found.")
 
-    last_active = None
-    if await redis_client.exists(str(user.id)):
-        users_last_activity_str = await redis_client.get(str(user.id))
-        try:
-            last_active = users_last_activity_str
-        except (ValueError, TypeError) as e:
-            logger.error(f"Error parsing last_active from Redis: {e}")
-            last_active = None
+    last_active = (await get_last_seen([user.id])).get(str(user.id))
 
     user_data["user_info"] = UserDb(
         id=user.id,
@@ -297,7 +326,7 @@ async def get_user_data_info(
 )
 async def get_user_roles_info(
     user_cor_id: str,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -325,7 +354,7 @@ async def get_user_roles_info(
 )
 async def get_user_profile_info(
     user_cor_id: str,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -354,7 +383,7 @@ async def get_user_profile_info(
 )
 async def get_user_doctors_info(
     user_cor_id: str,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -545,6 +574,7 @@ async def kickout_user(email: EmailStr, db: AsyncSession = Depends(get_db)):
     else:
         new_token = None
         await person.update_token(user=user, token=new_token, db=db)
+        await invalidate_principal(user.id)
         return {"message": f"{email} - delete refresh token"}
 
 
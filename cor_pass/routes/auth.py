@@ -35,12 +35,13 @@ from cor_pass.schemas import (
     RecoveryCodeModel,
     UserSessionModel,
 )
-from cor_pass.database.models import User
+from cor_pass.services.principal_cache import Principal
 from cor_pass.repository import person as repository_person
 from cor_pass.repository import user_session as repository_session
 from cor_pass.repository import cor_id as repository_cor_id
 from cor_pass.services.auth import auth_service
 from cor_pass.services import device_info as di
+from cor_pass.services import auth_throttle
 from cor_pass.services.email import (
     send_email_code,
     send_email_code_forgot_password,
@@ -59,18 +60,8 @@ from cor_pass.services.websocket import send_websocket_message
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt, JWTError
-from cor_pass.database.redis_db import redis_client
 import time
 
-# auth_attempts = defaultdict(list)
-# blocked_ips = {}
-
-# Константы для Redis ключей и порогов
-IP_ATTEMPTS_PREFIX = "login:ip_attempts:"
-IP_BLOCKED_PREFIX = "login:ip_blocked:"
-MAX_ATTEMPTS_PER_IP = 15
-BLOCK_DURATION_SECONDS = 15 * 60  # 15 минут в секундах
-
 
 router = APIRouter(prefix="/auth", tags=["Authorization"])
 security = HTTPBearer()
@@ -106,7 +97,7 @@ async def signup(
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Account already exists"
         )
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_person.create_user(body, db)
     if not new_user.cor_id:
         await repository_cor_id.create_new_corid(new_user, db)
@@ -187,49 +178,46 @@ async def login(
     device_information = di.get_device_info(request)
     client_ip = device_information["ip_address"]
 
-    # ---- Блокировки по IP (rate limit) ----
-    blocked_until_str = await redis_client.get(f"{IP_BLOCKED_PREFIX}{client_ip}")
-    if blocked_until_str:
-        blocked_until_timestamp = float(blocked_until_str)
-        if blocked_until_timestamp > time.time():
-            block_dt = datetime.fromtimestamp(blocked_until_timestamp)
-            logger.warning(f"IP-адрес {client_ip} заблокирован до {block_dt} (Redis).")
-            raise HTTPException(
-                status_code=429,
-                detail=f"IP-адрес заблокирован до {block_dt}",
-            )
-        else:
-            await redis_client.delete(f"{IP_BLOCKED_PREFIX}{client_ip}")
+    # ---- Блокировки по IP и аккаунту (скользящее окно в Redis) ----
+    throttle_checks = auth_throttle.login_checks(
+        client_ip=client_ip, account=body.username
+    )
+    retry_after = await auth_throttle.get_retry_after(throttle_checks)
+    if retry_after:
+        block_dt = datetime.fromtimestamp(time.time() + retry_after)
+        logger.warning(
+            f"Вход для {body.username} с IP {client_ip} заблокирован до {block_dt} (Redis)."
+        )
+        raise HTTPException(
+            status_code=429,
+            detail=f"Слишком много попыток авторизации. Вход заблокирован до {block_dt}",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
 
     user = await repository_person.get_user_by_email(body.username, db)
 
-    if user is None or not auth_service.verify_password(body.password, user.password):
+    password_is_valid, updated_password_hash = (
+        await auth_service.verify_password_and_update(body.password, user.password)
+        if user is not None
+        else (False, None)
+    )
+    if not password_is_valid:
         log_message = (
             f"Неудачная попытка входа для пользователя {body.username} с IP {client_ip}: "
             f"{'Пользователь не найден' if user is None else 'Неверный пароль'}"
         )
         logger.warning(log_message)
 
-        current_attempts = await redis_client.incr(f"{IP_ATTEMPTS_PREFIX}{client_ip}")
-        if current_attempts == 1:
-            await redis_client.expire(
-                f"{IP_ATTEMPTS_PREFIX}{client_ip}", BLOCK_DURATION_SECONDS
-            )
-
-        if current_attempts >= MAX_ATTEMPTS_PER_IP:
-            block_until_timestamp = time.time() + BLOCK_DURATION_SECONDS
-            await redis_client.set(
-                f"{IP_BLOCKED_PREFIX}{client_ip}",
-                str(block_until_timestamp),
-                ex=BLOCK_DURATION_SECONDS,
-            )
-            block_dt = datetime.fromtimestamp(block_until_timestamp)
+        retry_after = await auth_throttle.register_failure(throttle_checks)
+        if retry_after:
+            block_dt = datetime.fromtimestamp(time.time() + retry_after)
             logger.warning(
-                f"Слишком много попыток авторизации с IP-адреса {client_ip}. Блокировка до {block_dt} (Redis)."
+                f"Слишком много попыток авторизации для {body.username} с IP-адреса {client_ip}. Блокировка до {block_dt} (Redis)."
             )
             raise HTTPException(
                 status_code=429,
-                detail=f"Слишком много попыток авторизации. IP-адрес заблокирован до {block_dt}",
+                detail=f"Слишком много попыток авторизации. Вход заблокирован до {block_dt}",
+                headers={"Retry-After": str(int(retry_after) + 1)},
             )
 
         raise HTTPException(
@@ -237,9 +225,12 @@ async def login(
             detail="User not found / invalid email or password",
         )
     else:
-        # успешный логин → сбрасываем счётчики
-        await redis_client.delete(f"{IP_ATTEMPTS_PREFIX}{client_ip}")
-        await redis_client.delete(f"{IP_BLOCKED_PREFIX}{client_ip}")
+        # успешный логин → сбрасываем счётчики аккаунта (счётчик IP не сбрасывается)
+        await auth_throttle.reset(throttle_checks[1:])
+        # параметры bcrypt изменились → сохраняем пароль с новым хэшем
+        if updated_password_hash:
+            user.password = updated_password_hash
+            await db.commit()
 
     # ---- Информация об устройстве ----
     
@@ -473,7 +464,7 @@ async def check_session_status(
 async def confirm_login(
     request: Request,
     body: ConfirmLoginRequest,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
     device_info: dict = Depends(di.get_device_header),
 ):
@@ -995,7 +986,7 @@ async def verify_access_token(
 
     """
     token = credentials.credentials
-    user = await auth_service.get_current_user(token=token, db=db)
+    user = await auth_service.get_current_principal(token=token, db=db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid access token"
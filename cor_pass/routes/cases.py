@@ -9,7 +9,7 @@ from fastapi.responses import StreamingResponse
 import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
 from cor_pass.database.db import get_db
-from cor_pass.database.models import User
+from cor_pass.services.principal_cache import Principal
 from cor_pass.repository.lawyer import get_doctor
 from cor_pass.repository.patient import get_patient_by_corid
 from cor_pass.repository.printing_device import get_printing_device_by_device_class
@@ -493,7 +493,7 @@ async def get_referral_attachment(
 )
 async def take_case(
     case_id: str,
-    user: User = Depends(auth_service.get_current_user),  # Получаем ID текущего доктора
+    user: Principal = Depends(auth_service.get_current_principal),  # Получаем ID текущего доктора
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -516,7 +516,7 @@ async def take_case(
 )
 async def release_case(
     case_id: str,
-    user: User = Depends(auth_service.get_current_user),  # Получаем ID текущего доктора
+    user: Principal = Depends(auth_service.get_current_principal),  # Получаем ID текущего доктора
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -532,6 +532,51 @@ async def release_case(
         raise e
 
 
+@router.post(
+    "/claim_next",
+    response_model=CaseOwnershipResponse,
+    summary="Взять следующий кейс из очереди",
+)
+async def claim_next_case(
+    user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Выдаёт авторизованному доктору следующий свободный кейс из очереди
+    ("F"/"U" раньше "S", самые старые первыми) и берёт его в аренду.
+    Одновременные запросы разных докторов никогда не получают один и тот же кейс.
+    """
+    doctor = await get_doctor(doctor_id=user.cor_id, db=db)
+    if not doctor:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Doctor not found"
+        )
+    return await case_service.claim_next_case(db=db, doctor_id=doctor.doctor_id)
+
+
+@router.post(
+    "/{case_id}/renew_lease",
+    response_model=CaseOwnershipResponse,
+    summary="Продлить аренду кейса",
+)
+async def renew_case_lease(
+    case_id: str,
+    user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Продлевает аренду кейса, полученного из очереди, для его текущего владельца.
+    """
+    doctor = await get_doctor(doctor_id=user.cor_id, db=db)
+    if not doctor:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Doctor not found"
+        )
+    return await case_service.renew_case_lease(
+        db=db, case_id=case_id, doctor_id=doctor.doctor_id
+    )
+
+
 @router.patch(
     "/{case_id}/print_glasses",
     dependencies=[Depends(doctor_access)],
@@ -1042,7 +1042,7 @@ async def websocket_device_endpoint(websocket: WebSocket, session_id: str, db: A
             raise Exception("Missing credentials")
         
         user = await repository_person.get_user_by_email(email=user_email, db=db)
-        if user is None or not auth_service.verify_password(plain_password=password, hashed_password=user.password):
+        if user is None or not await auth_service.verify_password(plain_password=password, hashed_password=user.password):
             await websocket_events_manager.disconnect(connection_id)
             raise Exception("Invalid credentials")
         
@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException, Depends, status
 
 from cor_pass.database.db import get_db
 from cor_pass.services.auth import auth_service
-from cor_pass.database.models import User
+from cor_pass.services.principal_cache import Principal
 from cor_pass.services.access import user_access
 from cor_pass.schemas import ResponseCorIdModel
 from cor_pass.repository import cor_id as repository_cor_id
@@ -18,7 +18,7 @@ router = APIRouter(prefix="/medical/cor_id", tags=["Cor-Id"])
 )
 async def read_cor_id(
     cor_id: ResponseCorIdModel,
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -9,7 +9,7 @@ from fastapi import (
     status,
 )
 from fastapi.responses import JSONResponse
-from cor_pass.database.models import AccessLevel, Device, DeviceStatus, User
+from cor_pass.database.models import AccessLevel, Device, DeviceStatus
 from cor_pass.services.access import user_access
 from cor_pass.repository import device as repository_devices
 from cor_pass.repository import person as repository_users
@@ -20,6 +20,7 @@ from cor_pass.schemas import (
     GrantDeviceAccess,
 )
 from cor_pass.services.auth import auth_service
+from cor_pass.services.principal_cache import Principal
 from cor_pass.database.db import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
 from cor_pass.services.access import admin_access
@@ -147,7 +148,7 @@ async def disconnect_device(device_id: str):
 )
 async def activate_device(
     registration: DeviceRegistration,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     manufactured_device = await repository_devices.get_manufactured_device_by_token(
@@ -219,7 +220,7 @@ async def websocket_endpoint(websocket: WebSocket, db: AsyncSession = Depends(ge
 @router.post("/devices/{device_id}/share", response_model=DeviceAccessResponse)
 async def share_device(
     access_data: GrantDeviceAccess,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     device = await repository_devices.get_device_by_id(
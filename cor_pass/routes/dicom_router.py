@@ -9,7 +9,6 @@ from skimage.transform import resize
 from PIL import Image
 from PIL import ImageOps
 from io import BytesIO
-from functools import lru_cache
 from pathlib import Path
 import zipfile
 import shutil
@@ -18,7 +17,10 @@ from collections import Counter
 from skimage.transform import resize
 from collections import Counter
 from cor_pass.services.auth import auth_service
-from cor_pass.database.models import User
+from cor_pass.services.dicom_volume import RescaledVolume, decode_volume
+from cor_pass.services.slide_pool import slide_pool
+from cor_pass.services.volume_cache import volume_cache
+from cor_pass.services.principal_cache import Principal
 from pydicom import config
 from loguru import logger
 
@@ -59,162 +61,20 @@ def check_dicom_support():
         logger.debug(f"{name} ({uid}): {'✓' if handler else '✗'}")
 
 
-@lru_cache(maxsize=16)
 def load_volume(user_cor_id: str):
-    logger.debug("[INFO] Загружаем том из DICOM-файлов...")
-
-    # Чтение всех файлов
+    """Том пользователя из общего кэша томов (декодируется при промахе)."""
     user_dicom_dir = os.path.join(DICOM_ROOT_DIR, user_cor_id)
     if not os.path.exists(user_dicom_dir):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="DICOM данные для этого пользователя не найдены.",
         )
-
-    dicom_paths = [
-        os.path.join(user_dicom_dir, f)
-        for f in os.listdir(user_dicom_dir)
-        if not f.startswith(".") and os.path.isfile(os.path.join(user_dicom_dir, f))
-    ]
-
-    datasets = []
-    for path in dicom_paths:
-        try:
-            # Пробуем разные методы чтения файла
-            ds = None
-            read_attempts = [
-                lambda: pydicom.dcmread(path),  # Стандартное чтение
-                lambda: pydicom.dcmread(path, force=True),  # Принудительное чтение
-                lambda: pydicom.dcmread(
-                    path, force=True, defer_size=1024
-                ),  # Чтение с ограничением
-            ]
-
-            for attempt in read_attempts:
-                try:
-                    ds = attempt()
-                    break
-                except:
-                    continue
-
-            if ds is None:
-                logger.debug(f"[WARN] Не удалось прочитать файл {path}")
-                continue
-
-            # Попытка декомпрессии если файл сжат
-            if hasattr(ds, "file_meta") and hasattr(ds.file_meta, "TransferSyntaxUID"):
-                if ds.file_meta.TransferSyntaxUID.is_compressed:
-                    try:
-                        ds.decompress()  # Автоматический выбор декомпрессора
-                    except Exception as decompress_error:
-                        print(
-                            f"[WARN] Не удалось декомпрессировать {path}: {decompress_error}"
-                        )
-                        continue
-
-            # Проверка необходимых атрибутов
-            required_attrs = [
-                "ImagePositionPatient",
-                "ImageOrientationPatient",
-                "pixel_array",
-            ]
-            if all(hasattr(ds, attr) for attr in required_attrs):
-                datasets.append((ds, path))
-            else:
-                logger.debug(
-                    f"[WARN] Файл {path} не содержит необходимых DICOM-тегов. Пропущен."
-                )
-                logger.debug(
-                    f"       Найдены теги: {[attr for attr in required_attrs if hasattr(ds, attr)]}"
-                )
-
-        except Exception as e:
-            logger.debug(f"[WARN] Пропущен файл {path} из-за ошибки чтения: {str(e)}")
-            continue
-
-    if not datasets:
-        raise RuntimeError("Нет подходящих DICOM-файлов с ImagePositionPatient.")
-
-    # Определение нормали к срезу из ориентации
-    orientation = datasets[0][0].ImageOrientationPatient
-    normal = np.cross(orientation[:3], orientation[3:])
-
-    # Сортировка по проекции позиции на нормаль
-    datasets.sort(key=lambda item: np.dot(item[0].ImagePositionPatient, normal))
-
-    slices = []
-    shapes = []
-    example_ds = None
-
-    for ds, path in datasets:
-        try:
-            # Получаем pixel_array с обработкой возможных ошибок
-            if not hasattr(ds, "pixel_array"):
-                logger.debug(
-                    f"[WARN] Файл {path} не содержит pixel_array после декомпрессии"
-                )
-                continue
-
-            arr = ds.pixel_array.astype(np.float32)
-
-            # Применяем Rescale Slope/Intercept если они есть
-            if hasattr(ds, "RescaleSlope") and hasattr(ds, "RescaleIntercept"):
-                try:
-                    slope = (
-                        float(ds.RescaleSlope)
-                        if isinstance(
-                            ds.RescaleSlope, (str, pydicom.multival.MultiValue)
-                        )
-                        else ds.RescaleSlope
-                    )
-                    intercept = (
-                        float(ds.RescaleIntercept)
-                        if isinstance(
-                            ds.RescaleIntercept, (str, pydicom.multival.MultiValue)
-                        )
-                        else ds.RescaleIntercept
-                    )
-                    arr = arr * slope + intercept
-                except Exception as e:
-                    print(
-                        f"[WARN] Ошибка применения RescaleSlope/Intercept в {path}: {e}"
-                    )
-
-            slices.append(arr)
-            shapes.append(arr.shape)
-
-            if example_ds is None:
-                example_ds = ds
-
-        except Exception as e:
-            logger.debug(f"[ERROR] Ошибка обработки {os.path.basename(path)}: {e}")
-            continue
-
-    if not slices:
-        raise RuntimeError("Не удалось загрузить ни одного среза.")
-
-    # Приведение всех к одной форме
-    shape_counter = Counter(shapes)
-    target_shape = shape_counter.most_common(1)[0][0]
-    logger.debug(f"[INFO] Приведение всех срезов к форме {target_shape}")
-
-    resized_slices = [
-        (
-            resize(slice_, target_shape, preserve_range=True).astype(np.float32)
-            if slice_.shape != target_shape
-            else slice_
-        )
-        for slice_ in slices
-    ]
-
-    volume = np.stack(resized_slices)
-    logger.debug(f"[INFO] Загружено срезов: {len(volume)}")
-
-    return volume, example_ds
+    volume, ds, meta = volume_cache.load(user_dicom_dir, decode_volume)
+    return RescaledVolume(volume, meta.get("slopes"), meta.get("intercepts")), ds
 
 
 @router.get("/viewer", response_class=HTMLResponse)
-def get_viewer(current_user: User = Depends(auth_service.get_current_user)):
+def get_viewer(current_user: Principal = Depends(auth_service.get_current_principal)):
     return HTMLResponse(HTML_FILE.read_text(encoding="utf-8"))
 
 
@@ -248,7 +108,7 @@ def reconstruct(
     mode: str = Query("auto", enum=["auto", "window", "raw"]),
     window_center: float = Query(None),
     window_width: float = Query(None),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     try:
         volume, ds = load_volume(str(current_user.cor_id))
@@ -332,7 +192,7 @@ def reconstruct(
 @router.post("/upload")
 async def upload_dicom_files(
     files: List[UploadFile] = File(...),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     try:
         user_dir = os.path.join(DICOM_ROOT_DIR, str(current_user.cor_id))
@@ -340,7 +200,10 @@ async def upload_dicom_files(
         user_slide_dir = os.path.join(user_dir, "slides")
 
         # --- безопасное удаление старых данных ---
+        slide_pool.evict_dir(user_slide_dir)
         shutil.rmtree(user_dicom_dir, ignore_errors=True)  # не падает, если нет папки
+        # Старый том больше не соответствует файлам, даже если загрузка прервётся
+        volume_cache.invalidate(user_dicom_dir)
 
         # --- создание директорий ---
         os.makedirs(user_dicom_dir, exist_ok=True)
@@ -401,7 +264,7 @@ async def upload_dicom_files(
                 status_code=400, detail="No valid DICOM or SVS files found."
             )
 
-        load_volume.cache_clear()
+        volume_cache.invalidate(user_dicom_dir)
 
         if valid_svs > 0 and valid_dicom == 0:
             message = f"Загружен файл SVS ({valid_svs} шт.)"
@@ -421,7 +284,7 @@ async def upload_dicom_files(
 
 
 @router.get("/volume_info")
-def get_volume_info(current_user: User = Depends(auth_service.get_current_user)):
+def get_volume_info(current_user: Principal = Depends(auth_service.get_current_principal)):
     try:
         print(f"Loading volume for user cor_id: {current_user.cor_id}")  # Логирование
         volume, ds = load_volume(str(current_user.cor_id))
@@ -437,7 +300,7 @@ def get_volume_info(current_user: User = Depends(auth_service.get_current_user))
 
 
 @router.get("/metadata")
-def get_metadata(current_user: User = Depends(auth_service.get_current_user)):
+def get_metadata(current_user: Principal = Depends(auth_service.get_current_principal)):
     try:
         volume, ds = load_volume(str(current_user.cor_id))
         depth, height, width = volume.shape
@@ -1,5 +1,6 @@
 
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
+import json
 import uuid
 from fastapi import (
     APIRouter,
@@ -49,6 +50,9 @@ from cor_pass.repository.patient import (
     create_patient_linked_to_user,
     create_standalone_patient,
     find_patient,
+    find_patients_by_exact_name,
+    find_patients_by_full_name_query,
+    get_patient_search_candidates,
     get_patient_by_session_id,
     get_patient_info_for_signing,
     get_single_patient_by_corid
@@ -65,6 +69,8 @@ from cor_pass.schemas import (
     PatientCreationResponse,
     PatientFinalReportPageResponse,
     PatientResponseForSigning,
+    PatientDuplicateCandidate,
+    PatientSearchCandidate,
     PatientTestReportPageResponse,
     ReportAndDiagnosisUpdateSchema,
     ReportResponseSchema,
@@ -97,6 +103,7 @@ from cor_pass.repository import case as case_service
 from cor_pass.repository import person as repository_person
 from cor_pass.services.websocket_events_manager import websocket_events_manager
 from cor_pass.services.auth import auth_service
+from cor_pass.services.principal_cache import Principal
 from cor_pass.services.access import user_access, doctor_access, lab_assistant_or_doctor_access
 from cor_pass.services.auth import auth_service
 from cor_pass.services.document_validation import validate_document_file
@@ -227,7 +234,7 @@ async def upload_certificate(
 )
 async def get_doctor_patients(
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     doctor_patient_status: Optional[str] = Query(
         None,
         description="Фильтрация по статусу у врача (скорее всего отпадет) (варианты: registered, diagnosed, under_treatment, hospitalized, discharged, died, in_process, referred_for_additional_consultation)",
@@ -247,6 +254,10 @@ async def get_doctor_patients(
     sort_order: Optional[str] = Query("desc", description="Сортировка (asc или desc)"),
     skip: int = Query(1, ge=1, description="Страницы (1-based index)"),
     limit: int = Query(10, ge=1, le=100, description="К-ство на страницу"),
+    cursor: Optional[str] = Query(
+        None,
+        description="Курсор следующей страницы (next_cursor из предыдущего ответа); если передан, skip игнорируется",
+    ),
 ):
     doctor = None
     if current_doctor:
@@ -285,7 +296,8 @@ async def get_doctor_patients(
         sort_by=sort_by,
         sort_order=sort_order,
         skip=skip,
-        limit=limit
+        limit=limit,
+        cursor=cursor,
     )
     return response
  
@@ -298,7 +310,7 @@ async def get_doctor_patients(
 async def get_single_patient(
     patient_cor_id: str,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     doctor = await get_doctor(db=db, doctor_id=current_user.cor_id)
     if not doctor:
@@ -322,7 +334,7 @@ async def get_single_patient(
 async def add_new_patient_to_doctor(
     body: NewPatientRegistration,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     """
     Добавить нового пациента к врачу.
@@ -383,7 +395,7 @@ async def add_new_patient_to_doctor(
 async def add_existing_patient_to_doctor(
     patient_data: ExistingPatientAdd,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     """
     Добавить существующего пациента к врачу.
@@ -428,7 +440,7 @@ async def add_existing_patient_to_doctor(
 async def get_patient_glass_page_data(
     patient_id: str,
     case_id=Query(None, description="Опциональный параметр case_id"),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ) -> PatientGlassPageResponse:
     """
@@ -456,7 +468,7 @@ async def get_patient_glass_page_data(
 )
 async def get_single_case_details_for_glass_page(
     case_id: str,
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ) -> SingleCaseGlassPageResponse:
     """
@@ -481,7 +493,7 @@ async def get_single_case_details_for_glass_page(
 async def get_patient_cases_for_doctor(
     patient_cor_id: str,
     case_id=Query(None, description="Опциональный параметр case_id"),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ) -> PatientCasesWithReferralsResponse:
     """
@@ -513,7 +525,7 @@ async def get_patient_cases_for_doctor(
 )
 async def get_single_referral(
     case_id: str,
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -614,7 +626,7 @@ async def update_microdescription(
 async def get_patient_excision_page_data(
     patient_id: str,
     case_id=Query(None, description="Опциональный параметр case_id"),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ) -> PatientExcisionPageResponse:
     """
@@ -641,7 +653,7 @@ async def get_patient_excision_page_data(
 )
 async def get_single_case_details_for_excision_page(
     case_id: str,
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ) -> SingleCaseExcisionPageResponse:
     """
@@ -671,7 +683,7 @@ async def upload_doctor_signature(
     ),  # Имя подписи опционально, как Form-поле
     is_default: bool = Form(False),  # Дефолтность, как Form-поле
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
 ) -> DoctorSignatureResponse:
     doctor = await get_doctor(doctor_id=user.cor_id, db=db)
     return await create_doctor_signature(
@@ -694,7 +706,7 @@ async def upload_doctor_signature(
 )
 async def get_all_doctor_signatures(
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
 ) -> List[DoctorSignatureResponse]:
     doctor = await get_doctor(doctor_id=user.cor_id, db=db)
     return await get_doctor_signatures(db=db, doctor_id=doctor.id, router=router)
@@ -711,7 +723,7 @@ async def get_all_doctor_signatures(
 async def set_default_signature(
     signature_id: str,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
 ) -> List[DoctorSignatureResponse]:
     doctor = await get_doctor(doctor_id=user.cor_id, db=db)
     return await set_default_doctor_signature(
@@ -729,7 +741,7 @@ async def set_default_signature(
 async def delete_signature(
     signature_id: str,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
 ):
     doctor = await get_doctor(doctor_id=user.cor_id, db=db)
     return await delete_doctor_signature(
@@ -748,7 +760,7 @@ async def delete_signature(
 async def get_patient_report_full_page_data_route(
     patient_id: str,
     case_id=Query(None, description="Опциональный параметр case_id"),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ) -> PatientTestReportPageResponse:
     """
@@ -777,7 +789,7 @@ async def get_patient_report_full_page_data_route(
 )
 async def get_case_report_route(
     case_id: str,
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ) -> CaseIDReportPageResponse:
     """
@@ -795,7 +807,7 @@ async def handle_report_and_diagnosis(
     case_id: str,
     update_data: ReportAndDiagnosisUpdateSchema = Body(...),
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
 ):
     doctor = await get_doctor(doctor_id=user.cor_id, db=db)
     return await case_service.create_or_update_report_and_diagnosis(
@@ -847,7 +859,7 @@ async def add_signature_to_report_route(
     diagnosis_entry_id: str,
     request: SignReportRequest,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
 ) -> InitiateSignatureResponse:
     session_token = uuid.uuid4().hex
     expires_at = datetime.now(timezone.utc) + timedelta(minutes=SESSION_TTL_MINUTES)
@@ -911,7 +923,7 @@ async def get_signature_attachment(
 async def get_patient_final_report_full_page_data_route(
     patient_id: str,
     case_id=Query(None, description="Опциональный параметр case_id"),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ) -> PatientFinalReportPageResponse:
     """
@@ -937,7 +949,7 @@ async def get_patient_final_report_full_page_data_route(
 )
 async def get_case_final_report_route(
     case_id: str,
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ) -> CaseFinalReportPageResponse:
     """
@@ -962,10 +974,13 @@ async def get_case_final_report_route(
 )
 async def get_current_cases_report_full_page_data_route(
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     case_id=Query(None, description="Опциональный параметр case_id"),
     skip: int = Query(0, description="Количество записей для пропуска"),
     limit: int = Query(10, description="Максимальное количество записей для возврата"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы (next_cursor из предыдущего ответа)"
+    ),
 ) -> PatientTestReportPageResponse:
     """
     Этот маршрут возвращает список всех кейсов пациента, детали последнего кейса
@@ -979,6 +994,7 @@ async def get_current_cases_report_full_page_data_route(
         router=router,
         skip=skip,
         limit=limit,
+        cursor=cursor,
         current_doctor_id=doctor.doctor_id,
         case_id=case_id,
     )
@@ -994,10 +1010,13 @@ async def get_current_cases_report_full_page_data_route(
 )
 async def get_current_cases_with_directions_for_doctor(
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     case_id=Query(None, description="Опциональный параметр case_id"),
     skip: int = Query(0, description="Количество записей для пропуска"),
     limit: int = Query(10, description="Максимальное количество записей для возврата"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы (next_cursor из предыдущего ответа)"
+    ),
 ) -> PatientCasesWithReferralsResponse:
     """
     Возвращает список всех кейсов конкретного пациента, а также детали первого кейса, включая ссылку на файлы его направлений
@@ -1007,6 +1026,7 @@ async def get_current_cases_with_directions_for_doctor(
         db=db,
         skip=skip,
         limit=limit,
+        cursor=cursor,
         current_doctor_id=doctor.doctor_id,
         case_id=case_id,
     )
@@ -1029,10 +1049,13 @@ async def get_current_cases_with_directions_for_doctor(
 )
 async def get_patient_excision_page_data(
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     case_id=Query(None, description="Опциональный параметр case_id"),
     skip: int = Query(0, description="Количество записей для пропуска"),
     limit: int = Query(10, description="Максимальное количество записей для возврата"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы (next_cursor из предыдущего ответа)"
+    ),
 ) -> PatientExcisionPageResponse:
     """
     Возвращает все кейсы и данные вырезки по последнему кейсу
@@ -1042,6 +1065,7 @@ async def get_patient_excision_page_data(
         db=db,
         skip=skip,
         limit=limit,
+        cursor=cursor,
         current_doctor_id=doctor.doctor_id,
         case_id=case_id,
     )
@@ -1059,10 +1083,13 @@ async def get_patient_excision_page_data(
 )
 async def get_current_cases_glass_page_data(
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     case_id=Query(None, description="Опциональный параметр case_id"),
     skip: int = Query(0, description="Количество записей для пропуска"),
     limit: int = Query(10, description="Максимальное количество записей для возврата"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы (next_cursor из предыдущего ответа)"
+    ),
 ) -> PatientGlassPageResponse:
     """
     Возвращает список всех текущих кейсов и все стёкла первого кейса
@@ -1072,6 +1099,7 @@ async def get_current_cases_glass_page_data(
         db=db,
         skip=skip,
         limit=limit,
+        cursor=cursor,
         current_doctor_id=doctor.doctor_id,
         router=router,
         case_id=case_id,
@@ -1090,10 +1118,13 @@ async def get_current_cases_glass_page_data(
 )
 async def get_current_cases_final_report_full_page_data_route(
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     case_id=Query(None, description="Опциональный параметр case_id"),
     skip: int = Query(0, description="Количество записей для пропуска"),
     limit: int = Query(10, description="Максимальное количество записей для возврата"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы (next_cursor из предыдущего ответа)"
+    ),
 ) -> PatientFinalReportPageResponse:
     """
     Этот маршрут возвращает список всех кейсов пациента и данные для формирования финального заключения по последнему кейсу
@@ -1104,6 +1135,7 @@ async def get_current_cases_final_report_full_page_data_route(
         router=router,
         skip=skip,
         limit=limit,
+        cursor=cursor,
         current_doctor_id=doctor.doctor_id,
         case_id=case_id,
     )
@@ -1122,7 +1154,7 @@ async def get_current_cases_final_report_full_page_data_route(
 async def close_case_endpoint(
     case_id: str,
     db: AsyncSession = Depends(get_db),
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
 ) -> CaseCloseResponse:
     """
     Эндпоинт для закрытия кейса.
@@ -1167,7 +1199,7 @@ async def _get_and_return_patient_overview(db: AsyncSession, patient_cor_id: str
 async def unified_search(
     query: str = Query(..., min_length=2, description="ФИО / cor-id пациента или код / id кейса"),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     doctor = await get_doctor(doctor_id=current_user.cor_id, db=db)
     if not doctor:
@@ -1190,6 +1222,12 @@ async def unified_search(
     if found_patient_by_cor_id:
         return await _get_and_return_patient_overview(db, found_patient_by_cor_id.patient_cor_id)
     
+    # Точное совпадение ФИО (или одной фамилии) — по слепому индексу;
+    # однозначный результат возвращаем сразу
+    exact_matches = await find_patients_by_full_name_query(db=db, query=query)
+    if len(exact_matches) == 1:
+        return await _get_and_return_patient_overview(db, exact_matches[0].patient_cor_id)
+
     found_patient = await find_patient(db=db, search_ngrams_joined=search_ngrams_joined)
     if found_patient:
         return await _get_and_return_patient_overview(db, found_patient.patient_cor_id)
@@ -1199,8 +1237,64 @@ async def unified_search(
 
 
 
+@router.get(
+    "/search/patients",
+    response_model=List[PatientSearchCandidate],
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+    summary="Поиск пациентов по ФИО с оценкой релевантности",
+)
+async def search_patients_by_name(
+    query: str = Query(..., min_length=2, description="ФИО пациента или его часть"),
+    limit: int = Query(10, ge=1, le=50, description="Максимальное количество кандидатов"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Возвращает до limit пациентов, отсортированных по количеству совпавших
+    n-грамм запроса (score).
+    """
+    search_ngrams = generate_ngrams(query, n=2)
+    search_ngrams.extend(generate_ngrams(query, n=3))
+    return await get_patient_search_candidates(
+        db=db, search_ngrams=search_ngrams, limit=limit
+    )
+
+
+@router.get(
+    "/search/duplicates",
+    response_model=List[PatientDuplicateCandidate],
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+    summary="Проверка пациента на дубликаты по точному ФИО и дате рождения",
+)
+async def search_patient_duplicates(
+    surname: str = Query(..., min_length=1, description="Фамилия"),
+    first_name: str = Query(..., min_length=1, description="Имя"),
+    middle_name: Optional[str] = Query(None, description="Отчество"),
+    birth_date: Optional[date] = Query(None, description="Дата рождения"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Возвращает уже зарегистрированных пациентов с тем же ФИО
+    (без учёта регистра и лишних пробелов) и, если указана, той же датой рождения.
+    """
+    patients = await find_patients_by_exact_name(
+        db=db,
+        surname=surname,
+        first_name=first_name,
+        middle_name=middle_name,
+        birth_date=birth_date,
+    )
+    return [
+        PatientDuplicateCandidate(
+            patient_cor_id=patient.patient_cor_id,
+            birth_date=patient.birth_date,
+            sex=patient.sex,
+        )
+        for patient in patients
+    ]
+
+
 @router.post("/signing/confirm", tags=["DoctorSigning"])
-async def approve_signature(body: ActionRequest, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def approve_signature(body: ActionRequest, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(auth_service.get_current_principal)):
     """
     Вызывается мобильным приложением после диплинка для поодтверждения подписания.
     """
@@ -1256,7 +1350,7 @@ async def approve_signature(body: ActionRequest, db: AsyncSession = Depends(get_
 @router.get("/signing/status/{session_token}", 
             response_model=StatusResponse,
             tags=["DoctorSigning"])
-async def get_status(session_token: str, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def get_status(session_token: str, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(auth_service.get_current_principal)):
     """
     Для fallback-поллинга, если WS недоступен.
     """
@@ -1275,7 +1369,7 @@ async def get_status(session_token: str, db: AsyncSession = Depends(get_db), cur
 @router.get("/signing/status_by_diagnosis/{diagnosis_id}", 
             response_model=StatusResponse,
             tags=["DoctorSigning"])
-async def get_status_by_diagnosis_id(diagnosis_id: str, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def get_status_by_diagnosis_id(diagnosis_id: str, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(auth_service.get_current_principal)):
     """
     Проверка пендинг сессий
     """
@@ -1306,6 +1400,51 @@ async def websocket_signing(websocket: WebSocket):
         await websocket_events_manager.disconnect(connection_id)
 
 
+@router.websocket("/ws/case_feed/{token}")
+async def websocket_case_feed(
+    websocket: WebSocket, token: str, db: AsyncSession = Depends(get_db)
+):
+    """
+    WebSocket ленты изменений кейсов для врачей.\n
+    Клиент присылает {"case_ids": [...], "worklist": true} — кейсы, открытые на экране,
+    и нужно ли получать изменения всего списка "Текущие кейсы".\n
+    Сервер присылает {"event_type": "case_changed", "case_id", "entity", "version", "worklist"};
+    для удалённого кейса событие дополнительно содержит "deleted": true.
+    """
+    try:
+        user = await auth_service.get_current_principal(token, db)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid token")
+        return
+    doctor = await get_doctor(doctor_id=user.cor_id, db=db)
+    # Соединение с БД на всё время жизни сокета не нужно
+    await db.close()
+    if not doctor:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Doctor not found")
+        return
+
+    connection_id = await websocket_events_manager.connect(websocket)
+    websocket_events_manager.subscribe_case_feed(connection_id, case_ids=[])
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                data = json.loads(message)
+                case_ids = [str(case_id) for case_id in data.get("case_ids", [])]
+                worklist = bool(data.get("worklist", True))
+            except (ValueError, TypeError, AttributeError):
+                logger.warning(f"Invalid case feed subscription from {connection_id}: {message}")
+                continue
+            websocket_events_manager.subscribe_case_feed(
+                connection_id, case_ids=case_ids, worklist=worklist
+            )
+    except WebSocketDisconnect:
+        await websocket_events_manager.disconnect(connection_id)
+    except Exception as e:
+        logger.error(f"Error in ws/case_feed for {connection_id}: {e}")
+        await websocket_events_manager.disconnect(connection_id)
+
+
 @router.get(
     "/signing/patient_info",
     response_model=PatientResponseForSigning,
@@ -1315,7 +1454,7 @@ async def websocket_signing(websocket: WebSocket):
 )
 async def get_patient_info_for_cor_id_signing(
     session_token: str,
-    user: User = Depends(auth_service.get_current_user),
+    user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 )-> PatientResponseForSigning:
     """
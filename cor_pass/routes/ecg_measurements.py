@@ -11,7 +11,7 @@ from cor_pass.repository import ecg_service
 from cor_pass.schemas import (
     ECGMeasurementResponse,
 )
-from cor_pass.database.models import User
+from cor_pass.services.principal_cache import Principal
 from cor_pass.services.auth import auth_service
 from loguru import logger
 from cor_pass.services.access import user_access
@@ -31,7 +31,7 @@ async def upload_ecg(
     file: UploadFile = File(...),
     created_at: Optional[datetime] = Form(None),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user)
+    current_user: Principal = Depends(auth_service.get_current_principal)
 ):
     """
     Загрузка файла с ЭКГ-измерением и сохранение его в базу данных.
@@ -58,7 +58,7 @@ async def upload_ecg(
 async def get_raw_ecg_data(
     measurement_id: str,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user)
+    current_user: Principal = Depends(auth_service.get_current_principal)
 ):
     """
     Выводит сырые (raw) бинарные данные измерения ЭКГ по его ID.
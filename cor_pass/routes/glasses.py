@@ -199,13 +199,11 @@ async def upload_glass_file(
         preview_path = smb_full_path.replace(".svs", ".png")
         await save_file_to_smb_manual(buf, preview_path)
 
-        glass = await db.get(Glass, glass_id)
+        glass = await glass_service.set_glass_scan_urls(
+            db=db, glass_id=glass_id, scan_url=smb_full_path, preview_url=preview_path
+        )
         if not glass:
             raise HTTPException(status_code=404, detail="Стекло не найдено")
-
-        glass.scan_url = smb_full_path
-        glass.preview_url = preview_path
-        await db.commit()
         response = UploadGlassSVSResponse(
             preview_url=preview_path,
             scan_url=smb_full_path
@@ -27,6 +27,7 @@ from cor_pass.repository.medicine import (
     get_user_schedules,
 )
 from cor_pass.services.auth import auth_service
+from cor_pass.services.principal_cache import Principal
 from cor_pass.services.access import user_access
 
 router = APIRouter(prefix="/medicines", tags=["Medicines"])
@@ -164,7 +165,7 @@ async def get_my_medicines(
 async def update_medicine_info(
     medicine_id: str,
     body: MedicineUpdate,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -234,7 +235,7 @@ async def update_medicine_info(
 )
 async def delete_medicine_by_id(
     medicine_id: str,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -18,6 +18,7 @@ from cor_pass.routes.doctor import router as doctor_router
 from cor_pass.database.models import DoctorSignatureSession, User
 from cor_pass.services.access import user_access, doctor_access
 from cor_pass.services.auth import auth_service
+from cor_pass.services.principal_cache import Principal
 from cor_pass.database.db import get_db
 from cor_pass.repository.ophthalmological_prescription import (
     create_ophthalmological_prescription,
@@ -114,7 +115,7 @@ async def initiate_prescription_signing(
 )
 async def get_patient_prescriptions_route(
     patient_id: str,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -4,6 +4,7 @@ from cor_pass.database.db import get_db
 from cor_pass.services import redis_service
 from cor_pass.services.websocket_events_manager import websocket_events_manager
 from cor_pass.services.auth import auth_service
+from cor_pass.services.principal_cache import Principal
 from cor_pass.services.cipher import decrypt_data, decrypt_user_key
 from cor_pass.services.image_validation import validate_image_file
 from cor_pass.services.ip2_location import get_ip_geolocation
@@ -164,7 +165,7 @@ async def choose_medical_storage(
 
 @router.get("/get_email")
 async def get_user_email(
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -180,7 +181,7 @@ async def get_user_email(
 @router.patch("/change_email")
 async def change_email(
     body: EmailSchema,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -214,7 +215,7 @@ async def change_email(
 @router.post("/add_backup_email")
 async def add_backup_email(
     email: EmailSchema,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -241,7 +242,7 @@ async def add_backup_email(
 @router.patch("/change_password", dependencies=[Depends(user_access)])
 async def change_password(
     body: ChangePasswordModel,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -277,7 +278,7 @@ async def change_my_password(
     **Смена пароля в сценарии "Изменить свой пароль"** \n
     """
 
-    if not auth_service.verify_password(body.old_password, current_user.password):
+    if not await auth_service.verify_password(body.old_password, current_user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid old password"
         )
@@ -375,7 +376,7 @@ async def delete_my_account(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
     else:
-        if auth_service.verify_password(body.password, current_user.password):
+        if await auth_service.verify_password(body.password, current_user.password):
             await person.delete_user_by_email(db=db, email=current_user.email)
             logger.info(f"Account for user {current_user.email} was deleted")
             return {"message": f" user {current_user.email} - was deleted"}
@@ -388,7 +389,7 @@ async def delete_my_account(
 
 @router.get("/get_last_password_change")
 async def get_last_password_change(
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -446,7 +447,7 @@ async def send_recovery_keys_email(
 async def read_sessions(
     skip: int = 0,
     limit: int = 150,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -695,7 +696,7 @@ async def get_user_profile_endpoint(
 async def upload_profile_photo_endpoint(
     file: UploadFile = Depends(validate_image_file),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     """
     **Загрузка или обновление фотографии профиля.**\n
@@ -717,7 +718,7 @@ async def upload_profile_photo_endpoint(
 @router.get("/photo", status_code=status.HTTP_200_OK)
 async def get_profile_photo_endpoint(
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     """
     **Получение фотографии профиля.**\n
@@ -746,7 +747,7 @@ async def get_profile_photo_endpoint(
 @router.get("/photo/base64", status_code=status.HTTP_200_OK)
 async def get_profile_photo_base64_endpoint(
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
 ):
     """
     **Получение фотографии профиля в формате Base64.**\n
@@ -780,7 +781,7 @@ async def get_profile_photo_base64_endpoint(
 async def submit_feedback(
     feedback: FeedbackRatingScheema,
     background_tasks: BackgroundTasks,
-    current_user: User = Depends(auth_service.get_current_user)
+    current_user: Principal = Depends(auth_service.get_current_principal)
 ):
     """
     Принимает обратную связь от пользователя и отправляет её на почту отдела маркетинга.
@@ -800,7 +801,7 @@ async def submit_feedback(
 async def submit_proposal(
     feedback: FeedbackProposalsScheema,
     background_tasks: BackgroundTasks,
-    current_user: User = Depends(auth_service.get_current_user)
+    current_user: Principal = Depends(auth_service.get_current_principal)
 ):
     """
     Принимает предложение от пользователя и отправляет её на почту отдела маркетинга.
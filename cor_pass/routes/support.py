@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, status, BackgroundTasks
 from cor_pass.services.auth import auth_service
 
 from cor_pass.services.email import send_report_email
-from cor_pass.database.models import User
+from cor_pass.services.principal_cache import Principal
 
 from loguru import logger
 from cor_pass.schemas import (
@@ -23,7 +23,7 @@ router = APIRouter(prefix="/support", tags=["Support"])
 async def send_report(
     report: SupportReportScheema,
     background_tasks: BackgroundTasks,
-    current_user: User = Depends(auth_service.get_current_user)
+    current_user: Principal = Depends(auth_service.get_current_principal)
 ):
     """
     Принимает сообщение об ошибке от пользователя и отправляет её на почту отдела поддержки.
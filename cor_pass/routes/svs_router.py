@@ -1,128 +1,178 @@
+import asyncio
 import errno
 import re
-from fastapi import APIRouter, Depends, Query, HTTPException
-from fastapi.responses import StreamingResponse
+import struct
+import uuid
+from typing import AsyncIterator, List, Literal, Optional
+from fastapi import (
+    APIRouter,
+    Depends,
+    Query,
+    HTTPException,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from pydantic import ValidationError
+from fastapi.responses import Response, StreamingResponse
 import os
 import logging
 from openslide import OpenSlide
 from io import BytesIO
-from cor_pass.repository.glass import fetch_file_from_smb, get_glass_svs
-from cor_pass.routes.dicom_router import load_volume
+from cor_pass.services.access import doctor_access, lab_assistant_or_doctor_access
 from cor_pass.services.auth import auth_service
-from cor_pass.database.models import User
+from cor_pass.services.principal_cache import Principal
+from cor_pass.services.role_cache import get_db_roles
+from cor_pass.schemas import TileAddress, TileBatchRequest
 from PIL import Image
+import tifffile
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 from cor_pass.database.db import get_db
-import shutil
 from openslide import OpenSlide, OpenSlideUnsupportedFormatError
 
-from cor_pass.services.safe_delete_smb import DICOM_DIR, safe_delete_dir
+from cor_pass.services.slide_pool import (
+    DEEPZOOM_DEFAULT_QUALITY,
+    DEEPZOOM_OVERLAP,
+    DEEPZOOM_TILE_SIZE,
+    encode_tile,
+    find_slide_file,
+    slide_pool,
+)
+from cor_pass.services.remote_slide import associated_image, native_tile
+from cor_pass.services.slide_store import slide_store
+from cor_pass.services.tile_cache import (
+    etag_matches,
+    tile_cache,
+    tile_cache_key,
+    tile_etag,
+)
+from cor_pass.services.tile_executor import (
+    iter_completed,
+    run_slide_job,
+    tile_executor,
+    viewport_owner,
+)
+from cor_pass.services.tile_pyramid import tile_pyramid
 
 router = APIRouter(prefix="/svs", tags=["SVS"])
 
 # SVS_ROOT_DIR = "svs_users_data"
 # os.makedirs(SVS_ROOT_DIR, exist_ok=True)
 DICOM_ROOT_DIR = "dicom_users_data"
+# Файл в user_slide_dir с glass_id текущего слайда пользователя: сам слайд
+# остаётся в общем кэше slide_store и учитывается в его бюджете
+USER_GLASS_POINTER = ".glass_id"
+# Роли, которым доступны слайды стёкол
+SLIDE_VIEWER_ROLES = ("lab_assistant", "doctor")
 
 
-@router.get("/svs_metadata")
-def get_svs_metadata(current_user: User = Depends(auth_service.get_current_user)):
+async def _find_user_slide(current_user: Principal, db: AsyncSession) -> Optional[str]:
+    """
+    Путь к текущему слайду пользователя или None: слайд стекла из общего кэша,
+    выбранный через /svs/{glass_id}/svs, иначе SVS-файл в user_slide_dir.
+    """
     user_slide_dir = os.path.join(DICOM_ROOT_DIR, str(current_user.cor_id), "slides")
-    svs_files = [f for f in os.listdir(user_slide_dir) if f.lower().endswith(".svs")]
+    try:
+        with open(os.path.join(user_slide_dir, USER_GLASS_POINTER)) as f:
+            glass_id = f.read().strip()
+    except FileNotFoundError:
+        return find_slide_file(user_slide_dir)
+    return await slide_store.resolve_glass(db, glass_id)
 
-    if not svs_files:
-        raise HTTPException(status_code=404, detail="No SVS files found.")
 
-    svs_path = os.path.join(user_slide_dir, svs_files[0])
+@router.get("/svs_metadata")
+async def get_svs_metadata(
+    request: Request,
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    svs_path = await _find_user_slide(current_user, db)
 
-    try:
-        slide = OpenSlide(svs_path)
-
-        tile_size = 256  # размер тайла, подставь свой, если другой
-
-        # Основные метаданные
-        metadata = {
-            "filename": svs_files[0],
-            "dimensions": {
-                "width": slide.dimensions[0],
-                "height": slide.dimensions[1],
-                "levels": slide.level_count,
-            },
-            "basic_info": {
-                "mpp": float(slide.properties.get("aperio.MPP", 0)),
-                "magnification": slide.properties.get("aperio.AppMag", "N/A"),
-                "scan_date": slide.properties.get("aperio.Time", "N/A"),
-                "scanner": slide.properties.get("aperio.User", "N/A"),
-                "vendor": slide.properties.get("openslide.vendor", "N/A"),
-            },
-            "levels": [],
-            "full_properties": {},
-        }
-
-        # Информация о уровнях + количество тайлов на уровне
-        for level in range(slide.level_count):
-            width, height = slide.level_dimensions[level]
-            tiles_x = (width + tile_size - 1) // tile_size
-            tiles_y = (height + tile_size - 1) // tile_size
-
-            metadata["levels"].append(
-                {
-                    "downsample": float(
-                        slide.properties.get(f"openslide.level[{level}].downsample", 0)
-                    ),
-                    # Размеры берём из slide.level_dimensions, а не из свойств, т.к. они надежнее
-                    "width": width,
-                    "height": height,
-                    "tiles_x": tiles_x,
-                    "tiles_y": tiles_y,
-                    "total_tiles": tiles_x * tiles_y,
-                }
-            )
+    if svs_path is None:
+        raise HTTPException(status_code=404, detail="No SVS files found.")
 
-        # Все свойства для детального просмотра
-        metadata["full_properties"] = dict(slide.properties)
+    return await run_slide_job(request, _load_metadata, svs_path)
 
-        return metadata
+
+def _load_metadata(svs_path: str) -> dict:
+    try:
+        with slide_pool.acquire(svs_path) as slide:
+            return _slide_metadata(slide, os.path.basename(svs_path))
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _slide_metadata(slide: OpenSlide, filename: str) -> dict:
+    tile_size = 256  # размер тайла, подставь свой, если другой
+
+    # Основные метаданные
+    metadata = {
+        "filename": filename,
+        "dimensions": {
+            "width": slide.dimensions[0],
+            "height": slide.dimensions[1],
+            "levels": slide.level_count,
+        },
+        "basic_info": {
+            "mpp": float(slide.properties.get("aperio.MPP", 0)),
+            "magnification": slide.properties.get("aperio.AppMag", "N/A"),
+            "scan_date": slide.properties.get("aperio.Time", "N/A"),
+            "scanner": slide.properties.get("aperio.User", "N/A"),
+            "vendor": slide.properties.get("openslide.vendor", "N/A"),
+        },
+        "levels": [],
+        "full_properties": {},
+    }
+
+    # Информация о уровнях + количество тайлов на уровне
+    for level in range(slide.level_count):
+        width, height = slide.level_dimensions[level]
+        tiles_x = (width + tile_size - 1) // tile_size
+        tiles_y = (height + tile_size - 1) // tile_size
+
+        metadata["levels"].append(
+            {
+                "downsample": float(
+                    slide.properties.get(f"openslide.level[{level}].downsample", 0)
+                ),
+                # Размеры берём из slide.level_dimensions, а не из свойств, т.к. они надежнее
+                "width": width,
+                "height": height,
+                "tiles_x": tiles_x,
+                "tiles_y": tiles_y,
+                "total_tiles": tiles_x * tiles_y,
+            }
+        )
+
+    # Все свойства для детального просмотра
+    metadata["full_properties"] = dict(slide.properties)
+
+    return metadata
+
+
 @router.get("/preview_svs")
-def preview_svs(
+async def preview_svs(
+    request: Request,
     full: bool = Query(False),
     level: int = Query(0),  # Добавляем параметр уровня
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    user_slide_dir = os.path.join(DICOM_ROOT_DIR, str(current_user.cor_id), "slides")
-    svs_files = [f for f in os.listdir(user_slide_dir) if f.lower().endswith(".svs")]
+    svs_path = await _find_user_slide(current_user, db)
 
-    if not svs_files:
+    if svs_path is None:
         raise HTTPException(status_code=404, detail="No SVS found.")
 
-    svs_path = os.path.join(user_slide_dir, svs_files[0])
-
-    try:
-        slide = OpenSlide(svs_path)
-
-        if full:
-            # Полное изображение в выбранном разрешении
-            level = min(
-                level, slide.level_count - 1
-            )  # Проверяем, чтобы уровень был допустимым
-            size = slide.level_dimensions[level]
+    return await run_slide_job(request, _load_preview, svs_path, full, level)
 
-            # Читаем регион целиком
-            img = slide.read_region((0, 0), level, size)
 
-            # Конвертируем в RGB, если нужно
-            if img.mode == "RGBA":
-                img = img.convert("RGB")
-        else:
-            # Миниатюра
-            size = (300, 300)
-            img = slide.get_thumbnail(size)
+def _load_preview(svs_path: str, full: bool, level: int) -> StreamingResponse:
+    try:
+        with slide_pool.acquire(svs_path) as slide:
+            img = _render_preview(slide, full, level)
 
         buf = BytesIO()
         img.save(buf, format="PNG")
@@ -132,68 +182,841 @@ def preview_svs(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _render_preview(slide: OpenSlide, full: bool, level: int) -> Image.Image:
+    if full:
+        # Полное изображение в выбранном разрешении
+        level = min(
+            level, slide.level_count - 1
+        )  # Проверяем, чтобы уровень был допустимым
+        size = slide.level_dimensions[level]
+
+        # Читаем регион целиком
+        img = slide.read_region((0, 0), level, size)
+
+        # Конвертируем в RGB, если нужно
+        if img.mode == "RGBA":
+            img = img.convert("RGB")
+    else:
+        # Миниатюра
+        size = (300, 300)
+        img = slide.get_thumbnail(size)
+    return img
+
+
 @router.get("/tile")
-def get_tile(
+async def get_tile(
+    request: Request,
     level: int = Query(..., description="Zoom level"),
     x: int = Query(..., description="Tile X index"),
     y: int = Query(..., description="Tile Y index"),
     tile_size: int = Query(256, description="Tile size in pixels"),
-    current_user: User = Depends(auth_service.get_current_user),
+    gen: Optional[int] = Query(None, description="Viewport generation"),
+    viewport_level: Optional[int] = Query(
+        None, description="Zoom level currently displayed by the viewer"
+    ),
+    viewer: Optional[str] = Query(
+        None, max_length=64, description="Viewer session id, one per browser tab"
+    ),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
 ):
-    try:
-        user_slide_dir = os.path.join(
-            DICOM_ROOT_DIR, str(current_user.cor_id), "slides"
-        )
-        svs_files = [
-            f for f in os.listdir(user_slide_dir) if f.lower().endswith(".svs")
-        ]
+    svs_path = await _find_user_slide(current_user, db)
+
+    if svs_path is None:
+        logger.warning(f"[NO SVS] User {current_user.cor_id} has no SVS files")
+        return empty_tile()
 
-        if not svs_files:
-            logger.warning(f"[NO SVS] User {current_user.cor_id} has no SVS files")
-            raise HTTPException(status_code=404, detail="No SVS files found.")
+    return await run_slide_job(
+        request,
+        _load_legacy_tile,
+        request,
+        svs_path,
+        level,
+        x,
+        y,
+        tile_size,
+        owner=viewport_owner(current_user.id, svs_path, viewer),
+        level=level,
+        generation=gen,
+        viewport_level=viewport_level,
+    )
 
-        svs_path = os.path.join(user_slide_dir, svs_files[0])
-        slide = OpenSlide(svs_path)
 
-        if level < 0 or level >= slide.level_count:
-            logger.warning(
-                f"[INVALID LEVEL] level={level}, max={slide.level_count - 1}"
+def _load_legacy_tile(
+    request: Request, svs_path: str, level: int, x: int, y: int, tile_size: int
+) -> Response:
+    try:
+        def render() -> bytes:
+            with slide_pool.acquire(svs_path) as slide:
+                region = _read_tile_region(slide, level, x, y, tile_size)
+            if region is None:
+                raise _TileOutOfRange()
+            region = region.resize((tile_size, tile_size), Image.LANCZOS)
+            buf = BytesIO()
+            region.save(buf, format="JPEG")
+            return buf.getvalue()
+
+        try:
+            return _tile_response(
+                request,
+                key=tile_cache_key(
+                    slide_pool.content_hash(svs_path),
+                    level,
+                    x,
+                    y,
+                    f"legacy-jpeg-{tile_size}",
+                    0,
+                ),
+                render=render,
+                media_type="image/jpeg",
+                cache_control=REVALIDATE_CACHE_CONTROL,
             )
+        except _TileOutOfRange:
             return empty_tile()
 
-        level_width, level_height = slide.level_dimensions[level]
-        tiles_x = (level_width + tile_size - 1) // tile_size
-        tiles_y = (level_height + tile_size - 1) // tile_size
+    except Exception as e:
+        import traceback
+
+        logger.error(f"[ERROR GET TILE] {traceback.format_exc()}")
+        return empty_tile()
+
+
+class _TileOutOfRange(Exception):
+    pass
+
+
+def _read_tile_region(
+    slide: OpenSlide, level: int, x: int, y: int, tile_size: int
+) -> Optional[Image.Image]:
+    """Читает регион тайла; None, если уровень или индексы вне диапазона."""
+    if level < 0 or level >= slide.level_count:
+        logger.warning(
+            f"[INVALID LEVEL] level={level}, max={slide.level_count - 1}"
+        )
+        return None
+
+    level_width, level_height = slide.level_dimensions[level]
+    tiles_x = (level_width + tile_size - 1) // tile_size
+    tiles_y = (level_height + tile_size - 1) // tile_size
+
+    if x < 0 or x >= tiles_x or y < 0 or y >= tiles_y:
+        logger.warning(
+            f"[OUT OF BOUNDS] level={level}, x={x}, y={y}, tiles_x={tiles_x}, tiles_y={tiles_y}"
+        )
+        return None
+
+    # Пересчёт координат тайла из текущего уровня в координаты уровня 0
+    scale = slide.level_downsamples[level]
+    location = (int(x * tile_size * scale), int(y * tile_size * scale))
+
+    # Фактический размер региона (в пикселях уровня level)
+    region_width = min(tile_size, level_width - x * tile_size)
+    region_height = min(tile_size, level_height - y * tile_size)
 
-        if x < 0 or x >= tiles_x or y < 0 or y >= tiles_y:
-            logger.warning(
-                f"[OUT OF BOUNDS] level={level}, x={x}, y={y}, tiles_x={tiles_x}, tiles_y={tiles_y}"
+    return slide.read_region(
+        location, level, (region_width, region_height)
+    ).convert("RGB")
+
+
+_DEEPZOOM_MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+# Расширение в адресе тайла -> формат
+_TILE_EXTENSION_FORMATS = {"jpeg": "jpeg", "jpg": "jpeg", "webp": "webp"}
+
+# Адрес содержит хэш слайда, поэтому ответ не меняется. private — данные пациента
+# доступны только по токену и не должны храниться в общих прокси.
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# Адрес без хэша слайда: браузер кэширует, но перепроверяет по ETag
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+async def _user_slide_path(current_user: Principal, db: AsyncSession) -> str:
+    svs_path = await _find_user_slide(current_user, db)
+    if svs_path is None:
+        raise HTTPException(status_code=404, detail="No SVS files found.")
+    return svs_path
+
+
+def _negotiate_tile_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """Формат тайла: явно запрошенный, иначе WebP, если клиент его принимает."""
+    if requested:
+        return requested
+    if accept and "image/webp" in accept:
+        return "webp"
+    return "jpeg"
+
+
+def _tile_response(
+    request: Request,
+    key: str,
+    render,
+    media_type: str,
+    cache_control: str,
+) -> Response:
+    """
+    Ответ с тайлом из кэша (render() вызывается только при промахе).
+    При совпадении If-None-Match возвращает 304 без чтения кэша.
+    """
+    etag = tile_etag(key)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    content = _cached_tile(key, render)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+def _cached_tile(key: str, render) -> bytes:
+    content = tile_cache.get(key)
+    if content is None:
+        content = render()
+        tile_cache.put(key, content)
+    return content
+
+
+def _ensure_current_slide(svs_path: str, slide_hash: str) -> None:
+    if slide_pool.content_hash(svs_path) != slide_hash:
+        # Слайд заменён: клиент должен заново получить дескриптор
+        raise HTTPException(status_code=404, detail="Slide has been replaced")
+
+
+@router.get("/deepzoom")
+async def get_deepzoom_info(
+    request: Request,
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Хэш содержимого текущего слайда и адрес DZI-дескриптора. Адреса дескриптора
+    и тайлов содержат хэш, поэтому ответы по ним неизменяемы и кэшируются надолго.
+    """
+    svs_path = await _user_slide_path(current_user, db)
+    slide_hash = await run_slide_job(request, slide_pool.content_hash, svs_path)
+    return {
+        "content_hash": slide_hash,
+        "dzi_url": f"{router.prefix}/deepzoom/{slide_hash}.dzi",
+    }
+
+
+@router.get("/deepzoom/{slide_hash}.dzi")
+async def get_deepzoom_descriptor(
+    request: Request,
+    slide_hash: str,
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+    format: Literal["jpeg", "webp"] = Query("jpeg", description="Tile format"),
+):
+    """
+    DZI-дескриптор слайда (для OpenSeadragon и совместимых просмотрщиков):
+    размер изображения, размер тайла и перекрытие. Число уровней и сетка
+    тайлов каждого уровня однозначно выводятся из этих значений.
+    """
+    svs_path = await _user_slide_path(current_user, db)
+    return await run_slide_job(
+        request, _load_deepzoom_descriptor, svs_path, slide_hash, format
+    )
+
+
+def _load_deepzoom_descriptor(svs_path: str, slide_hash: str, format: str) -> Response:
+    _ensure_current_slide(svs_path, slide_hash)
+    with slide_pool.acquire_deepzoom(
+        svs_path, DEEPZOOM_TILE_SIZE, DEEPZOOM_OVERLAP
+    ) as dz:
+        return Response(
+            content=dz.get_dzi(format),
+            media_type="application/xml",
+            headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL},
+        )
+
+
+@router.get("/deepzoom/{slide_hash}_files/{level}/{col}_{row}.{ext}")
+async def get_deepzoom_tile(
+    request: Request,
+    slide_hash: str,
+    level: int,
+    col: int,
+    row: int,
+    ext: Literal["jpeg", "jpg", "webp"],
+    quality: int = Query(DEEPZOOM_DEFAULT_QUALITY, ge=1, le=100),
+    gen: Optional[int] = Query(None, description="Viewport generation"),
+    viewport_level: Optional[int] = Query(
+        None, description="Zoom level currently displayed by the viewer"
+    ),
+    viewer: Optional[str] = Query(
+        None, max_length=64, description="Viewer session id, one per browser tab"
+    ),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Тайл DeepZoom-пирамиды. Уровни и сетка тайлов соответствуют дескриптору
+    /svs/deepzoom/{slide_hash}.dzi, формат задаётся расширением (как в адресах,
+    которые строят DZI-клиенты по полю Format дескриптора). Граничные тайлы
+    возвращаются в фактическом размере, без растягивания до полного тайла.
+    """
+    svs_path = await _user_slide_path(current_user, db)
+    fmt = _TILE_EXTENSION_FORMATS[ext]
+    return await run_slide_job(
+        request,
+        _load_deepzoom_tile,
+        request,
+        svs_path,
+        slide_hash,
+        level,
+        col,
+        row,
+        fmt,
+        quality,
+        owner=viewport_owner(current_user.id, slide_hash, viewer),
+        level=level,
+        generation=gen,
+        viewport_level=viewport_level,
+    )
+
+
+def _load_deepzoom_tile(
+    request: Request,
+    svs_path: str,
+    slide_hash: str,
+    level: int,
+    col: int,
+    row: int,
+    fmt: str,
+    quality: int,
+) -> Response:
+    _ensure_current_slide(svs_path, slide_hash)
+    return _tile_response(
+        request,
+        key=tile_cache_key(slide_hash, level, col, row, fmt, quality),
+        render=lambda: _render_deepzoom_tile(
+            svs_path, slide_hash, level, col, row, fmt, quality
+        ),
+        media_type=_DEEPZOOM_MEDIA_TYPES[fmt],
+        cache_control=IMMUTABLE_CACHE_CONTROL,
+    )
+
+
+def _render_deepzoom_tile(
+    svs_path: str,
+    slide_hash: str,
+    level: int,
+    col: int,
+    row: int,
+    fmt: str,
+    quality: int,
+) -> bytes:
+    content = tile_pyramid.get(slide_hash, level, col, row, fmt, quality)
+    if content is not None:
+        return content
+    with slide_pool.acquire_deepzoom(
+        svs_path, DEEPZOOM_TILE_SIZE, DEEPZOOM_OVERLAP
+    ) as dz:
+        if not 0 <= level < dz.level_count:
+            raise HTTPException(status_code=404, detail="Invalid level")
+        cols, rows = dz.level_tiles[level]
+        if not (0 <= col < cols and 0 <= row < rows):
+            raise HTTPException(status_code=404, detail="Invalid tile address")
+        tile = dz.get_tile(level, (col, row))
+    return encode_tile(tile, fmt, quality)
+
+
+def _load_deepzoom_tile_bytes(
+    svs_path: str,
+    slide_hash: str,
+    level: int,
+    col: int,
+    row: int,
+    fmt: str,
+    quality: int,
+) -> bytes:
+    _ensure_current_slide(svs_path, slide_hash)
+    return _cached_tile(
+        tile_cache_key(slide_hash, level, col, row, fmt, quality),
+        lambda: _render_deepzoom_tile(
+            svs_path, slide_hash, level, col, row, fmt, quality
+        ),
+    )
+
+
+# Кадр пакетного ответа: статус (uint16), level, col, row, длина данных (uint32),
+# затем данные тайла. Статус 200 — тайл, 404 — неверный адрес, 409 — вытеснен
+# новой генерацией вьюпорта, 500 — ошибка рендеринга (данные пустые).
+TILE_FRAME_HEADER = struct.Struct(">HIIII")
+TILE_FRAMES_MEDIA_TYPE = "application/vnd.cor.tile-frames"
+
+
+def _tile_frame(status_code: int, tile: TileAddress, content: bytes = b"") -> bytes:
+    return (
+        TILE_FRAME_HEADER.pack(
+            status_code, tile.level, tile.col, tile.row, len(content)
+        )
+        + content
+    )
+
+
+def _submit_tile_batch(
+    owner: str,
+    svs_path: str,
+    slide_hash: str,
+    body: TileBatchRequest,
+    fmt: str,
+):
+    return tile_executor.submit_batch(
+        [
+            (
+                _load_deepzoom_tile_bytes,
+                (svs_path, slide_hash, tile.level, tile.col, tile.row, fmt, body.quality),
+                tile.level,
             )
-            return empty_tile()
+            for tile in body.tiles
+        ],
+        owner=owner,
+        generation=body.gen,
+        viewport_level=body.viewport_level,
+    )
 
-        # Пересчёт координат тайла из текущего уровня в координаты уровня 0
-        scale = slide.level_downsamples[level]
-        location = (int(x * tile_size * scale), int(y * tile_size * scale))
 
-        # Фактический размер региона (в пикселях уровня level)
-        region_width = min(tile_size, level_width - x * tile_size)
-        region_height = min(tile_size, level_height - y * tile_size)
+async def _iter_tile_frames(jobs, tiles: List[TileAddress]) -> AsyncIterator[bytes]:
+    """Кадры тайлов в порядке готовности."""
+    index = {id(job): tile for job, tile in zip(jobs, tiles)}
+    async for job in iter_completed(jobs):
+        tile = index[id(job)]
+        if job.future.cancelled():
+            yield _tile_frame(409, tile)
+            continue
+        error = job.future.exception()
+        if error is None:
+            yield _tile_frame(200, tile, job.future.result())
+        elif isinstance(error, HTTPException):
+            yield _tile_frame(error.status_code, tile)
+        else:
+            logger.error(f"[ERROR GET TILE] {tile}: {error!r}")
+            yield _tile_frame(500, tile)
 
-        region = slide.read_region(
-            location, level, (region_width, region_height)
-        ).convert("RGB")
-        region = region.resize((tile_size, tile_size), Image.LANCZOS)
 
-        buf = BytesIO()
-        region.save(buf, format="JPEG")
-        buf.seek(0)
-        return StreamingResponse(buf, media_type="image/jpeg")
+@router.post("/deepzoom/{slide_hash}/tiles")
+async def get_deepzoom_tiles_batch(
+    request: Request,
+    slide_hash: str,
+    body: TileBatchRequest,
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Несколько тайлов DeepZoom-пирамиды одним запросом. Тайлы рендерятся
+    параллельно и отправляются по мере готовности в виде кадров
+    TILE_FRAME_HEADER + данные (application/vnd.cor.tile-frames).
+    """
+    svs_path = await _user_slide_path(current_user, db)
+    fmt = _negotiate_tile_format(body.format, request.headers.get("accept"))
+    owner = viewport_owner(current_user.id, slide_hash, body.viewer)
+    jobs = _submit_tile_batch(owner, svs_path, slide_hash, body, fmt)
+    return StreamingResponse(
+        _iter_tile_frames(jobs, body.tiles),
+        media_type=TILE_FRAMES_MEDIA_TYPE,
+        headers={"X-Tile-Format": fmt},
+    )
 
+
+@router.websocket("/deepzoom/{slide_hash}/ws/{token}")
+async def deepzoom_tiles_websocket(
+    websocket: WebSocket,
+    slide_hash: str,
+    token: str,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    WebSocket для непрерывного панорамирования.\n
+    Клиент присылает TileBatchRequest в JSON для каждого нового вьюпорта
+    (с увеличивающимся gen); сервер отвечает бинарными кадрами тайлов в том же
+    формате, что и POST /svs/deepzoom/{slide_hash}/tiles. Новый вьюпорт
+    отменяет ещё не отрисованные тайлы предыдущего.
+    """
+    try:
+        current_user = await auth_service.get_current_principal(token, db)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid token")
+        return
+    try:
+        svs_path = await _find_user_slide(current_user, db)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+    # Соединение с БД на всё время жизни сокета не нужно
+    await db.close()
+    if svs_path is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="No SVS files found")
+        return
+    await _serve_tiles_websocket(websocket, current_user, svs_path, slide_hash)
+
+
+async def _serve_tiles_websocket(
+    websocket: WebSocket, current_user: Principal, svs_path: str, slide_hash: str
+) -> None:
+    await websocket.accept()
+    # Соединение — отдельная сессия просмотрщика, если клиент не указал свою
+    connection_viewer = uuid.uuid4().hex
+    send_lock = asyncio.Lock()
+    batch_task: Optional[asyncio.Task] = None
+
+    async def send_batch(jobs, tiles: List[TileAddress]) -> None:
+        frames = _iter_tile_frames(jobs, tiles)
+        try:
+            async for frame in frames:
+                async with send_lock:
+                    await websocket.send_bytes(frame)
+        finally:
+            await frames.aclose()
+
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                body = TileBatchRequest.model_validate_json(message)
+            except ValidationError as e:
+                await websocket.send_json(
+                    {
+                        "error": "invalid_request",
+                        "detail": e.errors(include_url=False, include_context=False),
+                    }
+                )
+                continue
+            fmt = body.format or "jpeg"
+            try:
+                owner = viewport_owner(
+                    current_user.id, slide_hash, body.viewer or connection_viewer
+                )
+                jobs = _submit_tile_batch(owner, svs_path, slide_hash, body, fmt)
+            except HTTPException as e:
+                await websocket.send_json(
+                    {"error": "rejected", "status": e.status_code, "gen": body.gen}
+                )
+                continue
+            if batch_task is not None and not batch_task.done():
+                batch_task.cancel()
+            batch_task = asyncio.create_task(send_batch(jobs, body.tiles))
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
-        import traceback
+        logger.error(f"Error in deepzoom tiles websocket: {e}")
+    finally:
+        if batch_task is not None and not batch_task.done():
+            batch_task.cancel()
 
-        logger.error(f"[ERROR GET TILE] {traceback.format_exc()}")
-        return empty_tile()
+
+# --- Слайды, адресуемые по glass_id (общий локальный кэш слайдов) ---
+
+
+def _glass_prefix(glass_id: str) -> str:
+    return f"{router.prefix}/glass/{glass_id}"
+
+
+@router.get(
+    "/glass/{glass_id}/metadata",
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+)
+async def get_glass_slide_metadata(
+    request: Request,
+    glass_id: str,
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    svs_path = await slide_store.resolve_glass(db, glass_id)
+    return await run_slide_job(request, _load_metadata, svs_path)
+
+
+@router.get(
+    "/glass/{glass_id}/preview",
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+)
+async def get_glass_slide_preview(
+    request: Request,
+    glass_id: str,
+    full: bool = Query(False),
+    level: int = Query(0),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    svs_path = await slide_store.resolve_glass(db, glass_id)
+    return await run_slide_job(request, _load_preview, svs_path, full, level)
+
+
+@router.get(
+    "/glass/{glass_id}/tile",
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+)
+async def get_glass_slide_tile(
+    request: Request,
+    glass_id: str,
+    level: int = Query(..., description="Zoom level"),
+    x: int = Query(..., description="Tile X index"),
+    y: int = Query(..., description="Tile Y index"),
+    tile_size: int = Query(256, description="Tile size in pixels"),
+    gen: Optional[int] = Query(None, description="Viewport generation"),
+    viewport_level: Optional[int] = Query(
+        None, description="Zoom level currently displayed by the viewer"
+    ),
+    viewer: Optional[str] = Query(
+        None, max_length=64, description="Viewer session id, one per browser tab"
+    ),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    svs_path = await slide_store.resolve_glass(db, glass_id)
+    return await run_slide_job(
+        request,
+        _load_legacy_tile,
+        request,
+        svs_path,
+        level,
+        x,
+        y,
+        tile_size,
+        owner=viewport_owner(current_user.id, glass_id, viewer),
+        level=level,
+        generation=gen,
+        viewport_level=viewport_level,
+    )
+
+
+@router.get(
+    "/glass/{glass_id}/deepzoom",
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+)
+async def get_glass_deepzoom_info(
+    request: Request,
+    glass_id: str,
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """Хэш содержимого слайда стекла и адрес его DZI-дескриптора."""
+    svs_path = await slide_store.resolve_glass(db, glass_id)
+    slide_hash = await run_slide_job(request, slide_pool.content_hash, svs_path)
+    return {
+        "content_hash": slide_hash,
+        "dzi_url": f"{_glass_prefix(glass_id)}/deepzoom/{slide_hash}.dzi",
+    }
+
+
+@router.get(
+    "/glass/{glass_id}/deepzoom/{slide_hash}.dzi",
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+)
+async def get_glass_deepzoom_descriptor(
+    request: Request,
+    glass_id: str,
+    slide_hash: str,
+    format: Literal["jpeg", "webp"] = Query("jpeg", description="Tile format"),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    svs_path = await slide_store.resolve_glass(db, glass_id)
+    return await run_slide_job(
+        request, _load_deepzoom_descriptor, svs_path, slide_hash, format
+    )
+
+
+@router.get(
+    "/glass/{glass_id}/deepzoom/{slide_hash}_files/{level}/{col}_{row}.{ext}",
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+)
+async def get_glass_deepzoom_tile(
+    request: Request,
+    glass_id: str,
+    slide_hash: str,
+    level: int,
+    col: int,
+    row: int,
+    ext: Literal["jpeg", "jpg", "webp"],
+    quality: int = Query(DEEPZOOM_DEFAULT_QUALITY, ge=1, le=100),
+    gen: Optional[int] = Query(None, description="Viewport generation"),
+    viewport_level: Optional[int] = Query(
+        None, description="Zoom level currently displayed by the viewer"
+    ),
+    viewer: Optional[str] = Query(
+        None, max_length=64, description="Viewer session id, one per browser tab"
+    ),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    svs_path = await slide_store.resolve_glass(db, glass_id)
+    fmt = _TILE_EXTENSION_FORMATS[ext]
+    return await run_slide_job(
+        request,
+        _load_deepzoom_tile,
+        request,
+        svs_path,
+        slide_hash,
+        level,
+        col,
+        row,
+        fmt,
+        quality,
+        owner=viewport_owner(current_user.id, slide_hash, viewer),
+        level=level,
+        generation=gen,
+        viewport_level=viewport_level,
+    )
+
+
+@router.post(
+    "/glass/{glass_id}/deepzoom/{slide_hash}/tiles",
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+)
+async def get_glass_deepzoom_tiles_batch(
+    request: Request,
+    glass_id: str,
+    slide_hash: str,
+    body: TileBatchRequest,
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    svs_path = await slide_store.resolve_glass(db, glass_id)
+    fmt = _negotiate_tile_format(body.format, request.headers.get("accept"))
+    owner = viewport_owner(current_user.id, slide_hash, body.viewer)
+    jobs = _submit_tile_batch(owner, svs_path, slide_hash, body, fmt)
+    return StreamingResponse(
+        _iter_tile_frames(jobs, body.tiles),
+        media_type=TILE_FRAMES_MEDIA_TYPE,
+        headers={"X-Tile-Format": fmt},
+    )
+
+
+@router.websocket("/glass/{glass_id}/deepzoom/{slide_hash}/ws/{token}")
+async def glass_deepzoom_tiles_websocket(
+    websocket: WebSocket,
+    glass_id: str,
+    slide_hash: str,
+    token: str,
+    db: AsyncSession = Depends(get_db),
+):
+    try:
+        current_user = await auth_service.get_current_principal(token, db)
+        roles = await get_db_roles(db=db, cor_id=current_user.cor_id)
+        if not any(role in roles for role in SLIDE_VIEWER_ROLES):
+            # Как lab_assistant_or_doctor_access, которую нельзя подключить к сокету
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden operation"
+            )
+        svs_path = await slide_store.resolve_glass(db, glass_id)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+    # Соединение с БД на всё время жизни сокета не нужно
+    await db.close()
+    await _serve_tiles_websocket(websocket, current_user, svs_path, slide_hash)
+
+
+# Этикетка (и снимок стекла целиком вместе с ней) содержит данные пациента
+PATIENT_LABEL_IMAGES = ("label", "macro")
+
+
+# Изображения, читаемые через tifffile прямо из SMB (по диапазонам), пока слайд
+# загружается в локальный кэш: так миниатюра и первые тайлы доступны сразу.
+
+
+@router.get(
+    "/glass/{glass_id}/associated/{name}",
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+)
+async def get_glass_associated_image(
+    request: Request,
+    glass_id: str,
+    name: Literal["thumbnail", "label", "macro"],
+    max_size: int = Query(512, ge=1, le=4096),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Вложенное изображение слайда. Миниатюра доступна лаборанту и доктору,
+    этикетка и macro — только доктору.
+    """
+    if name in PATIENT_LABEL_IMAGES:
+        await doctor_access(request, current_user, db)
+    scan_url = await slide_store.glass_scan_url(db, glass_id)
+    key = tile_cache_key(f"{scan_url}|{name}", -1, max_size, max_size, "jpeg", 90)
+    return await run_slide_job(
+        request,
+        _load_associated_image,
+        request,
+        slide_store.source_opener(scan_url),
+        key,
+        name,
+        max_size,
+    )
+
+
+def _load_associated_image(
+    request: Request, open_source, key: str, name: str, max_size: int
+) -> Response:
+    def render() -> bytes:
+        with open_source() as source, tifffile.TiffFile(source) as tif:
+            image = associated_image(tif, name)
+        if image is None:
+            raise HTTPException(status_code=404, detail=f"Slide has no {name} image")
+        image.thumbnail((max_size, max_size))
+        return encode_tile(image, "jpeg", 90)
+
+    return _tile_response(
+        request, key, render, "image/jpeg", REVALIDATE_CACHE_CONTROL
+    )
+
+
+@router.get(
+    "/glass/{glass_id}/native_tile/{level}/{x}_{y}",
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+)
+async def get_glass_native_tile(
+    request: Request,
+    glass_id: str,
+    level: int,
+    x: int,
+    y: int,
+    quality: int = Query(DEEPZOOM_DEFAULT_QUALITY, ge=1, le=100),
+    gen: Optional[int] = Query(None, description="Viewport generation"),
+    viewport_level: Optional[int] = Query(
+        None, description="Zoom level currently displayed by the viewer"
+    ),
+    viewer: Optional[str] = Query(
+        None, max_length=64, description="Viewer session id, one per browser tab"
+    ),
+    current_user: Principal = Depends(auth_service.get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Тайл в родной сетке TIFF (level 0 — самый подробный уровень). Размер тайла
+    и число уровней — в metadata слайда после загрузки либо в TIFF-тегах.
+    """
+    scan_url = await slide_store.glass_scan_url(db, glass_id)
+    key = tile_cache_key(f"{scan_url}|native", level, x, y, "jpeg", quality)
+    return await run_slide_job(
+        request,
+        _load_native_tile,
+        request,
+        slide_store.source_opener(scan_url),
+        key,
+        level,
+        x,
+        y,
+        quality,
+        owner=viewport_owner(current_user.id, glass_id, viewer),
+        level=level,
+        generation=gen,
+        viewport_level=viewport_level,
+    )
+
+
+def _load_native_tile(
+    request: Request, open_source, key: str, level: int, x: int, y: int, quality: int
+) -> Response:
+    def render() -> bytes:
+        with open_source() as source, tifffile.TiffFile(source) as tif:
+            tile = native_tile(tif, level, x, y)
+        if tile is None:
+            raise HTTPException(status_code=404, detail="Tile out of range")
+        return encode_tile(tile, "jpeg", quality)
+
+    return _tile_response(
+        request, key, render, "image/jpeg", REVALIDATE_CACHE_CONTROL
+    )
 
 
 def empty_tile(color=(255, 255, 255)) -> StreamingResponse:
@@ -216,76 +1039,47 @@ def safe_makedirs(path):
 
 @router.get(
     "/{glass_id}/svs",
-    dependencies=[Depends(auth_service.get_current_user)],
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
 )
 async def upload_svs_from_storage(
     glass_id: str,
-    current_user: User = Depends(auth_service.get_current_user),
+    current_user: Principal = Depends(auth_service.get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
     """
-    Обрабатывает SVS-файл из хранилища по glass_id, сохраняет его в user_slide_dir.
-    Старые SVS-файлы удаляются перед перемещением нового.
+    Делает слайд стекла glass_id текущим слайдом пользователя (для маршрутов
+    без glass_id). Слайд загружается в общий локальный кэш слайдов, в
+    user_slide_dir записывается только его glass_id; старые SVS-файлы
+    пользователя удаляются.
     """
-    safe_delete_dir(DICOM_DIR)
     try:
-        db_glass = await get_glass_svs(db=db, glass_id=glass_id)
-        if db_glass is None:
-            logger.error(f"Стекло или scan_url не найдены для ID {glass_id}")
-            raise HTTPException(status_code=404, detail="Glass or scan URL not found")
+        svs_cache_path = await slide_store.resolve_glass(db, glass_id)
 
         user_dir = os.path.join(DICOM_ROOT_DIR, str(current_user.cor_id))
-        user_dicom_dir = user_dir
         user_slide_dir = os.path.join(user_dir, "slides")
-
-        os.makedirs(user_dicom_dir, exist_ok=True)
         os.makedirs(user_slide_dir, exist_ok=True)
-        logger.debug(f"Созданы директории: {user_dicom_dir}, {user_slide_dir}")
-
 
         for f in os.listdir(user_slide_dir):
             f_path = os.path.join(user_slide_dir, f)
             if os.path.isfile(f_path) and f.lower().endswith(".svs"):
                 try:
+                    slide_pool.evict(f_path)
                     os.remove(f_path)
                     logger.debug(f"Удалён старый SVS-файл: {f_path}")
                 except Exception as e:
                     logger.warning(f"Не удалось удалить файл {f_path}: {e}")
 
-        filename = os.path.basename(db_glass.scan_url)
-        file_ext = os.path.splitext(filename)[1].lower()
-        if file_ext != ".svs":
-            logger.error(f"Файл {filename} не является SVS-файлом")
-            raise HTTPException(status_code=400, detail="File is not an SVS file")
-
-
-        temp_path = await fetch_file_from_smb(db_glass.scan_url)
-        logger.debug(f"SVS-файл загружен во временный файл: {temp_path}")
-
-        try:
-            OpenSlide(temp_path)
-            target_path = os.path.join(user_slide_dir, filename)
-            shutil.move(temp_path, target_path)
-            logger.info(f"SVS-файл перемещён в: {target_path}")
-        except OpenSlideUnsupportedFormatError:
-            logger.error(f"Файл {filename} не является допустимым SVS-форматом")
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-            raise HTTPException(status_code=400, detail=f"File {filename} is not a valid SVS format")
-        except Exception as e:
-            logger.error(f"Ошибка при обработке файла {filename}: {str(e)}")
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-            raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
-
-
-        try:
-            load_volume.cache_clear()
-        except NameError:
-            logger.debug("load_volume не определён, кэш не очищается")
+        pointer_path = os.path.join(user_slide_dir, USER_GLASS_POINTER)
+        tmp_path = f"{pointer_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(glass_id)
+        os.replace(tmp_path, pointer_path)
+        logger.info(f"Слайд {svs_cache_path} выбран для пользователя {current_user.cor_id}")
 
         return {"message": f"Загружен файл SVS (1 шт.)"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка в маршруте /upload/{glass_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -65,6 +65,18 @@ class UserDb(BaseModel):
         from_attributes = True
 
 
+class ActiveUsersCountResponse(BaseModel):
+    minutes: int = Field(..., description="Окно активности в минутах")
+    count: int = Field(..., description="Количество пользователей, активных за окно")
+
+
+class ActiveUserResponse(BaseModel):
+    id: str
+    cor_id: Optional[str] = None
+    email: Optional[str] = None
+    last_active: datetime
+
+
 class ResponseUser(BaseModel):
     user: UserDb
     detail: str = "User successfully created"
@@ -760,6 +772,9 @@ class CaseOwnerResponse(BaseModel):
     middle_name: Optional[str] = Field(None, description="Отчество врача")
     last_name: Optional[str] = Field(None, description="Фамилия врача")
     is_case_owner: Optional[bool] = Field(False, description="Владелец кейса")
+    lease_expires_at: Optional[datetime] = Field(
+        None, description="Срок аренды кейса (для кейсов, взятых из очереди)"
+    )
 
 
 class GlassBase(BaseModel):
@@ -1533,6 +1548,7 @@ class PatientFinalReportPageResponse(BaseModel):
     case_owner: Optional[CaseOwnerResponse]
     report_details: Optional[FinalReportResponseSchema]
     current_signings: Optional[StatusResponse] = None
+    next_cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -1553,6 +1569,7 @@ class PatientCasesWithReferralsResponse(BaseModel):
     case_details: Optional[CaseWithOwner]
     case_owner: Optional[CaseOwnerResponse]
     first_case_direction: Optional[FirstCaseReferralDetailsWithOwner] = None
+    next_cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -1588,6 +1605,7 @@ class PatientGlassPageResponse(BaseModel):
     first_case_details_for_glass: Optional[FirstCaseGlassDetailsSchemaWithOwner] = None
     case_owner: Optional[CaseOwnerResponse]
     report_details: Optional[FinalReportResponseSchema]
+    next_cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -1653,6 +1671,7 @@ class PatientExcisionPageResponse(BaseModel):
     all_cases: List[CaseWithOwner]
     last_case_details_for_excision: Optional[LastCaseExcisionDetailsSchemaWithOwner] = None
     case_owner: Optional[CaseOwnerResponse]
+    next_cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -1778,6 +1797,7 @@ class PatientResponseForGetPatients(BaseModel):
 class GetAllPatientsResponce(BaseModel):
     patients: List[PatientResponseForGetPatients]
     total_count: int
+    next_cursor: Optional[str] = None
 
 
 class LawyerCreate(BaseModel):
@@ -1845,6 +1865,7 @@ class PatientTestReportPageResponse(BaseModel):
     case_owner: Optional[CaseOwnerResponse]
     report_details: Optional[ReportResponseSchema]
     all_glasses_for_last_case: Optional[FirstCaseTestGlassDetailsSchema] = None
+    next_cursor: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -2268,6 +2289,22 @@ class SearchCaseDetailsSimple(BaseModel):
     case_id: str
     patient_id: str
 
+
+class PatientSearchCandidate(BaseModel):
+    patient_cor_id: str = Field(..., description="COR-ID пациента")
+    surname: Optional[str] = Field(None, description="Фамилия")
+    first_name: Optional[str] = Field(None, description="Имя")
+    middle_name: Optional[str] = Field(None, description="Отчество")
+    birth_date: Optional[date] = Field(None, description="Дата рождения")
+    sex: Optional[str] = Field(None, description="Пол")
+    score: int = Field(..., description="Количество совпавших n-грамм запроса")
+
+
+class PatientDuplicateCandidate(BaseModel):
+    patient_cor_id: str = Field(..., description="COR-ID пациента")
+    birth_date: Optional[date] = Field(None, description="Дата рождения")
+    sex: Optional[str] = Field(None, description="Пол")
+
 class GeneralPrinting(BaseModel):
     printer_ip: Optional[str] = None
     number_models_id: Optional[str] = None
@@ -2648,4 +2685,26 @@ class OphthalmologicalPrescriptionReadWithSigning(BaseModel):
 
 class WSMessageBase(BaseModel):
     session_token: str
-    data: Dict[str, Any]
\ No newline at end of file
+    data: Dict[str, Any]
+
+class TileAddress(BaseModel):
+    level: int = Field(..., ge=0)
+    col: int = Field(..., ge=0)
+    row: int = Field(..., ge=0)
+
+
+class TileBatchRequest(BaseModel):
+    tiles: List[TileAddress] = Field(..., min_length=1, max_length=256)
+    format: Optional[Literal["jpeg", "webp"]] = Field(
+        None, description="Формат тайлов; по умолчанию выбирается по заголовку Accept"
+    )
+    quality: int = Field(80, ge=1, le=100)
+    gen: Optional[int] = Field(None, description="Генерация вьюпорта")
+    viewport_level: Optional[int] = Field(
+        None, description="Уровень масштаба, отображаемый просмотрщиком"
+    )
+    viewer: Optional[str] = Field(
+        None,
+        max_length=64,
+        description="Идентификатор сессии просмотрщика (вкладки); для WebSocket — соединение",
+    )
@@ -1,10 +1,11 @@
-from fastapi import Depends, HTTPException, status
-from sqlalchemy import select
+from fastapi import Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from cor_pass.database import db
-from cor_pass.database.models import Doctor, Doctor_Status, EnergyManager, Lawyer, User, LabAssistant
+from cor_pass.database.models import User
 from cor_pass.services.auth import auth_service
+from cor_pass.services.principal_cache import Principal
+from cor_pass.services.role_cache import get_db_roles
 from cor_pass.config.config import settings
 
 
@@ -12,7 +13,7 @@ class UserAccess:
     def __init__(self, active_user):
         self.active_user = active_user
 
-    async def __call__(self, user: User = Depends(auth_service.get_current_user)):
+    async def __call__(self, user: Principal = Depends(auth_service.get_current_principal)):
         if not user.is_active:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden operation"
@@ -23,7 +24,7 @@ class AdminAccess:
     def __init__(self, email):
         self.email = email
 
-    async def __call__(self, user: User = Depends(auth_service.get_current_user)):
+    async def __call__(self, user: Principal = Depends(auth_service.get_current_principal)):
         if not user.email in settings.admin_accounts:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden operation"
@@ -36,22 +37,17 @@ class LawyerAccess:
 
     async def __call__(
         self,
-        user: User = Depends(auth_service.get_current_user),
+        request: Request,
+        user: Principal = Depends(auth_service.get_current_principal),
         db: AsyncSession = Depends(db.get_db),
     ):
-        has_access = False
         if user.email in settings.admin_accounts:
-            has_access = True
+            return
         if user.email in settings.lawyer_accounts:
-            has_access = True
+            return
 
-        query = select(Lawyer).where(Lawyer.lawyer_cor_id == user.cor_id)
-        result = await db.execute(query)
-        lawyer = result.scalar_one_or_none()
-        if lawyer:
-            has_access = True
-
-        if not has_access:
+        roles = await get_db_roles(db=db, cor_id=user.cor_id, request=request)
+        if "lawyer" not in roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Недостаточно прав для выполнения этой операции.",
@@ -64,18 +60,16 @@ class DoctorAccess:
 
     async def __call__(
         self,
-        user: User = Depends(auth_service.get_current_user),
+        request: Request,
+        user: Principal = Depends(auth_service.get_current_principal),
         db: AsyncSession = Depends(db.get_db),
     ):
-        query = select(Doctor).where(Doctor.doctor_id == user.cor_id)
-        result = await db.execute(query)
-        doctor = result.scalar_one_or_none()
-        if not doctor or doctor.status != Doctor_Status.approved:
+        roles = await get_db_roles(db=db, cor_id=user.cor_id, request=request)
+        if "doctor" not in roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Doctor access required and status is not approved",
             )
-        return doctor
 
 
 class LabAssistantOrDoctorAccess:
@@ -84,22 +78,13 @@ class LabAssistantOrDoctorAccess:
 
     async def __call__(
         self,
-        user: User = Depends(auth_service.get_current_user),
+        request: Request,
+        user: Principal = Depends(auth_service.get_current_principal),
         db: AsyncSession = Depends(db.get_db),
     ):
-        lab_assistant_query = select(LabAssistant).where(
-            LabAssistant.lab_assistant_cor_id == user.cor_id
-        )
-        lab_assistant = await db.scalar(lab_assistant_query)
-
-        if lab_assistant:
-            return lab_assistant
-
-        doctor_query = select(Doctor).where(Doctor.doctor_id == user.cor_id)
-        doctor = await db.scalar(doctor_query)
-
-        if doctor and doctor.status == Doctor_Status.approved:
-            return doctor
+        roles = await get_db_roles(db=db, cor_id=user.cor_id, request=request)
+        if "lab_assistant" in roles or "doctor" in roles:
+            return
 
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -112,20 +97,15 @@ class EnergyManagerAccess:
 
     async def __call__(
         self,
-        user: User = Depends(auth_service.get_current_user),
+        request: Request,
+        user: Principal = Depends(auth_service.get_current_principal),
         db: AsyncSession = Depends(db.get_db),
     ):
-        has_access = False
         if user.email in settings.admin_accounts:
-            has_access = True
-
-        query = select(EnergyManager).where(EnergyManager.energy_manager_cor_id == user.cor_id)
-        result = await db.execute(query)
-        energy_manager = result.scalar_one_or_none()
-        if energy_manager:
-            has_access = True
+            return
 
-        if not has_access:
+        roles = await get_db_roles(db=db, cor_id=user.cor_id, request=request)
+        if "energy_manager" not in roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Недостаточно прав для выполнения этой операции.",
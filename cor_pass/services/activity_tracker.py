@@ -0,0 +1,82 @@
+"""
+Учёт последней активности пользователей (presence).
+
+Отметки активности копятся в памяти воркера и раз в несколько секунд
+записываются в Redis одним ZADD в sorted set USER_PRESENCE_KEY
+(member — id пользователя, score — время последней активности, unix time).
+Чтение: ZMSCORE для списка пользователей, ZCOUNT / ZREVRANGEBYSCORE для
+"активны за последние N минут". Записи старше PRESENCE_RETENTION_SECONDS
+удаляются при сбросе, поэтому размер множества ограничен активными пользователями.
+"""
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from redis.exceptions import RedisError
+
+from cor_pass.database.redis_db import redis_client
+
+
+USER_PRESENCE_KEY = "presence:last_seen"
+ACTIVITY_FLUSH_INTERVAL_SECONDS = 5.0
+PRESENCE_RETENTION_SECONDS = 90 * 24 * 3600
+
+
+class ActivityTracker:
+    def __init__(self, flush_interval: float = ACTIVITY_FLUSH_INTERVAL_SECONDS):
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, float] = {}
+
+    def touch(self, user_id: str) -> None:
+        """Отмечает активность пользователя (без обращения к Redis)."""
+        self._pending[user_id] = time.time()
+
+    async def flush(self) -> None:
+        """Записывает накопленные отметки в Redis и удаляет устаревшие."""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.zadd(USER_PRESENCE_KEY, batch, gt=True)
+                pipe.zremrangebyscore(
+                    USER_PRESENCE_KEY, "-inf", time.time() - PRESENCE_RETENTION_SECONDS
+                )
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Failed to flush user activity ({len(batch)} users): {e}")
+            # Более свежие отметки, накопленные за время записи, имеют приоритет
+            self._pending = {**batch, **self._pending}
+
+    async def run(self) -> None:
+        """Фоновая задача: периодически сбрасывает отметки активности в Redis."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+activity_tracker = ActivityTracker()
+
+
+async def get_last_seen(user_ids: Iterable[str]) -> Dict[str, Optional[float]]:
+    """Время последней активности пользователей одним ZMSCORE (None — нет данных)."""
+    user_ids = [str(user_id) for user_id in user_ids]
+    if not user_ids:
+        return {}
+    scores = await redis_client.zmscore(USER_PRESENCE_KEY, user_ids)
+    return dict(zip(user_ids, scores))
+
+
+async def count_active_users(since: float) -> int:
+    """Количество пользователей, активных начиная с since (unix time)."""
+    return await redis_client.zcount(USER_PRESENCE_KEY, since, "+inf")
+
+
+async def list_active_users(
+    since: float, skip: int = 0, limit: int = 100
+) -> List[Tuple[str, float]]:
+    """Пользователи, активные начиная с since, от последних к более ранним."""
+    return await redis_client.zrevrangebyscore(
+        USER_PRESENCE_KEY, "+inf", since, start=skip, num=limit, withscores=True
+    )
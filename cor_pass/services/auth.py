@@ -5,16 +5,17 @@ import uuid
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
+from starlette.requests import HTTPConnection
 from datetime import timedelta, datetime, timezone
 from sqlalchemy import select
 
 from cor_pass.database.db import get_db
-from cor_pass.database.models import Device, DeviceAccess
-from cor_pass.repository import person as repository_users
+from cor_pass.database.models import Device, DeviceAccess, User
 from cor_pass.repository import device as repository_devices
 from cor_pass.config.config import settings
-from cor_pass.services import redis_service
+from cor_pass.services.auth_claims import get_request_claims
+from cor_pass.services.password_hashing import password_hasher, pwd_context
+from cor_pass.services.principal_cache import Principal, load_principal
 from loguru import logger
 from cor_pass.services.websocket_events_manager import websocket_events_manager
 
@@ -22,12 +23,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = pwd_context
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and the hashed version of that password,
             and returns True if they match, False otherwise. This is used to verify that the user's login
@@ -38,9 +39,17 @@ class Auth:
         :param hashed_password: Compare the plain_password parameter to see if they match
         :return: True if the password is correct, and false otherwise
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await password_hasher.verify(plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
+    async def verify_password_and_update(self, plain_password, hashed_password):
+        """
+        Проверяет пароль и возвращает (верный_пароль, новый_хэш_или_None).
+        Новый хэш возвращается, если параметры bcrypt изменились с момента
+        хэширования — его нужно сохранить пользователю.
+        """
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
             The function uses the pwd_context object to generate a hash from the given password.
@@ -48,7 +57,7 @@ class Auth:
         :param password: str: Pass the password into the function
         :return: A hash of the password
         """
-        return self.pwd_context.hash(password)
+        return await password_hasher.hash(password)
 
     async def create_access_token(
         self, data: dict, expires_delta: Optional[float] = None
@@ -150,25 +159,21 @@ class Auth:
                 detail="Could not validate credentials",
             )
 
-    async def get_current_user(
-        self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
-    ):
+    async def _decode_access_token(
+        self, token: str, claims: Optional[dict] = None
+    ) -> dict:
         """
-        Проверяет валидность Access токена и возвращает объект пользователя.
-        Включает проверку на:
-        - Истечение срока действия токена
-        - Наличие JTI в черном списке Redis (отзыв токена)
-        - Корректность структуры токена
-        - Существование пользователя в базе данных
+        Декодирует Access токен и проверяет подпись, срок действия, структуру
+        и область действия. Черный список проверяется в get_current_principal.
+        claims — уже проверенные JWTClaimsMiddleware claims этого токена (если есть).
 
-        :param token: Access токен из заголовка "Authorization: Bearer".
-        :param db: Асинхронная сессия базы данных.
-        :return: Объект User, если токен валиден и пользователь существует.
-        :raises HTTPException 401: Если токен невалиден, истёк, отозван или пользователь не найден.
+        :raises HTTPException 401: Если токен невалиден или истёк.
         """
         try:
-            payload = jwt.decode(
-                token, key=self.SECRET_KEY, algorithms=[self.ALGORITHM]
+            payload = (
+                claims
+                if claims is not None
+                else jwt.decode(token, key=self.SECRET_KEY, algorithms=[self.ALGORITHM])
             )
 
             exp = payload.get("exp")
@@ -183,22 +188,6 @@ class Auth:
                     headers={"WWW-Authenticate": "Bearer"},
                 )
 
-            if await redis_service.is_jti_blacklisted(jti):
-                logger.warning(f"Revoked token detected with JTI: {jti}")
-                event_data = {
-                    "channel": "cor-erp-prod",
-                    "event_type": "token_blacklisted",
-                    "token": token,
-                    "reason": "Token explicitly revoked or logged out.",
-                    "timestamp": datetime.now(timezone.utc).timestamp(),
-                }
-                await websocket_events_manager.broadcast_event(event_data)
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Токен отозван. Используйте новый токен или авторизуйтесь заново.",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-
             if datetime.fromtimestamp(exp, tz=timezone.utc) < datetime.now(
                 timezone.utc
             ):
@@ -272,8 +261,60 @@ class Auth:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        user = await repository_users.get_user_by_uuid(oid, db)
-        if user is None:
+        return payload
+
+    async def get_current_principal(
+        self,
+        token: str = Depends(oauth2_scheme),
+        db: AsyncSession = Depends(get_db),
+        connection: HTTPConnection = None,
+    ) -> Principal:
+        """
+        Проверяет валидность Access токена и возвращает снимок пользователя (Principal).
+        Включает проверку на:
+        - Истечение срока действия токена
+        - Наличие JTI в черном списке Redis (отзыв токена)
+        - Корректность структуры токена
+        - Существование пользователя
+
+        Черный список и снимок пользователя читаются одним pipeline из Redis
+        (services.principal_cache); Postgres запрашивается только при промахе кэша.
+
+        :param token: Access токен из заголовка "Authorization: Bearer".
+        :param db: Асинхронная сессия базы данных.
+        :param connection: Текущий запрос — для claims, проверенных JWTClaimsMiddleware.
+        :return: Principal, если токен валиден и пользователь существует.
+        :raises HTTPException 401: Если токен невалиден, истёк, отозван или пользователь не найден.
+        """
+        if connection is not None:
+            memo = getattr(connection.state, "principal", None)
+            if memo is not None and memo[0] == token:
+                return memo[1]
+
+        payload = await self._decode_access_token(
+            token, claims=get_request_claims(connection, token)
+        )
+        jti = payload["jti"]
+        oid = payload["oid"]
+
+        blacklisted, principal = await load_principal(user_id=oid, jti=jti, db=db)
+        if blacklisted:
+            logger.warning(f"Revoked token detected with JTI: {jti}")
+            event_data = {
+                "channel": "cor-erp-prod",
+                "event_type": "token_blacklisted",
+                "token": token,
+                "reason": "Token explicitly revoked or logged out.",
+                "timestamp": datetime.now(timezone.utc).timestamp(),
+            }
+            await websocket_events_manager.broadcast_event(event_data)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Токен отозван. Используйте новый токен или авторизуйтесь заново.",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        if principal is None:
             logger.warning(f"User with OID '{oid}' not found for valid token.")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -281,6 +322,34 @@ class Auth:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
+        if connection is not None:
+            connection.state.principal = (token, principal)
+        return principal
+
+    async def get_current_user(
+        self,
+        token: str = Depends(oauth2_scheme),
+        db: AsyncSession = Depends(get_db),
+        connection: HTTPConnection = None,
+    ) -> User:
+        """
+        Проверяет Access токен (см. get_current_principal) и возвращает объект User
+        из базы данных — для маршрутов, которым нужна вся строка пользователя.
+
+        :raises HTTPException 401: Если токен невалиден, истёк, отозван или пользователь не найден.
+        """
+        principal = await self.get_current_principal(
+            token=token, db=db, connection=connection
+        )
+        user = await db.get(User, principal.id)
+        if user is None:
+            logger.warning(f"User with OID '{principal.id}' not found for valid token.")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Пользователь не найден.",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
         return user
 
     async def create_device_jwt(
@@ -0,0 +1,66 @@
+"""
+ASGI middleware, которое один раз на запрос проверяет Bearer-токен и кладёт
+его claims в request.state — их повторно использует auth_service.get_current_user.
+Заодно отмечает активность пользователя в ActivityTracker.
+"""
+from typing import Optional, Tuple
+
+from jose import JWTError, jwt
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from cor_pass.config.config import settings
+from cor_pass.services.activity_tracker import activity_tracker
+
+
+JWT_CLAIMS_STATE_KEY = "jwt_claims"
+
+
+def _bearer_token(scope: Scope) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token.strip()
+            return None
+    return None
+
+
+class JWTClaimsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in ("http", "websocket"):
+            token = _bearer_token(scope)
+            if token:
+                try:
+                    claims = jwt.decode(
+                        token, key=settings.secret_key, algorithms=[settings.algorithm]
+                    )
+                except JWTError:
+                    # Ошибку с подробностями вернёт get_current_user
+                    claims = None
+                if claims is not None:
+                    scope.setdefault("state", {})[JWT_CLAIMS_STATE_KEY] = (
+                        token,
+                        claims,
+                    )
+                    oid = claims.get("oid")
+                    if oid:
+                        activity_tracker.touch(oid)
+        await self.app(scope, receive, send)
+
+
+def get_request_claims(
+    connection: Optional[HTTPConnection], token: str
+) -> Optional[dict]:
+    """Claims, уже проверенные JWTClaimsMiddleware для этого же токена, либо None."""
+    if connection is None:
+        return None
+    cached: Optional[Tuple[str, dict]] = getattr(
+        connection.state, JWT_CLAIMS_STATE_KEY, None
+    )
+    if cached is None or cached[0] != token:
+        return None
+    return cached[1]
@@ -0,0 +1,132 @@
+"""
+Ограничение попыток авторизации: скользящее окно в Redis, общее для всех воркеров.
+
+Каждый ключ (IP-адрес или аккаунт) — hash фиксированного размера: счётчики
+текущего и предыдущего окна, время окончания блокировки и уровень блокировки.
+Оценка числа попыток за последние window секунд: prev * (1 - доля прошедшего
+окна) + cur. При превышении лимита ключ блокируется на base * 2^(уровень-1)
+секунд (не более max). Все ключи одной проверки обрабатываются одним Lua-скриптом.
+"""
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+from cor_pass.database.redis_db import redis_client
+
+
+_SLIDING_WINDOW_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local increment = tonumber(ARGV[1])
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local offset = 1 + (i - 1) * 4
+    local limit = tonumber(ARGV[offset + 1])
+    local window = tonumber(ARGV[offset + 2])
+    local base_lock = tonumber(ARGV[offset + 3])
+    local max_lock = tonumber(ARGV[offset + 4])
+    local state = redis.call('HMGET', key, 'win', 'cur', 'prev', 'lock_until', 'level')
+    local win = tonumber(state[1]) or 0
+    local cur = tonumber(state[2]) or 0
+    local prev = tonumber(state[3]) or 0
+    local lock_until = tonumber(state[4]) or 0
+    local level = tonumber(state[5]) or 0
+    local current_win = math.floor(now / window)
+    if current_win ~= win then
+        if current_win == win + 1 then prev = cur else prev = 0 end
+        cur = 0
+        win = current_win
+    end
+    if lock_until > now then
+        retry_after = math.max(retry_after, lock_until - now)
+    elseif increment > 0 then
+        cur = cur + increment
+        local elapsed = (now - win * window) / window
+        if prev * (1 - elapsed) + cur >= limit then
+            level = level + 1
+            local lock = math.min(base_lock * 2 ^ (level - 1), max_lock)
+            lock_until = now + lock
+            retry_after = math.max(retry_after, lock)
+            cur = 0
+            prev = 0
+        end
+        redis.call('HSET', key, 'win', win, 'cur', cur, 'prev', prev,
+            'lock_until', lock_until, 'level', level)
+        redis.call('EXPIRE', key, math.ceil(math.max(window * 2, lock_until - now) + max_lock))
+    end
+end
+return tostring(retry_after)
+"""
+
+_sliding_window_script = redis_client.register_script(_SLIDING_WINDOW_LUA)
+
+
+@dataclass(frozen=True)
+class ThrottleRule:
+    prefix: str
+    limit: int
+    window_seconds: int
+    base_lockout_seconds: int
+    max_lockout_seconds: int
+
+
+# Неудачные попытки входа с одного IP-адреса
+LOGIN_IP_RULE = ThrottleRule(
+    prefix="throttle:login:ip:",
+    limit=15,
+    window_seconds=15 * 60,
+    base_lockout_seconds=15 * 60,
+    max_lockout_seconds=24 * 3600,
+)
+
+# Неудачные попытки входа в один аккаунт (с любых IP-адресов)
+LOGIN_ACCOUNT_RULE = ThrottleRule(
+    prefix="throttle:login:account:",
+    limit=10,
+    window_seconds=15 * 60,
+    base_lockout_seconds=5 * 60,
+    max_lockout_seconds=2 * 3600,
+)
+
+
+ThrottleChecks = Sequence[Tuple[ThrottleRule, str]]
+
+
+def login_checks(client_ip: str, account: str) -> List[Tuple[ThrottleRule, str]]:
+    return [
+        (LOGIN_IP_RULE, client_ip),
+        (LOGIN_ACCOUNT_RULE, account.strip().lower()),
+    ]
+
+
+async def _run(checks: ThrottleChecks, increment: int) -> float:
+    keys = []
+    args = [increment]
+    for rule, identifier in checks:
+        keys.append(f"{rule.prefix}{identifier}")
+        args.extend(
+            [
+                rule.limit,
+                rule.window_seconds,
+                rule.base_lockout_seconds,
+                rule.max_lockout_seconds,
+            ]
+        )
+    return float(await _sliding_window_script(keys=keys, args=args))
+
+
+async def get_retry_after(checks: ThrottleChecks) -> float:
+    """Сколько секунд осталось до снятия блокировки (0 — попытка разрешена)."""
+    return await _run(checks, increment=0)
+
+
+async def register_failure(checks: ThrottleChecks) -> float:
+    """
+    Учитывает неудачную попытку по всем ключам. Возвращает срок блокировки
+    в секундах, если лимит превышен (или ключ уже заблокирован), иначе 0.
+    """
+    return await _run(checks, increment=1)
+
+
+async def reset(checks: ThrottleChecks) -> None:
+    """Сбрасывает счётчики и уровень блокировки ключей."""
+    await redis_client.delete(*(f"{rule.prefix}{identifier}" for rule, identifier in checks))
@@ -0,0 +1,122 @@
+"""
+Слепые индексы (keyed HMAC-SHA256) для точного поиска по зашифрованным ФИО пациентов.
+
+Имена нормализуются (NFKC, casefold, "ё" -> "е", только буквы и цифры,
+слова через один пробел), поэтому "Петренко  Іван" и "петренко іван"
+дают один и тот же индекс. Ключ хранится отдельно от AES-ключа.
+
+Заполнение индексов для существующих пациентов:
+    python -m cor_pass.services.blind_index
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import unicodedata
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import select
+
+from cor_pass.config.config import settings
+
+
+def normalize_name(value: Optional[str]) -> str:
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKC", value).casefold().replace("ё", "е")
+    words = ("".join(ch for ch in word if ch.isalnum()) for word in value.split())
+    return " ".join(word for word in words if word)
+
+
+def _blind_index(purpose: str, normalized_value: str) -> Optional[str]:
+    if not normalized_value:
+        return None
+    return hmac.new(
+        settings.blind_index_key.encode("utf-8"),
+        f"{purpose}:{normalized_value}".encode("utf-8"),
+        hashlib.sha256,
+    ).hexdigest()
+
+
+def full_name_blind_index(
+    surname: Optional[str],
+    first_name: Optional[str],
+    middle_name: Optional[str] = None,
+) -> Optional[str]:
+    """Индекс полного ФИО в порядке "фамилия имя отчество"."""
+    full_name = " ".join(part for part in (surname, first_name, middle_name) if part)
+    return _blind_index("full_name", normalize_name(full_name))
+
+
+def full_name_query_blind_index(query: str) -> Optional[str]:
+    """Индекс для строки поиска, введённой как "фамилия имя [отчество]"."""
+    return _blind_index("full_name", normalize_name(query))
+
+
+def surname_blind_index(surname: Optional[str]) -> Optional[str]:
+    return _blind_index("surname", normalize_name(surname))
+
+
+async def backfill_patient_blind_indexes(batch_size: int = 500) -> int:
+    """
+    Заполняет слепые индексы пациентов, у которых они ещё не посчитаны.
+    Обрабатывает строки пачками по batch_size (keyset по id), каждая пачка —
+    отдельная транзакция. Пациенты, ФИО которых не расшифровывается, пропускаются
+    с предупреждением в логе. Возвращает количество обновлённых пациентов.
+    """
+    from cor_pass.database.db import async_session_maker
+    from cor_pass.database.models import Patient
+    from cor_pass.services.cipher import decrypt_data
+
+    decoded_key = base64.b64decode(settings.aes_key)
+
+    async def _decrypt(value: Optional[bytes]) -> Optional[str]:
+        return await decrypt_data(value, decoded_key) if value else None
+
+    updated = 0
+    skipped = 0
+    last_id = ""
+    while True:
+        async with async_session_maker() as db:
+            patients = (
+                await db.scalars(
+                    select(Patient)
+                    .where(
+                        Patient.id > last_id,
+                        Patient.blind_full_name.is_(None),
+                        Patient.encrypted_surname.is_not(None),
+                    )
+                    .order_by(Patient.id)
+                    .limit(batch_size)
+                )
+            ).all()
+            if not patients:
+                break
+            for patient in patients:
+                try:
+                    surname, first_name, middle_name = await asyncio.gather(
+                        _decrypt(patient.encrypted_surname),
+                        _decrypt(patient.encrypted_first_name),
+                        _decrypt(patient.encrypted_middle_name),
+                    )
+                except ValueError as e:
+                    # Строка остаётся без индексов; keyset по id идёт дальше
+                    logger.warning(f"Blind indexes skipped for patient {patient.id}: {e}")
+                    skipped += 1
+                    continue
+                patient.blind_full_name = full_name_blind_index(
+                    surname, first_name, middle_name
+                )
+                patient.blind_surname = surname_blind_index(surname)
+                updated += 1
+            await db.commit()
+            last_id = patients[-1].id
+            logger.info(
+                f"Blind indexes backfilled for {updated} patients, skipped {skipped}"
+            )
+    return updated
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_patient_blind_indexes())
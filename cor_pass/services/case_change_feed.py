@@ -0,0 +1,166 @@
+"""
+Лента изменений кейсов.
+
+Изменение публикуется через Postgres NOTIFY в той же транзакции, что и сама
+правка: событие уходит только после commit и пропадает при rollback.
+Публиковать может любой процесс с доступом к БД (API, сканер SMB),
+а каждый воркер API слушает канал своим соединением asyncpg.
+"""
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, Iterable, List
+
+import asyncpg
+from loguru import logger
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cor_pass.config.config import settings
+
+
+CASE_CHANGES_CHANNEL = "case_changes"
+
+# Кейс входит в список "Текущие кейсы" (см. repository.case._fetch_current_worklist_page)
+_WORKLIST_SQL = """
+    COALESCE(
+        grossing_status <> 'COMPLETED'
+        AND (
+            urgency_prefix IN ('F', 'U')
+            OR (urgency_prefix = 'S' AND has_scanned_glass)
+        ),
+        false
+    )
+"""
+
+_EMIT_CASE_CHANGES_SQL = text(
+    f"""
+    WITH bumped AS (
+        UPDATE cases SET change_version = change_version + 1
+        WHERE id IN :case_ids
+        RETURNING id, change_version, grossing_status, urgency_prefix, has_scanned_glass
+    )
+    SELECT pg_notify(
+        CAST(:channel AS text),
+        json_build_object(
+            'case_id', id,
+            'entity', CAST(:entity AS text),
+            'version', change_version,
+            'worklist', {_WORKLIST_SQL}
+        )::text
+    )
+    FROM bumped
+    """
+).bindparams(bindparam("case_ids", expanding=True))
+
+_CASE_DELETION_EVENTS_SQL = text(
+    f"""
+    SELECT json_build_object(
+        'case_id', id,
+        'entity', 'case',
+        'version', change_version + 1,
+        'worklist', {_WORKLIST_SQL},
+        'deleted', true
+    )::text
+    FROM cases
+    WHERE id IN :case_ids
+    """
+).bindparams(bindparam("case_ids", expanding=True))
+
+_NOTIFY_PAYLOADS_SQL = text(
+    """
+    SELECT pg_notify(CAST(:channel AS text), payload)
+    FROM unnest(CAST(:payloads AS text[])) AS payload
+    """
+)
+
+
+async def emit_case_changes(
+    db: AsyncSession, case_ids: Iterable[str], entity: str
+) -> None:
+    """
+    Увеличивает change_version кейсов и ставит в очередь NOTIFY
+    {case_id, entity, version, worklist} для каждого из них.
+    Вызывается до commit вызывающей стороны.
+    """
+    case_ids = [case_id for case_id in set(case_ids) if case_id]
+    if not case_ids:
+        return
+    # Текстовый запрос не вызывает autoflush, а флаг worklist читается из строки
+    await db.flush()
+    await db.execute(
+        _EMIT_CASE_CHANGES_SQL,
+        {"case_ids": case_ids, "channel": CASE_CHANGES_CHANNEL, "entity": entity},
+    )
+
+
+async def case_deletion_events(db: AsyncSession, case_ids: Iterable[str]) -> List[str]:
+    """
+    События {case_id, entity: "case", version, worklist, deleted: true}
+    для удаляемых кейсов. Читаются до DELETE (флаг worklist — по последнему
+    состоянию кейса) и публикуются notify_case_events после него.
+    """
+    case_ids = [case_id for case_id in set(case_ids) if case_id]
+    if not case_ids:
+        return []
+    await db.flush()
+    return list(
+        (await db.scalars(_CASE_DELETION_EVENTS_SQL, {"case_ids": case_ids})).all()
+    )
+
+
+async def notify_case_events(db: AsyncSession, payloads: List[str]) -> None:
+    """Ставит в очередь NOTIFY с готовыми событиями (уйдут после commit)."""
+    if not payloads:
+        return
+    await db.execute(
+        _NOTIFY_PAYLOADS_SQL,
+        {"channel": CASE_CHANGES_CHANNEL, "payloads": payloads},
+    )
+
+
+def _listener_dsn() -> str:
+    """DSN для asyncpg из URL SQLAlchemy (без суффикса драйвера)."""
+    return (
+        make_url(settings.sqlalchemy_database_url)
+        .set(drivername="postgresql")
+        .render_as_string(hide_password=False)
+    )
+
+
+async def listen_case_changes(
+    on_event: Callable[[Dict], Awaitable[None]], reconnect_delay: float = 5.0
+) -> None:
+    """
+    Слушает канал CASE_CHANGES_CHANNEL и передаёт каждое событие в on_event.
+    При потере соединения переподключается.
+    """
+    while True:
+        connection = None
+        queue: asyncio.Queue = asyncio.Queue()
+        try:
+            connection = await asyncpg.connect(_listener_dsn())
+            connection.add_termination_listener(lambda _conn: queue.put_nowait(None))
+            await connection.add_listener(
+                CASE_CHANGES_CHANNEL,
+                lambda _conn, _pid, _channel, payload: queue.put_nowait(payload),
+            )
+            logger.info(f"Subscribed to Postgres channel {CASE_CHANGES_CHANNEL}")
+            while True:
+                payload = await queue.get()
+                if payload is None:
+                    raise ConnectionError("Postgres listener connection closed")
+                try:
+                    await on_event(json.loads(payload))
+                except Exception as e:
+                    logger.error(f"Failed to handle case change {payload}: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(
+                f"Case change listener error: {e}. Reconnecting in {reconnect_delay} seconds..."
+            )
+            await asyncio.sleep(reconnect_delay)
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
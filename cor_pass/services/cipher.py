@@ -10,6 +10,7 @@ from cryptography.hazmat.primitives import hashes
 import os
 from Crypto.Util.Padding import pad as crypto_pad
 from functools import partial
+from typing import List, Optional, Sequence
 from cor_pass.config.config import settings
 
 
@@ -71,6 +72,31 @@ async def decrypt_data(encrypted_data: bytes, key: bytes) -> str:
         raise ValueError("Decryption failed. Invalid key or corrupted data.") from e
 
 
+def _sync_decrypt_data_batch_impl(
+    encrypted_values: Sequence[Optional[bytes]], key: bytes
+) -> List[Optional[str]]:
+    return [
+        _sync_decrypt_data_impl(value, key) if value else None
+        for value in encrypted_values
+    ]
+
+
+async def decrypt_data_batch(
+    encrypted_values: Sequence[Optional[bytes]], key: bytes
+) -> List[Optional[str]]:
+    """
+    Дешифрует список значений за один переход в поток (вместо потока на каждое поле).
+    Пустые значения возвращаются как None, порядок сохраняется.
+    """
+    try:
+        return await asyncio.to_thread(
+            _sync_decrypt_data_batch_impl, list(encrypted_values), key
+        )
+    except (ValueError, KeyError) as e:
+
+        raise ValueError("Decryption failed. Invalid key or corrupted data.") from e
+
+
 async def generate_aes_key(key_size: int = 16) -> bytes:
     """
     Генерирует новый ключ для AES.
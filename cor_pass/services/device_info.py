@@ -1,5 +1,9 @@
+from typing import Optional
+
 from fastapi import Header, HTTPException, Request, status
 
+from cor_pass.config.config import settings
+
 
 def get_device_header(
     user_agent: str = Header(None, description="User-Agent header"),
@@ -75,14 +79,30 @@ def get_device_info(request: Request) -> dict:
     }
 
 
-def get_client_ip(request: Request):
+def resolve_client_ip(
+    forwarded_for: Optional[str], real_ip: Optional[str], peer: Optional[str]
+) -> str:
+    """
+    IP-адрес клиента с учётом settings.trusted_proxy_count обратных прокси перед API.
+    Каждый прокси дописывает адрес своего собеседника в конец X-Forwarded-For,
+    поэтому адрес клиента — N-й справа, а всё левее клиент мог подставить сам.
+    Без доверенных прокси заголовки не учитываются: адрес — собеседник соединения.
+    """
+    proxies = settings.trusted_proxy_count
+    if proxies > 0:
+        if forwarded_for:
+            hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+            if hops:
+                return hops[-min(proxies, len(hops))]
+        if real_ip:
+            return real_ip.strip()
+    return peer or "unknown"
+
+
+def get_client_ip(request: Request) -> str:
     """Получение реального IP-адреса клиента."""
-    if "x-forwarded-for" in request.headers:
-        client_ip = request.headers["x-forwarded-for"].split(",")[0].strip()
-    elif "x-real-ip" in request.headers:
-        client_ip = request.headers["x-real-ip"].strip()
-    elif "http_client_ip" in request.headers:
-        client_ip = request.headers["http_client_ip"].strip()
-    else:
-        client_ip = request.client.host
-    return client_ip
+    return resolve_client_ip(
+        request.headers.get("x-forwarded-for"),
+        request.headers.get("x-real-ip"),
+        request.client.host if request.client else None,
+    )
@@ -0,0 +1,208 @@
+"""
+Декодирование DICOM-исследования в том.
+
+Заголовки срезов читаются без пиксельных данных, по ним определяются порядок
+срезов, форма и тип тома. Пиксели декодируются параллельно в пуле процессов
+(settings.dicom_decode_workers) и пишутся сразу в заранее выделенный массив.
+Том хранится в исходном целочисленном типе (int16/uint16 для КТ), а Rescale
+Slope/Intercept применяются при чтении через RescaledVolume — вдвое меньше
+памяти и места в кэше томов, чем float32.
+
+Пул использует spawn (воркер API многопоточный), поэтому функции, выполняемые
+в нём, вынесены из маршрутов в этот модуль.
+"""
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pydicom
+from loguru import logger
+from pydicom.multival import MultiValue
+from skimage.transform import resize
+
+from cor_pass.config.config import settings
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _decode_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: воркер API многопоточный, fork в нём небезопасен
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.dicom_decode_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _dicom_float(value, default: float) -> float:
+    if value is None or value == "":
+        return default
+    if isinstance(value, MultiValue):
+        value = value[0]
+    return float(value)
+
+
+def _read_header(path: str) -> Optional[pydicom.Dataset]:
+    for force in (False, True):
+        try:
+            return pydicom.dcmread(path, stop_before_pixels=True, force=force)
+        except Exception:
+            continue
+    return None
+
+
+def _native_dtype(ds: pydicom.Dataset) -> np.dtype:
+    bits = int(getattr(ds, "BitsAllocated", 16))
+    signed = int(getattr(ds, "PixelRepresentation", 0)) == 1
+    if bits <= 8:
+        return np.dtype(np.int8 if signed else np.uint8)
+    if bits <= 16:
+        return np.dtype(np.int16 if signed else np.uint16)
+    return np.dtype(np.int32 if signed else np.uint32)
+
+
+def decode_pixels(path: str) -> Optional[np.ndarray]:
+    """Пиксели среза в исходном типе (выполняется в пуле процессов)."""
+    ds = None
+    for force in (False, True):
+        try:
+            ds = pydicom.dcmread(path, force=force)
+            break
+        except Exception:
+            continue
+    if ds is None:
+        return None
+    try:
+        if hasattr(ds, "file_meta") and hasattr(ds.file_meta, "TransferSyntaxUID"):
+            if ds.file_meta.TransferSyntaxUID.is_compressed:
+                ds.decompress()
+        return ds.pixel_array
+    except Exception as e:
+        logger.debug(f"[WARN] Не удалось декодировать {path}: {e}")
+        return None
+
+
+def decode_volume(study_dir: str) -> Tuple[np.ndarray, dict]:
+    """
+    Том исследования в исходном типе данных и метаданные для кэша томов:
+    example_name — имя файла среза в study_dir, заголовок которого описывает
+    исследование,
+    slopes/intercepts — Rescale Slope/Intercept по срезам.
+    """
+    logger.debug("[INFO] Загружаем том из DICOM-файлов...")
+    paths = [
+        os.path.join(study_dir, f)
+        for f in os.listdir(study_dir)
+        if not f.startswith(".") and os.path.isfile(os.path.join(study_dir, f))
+    ]
+
+    headers = []
+    for path in paths:
+        ds = _read_header(path)
+        if ds is None:
+            logger.debug(f"[WARN] Не удалось прочитать файл {path}")
+            continue
+        if all(
+            hasattr(ds, attr)
+            for attr in ("ImagePositionPatient", "ImageOrientationPatient", "Rows", "Columns")
+        ):
+            headers.append((ds, path))
+        else:
+            logger.debug(f"[WARN] Файл {path} не содержит необходимых DICOM-тегов. Пропущен.")
+    if not headers:
+        raise RuntimeError("Нет подходящих DICOM-файлов с ImagePositionPatient.")
+
+    # Сортировка по проекции позиции на нормаль к срезу
+    orientation = headers[0][0].ImageOrientationPatient
+    normal = np.cross(orientation[:3], orientation[3:])
+    headers.sort(key=lambda item: np.dot(item[0].ImagePositionPatient, normal))
+
+    target_shape = Counter(
+        (int(ds.Rows), int(ds.Columns)) for ds, _ in headers
+    ).most_common(1)[0][0]
+    dtype = np.result_type(*{_native_dtype(ds) for ds, _ in headers})
+    logger.debug(f"[INFO] Том {len(headers)}x{target_shape}, тип {dtype}")
+
+    volume = np.empty((len(headers),) + target_shape, dtype=dtype)
+    slopes: List[float] = []
+    intercepts: List[float] = []
+    example_name = None
+    count = 0
+    arrays = _decode_executor().map(
+        decode_pixels,
+        [path for _, path in headers],
+        chunksize=max(1, len(headers) // (settings.dicom_decode_workers * 4)),
+    )
+    for (ds, path), arr in zip(headers, arrays):
+        if arr is None or arr.ndim != 2:
+            logger.debug(f"[WARN] Срез {os.path.basename(path)} пропущен")
+            continue
+        if arr.shape != target_shape:
+            arr = resize(arr, target_shape, preserve_range=True)
+        volume[count] = arr
+        slopes.append(_dicom_float(getattr(ds, "RescaleSlope", None), 1.0))
+        intercepts.append(_dicom_float(getattr(ds, "RescaleIntercept", None), 0.0))
+        if example_name is None:
+            example_name = os.path.basename(path)
+        count += 1
+
+    if count == 0:
+        raise RuntimeError("Не удалось загрузить ни одного среза.")
+    logger.debug(f"[INFO] Загружено срезов: {count}")
+    return volume[:count], {
+        "example_name": example_name,
+        "slopes": slopes,
+        "intercepts": intercepts,
+    }
+
+
+class RescaledVolume:
+    """
+    Том в исходном типе данных; Rescale Slope/Intercept (по срезам — первая ось)
+    применяются к результату индексации, который возвращается как float32.
+    """
+
+    def __init__(
+        self,
+        raw: np.ndarray,
+        slopes: Optional[List[float]] = None,
+        intercepts: Optional[List[float]] = None,
+    ):
+        self.raw = raw
+        self.shape = raw.shape
+        self._slopes = np.asarray(slopes if slopes is not None else 1.0, dtype=np.float32)
+        self._intercepts = np.asarray(
+            intercepts if intercepts is not None else 0.0, dtype=np.float32
+        )
+        # Одинаковые коэффициенты у всех срезов (обычно для КТ) — скаляры
+        if self._slopes.ndim and np.all(self._slopes == self._slopes[0]):
+            self._slopes = self._slopes[0]
+        if self._intercepts.ndim and np.all(self._intercepts == self._intercepts[0]):
+            self._intercepts = self._intercepts[0]
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def _per_slice(self, values: np.ndarray, first, ndim: int) -> np.ndarray:
+        if values.ndim == 0:
+            return values
+        values = values[first]
+        if values.ndim:
+            values = values.reshape((-1,) + (1,) * (ndim - 1))
+        return values
+
+    def __getitem__(self, key) -> np.ndarray:
+        data = np.asarray(self.raw[key], dtype=np.float32)
+        first = key[0] if isinstance(key, tuple) else key
+        slopes = self._per_slice(self._slopes, first, data.ndim)
+        intercepts = self._per_slice(self._intercepts, first, data.ndim)
+        return data * slopes + intercepts
@@ -0,0 +1,117 @@
+"""
+Хэширование и проверка паролей (bcrypt) вне event loop.
+
+bcrypt освобождает GIL, поэтому достаточно ограниченного пула потоков.
+Одновременно выполняется не больше password_hash_workers операций,
+ожидать может не больше password_hash_max_pending — остальные запросы
+получают 503, а не копятся в очереди.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from prometheus_client import Counter, Gauge, Histogram
+
+from cor_pass.config.config import settings
+
+
+# Изменение bcrypt_rounds приводит к перехэшированию пароля при следующем входе:
+# passlib считает хэш устаревшим только вне [min_rounds, max_rounds]
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds,
+)
+
+# Количество операций, ожидающих свободного потока
+password_hash_queue_depth = Gauge(
+    "password_hash_queue_depth", "Number of password hashing operations waiting for a worker"
+)
+
+# Гистограмма времени выполнения операций (без ожидания в очереди)
+password_hash_duration = Histogram(
+    "password_hash_duration_seconds",
+    "Duration of password hashing operations in seconds",
+    ["operation"],
+)
+
+# Счетчик операций, отклонённых из-за переполнения очереди
+password_hash_rejected_total = Counter(
+    "password_hash_rejected_total",
+    "Number of password hashing operations rejected because the queue is full",
+)
+
+
+class PasswordHasher:
+    def __init__(self, max_workers: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password-hash"
+        )
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+
+    async def _run(self, operation: str, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_workers)
+        if self._pending >= self._max_pending:
+            password_hash_rejected_total.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Сервер перегружен, повторите попытку позже.",
+                headers={"Retry-After": "1"},
+            )
+        self._pending += 1
+        password_hash_queue_depth.inc()
+        queued = True
+        try:
+            async with self._semaphore:
+                password_hash_queue_depth.dec()
+                queued = False
+                started = time.perf_counter()
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(
+                        self._executor, func, *args
+                    )
+                finally:
+                    password_hash_duration.labels(operation).observe(
+                        time.perf_counter() - started
+                    )
+        finally:
+            if queued:
+                # Запрос отменён во время ожидания
+                password_hash_queue_depth.dec()
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: Optional[str]) -> bool:
+        if not hashed_password:
+            return False
+        return await self._run("verify", pwd_context.verify, password, hashed_password)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: Optional[str]
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Проверяет пароль и, если хэш устарел (изменились параметры bcrypt),
+        возвращает новый хэш: (верный_пароль, новый_хэш_или_None).
+        """
+        if not hashed_password:
+            return False, None
+        return await self._run(
+            "verify", pwd_context.verify_and_update, password, hashed_password
+        )
+
+
+password_hasher = PasswordHasher(
+    max_workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending,
+)
@@ -0,0 +1,129 @@
+"""
+Кэш аутентифицированного пользователя (principal) для проверки access-токенов.
+
+Снимок пользователя (id, cor_id, email, is_active, account_status, roles)
+хранится в Redis с коротким TTL и в небольшом LRU внутри воркера.
+Проверка черного списка JTI выполняется в том же pipeline, что и чтение снимка,
+поэтому проверка токена стоит один round-trip в Redis и ни одного в Postgres.
+
+Снимок сбрасывается (invalidate_principal) при активации, деактивации,
+смене статуса, kickout и удалении пользователя. Локальный LRU других воркеров
+может отставать не дольше PRINCIPAL_LOCAL_TTL_SECONDS.
+"""
+import json
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cor_pass.database.models import User
+from cor_pass.database.redis_db import redis_client
+from cor_pass.services.redis_service import blacklist_key
+from cor_pass.services.role_cache import resolve_user_roles
+
+
+PRINCIPAL_CACHE_TTL_SECONDS = 60
+PRINCIPAL_LOCAL_TTL_SECONDS = 5
+PRINCIPAL_LOCAL_MAX_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: str
+    cor_id: Optional[str]
+    email: str
+    is_active: bool
+    account_status: Optional[str]
+    # Роли на момент снимка; проверки доступа используют services.role_cache
+    roles: Tuple[str, ...] = ()
+
+
+_local_cache: "OrderedDict[str, Tuple[float, Principal]]" = OrderedDict()
+
+
+def _principal_key(user_id: str) -> str:
+    return f"principal:{user_id}"
+
+
+def _local_get(user_id: str) -> Optional[Principal]:
+    entry = _local_cache.get(user_id)
+    if entry is None:
+        return None
+    expires_at, principal = entry
+    if expires_at < time.monotonic():
+        _local_cache.pop(user_id, None)
+        return None
+    _local_cache.move_to_end(user_id)
+    return principal
+
+
+def _local_put(principal: Principal) -> None:
+    _local_cache[principal.id] = (
+        time.monotonic() + PRINCIPAL_LOCAL_TTL_SECONDS,
+        principal,
+    )
+    _local_cache.move_to_end(principal.id)
+    while len(_local_cache) > PRINCIPAL_LOCAL_MAX_SIZE:
+        _local_cache.popitem(last=False)
+
+
+async def _build_principal(user: User, db: AsyncSession) -> Principal:
+    roles = await resolve_user_roles(user=user, db=db)
+    return Principal(
+        id=user.id,
+        cor_id=user.cor_id,
+        email=user.email,
+        is_active=bool(user.is_active),
+        account_status=(
+            user.account_status.value
+            if user.account_status is not None
+            else None
+        ),
+        roles=tuple(roles),
+    )
+
+
+async def load_principal(
+    user_id: str, jti: str, db: AsyncSession
+) -> Tuple[bool, Optional[Principal]]:
+    """
+    Возвращает (jti_в_черном_списке, principal). principal равен None,
+    если пользователь не найден. Postgres запрашивается только при промахе кэша.
+    """
+    principal = _local_get(user_id)
+    if principal is not None:
+        blacklisted = await redis_client.exists(blacklist_key(jti))
+        return bool(blacklisted), principal
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.exists(blacklist_key(jti))
+        pipe.get(_principal_key(user_id))
+        blacklisted, cached = await pipe.execute()
+    if blacklisted:
+        return True, None
+
+    if cached:
+        data = json.loads(cached)
+        principal = Principal(**{**data, "roles": tuple(data.get("roles", ()))})
+    else:
+        user = await db.get(User, user_id)
+        if user is None:
+            return False, None
+        principal = await _build_principal(user=user, db=db)
+        await redis_client.set(
+            _principal_key(user_id),
+            json.dumps(asdict(principal)),
+            ex=PRINCIPAL_CACHE_TTL_SECONDS,
+        )
+    _local_put(principal)
+    return False, principal
+
+
+async def invalidate_principal(user_id: Optional[str]) -> None:
+    """Сбрасывает снимок пользователя в Redis и в LRU текущего воркера."""
+    if not user_id:
+        return
+    _local_cache.pop(user_id, None)
+    await redis_client.delete(_principal_key(user_id))
@@ -0,0 +1,104 @@
+"""
+Чтение SVS (Aperio TIFF) через tifffile из любого seekable файлового объекта,
+в том числе из SMBRangeFile: читаются только нужные страницы и тайлы.
+
+Используется, пока слайд ещё не загружен в локальный кэш целиком
+(OpenSlide работает только с локальным файлом). JPEG-тайлы декодируются
+через Pillow с подстановкой JPEGTables страницы, поэтому imagecodecs не нужен.
+"""
+from io import BytesIO
+from typing import List, Optional
+
+import numpy as np
+import tifffile
+from PIL import Image
+
+
+ASSOCIATED_IMAGE_NAMES = ("thumbnail", "label", "macro")
+
+_JPEG_COMPRESSION = 7
+# APP14 Adobe с transform=0: компоненты JPEG хранятся как RGB, без YCbCr
+_ADOBE_RGB_MARKER = b"\xff\xee\x00\x0eAdobe\x00\x64\x00\x00\x00\x00\x00"
+
+
+def _decode_jpeg(data: bytes, jpegtables: Optional[bytes], rgb: bool) -> Image.Image:
+    if jpegtables:
+        # Таблицы без EOI + сегмент без SOI
+        data = jpegtables[:-2] + data[2:]
+    if rgb:
+        data = data[:2] + _ADOBE_RGB_MARKER + data[2:]
+    image = Image.open(BytesIO(data))
+    image.load()
+    return image.convert("RGB")
+
+
+def _page_to_image(page: tifffile.TiffPage) -> Image.Image:
+    if page.compression == _JPEG_COMPRESSION and len(page.dataoffsets) == 1:
+        fh = page.parent.filehandle
+        fh.seek(page.dataoffsets[0])
+        data = fh.read(page.databytecounts[0])
+        return _decode_jpeg(
+            data, page.jpegtables, page.photometric == tifffile.PHOTOMETRIC.RGB
+        )
+    array = page.asarray()
+    if array.dtype != np.uint8:
+        array = (array / max(int(array.max()), 1) * 255).astype(np.uint8)
+    return Image.fromarray(array).convert("RGB")
+
+
+def pyramid_pages(tif: tifffile.TiffFile) -> List[tifffile.TiffPage]:
+    """Тайловые страницы пирамиды — от самого подробного уровня к грубому."""
+    pages = [page for page in tif.pages if page.is_tiled]
+    pages.sort(key=lambda page: page.imagewidth, reverse=True)
+    return pages
+
+
+def associated_image(tif: tifffile.TiffFile, name: str) -> Optional[Image.Image]:
+    """Миниатюра, этикетка или макроснимок слайда (None, если его нет)."""
+    for index, page in enumerate(tif.pages):
+        if page.is_tiled:
+            continue
+        description = (page.description or "").lower()
+        if name == "thumbnail":
+            # В Aperio миниатюра — вторая страница, без метки в описании
+            matches = index == 1
+        else:
+            matches = name in description
+        if matches:
+            return _page_to_image(page)
+    return None
+
+
+def native_tile(tif: tifffile.TiffFile, level: int, x: int, y: int) -> Optional[Image.Image]:
+    """
+    Тайл уровня level в родной сетке TIFF (размер page.tilewidth x tilelength).
+    Граничные тайлы обрезаются до фактического размера изображения.
+    None, если адрес вне диапазона.
+    """
+    pages = pyramid_pages(tif)
+    if not 0 <= level < len(pages):
+        return None
+    page = pages[level]
+    tiles_x = -(-page.imagewidth // page.tilewidth)
+    tiles_y = -(-page.imagelength // page.tilelength)
+    if not (0 <= x < tiles_x and 0 <= y < tiles_y):
+        return None
+    index = y * tiles_x + x
+    fh = page.parent.filehandle
+    fh.seek(page.dataoffsets[index])
+    data = fh.read(page.databytecounts[index])
+    if page.compression == _JPEG_COMPRESSION:
+        tile = _decode_jpeg(
+            data, page.jpegtables, page.photometric == tifffile.PHOTOMETRIC.RGB
+        )
+    else:
+        segment, _, _ = page.decode(data, index)
+        segment = np.asarray(segment).reshape(page.tilelength, page.tilewidth, -1)
+        if segment.shape[2] == 1:
+            segment = segment[:, :, 0]
+        tile = Image.fromarray(segment).convert("RGB")
+    width = min(page.tilewidth, page.imagewidth - x * page.tilewidth)
+    height = min(page.tilelength, page.imagelength - y * page.tilelength)
+    if tile.size != (width, height):
+        tile = tile.crop((0, 0, width, height))
+    return tile
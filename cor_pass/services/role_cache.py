@@ -0,0 +1,148 @@
+"""
+Разрешение ролей пользователя одним запросом с кэшем в Redis.
+
+Роли, зависящие от таблиц (lawyer, doctor, lab_assistant, energy_manager),
+читаются одним SELECT с EXISTS-колонками и кэшируются в Redis вместе с версией
+ролей пользователя. Инвалидация увеличивает версию (invalidate_user_roles),
+поэтому запись, посчитанная до изменения, больше не считается попаданием.
+В пределах одного запроса результат запоминается в request.state.
+"""
+import json
+from typing import List, Optional
+
+from fastapi import Request
+from loguru import logger
+from redis.exceptions import RedisError
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cor_pass.config.config import settings
+from cor_pass.database.models import (
+    Doctor,
+    Doctor_Status,
+    EnergyManager,
+    LabAssistant,
+    Lawyer,
+    User,
+)
+from cor_pass.database.redis_db import redis_client
+
+
+ROLES_CACHE_TTL_SECONDS = 600
+
+
+def _roles_key(cor_id: str) -> str:
+    return f"user_roles:{cor_id}"
+
+
+def _roles_version_key(cor_id: str) -> str:
+    return f"user_roles_version:{cor_id}"
+
+
+async def _query_db_roles(db: AsyncSession, cor_id: str) -> List[str]:
+    """Роли из таблиц lawyers / doctors / lab_assistants / energy_managers одним запросом."""
+    row = (
+        await db.execute(
+            select(
+                exists().where(Lawyer.lawyer_cor_id == cor_id).label("lawyer"),
+                exists()
+                .where(
+                    Doctor.doctor_id == cor_id,
+                    Doctor.status == Doctor_Status.approved,
+                )
+                .label("doctor"),
+                exists()
+                .where(LabAssistant.lab_assistant_cor_id == cor_id)
+                .label("lab_assistant"),
+                exists()
+                .where(EnergyManager.energy_manager_cor_id == cor_id)
+                .label("energy_manager"),
+            )
+        )
+    ).one()
+    return [role for role, has_role in row._mapping.items() if has_role]
+
+
+async def get_db_roles(
+    db: AsyncSession, cor_id: str, request: Optional[Request] = None
+) -> List[str]:
+    """
+    Роли пользователя, хранящиеся в БД: request.state -> Redis -> Postgres.
+    При недоступности Redis роли читаются из БД.
+    """
+    memo = None
+    if request is not None:
+        memo = getattr(request.state, "user_roles", None)
+        if memo is None:
+            memo = request.state.user_roles = {}
+        if cor_id in memo:
+            return memo[cor_id]
+
+    version = None
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.get(_roles_version_key(cor_id))
+            pipe.get(_roles_key(cor_id))
+            version, cached = await pipe.execute()
+        version = version or "0"
+        if cached:
+            cached = json.loads(cached)
+            if cached.get("version") == version:
+                roles = cached["roles"]
+                if memo is not None:
+                    memo[cor_id] = roles
+                return roles
+    except RedisError as e:
+        logger.warning(f"Roles cache unavailable for {cor_id}: {e}")
+        version = None
+
+    roles = await _query_db_roles(db=db, cor_id=cor_id)
+
+    if version is not None:
+        try:
+            await redis_client.set(
+                _roles_key(cor_id),
+                json.dumps({"version": version, "roles": roles}),
+                ex=ROLES_CACHE_TTL_SECONDS,
+            )
+        except RedisError as e:
+            logger.warning(f"Failed to cache roles for {cor_id}: {e}")
+    if memo is not None:
+        memo[cor_id] = roles
+    return roles
+
+
+async def resolve_user_roles(
+    user: User, db: AsyncSession, request: Optional[Request] = None
+) -> List[str]:
+    """Полный список ролей пользователя в порядке, который отдаёт API."""
+    db_roles = set(await get_db_roles(db=db, cor_id=user.cor_id, request=request))
+    roles = []
+    if user.email in settings.admin_accounts:
+        roles.append("admin")
+    if "lawyer" in db_roles or user.email in settings.lawyer_accounts:
+        roles.append("lawyer")
+    if user.email.endswith("@cor-int.com"):
+        roles.append("cor-int")
+    for role in ("doctor", "lab_assistant", "energy_manager"):
+        if role in db_roles:
+            roles.append(role)
+    if user.is_active:
+        roles.append("active_user")
+    return roles
+
+
+async def invalidate_user_roles(cor_id: Optional[str]) -> None:
+    """
+    Сбрасывает кэш ролей пользователя. Вызывается после commit изменения,
+    влияющего на роли (создание/одобрение/удаление врача, юриста, лаборанта и т.п.).
+    """
+    if not cor_id:
+        return
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(_roles_version_key(cor_id))
+            pipe.delete(_roles_key(cor_id))
+            await pipe.execute()
+    except RedisError as e:
+        logger.error(f"Failed to invalidate roles cache for {cor_id}: {e}")
@@ -0,0 +1,230 @@
+"""
+Пул открытых OpenSlide-дескрипторов для SVS-маршрутов.
+
+Открытие OpenSlide разбирает всю структуру TIFF-файла, поэтому дескрипторы
+переиспользуются между запросами: LRU на процесс, ключ — путь к файлу,
+(mtime, size) проверяются при каждом обращении. Если файл заменён,
+старый дескриптор выводится из пула и закрывается, когда его отпустят
+все читающие потоки. read_region у OpenSlide потокобезопасен, поэтому
+один дескриптор одновременно используют несколько запросов.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Dict, Iterator, Optional, Tuple
+
+from loguru import logger
+from openslide import OpenSlide
+from openslide.deepzoom import DeepZoomGenerator
+from PIL import Image
+from prometheus_client import Counter, Gauge
+
+
+SLIDE_POOL_MAX_SIZE = 16
+
+# Параметры DeepZoom-пирамиды: 254 + 2 * overlap = 256 пикселей с перекрытием
+DEEPZOOM_TILE_SIZE = 254
+DEEPZOOM_OVERLAP = 1
+DEEPZOOM_DEFAULT_QUALITY = 80
+
+# Количество открытых OpenSlide-дескрипторов (в пуле и ожидающих закрытия)
+slide_pool_open_handles = Gauge(
+    "slide_pool_open_handles", "Number of open OpenSlide handles"
+)
+
+# Обращения к пулу: result=hit — дескриптор переиспользован, miss — открыт заново
+slide_pool_requests_total = Counter(
+    "slide_pool_requests_total",
+    "OpenSlide handle pool lookups",
+    ["result"],
+)
+
+
+class _PooledSlide:
+    __slots__ = ("slide", "signature", "refs", "retired", "deepzoom", "content_hash")
+
+    def __init__(self, slide: OpenSlide, signature: Tuple[int, int]):
+        self.slide = slide
+        self.signature = signature
+        self.refs = 0
+        self.retired = False
+        # DeepZoomGenerator по параметрам (tile_size, overlap, limit_bounds)
+        self.deepzoom: Dict[Tuple[int, int, bool], DeepZoomGenerator] = {}
+        self.content_hash: Optional[str] = None
+
+
+class SlideHandlePool:
+    def __init__(self, max_size: int = SLIDE_POOL_MAX_SIZE):
+        self._max_size = max_size
+        self._entries: "OrderedDict[str, _PooledSlide]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signature(path: str) -> Tuple[int, int]:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _close(self, entry: _PooledSlide) -> None:
+        try:
+            entry.slide.close()
+        except Exception as e:
+            logger.warning(f"Failed to close OpenSlide handle: {e}")
+        slide_pool_open_handles.dec()
+
+    def _retire(self, entry: _PooledSlide) -> Optional[_PooledSlide]:
+        """Помечает запись выведенной; возвращает её, если закрыть можно сразу."""
+        entry.retired = True
+        return entry if entry.refs == 0 else None
+
+    @contextmanager
+    def acquire(self, path: str) -> Iterator[OpenSlide]:
+        """Выдаёт открытый OpenSlide для path на время блока with."""
+        with self._acquire_entry(path) as entry:
+            yield entry.slide
+
+    @contextmanager
+    def acquire_deepzoom(
+        self, path: str, tile_size: int, overlap: int, limit_bounds: bool = True
+    ) -> Iterator[DeepZoomGenerator]:
+        """
+        Выдаёт DeepZoomGenerator поверх дескриптора из пула. Генератор
+        создаётся один раз на дескриптор и набор параметров.
+        """
+        key = (tile_size, overlap, limit_bounds)
+        with self._acquire_entry(path) as entry:
+            generator = entry.deepzoom.get(key)
+            if generator is None:
+                generator = DeepZoomGenerator(
+                    entry.slide,
+                    tile_size=tile_size,
+                    overlap=overlap,
+                    limit_bounds=limit_bounds,
+                )
+                entry.deepzoom[key] = generator
+            yield generator
+
+    def content_hash(self, path: str) -> str:
+        """
+        Хэш содержимого слайда: openslide.quickhash-1 (хэш свойств и тайлов
+        нижнего уровня), а для форматов без него — хэш пути, mtime и размера.
+        """
+        with self._acquire_entry(path) as entry:
+            if entry.content_hash is None:
+                quickhash = entry.slide.properties.get("openslide.quickhash-1")
+                if not quickhash:
+                    raw = f"{os.path.realpath(path)}|{entry.signature[0]}|{entry.signature[1]}"
+                    quickhash = hashlib.sha256(raw.encode()).hexdigest()
+                entry.content_hash = quickhash[:32]
+            return entry.content_hash
+
+    @contextmanager
+    def _acquire_entry(self, path: str) -> Iterator[_PooledSlide]:
+        path = os.path.realpath(path)
+        signature = self._signature(path)
+        to_close = []
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.signature != signature:
+                del self._entries[path]
+                to_close.append(self._retire(entry))
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(path)
+                entry.refs += 1
+        if entry is not None:
+            slide_pool_requests_total.labels("hit").inc()
+        else:
+            slide_pool_requests_total.labels("miss").inc()
+            # Открываем вне блокировки: разбор TIFF может занимать заметное время
+            slide = OpenSlide(path)
+            slide_pool_open_handles.inc()
+            opened = _PooledSlide(slide, signature)
+            opened.refs = 1
+            with self._lock:
+                current = self._entries.get(path)
+                if current is not None and current.signature == signature:
+                    # Параллельный запрос успел открыть тот же файл
+                    current.refs += 1
+                    self._entries.move_to_end(path)
+                    entry = current
+                    to_close.append(opened)
+                else:
+                    if current is not None:
+                        del self._entries[path]
+                        to_close.append(self._retire(current))
+                    self._entries[path] = opened
+                    entry = opened
+                    while len(self._entries) > self._max_size:
+                        _, evicted = self._entries.popitem(last=False)
+                        to_close.append(self._retire(evicted))
+        for stale in to_close:
+            if stale is not None:
+                self._close(stale)
+
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.refs -= 1
+                close_now = entry.retired and entry.refs == 0
+            if close_now:
+                self._close(entry)
+
+    def evict(self, path: str) -> None:
+        """Выводит из пула дескриптор файла (например, перед его заменой)."""
+        path = os.path.realpath(path)
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            stale = self._retire(entry) if entry is not None else None
+        if stale is not None:
+            self._close(stale)
+
+    def evict_dir(self, directory: str) -> None:
+        """Выводит из пула дескрипторы всех файлов в каталоге directory."""
+        prefix = os.path.join(os.path.realpath(directory), "")
+        with self._lock:
+            paths = [path for path in self._entries if path.startswith(prefix)]
+            stale = [self._retire(self._entries.pop(path)) for path in paths]
+        for entry in stale:
+            if entry is not None:
+                self._close(entry)
+
+
+slide_pool = SlideHandlePool()
+
+
+# Кэш выбора SVS-файла в каталоге: (mtime каталога, имя файла)
+_slide_dir_cache: Dict[str, Tuple[int, Optional[str]]] = {}
+
+
+def find_slide_file(slide_dir: str) -> Optional[str]:
+    """
+    Путь к SVS-файлу в каталоге slide_dir или None. Повторный os.listdir
+    выполняется только при изменении каталога.
+    """
+    try:
+        dir_mtime = os.stat(slide_dir).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _slide_dir_cache.get(slide_dir)
+    if cached is not None and cached[0] == dir_mtime:
+        filename = cached[1]
+    else:
+        svs_files = [f for f in os.listdir(slide_dir) if f.lower().endswith(".svs")]
+        filename = svs_files[0] if svs_files else None
+        _slide_dir_cache[slide_dir] = (dir_mtime, filename)
+    return os.path.join(slide_dir, filename) if filename else None
+
+
+def encode_tile(tile: Image.Image, fmt: str, quality: int) -> bytes:
+    buf = BytesIO()
+    if fmt == "webp":
+        tile.save(buf, format="WEBP", quality=quality, method=2)
+    else:
+        if tile.mode != "RGB":
+            tile = tile.convert("RGB")
+        tile.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
@@ -0,0 +1,321 @@
+"""
+Локальный кэш файлов слайдов (SVS) с SMB-хранилища, общий для всех
+пользователей и воркеров.
+
+Структура каталога settings.slide_cache_dir:
+  objects/<sha256 содержимого>.svs — файлы слайдов (content-addressed);
+  refs/<sha256 scan_url>           — sha256 содержимого для scan_url;
+  partial/<sha256 scan_url>.part   — загружаемый слайд (блочный кэш SMBRangeFile)
+                                     и .map — карта загруженных блоков;
+  locks/<sha256 scan_url>.lock     — flock на время загрузки.
+
+Загрузка выполняется один раз (single-flight): внутри воркера параллельные
+запросы ждут одну задачу, между воркерами — flock. Слайд докачивается блоками
+в partial/; пока загрузка идёт, source_opener() отдаёт SMBRangeFile над тем же
+блочным кэшем, так что миниатюру и первые тайлы можно показать сразу. После
+загрузки всех блоков считается sha256 и файл переносится в objects/.
+
+В settings.slide_cache_max_bytes входят и objects/, и partial/ (по занятому на
+диске месту: .part разреженный). Место под слайд освобождается перед загрузкой:
+удаляются давно открывавшиеся слайды (mtime обновляется при обращении) и
+брошенные недокачанные файлы, загрузку которых никто не держит под flock.
+Удаление файла, открытого OpenSlide в другом воркере, безопасно: данные
+остаются доступны до закрытия дескриптора.
+
+Файлы сканов на SMB считаются неизменяемыми: повторная проверка scan_url
+не выполняется.
+"""
+import asyncio
+import fcntl
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from loguru import logger
+from openslide import OpenSlide, OpenSlideUnsupportedFormatError
+from prometheus_client import Counter, Gauge
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cor_pass.config.config import settings
+from cor_pass.services.smb_range_file import SMBRangeFile
+
+
+# Кэш glass_id -> путь к слайду в воркере, чтобы не ходить в БД на каждый тайл
+GLASS_PATH_CACHE_TTL_SECONDS = 300
+GLASS_PATH_CACHE_MAX_SIZE = 4096
+# Как часто обновлять mtime слайда (метку LRU) при обращениях
+TOUCH_INTERVAL_SECONDS = 60
+_EVICT_TARGET_RATIO = 0.9
+_HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Обращения к кэшу слайдов: result=hit|download
+slide_store_requests_total = Counter(
+    "slide_store_requests_total", "Local slide cache lookups", ["result"]
+)
+
+# Размер локального кэша слайдов в байтах (по результату последнего обхода)
+slide_store_size_bytes = Gauge(
+    "slide_store_size_bytes", "Local slide cache size in bytes"
+)
+
+
+class SlideStore:
+    def __init__(self, directory: str, max_bytes: int):
+        self._objects_dir = os.path.join(directory, "objects")
+        self._refs_dir = os.path.join(directory, "refs")
+        self._partial_dir = os.path.join(directory, "partial")
+        self._locks_dir = os.path.join(directory, "locks")
+        for path in (
+            self._objects_dir,
+            self._refs_dir,
+            self._partial_dir,
+            self._locks_dir,
+        ):
+            os.makedirs(path, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._glass_paths: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._glass_urls: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._touched: Dict[str, float] = {}
+
+    @staticmethod
+    def _ref_name(scan_url: str) -> str:
+        return hashlib.sha256(scan_url.encode()).hexdigest()
+
+    def _object_path(self, content_hash: str) -> str:
+        return os.path.join(self._objects_dir, f"{content_hash}.svs")
+
+    def _touch(self, path: str) -> None:
+        now = time.time()
+        if now - self._touched.get(path, 0) < TOUCH_INTERVAL_SECONDS:
+            return
+        self._touched[path] = now
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _lookup(self, ref_name: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self._refs_dir, ref_name)) as f:
+                content_hash = f.read().strip()
+        except FileNotFoundError:
+            return None
+        path = self._object_path(content_hash)
+        return path if os.path.exists(path) else None
+
+    def _open_partial(self, scan_url: str, ref_name: str) -> SMBRangeFile:
+        return SMBRangeFile(scan_url, os.path.join(self._partial_dir, ref_name))
+
+    def _download(self, scan_url: str, ref_name: str) -> str:
+        """Загружает слайд в кэш (синхронно, под межпроцессной блокировкой)."""
+        lock_path = os.path.join(self._locks_dir, f"{ref_name}.lock")
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Пока ждали блокировку, слайд мог загрузить другой воркер
+            path = self._lookup(ref_name)
+            if path is not None:
+                return path
+
+            range_file = self._open_partial(scan_url, ref_name)
+            try:
+                self._evict(incoming=range_file.size)
+                range_file.prefetch()
+            finally:
+                range_file.close()
+
+            sha256 = hashlib.sha256()
+            with open(range_file.data_path, "rb") as f:
+                for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                    sha256.update(chunk)
+            content_hash = sha256.hexdigest()
+            path = self._object_path(content_hash)
+            try:
+                OpenSlide(range_file.data_path).close()
+            except OpenSlideUnsupportedFormatError:
+                for partial_path in (range_file.data_path, range_file.map_path):
+                    if os.path.exists(partial_path):
+                        os.unlink(partial_path)
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"File {os.path.basename(scan_url)} is not a valid SVS format",
+                )
+            os.replace(range_file.data_path, path)
+            os.unlink(range_file.map_path)
+
+            ref_tmp = os.path.join(self._refs_dir, f"{ref_name}.tmp")
+            with open(ref_tmp, "w") as f:
+                f.write(content_hash)
+            os.replace(ref_tmp, os.path.join(self._refs_dir, ref_name))
+            logger.info(f"Слайд {scan_url} загружен в кэш: {path}")
+        self._evict(keep=path)
+        return path
+
+    def _partial_sizes(self) -> Dict[str, Tuple[float, int]]:
+        """Недокачанные слайды: {ref_name: (mtime, байт на диске в .part и .map)}."""
+        partials: Dict[str, Tuple[float, int]] = {}
+        for entry in os.scandir(self._partial_dir):
+            ref_name, ext = os.path.splitext(entry.name)
+            if ext not in (".part", ".map"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            mtime, size = partials.get(ref_name, (0.0, 0))
+            partials[ref_name] = (max(mtime, stat.st_mtime), size + stat.st_blocks * 512)
+        return partials
+
+    def _remove_abandoned_partial(self, ref_name: str) -> bool:
+        """Удаляет недокачанный слайд, если его загрузка сейчас не идёт."""
+        lock_path = os.path.join(self._locks_dir, f"{ref_name}.lock")
+        with open(lock_path, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            for ext in (".part", ".map"):
+                try:
+                    os.unlink(os.path.join(self._partial_dir, f"{ref_name}{ext}"))
+                except FileNotFoundError:
+                    pass
+        logger.info(f"Недокачанный слайд удалён из кэша: {ref_name}")
+        return True
+
+    def _evict(self, keep: Optional[str] = None, incoming: int = 0) -> None:
+        """
+        Удаляет давно открывавшиеся слайды и брошенные недокачанные файлы, если
+        кэш больше лимита. incoming — размер слайда, загрузка которого начинается.
+        """
+        lock_path = os.path.join(self._locks_dir, "evict.lock")
+        with open(lock_path, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            # (mtime, размер, путь к слайду в objects/ | None, ref_name в partial/ | None)
+            entries = []
+            total = 0
+            for entry in os.scandir(self._objects_dir):
+                if not entry.name.endswith(".svs"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size
+                entries.append((stat.st_mtime, stat.st_size, entry.path, None))
+            for ref_name, (mtime, size) in self._partial_sizes().items():
+                total += size
+                entries.append((mtime, size, None, ref_name))
+            if total + incoming > self._max_bytes:
+                target = int(self._max_bytes * _EVICT_TARGET_RATIO) - incoming
+                for _, size, path, ref_name in sorted(entries, key=lambda e: e[0]):
+                    if total <= target:
+                        break
+                    if path is None:
+                        if not self._remove_abandoned_partial(ref_name):
+                            continue
+                    elif path == keep:
+                        continue
+                    else:
+                        try:
+                            os.unlink(path)
+                            logger.info(f"Слайд удалён из кэша: {path}")
+                        except FileNotFoundError:
+                            pass
+                    total -= size
+            slide_store_size_bytes.set(total)
+
+    def _start_download(self, scan_url: str, ref_name: str) -> asyncio.Future:
+        future = self._inflight.get(ref_name)
+        if future is None:
+            slide_store_requests_total.labels("download").inc()
+            loop = asyncio.get_running_loop()
+            future = asyncio.ensure_future(
+                loop.run_in_executor(None, self._download, scan_url, ref_name)
+            )
+            self._inflight[ref_name] = future
+            future.add_done_callback(lambda _: self._inflight.pop(ref_name, None))
+        return future
+
+    async def ensure(self, scan_url: str) -> str:
+        """Путь к локальной копии слайда scan_url; при необходимости загружает его."""
+        ref_name = self._ref_name(scan_url)
+        path = self._lookup(ref_name)
+        if path is not None:
+            slide_store_requests_total.labels("hit").inc()
+            self._touch(path)
+            return path
+        # shield: отмена одного запроса не прерывает загрузку для остальных
+        return await asyncio.shield(self._start_download(scan_url, ref_name))
+
+    def source_opener(self, scan_url: str) -> Callable[[], BinaryIO]:
+        """
+        Функция, открывающая файл слайда для tifffile: локальную копию, если она
+        уже есть, иначе SMBRangeFile над блочным кэшем загрузки (загрузка
+        запускается в фоне, если ещё не идёт). Вызывается в потоке исполнителя,
+        закрывает файл вызывающий код.
+        """
+        ref_name = self._ref_name(scan_url)
+        path = self._lookup(ref_name)
+        if path is not None:
+            self._touch(path)
+            return partial(open, path, "rb")
+        download = self._start_download(scan_url, ref_name)
+        # Ошибка фоновой загрузки будет получена следующим ensure()
+        download.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return partial(self._open_partial, scan_url, ref_name)
+
+    async def glass_scan_url(self, db: AsyncSession, glass_id: str) -> str:
+        """scan_url SVS-файла стекла (с кэшем в воркере)."""
+        cached = self._glass_urls.get(glass_id)
+        if cached is not None and cached[0] > time.monotonic():
+            self._glass_urls.move_to_end(glass_id)
+            return cached[1]
+        # repository.glass тянет за собой case и печать этикеток; сканер,
+        # которому нужен только ensure(), их не импортирует
+        from cor_pass.repository.glass import get_glass_svs
+
+        db_glass = await get_glass_svs(db=db, glass_id=glass_id)
+        if db_glass is None:
+            raise HTTPException(status_code=404, detail="Glass or scan URL not found")
+        if os.path.splitext(db_glass.scan_url)[1].lower() != ".svs":
+            raise HTTPException(status_code=400, detail="File is not an SVS file")
+        self._glass_urls[glass_id] = (
+            time.monotonic() + GLASS_PATH_CACHE_TTL_SECONDS,
+            db_glass.scan_url,
+        )
+        while len(self._glass_urls) > GLASS_PATH_CACHE_MAX_SIZE:
+            self._glass_urls.popitem(last=False)
+        return db_glass.scan_url
+
+    async def resolve_glass(self, db: AsyncSession, glass_id: str) -> str:
+        """Путь к локальной копии слайда стекла glass_id."""
+        cached = self._glass_paths.get(glass_id)
+        if cached is not None:
+            expires_at, path = cached
+            if expires_at > time.monotonic() and os.path.exists(path):
+                self._glass_paths.move_to_end(glass_id)
+                self._touch(path)
+                return path
+            self._glass_paths.pop(glass_id, None)
+
+        path = await self.ensure(await self.glass_scan_url(db, glass_id))
+
+        self._glass_paths[glass_id] = (
+            time.monotonic() + GLASS_PATH_CACHE_TTL_SECONDS,
+            path,
+        )
+        while len(self._glass_paths) > GLASS_PATH_CACHE_MAX_SIZE:
+            self._glass_paths.popitem(last=False)
+        return path
+
+
+slide_store = SlideStore(
+    directory=settings.slide_cache_dir, max_bytes=settings.slide_cache_max_bytes
+)
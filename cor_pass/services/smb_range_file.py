@@ -0,0 +1,206 @@
+"""
+Чтение файлов с SMB-сервера по диапазонам с локальным блочным кэшем.
+
+SMBRangeFile — seekable файловый объект (io.RawIOBase) поверх файла на SMB.
+Чтение выравнивается по блокам block_size: недостающие блоки загружаются
+через retrieveFileFromOffset и сохраняются в разреженный локальный файл
+(<cache>.part), а их наличие отмечается в карте блоков (<cache>.map, один байт
+на блок). Кэш общий для всех процессов: блок записывается до отметки в карте,
+поэтому читатель никогда не увидит неполный блок.
+
+Так TIFF-читатели (tifffile) получают заголовки, миниатюру, этикетку и первые
+тайлы слайда за несколько блоков, не дожидаясь загрузки всего файла;
+prefetch() докачивает оставшиеся блоки.
+"""
+import io
+import os
+import queue
+import socket
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from loguru import logger
+from smb.SMBConnection import SMBConnection
+
+from cor_pass.config.config import settings
+
+
+SMB_BLOCK_SIZE = 1024 * 1024
+# Сколько блоков загружается одним запросом при фоновой докачке
+PREFETCH_RUN_BLOCKS = 32
+_SMB_POOL_MAX_IDLE = 8
+
+
+def smb_relative_path(path: str) -> str:
+    prefix = f"\\\\{settings.smb_server_ip}\\{settings.smb_share}\\"
+    if path.startswith(prefix):
+        return path[len(prefix):].strip("/\\")
+    return path.strip("/\\")
+
+
+class _SMBConnectionPool:
+    def __init__(self, max_idle: int):
+        self._idle: "queue.LifoQueue[SMBConnection]" = queue.LifoQueue(maxsize=max_idle)
+
+    def _connect(self) -> SMBConnection:
+        conn = SMBConnection(
+            settings.smb_user,
+            settings.smb_pass,
+            my_name=socket.gethostname(),
+            remote_name=settings.remote_name,
+            use_ntlm_v2=True,
+            is_direct_tcp=True,
+        )
+        if not conn.connect(settings.smb_server_ip, 445):
+            logger.error(f"Не удалось подключиться к SMB-серверу {settings.smb_server_ip}")
+            raise RuntimeError("Failed to connect to SMB server")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[SMBConnection]:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except Exception:
+            # Состояние соединения после ошибки неизвестно
+            conn.close()
+            raise
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+smb_pool = _SMBConnectionPool(_SMB_POOL_MAX_IDLE)
+
+
+def smb_file_size(scan_url: str) -> int:
+    with smb_pool.connection() as conn:
+        file_info = conn.getAttributes(settings.smb_share, smb_relative_path(scan_url))
+    filesize = getattr(file_info, "file_size", None)
+    if filesize is None:
+        raise ValueError("Cannot get filesize from SMB file_info")
+    return filesize
+
+
+class SMBRangeFile(io.RawIOBase):
+    def __init__(
+        self,
+        scan_url: str,
+        cache_path: str,
+        size: Optional[int] = None,
+        block_size: int = SMB_BLOCK_SIZE,
+    ):
+        super().__init__()
+        self.scan_url = scan_url
+        self.size = size if size is not None else smb_file_size(scan_url)
+        self.block_size = block_size
+        self.block_count = (self.size + block_size - 1) // block_size
+        self.data_path = f"{cache_path}.part"
+        self.map_path = f"{cache_path}.map"
+        self._relative_path = smb_relative_path(scan_url)
+        self._position = 0
+        self._data_fd = os.open(self.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._map_fd = os.open(self.map_path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._data_fd).st_size != self.size:
+            os.ftruncate(self._data_fd, self.size)
+        if os.fstat(self._map_fd).st_size != self.block_count:
+            os.ftruncate(self._map_fd, self.block_count)
+
+    # --- io.RawIOBase ---
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self.size - self._position)
+        if length <= 0:
+            return 0
+        data = self.pread(self._position, length)
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            os.close(self._data_fd)
+            os.close(self._map_fd)
+        super().close()
+
+    # --- блочный кэш ---
+
+    def pread(self, offset: int, length: int) -> bytes:
+        """Читает диапазон, загружая недостающие блоки с SMB."""
+        first = offset // self.block_size
+        last = (offset + length - 1) // self.block_size
+        self._ensure_blocks(first, last)
+        return os.pread(self._data_fd, length, offset)
+
+    def _missing_runs(self, first: int, last: int, max_run: int):
+        present = os.pread(self._map_fd, last - first + 1, first)
+        run_start = None
+        for i, flag in enumerate(present):
+            block = first + i
+            if flag == 0:
+                if run_start is None:
+                    run_start = block
+                elif block - run_start >= max_run:
+                    yield run_start, block - 1
+                    run_start = block
+            elif run_start is not None:
+                yield run_start, block - 1
+                run_start = None
+        if run_start is not None:
+            yield run_start, last
+
+    def _fetch_run(self, first: int, last: int) -> None:
+        offset = first * self.block_size
+        length = min((last + 1) * self.block_size, self.size) - offset
+        buf = io.BytesIO()
+        with smb_pool.connection() as conn:
+            _, received = conn.retrieveFileFromOffset(
+                settings.smb_share, self._relative_path, buf, offset, length
+            )
+        if received != length:
+            raise RuntimeError(
+                f"Expected {length} bytes at offset {offset}, got {received}"
+            )
+        os.pwrite(self._data_fd, buf.getbuffer(), offset)
+        # Отметка в карте — только после записи данных блока
+        os.pwrite(self._map_fd, b"\x01" * (last - first + 1), first)
+
+    def _ensure_blocks(self, first: int, last: int) -> None:
+        for run_first, run_last in self._missing_runs(first, last, max_run=last - first + 1):
+            self._fetch_run(run_first, run_last)
+
+    def is_complete(self) -> bool:
+        return b"\x00" not in os.pread(self._map_fd, self.block_count, 0)
+
+    def prefetch(self) -> None:
+        """Загружает все недостающие блоки файла."""
+        if self.block_count == 0:
+            return
+        for run_first, run_last in self._missing_runs(
+            0, self.block_count - 1, max_run=PREFETCH_RUN_BLOCKS
+        ):
+            self._fetch_run(run_first, run_last)
@@ -0,0 +1,230 @@
+"""
+Кэш отрендеренных тайлов слайдов.
+
+Ключ — (хэш содержимого слайда, уровень, x, y, формат, качество), поэтому
+запись никогда не устаревает: замена слайда меняет хэш, а не содержимое
+записи. Два уровня:
+  * память воркера — LRU с ограничением по байтам;
+  * диск (settings.tile_cache_dir) — общий для всех воркеров gunicorn.
+    Запись атомарная (временный файл + os.replace), mtime файла обновляется
+    при чтении и служит меткой LRU. Размер кэша — общий для воркеров
+    счётчик в файле .size: каждый воркер прибавляет к нему записанные байты,
+    поэтому лимит settings.tile_cache_max_bytes действует на весь каталог,
+    а не на каждого воркера. Когда счётчик превышает лимит, один из воркеров
+    (под flock) обходит каталог, удаляет самые старые файлы и записывает
+    в счётчик измеренный размер.
+"""
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+from cor_pass.config.config import settings
+
+
+# Обращения к кэшу тайлов: tier=memory|disk — попадание, tier=miss — промах
+tile_cache_requests_total = Counter(
+    "tile_cache_requests_total", "Rendered tile cache lookups", ["tier"]
+)
+
+# Размер уровней кэша в байтах (disk — по результату последнего обхода каталога)
+tile_cache_size_bytes = Gauge(
+    "tile_cache_size_bytes", "Rendered tile cache size in bytes", ["tier"]
+)
+
+# Доля от лимита, до которой очищается дисковый кэш при переполнении
+_EVICT_TARGET_RATIO = 0.9
+
+
+def tile_cache_key(
+    slide_hash: str, level: int, x: int, y: int, fmt: str, quality: int
+) -> str:
+    raw = f"{slide_hash}|{level}|{x}|{y}|{fmt}|{quality}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def tile_etag(key: str) -> str:
+    """Сильный ETag: ключ однозначно определяет байты тайла."""
+    return f'"{key[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip() == etag for tag in if_none_match.split(","))
+
+
+class TileCache:
+    def __init__(self, directory: str, max_disk_bytes: int, max_memory_bytes: int):
+        self._directory = directory
+        self._max_disk_bytes = max_disk_bytes
+        self._max_memory_bytes = max_memory_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # Дескриптор файла-счётчика .size открывается в каждом процессе заново:
+        # унаследованный при fork делит flock с родителем
+        self._size_lock = threading.Lock()
+        self._size_fd: Optional[int] = None
+        self._size_pid: Optional[int] = None
+        self._disk_scanned = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key[:2], key[2:])
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self._max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self._max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+            tile_cache_size_bytes.labels("memory").set(self._memory_bytes)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+        if data is not None:
+            tile_cache_requests_total.labels("memory").inc()
+            return data
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            tile_cache_requests_total.labels("miss").inc()
+            return None
+        except OSError as e:
+            logger.warning(f"Tile cache read failed for {path}: {e}")
+            tile_cache_requests_total.labels("miss").inc()
+            return None
+        tile_cache_requests_total.labels("disk").inc()
+        self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self._remember(key, data)
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning(f"Tile cache write failed for {path}: {e}")
+            return
+
+        try:
+            disk_bytes = self._update_disk_bytes(lambda total: total + len(data))
+        except OSError as e:
+            logger.warning(f"Tile cache size update failed: {e}")
+            return
+        with self._lock:
+            need_scan = not self._disk_scanned or disk_bytes > self._max_disk_bytes
+            if need_scan:
+                self._disk_scanned = True
+        if need_scan:
+            self._evict_disk()
+
+    def _update_disk_bytes(self, update: Callable[[int], int]) -> int:
+        """
+        Заменяет общий для воркеров размер дискового кэша на update(текущий)
+        под flock файла .size и возвращает новое значение.
+        """
+        with self._size_lock:
+            if self._size_pid != os.getpid():
+                self._size_fd = os.open(
+                    os.path.join(self._directory, ".size"), os.O_RDWR | os.O_CREAT, 0o644
+                )
+                self._size_pid = os.getpid()
+            fcntl.flock(self._size_fd, fcntl.LOCK_EX)
+            try:
+                raw = os.pread(self._size_fd, 8, 0)
+                current = int.from_bytes(raw, "little") if len(raw) == 8 else 0
+                total = max(0, update(current))
+                os.pwrite(self._size_fd, total.to_bytes(8, "little"), 0)
+            finally:
+                fcntl.flock(self._size_fd, fcntl.LOCK_UN)
+        return total
+
+    def _scan(self) -> Tuple[int, list]:
+        total = 0
+        files = []
+        for bucket in os.scandir(self._directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return total, files
+
+    def _evict_disk(self) -> None:
+        """Удаляет самые давно использованные файлы, если кэш больше лимита."""
+        lock_path = os.path.join(self._directory, ".evict.lock")
+        with open(lock_path, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Очисткой уже занимается другой воркер
+                return
+            started = time.perf_counter()
+            total, files = self._scan()
+            removed = 0
+            if total > self._max_disk_bytes:
+                target = int(self._max_disk_bytes * _EVICT_TARGET_RATIO)
+                files.sort()
+                for _, size, path in files:
+                    if total <= target:
+                        break
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    removed += 1
+            # Записанное другими воркерами во время обхода может не попасть
+            # в счётчик; следующий обход это исправит
+            self._update_disk_bytes(lambda _: total)
+            tile_cache_size_bytes.labels("disk").set(total)
+            if removed:
+                logger.info(
+                    f"Tile cache: evicted {removed} files in "
+                    f"{time.perf_counter() - started:.2f}s, size {total} bytes"
+                )
+
+
+tile_cache = TileCache(
+    directory=settings.tile_cache_dir,
+    max_disk_bytes=settings.tile_cache_max_bytes,
+    max_memory_bytes=settings.tile_cache_memory_bytes,
+)
@@ -0,0 +1,336 @@
+"""
+Выделенный пул потоков для чтения слайдов (OpenSlide) и рендеринга тайлов.
+
+Тяжёлые операции не занимают общий threadpool Starlette, в котором работают
+остальные синхронные маршруты. Задачи упорядочены по приоритету: тайлы
+текущего уровня масштаба пользователя (параметр viewport_level, запоминается
+до следующего запроса с ним) выполняются раньше остальных.
+
+Отмена:
+  * клиент отключился — ещё не начатая задача снимается с очереди;
+  * клиент прислал тайл новой генерации вьюпорта (параметр gen) — все
+    ожидающие задачи этого вьюпорта со старой генерацией снимаются,
+    такие запросы получают 409.
+Вьюпорт (owner задач) — пользователь, слайд и сессия просмотрщика
+(viewport_owner), поэтому вкладки и слайды одного пользователя не отменяют
+задачи друг друга.
+Если в очереди больше tile_executor_max_pending задач, новые запросы
+получают 503 с Retry-After.
+"""
+import asyncio
+import itertools
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import Response
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+from cor_pass.config.config import settings
+
+
+# Приоритеты задач (меньше — раньше)
+PRIORITY_CURRENT_LEVEL = 0
+PRIORITY_OTHER = 1
+
+_VIEWPORTS_MAX_SIZE = 10000
+
+# Количество задач, ожидающих свободного потока
+tile_executor_queue_depth = Gauge(
+    "tile_executor_queue_depth", "Number of slide rendering jobs waiting for a worker"
+)
+
+# Счетчик задач, отклонённых из-за переполнения очереди
+tile_executor_rejected_total = Counter(
+    "tile_executor_rejected_total",
+    "Number of slide rendering jobs rejected because the queue is full",
+)
+
+# Счетчик задач, снятых с очереди: reason=superseded|disconnected
+tile_executor_cancelled_total = Counter(
+    "tile_executor_cancelled_total",
+    "Number of slide rendering jobs cancelled before they started",
+    ["reason"],
+)
+
+
+def viewport_owner(user_id: str, slide_id: str, viewer: Optional[str] = None) -> str:
+    """
+    Ключ вьюпорта для owner задач: пользователь, слайд (хэш, glass_id или путь)
+    и сессия просмотрщика (вкладка, WebSocket-соединение).
+    """
+    return f"{user_id}|{slide_id}|{viewer or ''}"
+
+
+class _TileJob:
+    __slots__ = ("owner", "generation", "func", "args", "future", "queued", "superseded")
+
+    def __init__(self, owner, generation, func, args):
+        self.owner: Optional[str] = owner
+        self.generation: Optional[int] = generation
+        self.func = func
+        self.args = args
+        self.future: Future = Future()
+        self.queued = True
+        self.superseded = False
+
+
+class TileExecutor:
+    def __init__(self, max_workers: int, max_pending: int):
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._queue: "queue.PriorityQueue[Tuple[int, int, _TileJob]]" = (
+            queue.PriorityQueue()
+        )
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._pending_count = 0
+        self._pending_by_owner: Dict[str, Set[_TileJob]] = {}
+        # Последнее состояние вьюпорта: (генерация, уровень масштаба)
+        self._viewports: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+        self._threads = []
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self._max_workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"tile-render-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _dequeue(self, job: _TileJob) -> None:
+        """Снимает задачу с учёта ожидающих. Вызывается под self._lock."""
+        if not job.queued:
+            return
+        job.queued = False
+        self._pending_count -= 1
+        tile_executor_queue_depth.dec()
+        if job.owner is not None:
+            owner_jobs = self._pending_by_owner.get(job.owner)
+            if owner_jobs is not None:
+                owner_jobs.discard(job)
+                if not owner_jobs:
+                    del self._pending_by_owner[job.owner]
+
+    def _worker(self) -> None:
+        while True:
+            _, _, job = self._queue.get()
+            with self._lock:
+                self._dequeue(job)
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = job.func(*job.args)
+            except BaseException as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
+
+    def _cancel_superseded(self, owner: str, generation: int) -> None:
+        """Снимает ожидающие задачи вьюпорта старых генераций. Под self._lock."""
+        for job in list(self._pending_by_owner.get(owner, ())):
+            if (
+                job.generation is not None
+                and job.generation < generation
+                and job.future.cancel()
+            ):
+                job.superseded = True
+                self._dequeue(job)
+                tile_executor_cancelled_total.labels("superseded").inc()
+
+    def _priority(
+        self,
+        owner: Optional[str],
+        level: Optional[int],
+        generation: Optional[int],
+        viewport_level: Optional[int],
+    ) -> int:
+        """
+        Обновляет вьюпорт owner (генерацию и текущий уровень масштаба)
+        и возвращает приоритет новой задачи. Вызывается под self._lock.
+        """
+        if owner is None or level is None:
+            return PRIORITY_CURRENT_LEVEL
+        current = self._viewports.get(owner)
+        if current is not None and generation is not None:
+            if generation < current[0]:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Viewport has changed",
+                )
+            if generation > current[0]:
+                self._cancel_superseded(owner, generation)
+        if generation is None:
+            generation = current[0] if current is not None else 0
+        if viewport_level is None:
+            viewport_level = current[1] if current is not None else level
+        self._viewports[owner] = (generation, viewport_level)
+        self._viewports.move_to_end(owner)
+        while len(self._viewports) > _VIEWPORTS_MAX_SIZE:
+            self._viewports.popitem(last=False)
+        return PRIORITY_CURRENT_LEVEL if level == viewport_level else PRIORITY_OTHER
+
+    def submit(
+        self,
+        func: Callable,
+        *args,
+        owner: Optional[str] = None,
+        level: Optional[int] = None,
+        generation: Optional[int] = None,
+        viewport_level: Optional[int] = None,
+    ) -> _TileJob:
+        self._ensure_started()
+        with self._lock:
+            priority = self._priority(owner, level, generation, viewport_level)
+            if self._pending_count >= self._max_pending:
+                tile_executor_rejected_total.inc()
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Сервер перегружен, повторите попытку позже.",
+                    headers={"Retry-After": "1"},
+                )
+            job = _TileJob(owner, generation, func, args)
+            self._pending_count += 1
+            tile_executor_queue_depth.inc()
+            if owner is not None:
+                self._pending_by_owner.setdefault(owner, set()).add(job)
+        self._queue.put((priority, next(self._seq), job))
+        return job
+
+    def submit_batch(
+        self,
+        calls: Sequence[Tuple[Callable, tuple, int]],
+        owner: Optional[str] = None,
+        generation: Optional[int] = None,
+        viewport_level: Optional[int] = None,
+    ) -> List[_TileJob]:
+        """
+        Ставит в очередь пакет задач (функция, аргументы, уровень). Если очередь
+        переполняется посреди пакета, уже поставленные задачи снимаются.
+        """
+        jobs: List[_TileJob] = []
+        try:
+            for func, args, level in calls:
+                jobs.append(
+                    self.submit(
+                        func,
+                        *args,
+                        owner=owner,
+                        level=level,
+                        generation=generation,
+                        viewport_level=viewport_level,
+                    )
+                )
+        except HTTPException:
+            for job in jobs:
+                self.cancel(job)
+            raise
+        return jobs
+
+    def cancel(self, job: _TileJob) -> bool:
+        """Снимает ещё не начатую задачу с очереди."""
+        with self._lock:
+            if not job.future.cancel():
+                return False
+            self._dequeue(job)
+        return True
+
+
+tile_executor = TileExecutor(
+    max_workers=settings.tile_executor_workers,
+    max_pending=settings.tile_executor_max_pending,
+)
+
+
+async def iter_completed(jobs: Sequence[_TileJob]) -> AsyncIterator[_TileJob]:
+    """
+    Выдаёт задачи по мере завершения. При закрытии итератора (например,
+    клиент отключился) ещё не начатые задачи снимаются с очереди.
+    """
+    futures = {asyncio.wrap_future(job.future): job for job in jobs}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                yield futures[future]
+    finally:
+        for job in jobs:
+            if not job.future.done() and tile_executor.cancel(job):
+                tile_executor_cancelled_total.labels("disconnected").inc()
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def run_slide_job(
+    request: Request,
+    func: Callable,
+    *args,
+    owner: Optional[str] = None,
+    level: Optional[int] = None,
+    generation: Optional[int] = None,
+    viewport_level: Optional[int] = None,
+):
+    """
+    Выполняет func(*args) в tile_executor. Если клиент отключился до начала
+    выполнения, задача снимается с очереди; если она вытеснена новой
+    генерацией вьюпорта — возвращается 409.
+    """
+    job = tile_executor.submit(
+        func,
+        *args,
+        owner=owner,
+        level=level,
+        generation=generation,
+        viewport_level=viewport_level,
+    )
+    result_future = asyncio.wrap_future(job.future)
+    disconnect_task = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait(
+            {result_future, disconnect_task}, return_when=asyncio.FIRST_COMPLETED
+        )
+        if result_future.done():
+            if result_future.cancelled():
+                if job.superseded:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="Viewport has changed",
+                    )
+                raise asyncio.CancelledError()
+            return result_future.result()
+        # Клиент отключился: ответ уже некому отправлять
+        if tile_executor.cancel(job):
+            tile_executor_cancelled_total.labels("disconnected").inc()
+        else:
+            logger.debug("Client disconnected while slide job was running")
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    finally:
+        disconnect_task.cancel()
+        if not job.future.done():
+            tile_executor.cancel(job)
@@ -0,0 +1,176 @@
+"""
+Заранее отрендеренные DeepZoom-пирамиды слайдов.
+
+Для каждого слайда — один SQLite-файл в стиле MBTiles
+(settings.tile_pyramid_dir/<хэш слайда>.mbtiles) с таблицами
+metadata(name, value) и tiles(zoom_level, tile_column, tile_row, tile_data).
+В отличие от MBTiles, адресация тайлов — DeepZoom (строки сверху вниз), уровни
+совпадают с уровнями /svs/deepzoom, а формат и качество записаны в metadata.
+
+По умолчанию рендерятся все уровни, кроме PYRAMID_SKIPPED_LEVELS самых
+подробных (на них приходится ~95% тайлов), при settings.tile_pyramid_all_levels
+— вся пирамида. Файл пишется во временный и атомарно переносится на место,
+поэтому читатель видит либо полную пирамиду, либо никакую.
+
+generate_pyramid() запускается в отдельном процессе (см. scan_worker),
+TilePyramidStore.get() используется SVS-маршрутами; отсутствующие тайлы
+рендерятся через OpenSlide.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from loguru import logger
+from prometheus_client import Counter
+
+from cor_pass.config.config import settings
+from cor_pass.services.slide_pool import (
+    DEEPZOOM_DEFAULT_QUALITY,
+    DEEPZOOM_OVERLAP,
+    DEEPZOOM_TILE_SIZE,
+    encode_tile,
+    slide_pool,
+)
+
+
+PYRAMID_FORMAT = "jpeg"
+PYRAMID_QUALITY = DEEPZOOM_DEFAULT_QUALITY
+PYRAMID_SKIPPED_LEVELS = 2
+# Открытых SQLite-соединений на поток
+_MAX_OPEN_PYRAMIDS = 32
+_INSERT_BATCH_SIZE = 256
+
+# Обращения к пирамидам: result=hit — тайл отдан из пирамиды, miss — рендер через OpenSlide
+tile_pyramid_requests_total = Counter(
+    "tile_pyramid_requests_total", "Pre-rendered tile pyramid lookups", ["result"]
+)
+
+_SCHEMA = """
+CREATE TABLE metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE tiles (
+    zoom_level INTEGER,
+    tile_column INTEGER,
+    tile_row INTEGER,
+    tile_data BLOB,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+) WITHOUT ROWID;
+"""
+
+
+def pyramid_path(slide_hash: str) -> str:
+    return os.path.join(settings.tile_pyramid_dir, f"{slide_hash}.mbtiles")
+
+
+def generate_pyramid(svs_path: str, all_levels: bool = False) -> Optional[str]:
+    """
+    Рендерит пирамиду слайда svs_path; возвращает путь к файлу пирамиды
+    (None, если она уже существует).
+    """
+    os.makedirs(settings.tile_pyramid_dir, exist_ok=True)
+    slide_hash = slide_pool.content_hash(svs_path)
+    path = pyramid_path(slide_hash)
+    if os.path.exists(path):
+        return None
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;")
+        conn.executescript(_SCHEMA)
+        with slide_pool.acquire_deepzoom(
+            svs_path, DEEPZOOM_TILE_SIZE, DEEPZOOM_OVERLAP
+        ) as dz:
+            max_level = dz.level_count - 1
+            if not all_levels:
+                max_level = max(max_level - PYRAMID_SKIPPED_LEVELS, 0)
+            conn.executemany(
+                "INSERT INTO metadata (name, value) VALUES (?, ?)",
+                [
+                    ("name", os.path.basename(svs_path)),
+                    ("format", PYRAMID_FORMAT),
+                    ("quality", str(PYRAMID_QUALITY)),
+                    ("tile_size", str(DEEPZOOM_TILE_SIZE)),
+                    ("overlap", str(DEEPZOOM_OVERLAP)),
+                    ("minzoom", "0"),
+                    ("maxzoom", str(max_level)),
+                ],
+            )
+            for level in range(max_level + 1):
+                cols, rows = dz.level_tiles[level]
+                batch = []
+                for row in range(rows):
+                    for col in range(cols):
+                        tile = dz.get_tile(level, (col, row))
+                        batch.append(
+                            (level, col, row, encode_tile(tile, PYRAMID_FORMAT, PYRAMID_QUALITY))
+                        )
+                        if len(batch) >= _INSERT_BATCH_SIZE:
+                            conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", batch)
+                            batch = []
+                conn.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", batch)
+        conn.commit()
+        conn.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        conn.close()
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    logger.info(f"Пирамида тайлов {svs_path} (уровни 0..{max_level}) сохранена: {path}")
+    return path
+
+
+class TilePyramidStore:
+    """Чтение тайлов из пирамид; SQLite-соединения открываются по одному на поток."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _connection(self, slide_hash: str) -> Optional[sqlite3.Connection]:
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = OrderedDict()
+        conn = connections.get(slide_hash)
+        if conn is not None:
+            connections.move_to_end(slide_hash)
+            return conn
+        path = pyramid_path(slide_hash)
+        if not os.path.exists(path):
+            return None
+        # Пирамида не меняется после записи: immutable отключает блокировки
+        conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+        metadata = dict(conn.execute("SELECT name, value FROM metadata"))
+        if (
+            metadata.get("format") != PYRAMID_FORMAT
+            or metadata.get("quality") != str(PYRAMID_QUALITY)
+            or metadata.get("tile_size") != str(DEEPZOOM_TILE_SIZE)
+            or metadata.get("overlap") != str(DEEPZOOM_OVERLAP)
+        ):
+            conn.close()
+            return None
+        connections[slide_hash] = conn
+        while len(connections) > _MAX_OPEN_PYRAMIDS:
+            _, old = connections.popitem(last=False)
+            old.close()
+        return conn
+
+    def get(
+        self, slide_hash: str, level: int, col: int, row: int, fmt: str, quality: int
+    ) -> Optional[bytes]:
+        """Тайл из пирамиды или None, если его нет (или он в другом формате)."""
+        if fmt != PYRAMID_FORMAT or quality != PYRAMID_QUALITY:
+            return None
+        conn = self._connection(slide_hash)
+        row_data = None
+        if conn is not None:
+            row_data = conn.execute(
+                "SELECT tile_data FROM tiles"
+                " WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (level, col, row),
+            ).fetchone()
+        tile_pyramid_requests_total.labels("hit" if row_data else "miss").inc()
+        return row_data[0] if row_data else None
+
+
+tile_pyramid = TilePyramidStore()
@@ -0,0 +1,283 @@
+"""
+Кэш декодированных DICOM-томов, общий для всех воркеров.
+
+Том декодируется один раз и сохраняется в settings.volume_cache_dir как
+<хэш исследования>.npy; воркеры открывают его через np.load(mmap_mode="r"),
+так что страницы тома лежат в page cache в одном экземпляре.
+
+Хэш исследования — sha256 содержимого его файлов. Чтобы не читать файлы
+на каждый запрос, хэш запоминается вместе с версией исследования
+(keys/<sha256 каталога>). Версия (versions/<sha256 каталога>) увеличивается
+через invalidate() после изменения файлов исследования; её видят все процессы,
+поэтому после загрузки новых файлов ни один воркер не отдаст старый том.
+
+Том ключуется по содержимому, поэтому одинаковые исследования разных
+пользователей делят один .npy. Заголовок среза читается из каталога
+вызывающего (в метаданных хранится имя файла, а не путь): имена файлов входят
+в хэш, так что файл с тем же содержимым есть в каждом таком каталоге.
+
+Если суммарный размер томов превышает settings.volume_cache_max_bytes,
+удаляются давно открывавшиеся. Удаление файла, отображённого в память
+другим воркером, безопасно: данные остаются доступны до закрытия отображения.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pydicom
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+from cor_pass.config.config import settings
+
+
+# Открытых отображений томов на процесс
+VOLUME_CACHE_OPEN_MAX_SIZE = 16
+# Как часто обновлять mtime тома (метку LRU) при обращениях
+TOUCH_INTERVAL_SECONDS = 60
+_EVICT_TARGET_RATIO = 0.9
+_HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Обращения к кэшу томов: result=memory — отображение уже открыто в процессе,
+# disk — открыт готовый .npy, build — том декодирован из DICOM
+volume_cache_requests_total = Counter(
+    "volume_cache_requests_total", "DICOM volume cache lookups", ["result"]
+)
+
+# Размер кэша томов на диске в байтах (по результату последнего обхода)
+volume_cache_size_bytes = Gauge(
+    "volume_cache_size_bytes", "DICOM volume cache size in bytes"
+)
+
+
+def _study_files(study_dir: str):
+    return sorted(
+        f
+        for f in os.listdir(study_dir)
+        if not f.startswith(".")
+        and not f.lower().endswith(".svs")
+        and os.path.isfile(os.path.join(study_dir, f))
+    )
+
+
+class VolumeCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self._volumes_dir = os.path.join(directory, "volumes")
+        self._keys_dir = os.path.join(directory, "keys")
+        self._versions_dir = os.path.join(directory, "versions")
+        self._locks_dir = os.path.join(directory, "locks")
+        for path in (
+            self._volumes_dir,
+            self._keys_dir,
+            self._versions_dir,
+            self._locks_dir,
+        ):
+            os.makedirs(path, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._keys: Dict[str, Tuple[int, str]] = {}
+        self._open: "OrderedDict[str, Tuple[np.ndarray, pydicom.Dataset, dict]]" = OrderedDict()
+        self._touched: Dict[str, float] = {}
+
+    @staticmethod
+    def _dir_name(study_dir: str) -> str:
+        return hashlib.sha256(os.path.realpath(study_dir).encode()).hexdigest()
+
+    def _volume_path(self, key: str) -> str:
+        return os.path.join(self._volumes_dir, f"{key}.npy")
+
+    def _version(self, dir_name: str) -> int:
+        try:
+            with open(os.path.join(self._versions_dir, dir_name)) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def invalidate(self, study_dir: str) -> None:
+        """Вызывается после изменения файлов исследования study_dir."""
+        dir_name = self._dir_name(study_dir)
+        path = os.path.join(self._versions_dir, dir_name)
+        with open(os.path.join(self._locks_dir, f"{dir_name}.version.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            version = self._version(dir_name) + 1
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(version))
+            os.replace(tmp_path, path)
+        logger.debug(f"Версия тома {study_dir}: {version}")
+
+    def _study_key(self, study_dir: str) -> str:
+        """sha256 содержимого файлов исследования для его текущей версии."""
+        dir_name = self._dir_name(study_dir)
+        version = self._version(dir_name)
+        cached = self._keys.get(dir_name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        key_path = os.path.join(self._keys_dir, dir_name)
+        key = None
+        try:
+            with open(key_path) as f:
+                stored_version, stored_key = f.read().split()
+            if int(stored_version) == version:
+                key = stored_key
+        except (FileNotFoundError, ValueError):
+            pass
+        if key is None:
+            sha256 = hashlib.sha256()
+            for name in _study_files(study_dir):
+                sha256.update(name.encode() + b"\0")
+                with open(os.path.join(study_dir, name), "rb") as f:
+                    for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                        sha256.update(chunk)
+                sha256.update(b"\0")
+            key = sha256.hexdigest()
+            tmp_path = f"{key_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(f"{version} {key}")
+            os.replace(tmp_path, key_path)
+        self._keys[dir_name] = (version, key)
+        return key
+
+    def _touch(self, path: str) -> None:
+        now = time.time()
+        if now - self._touched.get(path, 0) < TOUCH_INTERVAL_SECONDS:
+            return
+        self._touched[path] = now
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _open_volume(
+        self, study_dir: str, key: str
+    ) -> Optional[Tuple[np.ndarray, pydicom.Dataset, dict]]:
+        path = self._volume_path(key)
+        try:
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+            volume = np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        # Тома, сохранённые раньше, хранят абсолютный путь к срезу
+        example_name = meta.get("example_name") or os.path.basename(meta["example_path"])
+        ds = pydicom.dcmread(
+            os.path.join(study_dir, example_name), stop_before_pixels=True, force=True
+        )
+        self._touch(path)
+        return volume, ds, meta
+
+    def _remove_partial(self, path: str) -> None:
+        """Удаляет недописанные файлы тома (после сбоя или падения процесса)."""
+        prefix = f"{os.path.basename(path)}."
+        for entry in os.scandir(self._volumes_dir):
+            if entry.name.startswith(prefix) and entry.name.endswith(".tmp"):
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _build(
+        self, study_dir: str, key: str, decode: Callable[[str], Tuple[np.ndarray, dict]]
+    ) -> Tuple[np.ndarray, pydicom.Dataset, dict]:
+        with open(os.path.join(self._locks_dir, f"{key}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Пока ждали блокировку, том мог построить другой воркер
+            opened = self._open_volume(study_dir, key)
+            if opened is not None:
+                volume_cache_requests_total.labels("disk").inc()
+                return opened
+            volume_cache_requests_total.labels("build").inc()
+            path = self._volume_path(key)
+            # Под блокировкой ключа чужих записей этого тома нет
+            self._remove_partial(path)
+            volume, meta = decode(study_dir)
+            try:
+                with open(f"{path}.tmp", "wb") as f:
+                    np.save(f, volume, allow_pickle=False)
+                with open(f"{path}.json.tmp", "w") as f:
+                    json.dump(meta, f)
+            except BaseException:
+                self._remove_partial(path)
+                raise
+            # Готовым считается только .npy, переименованный целиком после
+            # своих метаданных
+            os.replace(f"{path}.json.tmp", f"{path}.json")
+            os.replace(f"{path}.tmp", path)
+        self._evict(keep=path)
+        return self._open_volume(study_dir, key)
+
+    def _evict(self, keep: str) -> None:
+        """Удаляет давно открывавшиеся тома, если кэш больше лимита."""
+        with open(os.path.join(self._locks_dir, "evict.lock"), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            files = []
+            total = 0
+            for entry in os.scandir(self._volumes_dir):
+                if not entry.name.endswith(".npy"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+            if total > self._max_bytes:
+                target = int(self._max_bytes * _EVICT_TARGET_RATIO)
+                for _, size, path in sorted(files):
+                    if total <= target:
+                        break
+                    if path == keep:
+                        continue
+                    for stale in (path, f"{path}.json"):
+                        try:
+                            os.unlink(stale)
+                        except FileNotFoundError:
+                            pass
+                    logger.info(f"Том удалён из кэша: {path}")
+                    total -= size
+            volume_cache_size_bytes.set(total)
+
+    def load(
+        self, study_dir: str, decode: Callable[[str], Tuple[np.ndarray, dict]]
+    ) -> Tuple[np.ndarray, pydicom.Dataset, dict]:
+        """
+        Том исследования (только для чтения), заголовок одного из его срезов
+        и метаданные тома. decode(study_dir) вызывается при промахе и возвращает
+        том и метаданные (JSON); meta["example_name"] — имя DICOM-файла
+        в study_dir, заголовок которого описывает исследование.
+        """
+        key = self._study_key(study_dir)
+        with self._lock:
+            opened = self._open.get(key)
+            if opened is not None:
+                self._open.move_to_end(key)
+        if opened is not None and os.path.exists(self._volume_path(key)):
+            volume_cache_requests_total.labels("memory").inc()
+            self._touch(self._volume_path(key))
+            return opened
+
+        opened = self._open_volume(study_dir, key)
+        if opened is not None:
+            volume_cache_requests_total.labels("disk").inc()
+        else:
+            opened = self._build(study_dir, key, decode)
+        with self._lock:
+            self._open[key] = opened
+            while len(self._open) > VOLUME_CACHE_OPEN_MAX_SIZE:
+                self._open.popitem(last=False)
+        return opened
+
+
+volume_cache = VolumeCache(
+    directory=settings.volume_cache_dir, max_bytes=settings.volume_cache_max_bytes
+)
@@ -7,6 +7,8 @@ import uuid
 from fastapi import WebSocket, WebSocketDisconnect, status
 import json
 from cor_pass.database.redis_db import redis_client
+from cor_pass.services.case_change_feed import listen_case_changes
+from cor_pass.services.device_info import resolve_client_ip
 from fastapi.websockets import WebSocketState
 
 from loguru import logger
@@ -17,23 +19,12 @@ def get_websocket_client_ip(websocket: WebSocket) -> str:
     Получение реального IP-адреса клиента WebSocket из scope.
     Аналогично get_client_ip для HTTP-запросов, но адаптировано под WebSocket.
     """
-    scope = websocket.scope
-    headers = {k.decode("utf-8"): v.decode("utf-8") for k, v in scope["headers"]}
-
-    if "x-forwarded-for" in headers:
-        client_ip = headers["x-forwarded-for"].split(",")[0].strip()
-    elif "x-real-ip" in headers:
-        client_ip = headers["x-real-ip"].strip()
-    elif "http_client_ip" in headers:
-        client_ip = headers["http_client_ip"].strip()
-    else:
-        client = scope.get("client")
-        if client:
-            client_ip = client[0]
-        else:
-            client_ip = "unknown"
-
-    return client_ip
+    client = websocket.scope.get("client")
+    return resolve_client_ip(
+        websocket.headers.get("x-forwarded-for"),
+        websocket.headers.get("x-real-ip"),
+        client[0] if client else None,
+    )
 
 
 
@@ -133,12 +124,18 @@ class WebSocketEventsManager:
     def __init__(self, worker_id: str):
         self.worker_id = worker_id
         self.active_connections: Dict[str, Dict[str, any]] = {}  # {"websocket": WebSocket, "session_id": str | None}
+        # Подписки на ленту изменений кейсов: {connection_id: {"case_ids": set, "worklist": bool}}
+        self.case_feed_subscriptions: Dict[str, Dict[str, any]] = {}
         logger.info(f"WebSocketEventsManager initialized for worker {worker_id}")
 
     async def init_redis_listener(self):
         """Запуск подписки на глобальный и персональный Redis каналы."""
         asyncio.create_task(self._listen_pubsub())
 
+    async def init_case_feed_listener(self):
+        """Запуск прослушивания ленты изменений кейсов (Postgres NOTIFY)."""
+        asyncio.create_task(listen_case_changes(self._deliver_case_change))
+
     async def _listen_pubsub(self):
         pubsub = redis_client.pubsub()
         await pubsub.subscribe("ws:broadcast", f"ws:worker:{self.worker_id}")
@@ -185,6 +182,7 @@ class WebSocketEventsManager:
 
     async def disconnect(self, connection_id: str):
         """Отключение WebSocket клиента."""
+        self.case_feed_subscriptions.pop(connection_id, None)
         conn = self.active_connections.pop(connection_id, None)
         if conn and conn["websocket"].client_state == WebSocketState.CONNECTED:
             await conn["websocket"].close(code=status.WS_1000_NORMAL_CLOSURE)
@@ -227,12 +225,17 @@ class WebSocketEventsManager:
         logger.debug(f"Targeted event published to worker {worker_id} for session_id {session_id}")
 
     async def _broadcast_to_local(self, event: Dict):
-        """Отправка broadcast события только локальным клиентам без session_id."""
+        """
+        Отправка broadcast события только локальным клиентам без session_id.
+        Сокеты ленты кейсов получают только свои события (_deliver_case_change).
+        """
         dead_ids = []
 
         for connection_id, conn in self.active_connections.items():
             if conn["session_id"] is not None:
                 continue  # Пропускаем клиентов с session_id
+            if connection_id in self.case_feed_subscriptions:
+                continue
             websocket = conn["websocket"]
             if websocket.client_state != WebSocketState.CONNECTED:
                 dead_ids.append(connection_id)
@@ -263,6 +266,41 @@ class WebSocketEventsManager:
             logger.warning(f"Error sending targeted to {connection_id}: {e}")
             await self.disconnect(connection_id)
 
+    def subscribe_case_feed(
+        self, connection_id: str, case_ids: List[str], worklist: bool = True
+    ):
+        """
+        Задаёт подписку соединения на ленту изменений кейсов.
+        case_ids — кейсы, открытые у клиента; worklist=True — также все события
+        по кейсам, входящим в список "Текущие кейсы" (в т.ч. новые в нём).
+        """
+        self.case_feed_subscriptions[connection_id] = {
+            "case_ids": set(case_ids),
+            "worklist": worklist,
+        }
+
+    async def _deliver_case_change(self, event: Dict):
+        """Отправка изменения кейса локальным подписчикам ленты с фильтрацией."""
+        dead_ids = []
+        message = json.dumps({"event_type": "case_changed", **event})
+
+        for connection_id, subscription in list(self.case_feed_subscriptions.items()):
+            if event.get("case_id") not in subscription["case_ids"] and not (
+                subscription["worklist"] and event.get("worklist")
+            ):
+                continue
+            conn = self.active_connections.get(connection_id)
+            if not conn or conn["websocket"].client_state != WebSocketState.CONNECTED:
+                dead_ids.append(connection_id)
+                continue
+            try:
+                await conn["websocket"].send_text(message)
+            except Exception as e:
+                logger.warning(f"Error sending case change to {connection_id}: {e}")
+                dead_ids.append(connection_id)
+
+        await self._cleanup_dead_connections(dead_ids)
+
     async def _cleanup_dead_connections(self, dead_ids: List[str]):
         """Очистка мёртвых соединений."""
         for cid in dead_ids:
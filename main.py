@@ -59,11 +59,11 @@ from cor_pass.routes import (
 )
 from cor_pass.config.config import settings
 from cor_pass.services.ip2_location import initialize_ip2location
+from cor_pass.services.device_info import get_client_ip
 from loguru import logger
-from cor_pass.services.auth import auth_service
+from cor_pass.services.activity_tracker import activity_tracker
+from cor_pass.services.auth_claims import JWTClaimsMiddleware
 from fastapi.responses import JSONResponse
-from collections import defaultdict
-from jose import JWTError, jwt
 
 from cor_pass.services.websocket import check_session_timeouts, cleanup_auth_sessions, register_signature_expirer
 
@@ -227,30 +227,13 @@ async def add_process_time_header(request: Request, call_next):
     return response
 
 
-# Middleware для фиксирования активных пользователей
-@app.middleware("http")
-async def track_active_users(request: Request, call_next):
-    user_token = request.headers.get("Authorization")
-    if user_token:
-        token_parts = user_token.split(" ")
-        if len(token_parts) >= 2:
-            try:
-                decoded_token = jwt.decode(
-                    token_parts[1],
-                    options={"verify_signature": False},
-                    key=auth_service.SECRET_KEY,
-                    algorithms=[auth_service.ALGORITHM],
-                )
-                oid = decoded_token.get("oid")
-                await redis_client.set(oid, time.time())
-            except JWTError:
-                pass
-    response = await call_next(request)
-    return response
+# Middleware: проверка Bearer-токена один раз на запрос и учёт активных пользователей
+app.add_middleware(JWTClaimsMiddleware)
 
 
 async def custom_identifier(request: Request) -> str:
-    return request.client.host
+    # За прокси request.client.host — адрес прокси; см. settings.trusted_proxy_count
+    return get_client_ip(request)
 
 
 # Событие при старте приложения
@@ -260,9 +243,11 @@ async def startup():
     await FastAPILimiter.init(redis_client, identifier=custom_identifier)
     asyncio.create_task(check_session_timeouts())
     asyncio.create_task(cleanup_auth_sessions())
+    asyncio.create_task(activity_tracker.run())
     register_signature_expirer(app, async_session_maker)
     initialize_ip2location()
     await websocket_events_manager.init_redis_listener()
+    await websocket_events_manager.init_case_feed_listener()
     if settings.app_env == "development":
         await create_modbus_client(app)
 
@@ -270,12 +255,10 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("------------- SHUTDOWN --------------")
+    await activity_tracker.flush()
     await close_modbus_client(app)
 
 
-auth_attempts = defaultdict(list)
-blocked_ips = {}
-
 app.include_router(auth.router, prefix="/api")
 app.include_router(admin.router, prefix="/api")
 app.include_router(records.router, prefix="/api")
@@ -4,6 +4,7 @@ import socket
 import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from smb.SMBConnection import SMBConnection
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
@@ -11,11 +12,16 @@ from sqlalchemy.orm import sessionmaker, joinedload
 from sqlalchemy.future import select
 from loguru import logger
 from openslide import OpenSlide
+from PIL import Image
+import tifffile
 from io import BytesIO
 import tempfile
 import time
 from cor_pass.database.models import Cassette, Glass, Sample 
 from cor_pass.config.config import settings
+from cor_pass.services.case_change_feed import emit_case_changes
+from cor_pass.services.remote_slide import associated_image
+from cor_pass.services.smb_range_file import SMBRangeFile
 import enum
 
 SMB_USER = settings.smb_user
@@ -149,6 +155,98 @@ async def fetch_file_from_smb(path: str) -> str:
 
     return await loop.run_in_executor(None, _read_file)
 
+async def read_preview_by_range(scan_url: str) -> Image.Image:
+    """
+    Превью 512x512 из встроенной миниатюры SVS: читаются только заголовки TIFF
+    и страница миниатюры (несколько блоков), а не весь файл.
+    """
+    def _read():
+        start_time = time.time()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with SMBRangeFile(scan_url, os.path.join(cache_dir, "slide")) as source:
+                with tifffile.TiffFile(source) as tif:
+                    preview = associated_image(tif, "thumbnail")
+        if preview is None:
+            raise ValueError("Slide has no thumbnail page")
+        preview.thumbnail((512, 512))
+        logger.debug(f"Time to read thumbnail by range: {time.time() - start_time} seconds")
+        return preview
+
+    return await asyncio.to_thread(_read)
+
+
+async def read_preview_full(scan_url: str) -> Image.Image:
+    temp_file_path = await fetch_file_from_smb(scan_url)
+    try:
+        start_time = time.time()
+        slide = OpenSlide(temp_file_path)
+        logger.debug(f"Time to open slide: {time.time() - start_time} seconds")
+        return slide.get_thumbnail((512, 512))
+    finally:
+        if os.path.exists(temp_file_path):
+            os.unlink(temp_file_path)
+            logger.debug(f"Temporary file {temp_file_path} deleted")
+
+
+# Пирамиды тайлов строятся в отдельных процессах и не задерживают сканирование;
+# семафор ограничивает и загрузку слайдов, и рендеринг
+_pyramid_executor = None
+_pyramid_semaphore = asyncio.Semaphore(settings.tile_pyramid_workers)
+_pyramid_tasks = {}
+
+
+def schedule_tile_pyramid(scan_url: str) -> None:
+    if scan_url in _pyramid_tasks:
+        return
+    task = asyncio.create_task(build_tile_pyramid(scan_url))
+    _pyramid_tasks[scan_url] = task
+    task.add_done_callback(lambda _: _pyramid_tasks.pop(scan_url, None))
+
+
+async def build_tile_pyramid(scan_url: str) -> None:
+    global _pyramid_executor
+    # Только при включённых пирамидах: кэш слайдов и рендеринг не нужны
+    # сканеру для обычного обхода
+    from cor_pass.services.slide_store import slide_store
+    from cor_pass.services.tile_pyramid import generate_pyramid
+
+    async with _pyramid_semaphore:
+        try:
+            start_time = time.time()
+            svs_path = await slide_store.ensure(scan_url)
+            if _pyramid_executor is None:
+                _pyramid_executor = ProcessPoolExecutor(max_workers=settings.tile_pyramid_workers)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                _pyramid_executor, generate_pyramid, svs_path, settings.tile_pyramid_all_levels
+            )
+            logger.debug(f"Time to build tile pyramid for {scan_url}: {time.time() - start_time} seconds")
+        except Exception as e:
+            logger.error(f"Ошибка при построении пирамиды тайлов для {scan_url}: {str(e)}")
+
+
+# Стёкла, превью которых не удалось получить: {glass_id: (неудачных попыток,
+# time.monotonic() следующей попытки)}. Интервал удваивается с каждой неудачей
+# от SCAN_INTERVAL_SECONDS до settings.scan_preview_retry_max_seconds
+_preview_retries = {}
+
+
+def preview_retry_due(glass_id: str) -> bool:
+    retry = _preview_retries.get(glass_id)
+    return retry is None or retry[1] <= time.monotonic()
+
+
+def record_preview_failure(glass_id: str) -> float:
+    """Откладывает следующую попытку превью стекла; возвращает задержку в секундах."""
+    failures = _preview_retries.get(glass_id, (0, 0.0))[0] + 1
+    delay = min(
+        SCAN_INTERVAL_SECONDS * 2 ** (failures - 1),
+        settings.scan_preview_retry_max_seconds,
+    )
+    _preview_retries[glass_id] = (failures, time.monotonic() + delay)
+    return delay
+
+
 async def save_file_to_smb(data: BytesIO, path: str) -> None:
     loop = asyncio.get_running_loop()
 
@@ -340,11 +438,16 @@ async def update_scan_urls():
 
         updated = 0
         skipped = 0
+        scanned_case_ids = set()
         for glass in glasses:
             if glass.scan_url and glass.preview_url:
                 skipped += 1
                 # logger.debug(f"[SKIP] Стекло {glass.id} уже имеет scan_url: {glass.scan_url} и preview_url: {glass.preview_url}")
                 continue
+            if glass.scan_url and not preview_retry_due(glass.id):
+                # Скан уже привязан, превью не получилось — ждём следующей попытки
+                skipped += 1
+                continue
 
             case_code = glass.cassette.sample.case.case_code
             sample_number = glass.cassette.sample.sample_number
@@ -375,35 +478,43 @@ async def update_scan_urls():
                 ):
                     if file.lower().endswith('.svs'):
                         scan_url = f"\\\\{SMB_SERVER_IP}\\{SMB_SHARE}\\{file}"
-                        glass.scan_url = scan_url
-                        logger.debug(f"[OK] Стекло {glass.id} → scan_url: {scan_url}")
+                        if glass.scan_url != scan_url:
+                            glass.scan_url = scan_url
+                            glass.cassette.sample.case.has_scanned_glass = True
+                            scanned_case_ids.add(glass.cassette.sample.case_id)
+                            logger.debug(f"[OK] Стекло {glass.id} → scan_url: {scan_url}")
 
                         if not glass.preview_url:
                             try:
-                                temp_file_path = await fetch_file_from_smb(scan_url)
                                 try:
-                                    start_time = time.time()
-                                    slide = OpenSlide(temp_file_path)
-                                    logger.debug(f"Time to open slide: {time.time() - start_time} seconds")
-                                    preview = slide.get_thumbnail((512, 512))
-                                    buf = BytesIO()
-                                    preview.save(buf, format="PNG")
-                                    buf.seek(0)
-                                    preview_path = scan_url.replace('.svs', '.png').replace('.SVS', '.png')
-                                    await save_file_to_smb(buf, preview_path)
-                                    glass.preview_url = preview_path
-                                    logger.debug(f"[OK] Стекло {glass.id} → preview_url: {preview_path}")
-                                finally:
-                                    if os.path.exists(temp_file_path):
-                                        os.unlink(temp_file_path)
-                                        logger.debug(f"Temporary file {temp_file_path} deleted")
+                                    preview = await read_preview_by_range(scan_url)
+                                except Exception as e:
+                                    logger.warning(f"Не удалось прочитать миниатюру {file} по диапазонам, загружаем файл целиком: {str(e)}")
+                                    preview = await read_preview_full(scan_url)
+                                buf = BytesIO()
+                                preview.save(buf, format="PNG")
+                                buf.seek(0)
+                                preview_path = scan_url.replace('.svs', '.png').replace('.SVS', '.png')
+                                await save_file_to_smb(buf, preview_path)
+                                glass.preview_url = preview_path
+                                scanned_case_ids.add(glass.cassette.sample.case_id)
+                                _preview_retries.pop(glass.id, None)
+                                logger.debug(f"[OK] Стекло {glass.id} → preview_url: {preview_path}")
                             except Exception as e:
-                                logger.error(f"Ошибка при генерации или сохранении превью для {file}: {str(e)}")
+                                delay = record_preview_failure(glass.id)
+                                logger.error(
+                                    f"Ошибка при генерации или сохранении превью для {file}: {str(e)}; "
+                                    f"следующая попытка через {delay:.0f} с"
+                                )
                                 continue
 
+                        if settings.tile_pyramid_enabled:
+                            schedule_tile_pyramid(scan_url)
+
                         updated += 1
                         break
 
+        await emit_case_changes(session, scanned_case_ids, "glass")
         await session.commit()
         # logger.info(f"Обновлено {updated} записей, пропущено {skipped} записей")
 
@@ -0,0 +1,98 @@
+"""
+Замер пропускной способности рендеринга DeepZoom-тайлов: тайлов в секунду
+и тайлов в секунду на ядро для уровня пирамиды SVS-слайда.
+
+Каждый процесс открывает слайд через slide_pool (как воркер API) и рендерит
+свою часть тайлов уровня тем же путём, что /svs/deepzoom/..._files
+(DeepZoomGenerator.get_tile + encode_tile), без кэшей и пирамид.
+
+    python -m tests.benchmarks.deepzoom_tiles /data/slide.svs --workers 4
+    python -m tests.benchmarks.deepzoom_tiles /data/slide.svs --level -1 --format webp
+
+--level отрицательный — отсчёт от самого подробного уровня (-1 — полное разрешение).
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+from cor_pass.services.slide_pool import (
+    DEEPZOOM_DEFAULT_QUALITY,
+    DEEPZOOM_OVERLAP,
+    DEEPZOOM_TILE_SIZE,
+    encode_tile,
+    slide_pool,
+)
+
+
+def _level_tiles(svs_path: str, level: int) -> Tuple[int, List[Tuple[int, int]]]:
+    with slide_pool.acquire_deepzoom(svs_path, DEEPZOOM_TILE_SIZE, DEEPZOOM_OVERLAP) as dz:
+        if level < 0:
+            level += dz.level_count
+        cols, rows = dz.level_tiles[level]
+    return level, [(col, row) for row in range(rows) for col in range(cols)]
+
+
+def _render(
+    svs_path: str, level: int, addresses: List[Tuple[int, int]], fmt: str, quality: int
+) -> Tuple[int, int, float]:
+    """Рендерит тайлы в процессе пула: (число тайлов, байт, секунд)."""
+    total_bytes = 0
+    started = time.perf_counter()
+    with slide_pool.acquire_deepzoom(svs_path, DEEPZOOM_TILE_SIZE, DEEPZOOM_OVERLAP) as dz:
+        for address in addresses:
+            total_bytes += len(encode_tile(dz.get_tile(level, address), fmt, quality))
+    return len(addresses), total_bytes, time.perf_counter() - started
+
+
+def main(args: argparse.Namespace) -> None:
+    level, addresses = _level_tiles(args.svs_path, args.level)
+    random.Random(0).shuffle(addresses)
+    addresses = addresses[: args.tiles]
+    chunks = [addresses[i :: args.workers] for i in range(args.workers)]
+
+    def render_all(executor, parts):
+        return list(
+            executor.map(
+                _render,
+                [args.svs_path] * len(parts),
+                [level] * len(parts),
+                parts,
+                [args.format] * len(parts),
+                [args.quality] * len(parts),
+            )
+        )
+
+    with ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        # Прогрев: импорт модулей и открытие слайда в каждом процессе
+        render_all(executor, [chunk[:1] for chunk in chunks])
+        started = time.perf_counter()
+        results = render_all(executor, chunks)
+        elapsed = time.perf_counter() - started
+
+    tiles = sum(count for count, _, _ in results)
+    total_bytes = sum(size for _, size, _ in results)
+    busy = sum(seconds for _, _, seconds in results)
+    print(
+        f"{os.path.basename(args.svs_path)}: уровень {level}, {tiles} тайлов "
+        f"{args.format} q={args.quality}, процессов {args.workers}"
+    )
+    print(f"  всего:      {tiles / elapsed:8.1f} тайлов/с за {elapsed:.2f} с")
+    print(f"  на ядро:    {tiles / busy:8.1f} тайлов/с")
+    print(f"  средний размер тайла: {total_bytes / max(tiles, 1) / 1024:.1f} КиБ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("svs_path")
+    parser.add_argument("--level", type=int, default=-1)
+    parser.add_argument("--tiles", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--format", choices=["jpeg", "webp"], default="jpeg")
+    parser.add_argument("--quality", type=int, default=DEEPZOOM_DEFAULT_QUALITY)
+    main(parser.parse_args())
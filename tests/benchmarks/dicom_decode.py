@@ -0,0 +1,124 @@
+"""
+Замер загрузки DICOM-исследования в том: services.dicom_volume.decode_volume
+(пул процессов, исходный тип данных) против последовательного декодирования
+в float32 с np.stack, как до появления пула.
+
+Без каталога исследования генерируется синтетическое КТ (int16, свои Rescale
+Slope/Intercept у каждого среза) во временном каталоге:
+
+    python -m tests.benchmarks.dicom_decode --slices 500 --size 512
+    python -m tests.benchmarks.dicom_decode /data/study --workers 8
+
+Первый вызов decode_volume включает запуск пула (spawn), поэтому выводится
+отдельно от повторного.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+from cor_pass.config.config import settings
+from cor_pass.services import dicom_volume
+
+
+def _write_study(study_dir: str, slices: int, size: int) -> None:
+    rng = np.random.default_rng(0)
+    series_uid = generate_uid()
+    for index in rng.permutation(slices):
+        file_meta = FileMetaDataset()
+        file_meta.MediaStorageSOPClassUID = CTImageStorage
+        file_meta.MediaStorageSOPInstanceUID = generate_uid()
+        file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+        ds = Dataset()
+        ds.file_meta = file_meta
+        ds.SOPClassUID = CTImageStorage
+        ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+        ds.SeriesInstanceUID = series_uid
+        ds.Modality = "CT"
+        ds.ImagePositionPatient = [0.0, 0.0, float(index)]
+        ds.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+        ds.PixelSpacing = [0.7, 0.7]
+        ds.SliceThickness = 1.0
+        ds.RescaleSlope = 1.0 + (index % 3) * 0.5
+        ds.RescaleIntercept = -1024.0 + index % 7
+        ds.Rows = ds.Columns = size
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.BitsAllocated = 16
+        ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 1
+        pixels = rng.integers(-1024, 3072, size=(size, size), dtype=np.int16)
+        ds.PixelData = pixels.astype("<i2").tobytes()
+        pydicom.dcmwrite(
+            os.path.join(study_dir, f"{ds.SOPInstanceUID}.dcm"), ds, enforce_file_format=True
+        )
+
+
+def _decode_sequential(study_dir: str) -> np.ndarray:
+    """Прежний путь: полное чтение каждого файла, float32 и np.stack."""
+    datasets = [
+        pydicom.dcmread(os.path.join(study_dir, f))
+        for f in os.listdir(study_dir)
+        if not f.startswith(".")
+    ]
+    orientation = datasets[0].ImageOrientationPatient
+    normal = np.cross(orientation[:3], orientation[3:])
+    datasets.sort(key=lambda ds: np.dot(ds.ImagePositionPatient, normal))
+    return np.stack(
+        [
+            ds.pixel_array.astype(np.float32) * float(ds.RescaleSlope)
+            + float(ds.RescaleIntercept)
+            for ds in datasets
+        ]
+    )
+
+
+def _report(name: str, seconds: float, volume: np.ndarray) -> None:
+    print(
+        f"  {name:<28} {seconds:7.2f} с  {len(volume) / seconds:7.1f} срезов/с  "
+        f"{volume.nbytes / 1024**2:8.1f} МиБ ({volume.dtype})"
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    settings.dicom_decode_workers = args.workers
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        study_dir = args.study_dir
+        if study_dir is None:
+            study_dir = tmp_dir
+            _write_study(study_dir, args.slices, args.size)
+        print(f"{study_dir}: процессов {args.workers}")
+
+        started = time.perf_counter()
+        volume = _decode_sequential(study_dir)
+        _report("последовательно, float32", time.perf_counter() - started, volume)
+        del volume
+
+        for name in ("decode_volume (запуск пула)", "decode_volume"):
+            started = time.perf_counter()
+            raw, meta = dicom_volume.decode_volume(study_dir)
+            _report(name, time.perf_counter() - started, raw)
+
+        rescaled = dicom_volume.RescaledVolume(raw, meta["slopes"], meta["intercepts"])
+        started = time.perf_counter()
+        for index in range(len(rescaled)):
+            rescaled[index]
+        seconds = time.perf_counter() - started
+        print(f"  аксиальные срезы через RescaledVolume: {seconds / len(rescaled) * 1000:.2f} мс/срез")
+        dicom_volume._decode_executor().shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("study_dir", nargs="?")
+    parser.add_argument("--slices", type=int, default=500)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=settings.dicom_decode_workers)
+    main(parser.parse_args())
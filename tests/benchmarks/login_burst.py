@@ -0,0 +1,107 @@
+"""
+Нагрузочный замер: задержка несвязанного эндпоинта во время всплеска логинов.
+
+Пока bcrypt выполнялся в event loop, каждый логин останавливал воркер на время
+хэширования и p99 всех остальных запросов рос вместе с числом логинов.
+Скрипт измеряет задержку probe-запросов (по умолчанию /api/healthchecker)
+сначала без нагрузки, затем во время параллельных логинов, и печатает p50/p99.
+
+Запуск против работающего API (один воркер uvicorn даёт самый наглядный результат):
+    python tests/benchmarks/login_burst.py --base-url http://localhost:8000 \\
+        --email user@example.com --password secret --logins 200 --concurrency 50
+
+Каждый логин отправляется с отдельным X-Forwarded-For, чтобы не упираться
+в ограничение частоты по IP. Заголовок учитывается, только если API запущен
+с TRUSTED_PROXY_COUNT=1 — для замера API запускают так без прокси перед ним
+(в рабочей конфигурации адрес дописывает сам прокси). Для аккаунта
+используются верные учётные данные, поэтому блокировка аккаунта не срабатывает.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from typing import List
+
+import httpx
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def _probe(
+    client: httpx.AsyncClient, path: str, interval: float, stop: asyncio.Event
+) -> List[float]:
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(path)
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def _login_burst(
+    client: httpx.AsyncClient, args: argparse.Namespace
+) -> Counter:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    statuses: Counter = Counter()
+
+    async def login(i: int) -> None:
+        async with semaphore:
+            response = await client.post(
+                "/api/auth/login",
+                data={"username": args.email, "password": args.password},
+                headers={"X-Forwarded-For": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}"},
+            )
+            statuses[response.status_code] += 1
+
+    await asyncio.gather(*(login(i) for i in range(args.logins)))
+    return statuses
+
+
+def _report(name: str, latencies: List[float]) -> None:
+    print(
+        f"{name:>9}: n={len(latencies):5d}  p50={statistics.median(latencies):8.1f} ms"
+        f"  p99={_percentile(latencies, 99):8.1f} ms  max={max(latencies):8.1f} ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(client, args.probe_path, args.probe_interval, stop))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        baseline = await probe
+
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(client, args.probe_path, args.probe_interval, stop))
+        started = time.perf_counter()
+        statuses = await _login_burst(client, args)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        during_burst = await probe
+
+    print(
+        f"Логинов: {args.logins} за {elapsed:.1f} с ({args.logins / elapsed:.1f}/с), "
+        f"статусы: {dict(statuses)}"
+    )
+    _report("baseline", baseline)
+    _report("burst", during_burst)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--probe-path", default="/api/healthchecker")
+    parser.add_argument("--probe-interval", type=float, default=0.01)
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+"""
+Общие фикстуры тестов.
+
+Тесты, которым нужны внешние сервисы, пропускаются, если сервис не задан:
+  TEST_DATABASE_URL — postgresql+asyncpg://… база с применёнными миграциями
+                      alembic (upgrade head); тесты создают и удаляют свои строки;
+  TEST_REDIS_URL    — redis://… отдельная БД Redis (тесты пишут ключи с префиксом).
+"""
+import asyncio
+import os
+import sys
+from urllib.parse import urlparse
+
+import pytest
+
+# Значение по умолчанию в Settings — заглушка, не проходящая проверку int;
+# без env-файла окружения cor_pass.config.config не импортируется
+os.environ.setdefault("BASIC_ACCOUNT_RECORDS", "0")
+
+# cor_pass.database.db создаёт движок при импорте — из той же тестовой базы
+if os.getenv("TEST_DATABASE_URL"):
+    os.environ.setdefault("SQLALCHEMY_DATABASE_URL", os.environ["TEST_DATABASE_URL"])
+
+# cor_pass.database.redis_db создаёт клиент при импорте — из тестовой БД Redis
+if os.getenv("TEST_REDIS_URL"):
+    _redis_url = urlparse(os.environ["TEST_REDIS_URL"])
+    os.environ.setdefault("REDIS_HOST", _redis_url.hostname or "localhost")
+    os.environ.setdefault("REDIS_PORT", str(_redis_url.port or 6379))
+    os.environ.setdefault("REDIS_DB", _redis_url.path.lstrip("/") or "0")
+
+
+@pytest.fixture
+def database_url() -> str:
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL не задан")
+    return url
+
+
+@pytest.fixture
+def redis_url() -> str:
+    url = os.getenv("TEST_REDIS_URL")
+    if not url:
+        pytest.skip("TEST_REDIS_URL не задан")
+    return url
+
+
+async def _disconnect_redis() -> None:
+    # Соединения клиента Redis привязаны к циклу событий, а каждый тест
+    # запускает свой asyncio.run
+    redis_db = sys.modules.get("cor_pass.database.redis_db")
+    if redis_db is not None:
+        await redis_db.redis_client.connection_pool.disconnect()
+
+
+@pytest.fixture
+def run_async():
+    """
+    run_async(scenario) выполняет корутину scenario() в новом цикле событий
+    и закрывает соединения клиента Redis.
+    """
+
+    def run(scenario):
+        async def main():
+            try:
+                return await scenario()
+            finally:
+                await _disconnect_redis()
+
+        return asyncio.run(main())
+
+    return run
+
+
+@pytest.fixture
+def run_db(database_url, run_async):
+    """
+    run_db(scenario, **engine_kwargs) выполняет scenario(session_maker) с
+    отдельным движком тестовой базы; engine_kwargs передаются в
+    create_async_engine (например, pool_size для параллельных сессий).
+    """
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    def run(scenario, **engine_kwargs):
+        async def main():
+            engine = create_async_engine(database_url, **engine_kwargs)
+            session_maker = sessionmaker(
+                engine, expire_on_commit=False, class_=AsyncSession
+            )
+            try:
+                return await scenario(session_maker)
+            finally:
+                await engine.dispose()
+
+        return run_async(main)
+
+    return run
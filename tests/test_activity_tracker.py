@@ -0,0 +1,72 @@
+"""
+Presence в sorted set (services.activity_tracker): пакетная запись отметок
+и чтение последней активности (Redis, см. tests/conftest.py).
+"""
+import time
+import uuid
+
+import pytest
+
+pytest.importorskip("redis")
+pytest.importorskip("loguru")
+
+from cor_pass.database.redis_db import redis_client
+from cor_pass.services import activity_tracker as activity_module
+from cor_pass.services.activity_tracker import (
+    ActivityTracker,
+    count_active_users,
+    get_last_seen,
+    list_active_users,
+)
+
+
+@pytest.fixture
+def presence_key(run_async, monkeypatch, redis_url):
+    key = f"test:presence:{uuid.uuid4().hex}"
+    monkeypatch.setattr(activity_module, "USER_PRESENCE_KEY", key)
+    yield key
+
+    async def cleanup():
+        await redis_client.delete(key)
+
+    run_async(cleanup)
+
+
+def test_flush_writes_batch_and_readers_see_it(run_async, presence_key):
+    async def scenario():
+        tracker = ActivityTracker()
+        tracker.touch("a")
+        tracker.touch("b")
+        await tracker.flush()
+        assert tracker._pending == {}
+
+        now = time.time()
+        last_seen = await get_last_seen(["a", "b", "c"])
+        assert last_seen["c"] is None
+        assert all(now - 60 < last_seen[u] <= now for u in ("a", "b"))
+        assert await count_active_users(now - 60) == 2
+        assert [user for user, _ in await list_active_users(now - 60)] in (
+            ["a", "b"],
+            ["b", "a"],
+        )
+
+    run_async(scenario)
+
+
+def test_older_mark_does_not_overwrite_newer_one(run_async, presence_key):
+    async def scenario():
+        now = time.time()
+        await redis_client.zadd(presence_key, {"a": now})
+        tracker = ActivityTracker()
+        # Отметка другого воркера, накопленная раньше, приходит позже
+        tracker._pending = {"a": now - 120, "stale": now - 400 * 24 * 3600}
+        await tracker.flush()
+
+        last_seen = await get_last_seen(["a", "stale"])
+        assert last_seen["a"] == pytest.approx(now)
+        # Записи старше PRESENCE_RETENTION_SECONDS удаляются при сбросе
+        assert last_seen["stale"] is None
+        assert await count_active_users(now - 60) == 1
+        assert await list_active_users(now - 3600, skip=1) == []
+
+    run_async(scenario)
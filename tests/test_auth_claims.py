@@ -0,0 +1,76 @@
+"""
+JWTClaimsMiddleware: токен проверяется один раз на запрос, claims доступны
+через get_request_claims, активность отмечается в ActivityTracker без Redis.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("jose")
+pytest.importorskip("starlette")
+pytest.importorskip("redis")
+pytest.importorskip("loguru")
+
+from jose import jwt
+from starlette.requests import HTTPConnection
+
+from cor_pass.config.config import settings
+from cor_pass.services import auth_claims
+from cor_pass.services.activity_tracker import ActivityTracker
+from cor_pass.services.auth_claims import JWTClaimsMiddleware, get_request_claims
+
+
+SECRET_KEY = "test-secret"
+ALGORITHM = "HS256"
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    monkeypatch.setattr(settings, "secret_key", SECRET_KEY)
+    monkeypatch.setattr(settings, "algorithm", ALGORITHM)
+    tracker = ActivityTracker()
+    monkeypatch.setattr(auth_claims, "activity_tracker", tracker)
+    return tracker
+
+
+def _call(headers):
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen["scope"] = scope
+
+    scope = {"type": "http", "headers": headers}
+    asyncio.run(JWTClaimsMiddleware(app)(scope, None, None))
+    return seen["scope"]
+
+
+def _auth_header(token: str):
+    return [(b"authorization", f"Bearer {token}".encode())]
+
+
+def test_valid_token_claims_are_reused_and_activity_is_touched(tracker):
+    token = jwt.encode({"oid": "user-1", "jti": "j1"}, SECRET_KEY, algorithm=ALGORITHM)
+    scope = _call(_auth_header(token))
+
+    connection = HTTPConnection(scope)
+    assert get_request_claims(connection, token) == {"oid": "user-1", "jti": "j1"}
+    # Claims привязаны к токену: для другого токена проверка выполняется заново
+    assert get_request_claims(connection, token + "x") is None
+    assert get_request_claims(None, token) is None
+    assert set(tracker._pending) == {"user-1"}
+
+
+def test_invalid_token_is_not_trusted(tracker):
+    token = jwt.encode({"oid": "user-1"}, "another-secret", algorithm=ALGORITHM)
+    scope = _call(_auth_header(token))
+
+    assert get_request_claims(HTTPConnection(scope), token) is None
+    assert tracker._pending == {}
+
+
+def test_requests_without_bearer_token_pass_through(tracker):
+    scope = _call([(b"authorization", b"Basic dXNlcjpwYXNz")])
+    assert get_request_claims(HTTPConnection(scope), "dXNlcjpwYXNz") is None
+    scope = _call([])
+    assert "state" not in scope
+    assert tracker._pending == {}
@@ -0,0 +1,99 @@
+"""
+Скользящее окно попыток авторизации (services.auth_throttle)
+(Redis, см. tests/conftest.py).
+"""
+import asyncio
+import uuid
+
+import pytest
+
+pytest.importorskip("redis")
+
+from cor_pass.database.redis_db import redis_client
+from cor_pass.services.auth_throttle import (
+    ThrottleRule,
+    get_retry_after,
+    register_failure,
+    reset,
+)
+
+
+def _rule(limit: int, base_lockout_seconds: int = 1, max_lockout_seconds: int = 60):
+    return ThrottleRule(
+        prefix=f"test:throttle:{uuid.uuid4().hex}:",
+        limit=limit,
+        window_seconds=600,
+        base_lockout_seconds=base_lockout_seconds,
+        max_lockout_seconds=max_lockout_seconds,
+    )
+
+
+@pytest.fixture
+def run_with_rules(run_async):
+    """run_with_rules(scenario, *rules) — как run_async, с удалением ключей правил."""
+
+    def run(scenario, *rules):
+        async def main():
+            try:
+                await scenario()
+            finally:
+                for rule in rules:
+                    keys = await redis_client.keys(f"{rule.prefix}*")
+                    if keys:
+                        await redis_client.delete(*keys)
+
+        run_async(main)
+
+    return run
+
+
+def test_lockout_after_limit_and_reset(run_with_rules, redis_url):
+    rule = _rule(limit=3, base_lockout_seconds=30)
+    checks = [(rule, "10.0.0.1")]
+
+    async def scenario():
+        assert await register_failure(checks) == 0
+        assert await register_failure(checks) == 0
+        assert await get_retry_after(checks) == 0
+        assert await register_failure(checks) == pytest.approx(30, abs=1)
+        # Во время блокировки попытки не считаются, срок не продлевается
+        assert 0 < await register_failure(checks) <= 30
+        assert 0 < await get_retry_after(checks) <= 30
+        # Другой идентификатор того же правила не затронут
+        assert await get_retry_after([(rule, "10.0.0.2")]) == 0
+
+        await reset(checks)
+        assert await get_retry_after(checks) == 0
+        assert await register_failure(checks) == 0
+
+    run_with_rules(scenario, rule)
+
+
+def test_lockout_doubles_for_repeat_offenders(run_with_rules, redis_url):
+    rule = _rule(limit=2, base_lockout_seconds=1, max_lockout_seconds=60)
+    checks = [(rule, "account@example.com")]
+
+    async def scenario():
+        await register_failure(checks)
+        assert await register_failure(checks) == pytest.approx(1, abs=0.1)
+        await asyncio.sleep(1.1)
+        assert await get_retry_after(checks) == 0
+        await register_failure(checks)
+        assert await register_failure(checks) == pytest.approx(2, abs=0.1)
+
+    run_with_rules(scenario, rule)
+
+
+def test_one_locked_key_blocks_the_whole_check(run_with_rules, redis_url):
+    ip_rule = _rule(limit=100)
+    account_rule = _rule(limit=2, base_lockout_seconds=30)
+
+    async def scenario():
+        for ip in ("10.0.0.1", "10.0.0.2"):
+            await register_failure([(ip_rule, ip), (account_rule, "victim")])
+        # Аккаунт заблокирован и для запросов с нового IP
+        retry_after = await get_retry_after([(ip_rule, "10.0.0.3"), (account_rule, "victim")])
+        assert retry_after == pytest.approx(30, abs=1)
+        assert await get_retry_after([(ip_rule, "10.0.0.3"), (account_rule, "other")]) == 0
+
+    run_with_rules(scenario, ip_rule, account_rule)
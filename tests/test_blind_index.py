@@ -0,0 +1,47 @@
+"""
+Нормализация ФИО и слепые индексы (services.blind_index).
+"""
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("loguru")
+pytest.importorskip("sqlalchemy")
+
+from cor_pass.services.blind_index import (
+    full_name_blind_index,
+    full_name_query_blind_index,
+    normalize_name,
+    surname_blind_index,
+)
+
+
+def test_normalize_name():
+    assert normalize_name("  Петренко   ІВАН ") == "петренко іван"
+    assert normalize_name("Сёмин") == "семин"
+    assert normalize_name("O'Neil-Smith") == "oneilsmith"
+    # Полноширинные символы приводятся NFKC
+    assert normalize_name("Ｉｖａｎ") == "ivan"
+    assert normalize_name(None) == ""
+    assert normalize_name(" - ") == ""
+
+
+def test_spelling_variants_share_an_index():
+    index = full_name_blind_index("Петренко", "Іван", "Сергійович")
+    assert index == full_name_blind_index("ПЕТРЕНКО", " іван", "сергійович ")
+    assert index == full_name_query_blind_index("петренко  Іван Сергійович")
+    assert len(index) == 64
+
+
+def test_indexes_are_separated_by_purpose():
+    # Фамилия как полное имя и как фамилия — разные индексы
+    assert surname_blind_index("Петренко") != full_name_query_blind_index("Петренко")
+    assert full_name_blind_index("Петренко", "Іван") != full_name_blind_index(
+        "Іван", "Петренко"
+    )
+
+
+def test_empty_names_have_no_index():
+    assert surname_blind_index(None) is None
+    assert surname_blind_index("  ") is None
+    assert full_name_blind_index(None, None) is None
+    assert full_name_query_blind_index("") is None
@@ -0,0 +1,178 @@
+"""
+Конкурентное владение кейсами: claim_next_case, take_case_ownership,
+release_case_ownership (Postgres, см. tests/conftest.py).
+"""
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException
+from sqlalchemy import delete
+
+from cor_pass.database import models as db_models
+from cor_pass.repository.case import (
+    claim_next_case,
+    release_case_ownership,
+    take_case_ownership,
+)
+
+
+CLAIMERS = 24
+
+
+async def _create_doctors(session_maker, count: int):
+    users, doctors = [], []
+    for _ in range(count):
+        cor_id = f"test-{uuid.uuid4().hex[:20]}"
+        users.append(
+            db_models.User(
+                id=str(uuid.uuid4()),
+                cor_id=cor_id,
+                email=f"{cor_id}@example.com",
+                password="x",
+                unique_cipher_key="x",
+            )
+        )
+        doctors.append(
+            db_models.Doctor(doctor_id=cor_id, work_email=f"{cor_id}@work.example.com")
+        )
+    async with session_maker() as db:
+        db.add_all(users)
+        await db.flush()
+        db.add_all(doctors)
+        await db.commit()
+    return [doctor.doctor_id for doctor in doctors], [user.id for user in users]
+
+
+async def _create_cases(session_maker, count: int):
+    # Срочные кейсы из далёкого прошлого — в начале очереди
+    cases = [
+        db_models.Case(
+            id=str(uuid.uuid4()),
+            case_code=f"F{uuid.uuid4().hex[:16]}",
+            creation_date=datetime(2000, 1, 1),
+        )
+        for _ in range(count)
+    ]
+    async with session_maker() as db:
+        db.add_all(cases)
+        await db.commit()
+    return [case.id for case in cases]
+
+
+async def _cleanup(session_maker, case_ids, doctor_ids, user_ids):
+    async with session_maker() as db:
+        await db.execute(delete(db_models.Case).where(db_models.Case.id.in_(case_ids)))
+        await db.execute(
+            delete(db_models.Doctor).where(db_models.Doctor.doctor_id.in_(doctor_ids))
+        )
+        await db.execute(delete(db_models.User).where(db_models.User.id.in_(user_ids)))
+        await db.commit()
+
+
+
+async def _attempt(session_maker, func, *args):
+    async with session_maker() as db:
+        try:
+            return await func(db, *args)
+        except HTTPException as e:
+            return e
+
+
+def test_concurrent_claimers_never_get_the_same_case(run_db):
+    async def scenario(session_maker):
+        doctor_ids, user_ids = await _create_doctors(session_maker, CLAIMERS)
+        # Кейсов меньше, чем докторов: лишние должны получить 404, а не дубликат
+        case_ids = await _create_cases(session_maker, CLAIMERS - 4)
+        try:
+            # Остальные кейсы общей БД заблокированы транзакцией, которая
+            # откатывается: claim_next_case пропускает их (SKIP LOCKED) и не меняет
+            async with session_maker() as holder:
+                await holder.execute(
+                    sqlalchemy.select(db_models.Case.id)
+                    .where(
+                        db_models.Case.id.not_in(case_ids),
+                        db_models.Case.grossing_status
+                        != db_models.Grossing_status.COMPLETED,
+                    )
+                    .with_for_update(skip_locked=True)
+                )
+                results = await asyncio.gather(
+                    *(
+                        _attempt(session_maker, claim_next_case, doctor_id)
+                        for doctor_id in doctor_ids
+                    )
+                )
+                await holder.rollback()
+            claimed = [r.case_details.id for r in results if not isinstance(r, HTTPException)]
+            errors = [r for r in results if isinstance(r, HTTPException)]
+
+            assert sorted(claimed) == sorted(case_ids)
+            assert len(errors) == 4
+            assert all(e.status_code == 404 for e in errors)
+
+            async with session_maker() as db:
+                owners = dict(
+                    (
+                        await db.execute(
+                            sqlalchemy.select(
+                                db_models.Case.id, db_models.Case.case_owner
+                            ).where(db_models.Case.id.in_(claimed))
+                        )
+                    ).all()
+                )
+            # Каждый кейс закреплён ровно за тем доктором, которому он выдан
+            for doctor_id, result in zip(doctor_ids, results):
+                if not isinstance(result, HTTPException):
+                    assert owners[result.case_details.id] == doctor_id
+        finally:
+            await _cleanup(session_maker, case_ids, doctor_ids, user_ids)
+
+    run_db(scenario, pool_size=CLAIMERS + 2, max_overflow=0)
+
+
+def test_concurrent_take_has_single_winner(run_db):
+    async def scenario(session_maker):
+        doctor_ids, user_ids = await _create_doctors(session_maker, CLAIMERS)
+        case_ids = await _create_cases(session_maker, 1)
+        try:
+            results = await asyncio.gather(
+                *(
+                    _attempt(session_maker, take_case_ownership, case_ids[0], doctor_id)
+                    for doctor_id in doctor_ids
+                )
+            )
+            winners = [
+                doctor_id
+                for doctor_id, r in zip(doctor_ids, results)
+                if not isinstance(r, HTTPException)
+            ]
+            assert len(winners) == 1
+            assert all(
+                r.status_code == 409 for r in results if isinstance(r, HTTPException)
+            )
+
+            # Чужой кейс освободить нельзя, свой — можно, после чего его снова берут
+            loser = next(d for d in doctor_ids if d != winners[0])
+            result = await _attempt(
+                session_maker, release_case_ownership, case_ids[0], loser
+            )
+            assert isinstance(result, HTTPException) and result.status_code == 403
+            result = await _attempt(
+                session_maker, release_case_ownership, case_ids[0], winners[0]
+            )
+            assert not isinstance(result, HTTPException)
+            result = await _attempt(
+                session_maker, take_case_ownership, case_ids[0], loser
+            )
+            assert not isinstance(result, HTTPException)
+        finally:
+            await _cleanup(session_maker, case_ids, doctor_ids, user_ids)
+
+    run_db(scenario, pool_size=CLAIMERS + 2, max_overflow=0)
@@ -0,0 +1,48 @@
+"""
+Доставка событий локальным WebSocket-соединениям (services.websocket_events_manager):
+сокеты ленты кейсов получают только события своих кейсов, а не глобальный broadcast.
+"""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("redis")
+pytest.importorskip("fastapi")
+pytest.importorskip("loguru")
+pytest.importorskip("sqlalchemy")
+
+from fastapi.websockets import WebSocketState
+
+from cor_pass.services.websocket_events_manager import WebSocketEventsManager
+
+
+class FakeWebSocket:
+    client_state = WebSocketState.CONNECTED
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(json.loads(text))
+
+
+def test_case_feed_socket_gets_only_its_case_events():
+    manager = WebSocketEventsManager(worker_id="test")
+    plain, feed = FakeWebSocket(), FakeWebSocket()
+    manager.active_connections = {
+        "plain": {"websocket": plain, "session_id": None},
+        "feed": {"websocket": feed, "session_id": None},
+    }
+    manager.subscribe_case_feed("feed", case_ids=["case-1"], worklist=False)
+
+    async def scenario():
+        await manager._broadcast_to_local({"event_type": "glass_scanned"})
+        await manager._deliver_case_change({"case_id": "case-2", "worklist": True})
+        await manager._deliver_case_change({"case_id": "case-1", "worklist": False})
+
+    asyncio.run(scenario())
+    assert plain.sent == [{"event_type": "glass_scanned"}]
+    assert feed.sent == [
+        {"event_type": "case_changed", "case_id": "case-1", "worklist": False}
+    ]
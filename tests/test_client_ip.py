@@ -0,0 +1,46 @@
+"""
+Адрес клиента за обратными прокси (services.device_info.get_client_ip):
+X-Forwarded-For учитывается только в части, дописанной доверенными прокси.
+"""
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("pydantic_settings")
+
+from starlette.requests import Request
+
+from cor_pass.config.config import settings
+from cor_pass.services.device_info import get_client_ip
+
+
+def _request(headers: dict, peer: str = "10.0.0.2") -> Request:
+    return Request(
+        {
+            "type": "http",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+            "client": (peer, 50000),
+        }
+    )
+
+
+def test_headers_ignored_without_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(settings, "trusted_proxy_count", 0)
+    request = _request({"X-Forwarded-For": "1.2.3.4", "X-Real-IP": "5.6.7.8"})
+    assert get_client_ip(request) == "10.0.0.2"
+
+
+def test_spoofed_forwarded_for_entries_are_skipped(monkeypatch):
+    monkeypatch.setattr(settings, "trusted_proxy_count", 1)
+    # Клиент подставил 1.1.1.1, прокси дописал его настоящий адрес
+    request = _request({"X-Forwarded-For": "1.1.1.1, 203.0.113.7"})
+    assert get_client_ip(request) == "203.0.113.7"
+
+    monkeypatch.setattr(settings, "trusted_proxy_count", 2)
+    request = _request({"X-Forwarded-For": "1.1.1.1, 203.0.113.7, 10.0.0.5"})
+    assert get_client_ip(request) == "203.0.113.7"
+
+
+def test_trusted_proxy_fallbacks(monkeypatch):
+    monkeypatch.setattr(settings, "trusted_proxy_count", 1)
+    assert get_client_ip(_request({"X-Real-IP": "203.0.113.9"})) == "203.0.113.9"
+    assert get_client_ip(_request({})) == "10.0.0.2"
@@ -0,0 +1,132 @@
+"""
+Резервирование номеров регистрации COR-ID (repository.cor_id): параллельные
+вызовы никогда не получают один и тот же номер (Redis, см. tests/conftest.py).
+"""
+import asyncio
+import random
+from datetime import date
+
+import pytest
+
+pytest.importorskip("redis")
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+
+from fastapi import HTTPException
+
+from cor_pass.database.redis_db import redis_client
+from cor_pass.repository import cor_id as cor_id_repository
+from cor_pass.repository.cor_id import (
+    REGISTER_KEY_TTL_SECONDS,
+    _build_corid,
+    _corid_prefix,
+    create_corids_bulk,
+    decode_corid,
+    n_facility,
+    patient_bit,
+    reserve_register_numbers,
+)
+
+
+ALLOCATIONS = 10_000
+# Одновременных запросов к Redis (ограничено, чтобы не упереться в maxclients)
+CONCURRENCY = 256
+DAY = date(2099, 1, 1)
+
+
+@pytest.fixture
+def facility(run_async, redis_url):
+    # Учреждение, которого нет в рабочих данных
+    facility_number = random.randint(10**8, 10**9)
+    yield facility_number
+
+    async def cleanup():
+        await redis_client.delete(f"register:{facility_number}:{DAY.isoformat()}")
+
+    run_async(cleanup)
+
+
+def test_parallel_allocations_are_unique(run_async, facility):
+    async def scenario():
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        async def allocate(count: int) -> range:
+            async with semaphore:
+                return await reserve_register_numbers(facility, count=count, day=DAY)
+
+        # Одиночные номера вперемешку с блоками
+        counts = [1] * (ALLOCATIONS - 100 * 10) + [10] * 100
+        random.shuffle(counts)
+        reserved = await asyncio.gather(*(allocate(count) for count in counts))
+
+        numbers = [number for block in reserved for number in block]
+        assert len(numbers) == ALLOCATIONS
+        assert sorted(numbers) == list(range(1, ALLOCATIONS + 1))
+        assert all(len(block) == count for block, count in zip(reserved, counts))
+
+        ttl = await redis_client.ttl(f"register:{facility}:{DAY.isoformat()}")
+        assert 0 < ttl <= REGISTER_KEY_TTL_SECONDS
+
+        prefix = _corid_prefix(DAY)
+        cor_ids = {_build_corid(prefix, number, 1990, "M") for number in numbers}
+        assert len(cor_ids) == ALLOCATIONS
+
+    run_async(scenario)
+
+
+def test_exhausted_day_range_is_rejected(run_async, facility):
+    async def scenario():
+        await redis_client.set(
+            f"register:{facility}:{DAY.isoformat()}", 2**patient_bit - 2
+        )
+        assert list(await reserve_register_numbers(facility, day=DAY)) == [
+            2**patient_bit - 1
+        ]
+        with pytest.raises(HTTPException) as exc_info:
+            await reserve_register_numbers(facility, day=DAY)
+        assert exc_info.value.status_code == 503
+        with pytest.raises(ValueError):
+            await reserve_register_numbers(facility, count=0, day=DAY)
+
+    run_async(scenario)
+
+
+def test_bulk_corids_use_one_contiguous_block(run_async, redis_url, monkeypatch):
+    register_key = f"register:{n_facility}:{DAY.isoformat()}"
+    script = cor_id_repository._reserve_register_numbers_script
+    calls = []
+
+    async def counting_script(*args, **kwargs):
+        calls.append(kwargs["args"][0])
+        return await script(*args, **kwargs)
+
+    monkeypatch.setattr(
+        cor_id_repository, "_reserve_register_numbers_script", counting_script
+    )
+
+    async def scenario():
+        try:
+            await redis_client.delete(register_key)
+            await reserve_register_numbers(n_facility, day=DAY)
+            n = 500
+            birth_years = [1950 + i % 60 for i in range(n)]
+            sexes = ["M" if i % 2 else "F" for i in range(n)]
+            cor_ids = await create_corids_bulk(n, birth_years, sexes, day=DAY)
+
+            # Один INCRBY на весь импорт, сразу за уже выданным номером
+            assert calls == [1, n]
+            assert len(set(cor_ids)) == n
+            decoded = [decode_corid(cor_id) for cor_id in cor_ids]
+            assert [d["register_per_day"] for d in decoded] == list(range(2, n + 2))
+            assert all(d["facility_number"] == n_facility for d in decoded)
+            assert [d["birth_year"] for d in decoded] == [str(y) for y in birth_years]
+            assert [d["gender"] for d in decoded] == sexes
+
+            assert await create_corids_bulk(0, [], []) == []
+            with pytest.raises(ValueError):
+                await create_corids_bulk(2, [1990, 1991], ["M"], day=DAY)
+            assert calls == [1, n]
+        finally:
+            await redis_client.delete(register_key)
+
+    run_async(scenario)
@@ -0,0 +1,122 @@
+"""
+Декодирование DICOM-исследования в том (services.dicom_volume): порядок
+срезов, исходный тип данных и Rescale Slope/Intercept по срезам при чтении
+аксиальных, корональных и сагиттальных плоскостей.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pydicom = pytest.importorskip("pydicom")
+pytest.importorskip("skimage")
+pytest.importorskip("loguru")
+pytest.importorskip("pydantic_settings")
+
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+from cor_pass.config.config import settings
+from cor_pass.services import dicom_volume
+from cor_pass.services.dicom_volume import RescaledVolume, decode_volume
+
+
+ROWS, COLUMNS = 6, 7
+# (позиция по z, slope, intercept) — файлы пишутся не по порядку срезов
+SLICES = [(20.0, 2.0, -1024.0), (0.0, 1.0, -1000.0), (10.0, 0.5, 0.0), (30.0, 1.5, 24.0)]
+
+
+def _write_slice(path: str, z: float, slope: float, intercept: float, pixels) -> None:
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = CTImageStorage
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.SOPClassUID = CTImageStorage
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.Modality = "CT"
+    ds.ImagePositionPatient = [0.0, 0.0, z]
+    ds.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+    ds.PixelSpacing = [0.5, 0.5]
+    ds.SliceThickness = 10.0
+    ds.RescaleSlope = slope
+    ds.RescaleIntercept = intercept
+    ds.Rows, ds.Columns = pixels.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 1
+    ds.PixelData = pixels.astype("<i2").tobytes()
+    pydicom.dcmwrite(path, ds, enforce_file_format=True)
+
+
+@pytest.fixture
+def decode_pool(monkeypatch):
+    monkeypatch.setattr(settings, "dicom_decode_workers", 2)
+    monkeypatch.setattr(dicom_volume, "_executor", None)
+    yield
+    if dicom_volume._executor is not None:
+        dicom_volume._executor.shutdown()
+
+
+@pytest.fixture
+def study_dir(tmp_path):
+    rng = np.random.default_rng(0)
+    pixels = {}
+    for index, (z, slope, intercept) in enumerate(SLICES):
+        data = rng.integers(-2000, 3000, size=(ROWS, COLUMNS), dtype=np.int16)
+        pixels[z] = data
+        _write_slice(str(tmp_path / f"slice_{index}.dcm"), z, slope, intercept, data)
+    # Служебные файлы и файлы без тегов положения в том не попадают
+    (tmp_path / ".DS_Store").write_bytes(b"\0")
+    (tmp_path / "DICOMDIR.txt").write_text("not a dicom file")
+    return str(tmp_path), pixels
+
+
+def test_decode_volume_sorts_slices_and_keeps_native_dtype(decode_pool, study_dir):
+    path, pixels = study_dir
+    raw, meta = decode_volume(path)
+
+    ordered = sorted(SLICES)
+    assert raw.dtype == np.int16
+    assert raw.shape == (len(SLICES), ROWS, COLUMNS)
+    for index, (z, slope, intercept) in enumerate(ordered):
+        np.testing.assert_array_equal(raw[index], pixels[z])
+    assert meta["slopes"] == [slope for _, slope, _ in ordered]
+    assert meta["intercepts"] == [intercept for _, _, intercept in ordered]
+    assert meta["example_name"] == "slice_1.dcm"
+
+
+def test_rescaled_volume_applies_per_slice_coefficients(decode_pool, study_dir):
+    raw, meta = decode_volume(study_dir[0])
+    volume = RescaledVolume(raw, meta["slopes"], meta["intercepts"])
+    slopes = np.array(meta["slopes"], dtype=np.float32)
+    intercepts = np.array(meta["intercepts"], dtype=np.float32)
+    expected = raw.astype(np.float32) * slopes[:, None, None] + intercepts[:, None, None]
+
+    assert len(volume) == len(SLICES)
+    # Аксиальные срезы — по первой оси, каждый со своими коэффициентами
+    for index in range(len(SLICES)):
+        axial = volume[index]
+        assert axial.dtype == np.float32
+        np.testing.assert_allclose(axial, expected[index])
+    # Корональная и сагиттальная плоскости проходят через все срезы
+    for row in range(ROWS):
+        np.testing.assert_allclose(volume[:, row, :], expected[:, row, :])
+    for column in range(COLUMNS):
+        np.testing.assert_allclose(volume[:, :, column], expected[:, :, column])
+    np.testing.assert_allclose(volume[1:3], expected[1:3])
+    np.testing.assert_allclose(volume[2, 3, 4], expected[2, 3, 4])
+
+
+def test_rescaled_volume_uniform_and_missing_coefficients():
+    raw = np.arange(2 * 3 * 4, dtype=np.int16).reshape(2, 3, 4)
+    uniform = RescaledVolume(raw, [1.0, 1.0], [-1024.0, -1024.0])
+    np.testing.assert_allclose(uniform[:, 1, :], raw[:, 1, :] - 1024.0)
+
+    # Тома из кэша, записанные до хранения коэффициентов, уже пересчитаны
+    legacy = RescaledVolume(raw.astype(np.float32))
+    np.testing.assert_allclose(legacy[:, :, 2], raw[:, :, 2])
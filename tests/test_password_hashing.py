@@ -0,0 +1,82 @@
+"""
+Хэширование паролей вне event loop (services.password_hashing).
+"""
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("passlib")
+pytest.importorskip("bcrypt")
+pytest.importorskip("fastapi")
+pytest.importorskip("prometheus_client")
+
+from fastapi import HTTPException
+from passlib.hash import bcrypt
+
+from cor_pass.config.config import settings
+from cor_pass.services.password_hashing import PasswordHasher, pwd_context
+
+
+def test_verify_and_update_rehashes_other_cost():
+    async def scenario():
+        hasher = PasswordHasher(max_workers=2, max_pending=4)
+        current = await hasher.hash("secret")
+        assert await hasher.verify("secret", current)
+        assert not await hasher.verify("wrong", current)
+        assert not await hasher.verify("secret", None)
+        assert await hasher.verify_and_update("secret", current) == (True, None)
+
+        other_rounds = 4 if settings.bcrypt_rounds != 4 else 5
+        legacy = bcrypt.using(rounds=other_rounds).hash("secret")
+        valid, new_hash = await hasher.verify_and_update("secret", legacy)
+        assert valid
+        assert new_hash is not None
+        assert bcrypt.from_string(new_hash).rounds == settings.bcrypt_rounds
+        assert await hasher.verify_and_update("wrong", legacy) == (False, None)
+
+    asyncio.run(scenario())
+
+
+def test_hashing_does_not_block_event_loop():
+    started = time.perf_counter()
+    pwd_context.hash("secret")
+    single_hash = time.perf_counter() - started
+
+    async def scenario():
+        hasher = PasswordHasher(max_workers=2, max_pending=16)
+        max_gap = 0.0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal max_gap
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.001)
+                now = time.perf_counter()
+                max_gap = max(max_gap, now - last)
+                last = now
+
+        task = asyncio.create_task(ticker())
+        await asyncio.gather(*(hasher.hash("secret") for _ in range(8)))
+        done.set()
+        await task
+        return max_gap
+
+    # В event loop каждый хэш останавливал бы его на single_hash
+    assert asyncio.run(scenario()) < single_hash / 2
+
+
+def test_overflow_is_rejected_with_503():
+    async def scenario():
+        hasher = PasswordHasher(max_workers=1, max_pending=2)
+        results = await asyncio.gather(
+            *(hasher.hash("secret") for _ in range(3)), return_exceptions=True
+        )
+        rejected = [r for r in results if isinstance(r, HTTPException)]
+        assert len(rejected) == 1
+        assert rejected[0].status_code == 503
+        assert rejected[0].headers == {"Retry-After": "1"}
+        assert sum(isinstance(r, str) for r in results) == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,108 @@
+"""
+Кэш principal для проверки access-токенов (services.principal_cache):
+снимок пользователя из Redis, черный список JTI и сброс снимка
+(Postgres и Redis, см. tests/conftest.py).
+"""
+import uuid
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+pytest.importorskip("redis")
+
+from sqlalchemy import delete, update
+
+from cor_pass.database import models as db_models
+from cor_pass.database.redis_db import redis_client
+from cor_pass.services import principal_cache
+from cor_pass.services.principal_cache import invalidate_principal, load_principal
+from cor_pass.services.redis_service import blacklist_key
+
+
+
+async def _create_user(session_maker) -> db_models.User:
+    cor_id = f"test-{uuid.uuid4().hex[:20]}"
+    user = db_models.User(
+        id=str(uuid.uuid4()),
+        cor_id=cor_id,
+        email=f"{cor_id}@example.com",
+        password="x",
+        unique_cipher_key="x",
+        is_active=True,
+    )
+    async with session_maker() as db:
+        db.add(user)
+        await db.commit()
+    return user
+
+
+async def _cleanup(session_maker, user: db_models.User) -> None:
+    await invalidate_principal(user.id)
+    async with session_maker() as db:
+        await db.execute(delete(db_models.User).where(db_models.User.id == user.id))
+        await db.commit()
+
+
+def test_principal_is_served_from_cache_until_invalidated(run_db, redis_url):
+    async def scenario(session_maker):
+        user = await _create_user(session_maker)
+        jti = uuid.uuid4().hex
+        try:
+            async with session_maker() as db:
+                blacklisted, principal = await load_principal(user.id, jti, db)
+            assert not blacklisted
+            assert (principal.id, principal.cor_id, principal.email) == (
+                user.id,
+                user.cor_id,
+                user.email,
+            )
+            assert "active_user" in principal.roles
+
+            async with session_maker() as db:
+                await db.execute(
+                    update(db_models.User)
+                    .where(db_models.User.id == user.id)
+                    .values(is_active=False)
+                )
+                await db.commit()
+            # Без локального LRU снимок читается из Redis, а не из Postgres
+            principal_cache._local_cache.clear()
+            async with session_maker() as db:
+                _, cached = await load_principal(user.id, jti, db)
+            assert cached == principal
+
+            await invalidate_principal(user.id)
+            async with session_maker() as db:
+                _, fresh = await load_principal(user.id, jti, db)
+            assert not fresh.is_active
+            assert "active_user" not in fresh.roles
+        finally:
+            await _cleanup(session_maker, user)
+
+    run_db(scenario)
+
+
+def test_blacklisted_jti_and_unknown_user(run_db, redis_url):
+    async def scenario(session_maker):
+        user = await _create_user(session_maker)
+        jti = uuid.uuid4().hex
+        try:
+            await redis_client.set(blacklist_key(jti), "1", ex=60)
+            async with session_maker() as db:
+                assert await load_principal(user.id, jti, db) == (True, None)
+                # Снимок уже в LRU воркера — черный список всё равно проверяется
+                await load_principal(user.id, uuid.uuid4().hex, db)
+                blacklisted, _ = await load_principal(user.id, jti, db)
+                assert blacklisted
+
+                missing = str(uuid.uuid4())
+                assert await load_principal(missing, uuid.uuid4().hex, db) == (
+                    False,
+                    None,
+                )
+        finally:
+            await redis_client.delete(blacklist_key(jti))
+            await _cleanup(session_maker, user)
+
+    run_db(scenario)
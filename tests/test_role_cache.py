@@ -0,0 +1,106 @@
+"""
+Версионированный кэш ролей (services.role_cache): попадание в кэш, сброс
+через invalidate_user_roles и отбрасывание записи, посчитанной до сброса
+(Postgres и Redis, см. tests/conftest.py).
+"""
+import json
+import uuid
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+pytest.importorskip("redis")
+
+from sqlalchemy import delete
+
+from cor_pass.database import models as db_models
+from cor_pass.database.redis_db import redis_client
+from cor_pass.services.role_cache import (
+    _roles_key,
+    _roles_version_key,
+    get_db_roles,
+    invalidate_user_roles,
+)
+
+
+
+async def _create_doctor(session_maker) -> str:
+    cor_id = f"test-{uuid.uuid4().hex[:20]}"
+    async with session_maker() as db:
+        db.add(
+            db_models.User(
+                id=str(uuid.uuid4()),
+                cor_id=cor_id,
+                email=f"{cor_id}@example.com",
+                password="x",
+                unique_cipher_key="x",
+            )
+        )
+        await db.flush()
+        db.add(
+            db_models.Doctor(
+                doctor_id=cor_id,
+                work_email=f"{cor_id}@work.example.com",
+                status=db_models.Doctor_Status.approved,
+            )
+        )
+        await db.commit()
+    return cor_id
+
+
+async def _delete_doctor_row(session_maker, cor_id: str) -> None:
+    async with session_maker() as db:
+        await db.execute(
+            delete(db_models.Doctor).where(db_models.Doctor.doctor_id == cor_id)
+        )
+        await db.commit()
+
+
+async def _cleanup(session_maker, cor_id: str) -> None:
+    await _delete_doctor_row(session_maker, cor_id)
+    async with session_maker() as db:
+        await db.execute(delete(db_models.User).where(db_models.User.cor_id == cor_id))
+        await db.commit()
+    await redis_client.delete(_roles_key(cor_id), _roles_version_key(cor_id))
+
+
+def test_cached_roles_survive_until_invalidated(run_db, redis_url):
+    async def scenario(session_maker):
+        cor_id = await _create_doctor(session_maker)
+        try:
+            async with session_maker() as db:
+                assert await get_db_roles(db=db, cor_id=cor_id) == ["doctor"]
+            # Роль отозвана в обход репозитория: кэш ещё отдаёт старое значение
+            await _delete_doctor_row(session_maker, cor_id)
+            async with session_maker() as db:
+                assert await get_db_roles(db=db, cor_id=cor_id) == ["doctor"]
+
+            await invalidate_user_roles(cor_id)
+            async with session_maker() as db:
+                assert await get_db_roles(db=db, cor_id=cor_id) == []
+        finally:
+            await _cleanup(session_maker, cor_id)
+
+    run_db(scenario)
+
+
+def test_entry_computed_before_invalidation_is_ignored(run_db, redis_url):
+    async def scenario(session_maker):
+        cor_id = await _create_doctor(session_maker)
+        try:
+            await invalidate_user_roles(cor_id)
+            version = await redis_client.get(_roles_version_key(cor_id))
+            # Запрос, начавшийся до сброса, записал роли с прежней версией
+            await redis_client.set(
+                _roles_key(cor_id),
+                json.dumps({"version": str(int(version) - 1), "roles": ["lawyer"]}),
+            )
+            async with session_maker() as db:
+                assert await get_db_roles(db=db, cor_id=cor_id) == ["doctor"]
+            cached = json.loads(await redis_client.get(_roles_key(cor_id)))
+            assert cached == {"version": version, "roles": ["doctor"]}
+        finally:
+            await _cleanup(session_maker, cor_id)
+
+    run_db(scenario)
@@ -0,0 +1,52 @@
+"""
+Лимит локального кэша слайдов (services.slide_store): в размер входят
+недокачанные файлы partial/, брошенные удаляются, активная загрузка — нет.
+"""
+import fcntl
+import os
+
+import pytest
+
+pytest.importorskip("openslide")
+pytest.importorskip("smb")
+pytest.importorskip("fastapi")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("prometheus_client")
+
+from cor_pass.services.slide_store import SlideStore
+
+
+BLOCK = 4096
+
+
+def _write(path: str, size: int, mtime: float) -> str:
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_evict_counts_partial_downloads(tmp_path):
+    store = SlideStore(str(tmp_path), max_bytes=10 * BLOCK)
+    objects, partial, locks = (str(tmp_path / name) for name in ("objects", "partial", "locks"))
+    old_slide = _write(os.path.join(objects, "a.svs"), 2 * BLOCK, 300)
+    new_slide = _write(os.path.join(objects, "b.svs"), 2 * BLOCK, 400)
+    # Недокачанные слайды старше готовых: .part + .map по 5 блоков
+    for ref_name, mtime in (("active", 100), ("abandoned", 200)):
+        _write(os.path.join(partial, f"{ref_name}.part"), 4 * BLOCK, mtime)
+        _write(os.path.join(partial, f"{ref_name}.map"), BLOCK, mtime)
+
+    with open(os.path.join(locks, "active.lock"), "w") as download_lock:
+        # Загрузку "active" держит другой воркер
+        fcntl.flock(download_lock, fcntl.LOCK_EX)
+
+        # 14 блоков при лимите 10: хватает удаления брошенной загрузки
+        store._evict()
+        assert sorted(os.listdir(partial)) == ["active.map", "active.part"]
+        assert os.path.exists(old_slide) and os.path.exists(new_slide)
+
+        # Место под новый слайд в 2 блока освобождается до загрузки
+        store._evict(incoming=2 * BLOCK)
+        assert not os.path.exists(old_slide)
+        assert os.path.exists(new_slide)
+        assert sorted(os.listdir(partial)) == ["active.map", "active.part"]
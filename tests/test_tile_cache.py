@@ -0,0 +1,41 @@
+"""
+Дисковый уровень кэша тайлов (services.tile_cache): лимит размера общий для
+всех воркеров, работающих с одним каталогом.
+"""
+import os
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+pytest.importorskip("loguru")
+pytest.importorskip("pydantic_settings")
+
+from cor_pass.services.tile_cache import TileCache, tile_cache_key
+
+
+TILE_BYTES = 1000
+
+
+def _disk_bytes(directory: str) -> int:
+    return sum(
+        entry.stat().st_size
+        for bucket in os.scandir(directory)
+        if bucket.is_dir()
+        for entry in os.scandir(bucket.path)
+    )
+
+
+def test_disk_limit_is_shared_between_workers(tmp_path):
+    directory = str(tmp_path)
+    max_bytes = 10 * TILE_BYTES
+    # Отдельные экземпляры — как воркеры gunicorn с общим каталогом
+    workers = [TileCache(directory, max_bytes, max_memory_bytes=0) for _ in range(4)]
+
+    for i in range(60):
+        key = tile_cache_key("slide", 0, i, 0, "jpeg", 80)
+        workers[i % len(workers)].put(key, b"x" * TILE_BYTES)
+        assert _disk_bytes(directory) <= max_bytes
+
+    # Самые новые тайлы остались на диске и читаются любым воркером
+    newest = tile_cache_key("slide", 0, 59, 0, "jpeg", 80)
+    assert workers[0].get(newest) == b"x" * TILE_BYTES
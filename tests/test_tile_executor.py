@@ -0,0 +1,61 @@
+"""
+Приоритеты и отмена задач рендеринга по вьюпортам (services.tile_executor).
+"""
+import threading
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("prometheus_client")
+pytest.importorskip("loguru")
+
+from fastapi import HTTPException
+
+from cor_pass.services.tile_executor import TileExecutor, viewport_owner
+
+
+@pytest.fixture
+def executor():
+    executor = TileExecutor(max_workers=1, max_pending=100)
+    release = threading.Event()
+    # Единственный поток занят, остальные задачи ждут в очереди
+    blocker = executor.submit(release.wait)
+    yield executor
+    release.set()
+    blocker.future.result(timeout=5)
+
+
+def _submit(executor, owner, generation, level=0):
+    return executor.submit(
+        lambda: None, owner=owner, level=level, generation=generation
+    )
+
+
+def test_new_generation_cancels_only_its_own_viewport(executor):
+    slide_a = viewport_owner("user-1", "slide-a")
+    slide_b = viewport_owner("user-1", "slide-b")
+    other_tab = viewport_owner("user-1", "slide-a", viewer="tab-2")
+
+    old_a = _submit(executor, slide_a, 1)
+    old_b = _submit(executor, slide_b, 1)
+    old_tab = _submit(executor, other_tab, 1)
+
+    _submit(executor, slide_a, 2)
+
+    assert old_a.future.cancelled() and old_a.superseded
+    # Другой слайд и другая вкладка того же пользователя не затронуты
+    assert not old_b.future.cancelled()
+    assert not old_tab.future.cancelled()
+
+    # Запоздавший тайл старой генерации своего вьюпорта отклоняется
+    with pytest.raises(HTTPException) as exc_info:
+        _submit(executor, slide_a, 1)
+    assert exc_info.value.status_code == 409
+    _submit(executor, slide_b, 1)
+
+
+def test_viewport_owner_keys():
+    assert viewport_owner("u", "s") == viewport_owner("u", "s", None)
+    assert viewport_owner("u", "s") != viewport_owner("u", "s", "tab")
+    assert viewport_owner("u", "s1") != viewport_owner("u", "s2")
+    assert viewport_owner("u1", "s") != viewport_owner("u2", "s")
@@ -0,0 +1,188 @@
+"""
+Общий кэш декодированных DICOM-томов (services.volume_cache): однократное
+декодирование, инвалидация по версии, бюджет на диске и недописанные тома.
+"""
+import json
+import os
+import shutil
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pydicom = pytest.importorskip("pydicom")
+pytest.importorskip("prometheus_client")
+pytest.importorskip("loguru")
+pytest.importorskip("pydantic_settings")
+
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+from cor_pass.services import volume_cache as volume_cache_module
+from cor_pass.services.volume_cache import VolumeCache
+
+
+SLICES = 4
+SIZE = 16
+# Размер .npy одного тома (int16 + заголовок формата)
+VOLUME_BYTES = SLICES * SIZE * SIZE * 2 + 128
+
+
+def _write_study(study_dir, seed: int) -> None:
+    os.makedirs(study_dir, exist_ok=True)
+    for index in range(2):
+        file_meta = FileMetaDataset()
+        file_meta.MediaStorageSOPClassUID = CTImageStorage
+        file_meta.MediaStorageSOPInstanceUID = generate_uid()
+        file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = Dataset()
+        ds.file_meta = file_meta
+        ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+        ds.PatientID = f"study-{seed}"
+        ds.PixelSpacing = [0.5, 0.5]
+        pydicom.dcmwrite(
+            os.path.join(study_dir, f"slice_{index}.dcm"), ds, enforce_file_format=True
+        )
+
+
+class Decoder:
+    """decode(study_dir) для VolumeCache.load, считающий вызовы."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, study_dir: str):
+        self.calls += 1
+        seed = len(study_dir) + self.calls
+        volume = np.full((SLICES, SIZE, SIZE), seed, dtype=np.int16)
+        return volume, {"example_name": "slice_0.dcm", "slopes": [1.0] * SLICES}
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def test_load_decodes_once_and_serves_mmap(tmp_path, cache_dir):
+    study = str(tmp_path / "study")
+    _write_study(study, 1)
+    decode = Decoder()
+    cache = VolumeCache(cache_dir, max_bytes=10 * VOLUME_BYTES)
+
+    volume, ds, meta = cache.load(study, decode)
+    assert decode.calls == 1
+    assert isinstance(volume, np.memmap) and not volume.flags.writeable
+    assert ds.PatientID == "study-1"
+    assert meta["slopes"] == [1.0] * SLICES
+    assert cache.load(study, decode)[0] is volume
+
+    # Другой воркер открывает готовый .npy, не декодируя
+    other_worker = VolumeCache(cache_dir, max_bytes=10 * VOLUME_BYTES)
+    reopened, _, _ = other_worker.load(study, decode)
+    assert decode.calls == 1
+    np.testing.assert_array_equal(reopened, volume)
+
+
+def test_invalidate_rebuilds_after_files_change(tmp_path, cache_dir):
+    study = str(tmp_path / "study")
+    _write_study(study, 1)
+    decode = Decoder()
+    cache = VolumeCache(cache_dir, max_bytes=10 * VOLUME_BYTES)
+    first, _, _ = cache.load(study, decode)
+
+    _write_study(study, 2)
+    # Без invalidate хэш исследования не пересчитывается
+    assert cache.load(study, decode)[0] is first
+    assert decode.calls == 1
+
+    VolumeCache(cache_dir, max_bytes=10 * VOLUME_BYTES).invalidate(study)
+    rebuilt, ds, _ = cache.load(study, decode)
+    assert decode.calls == 2
+    assert ds.PatientID == "study-2"
+    assert not np.array_equal(rebuilt, first)
+
+
+def test_identical_study_reads_header_from_own_directory(tmp_path, cache_dir):
+    first = str(tmp_path / "first")
+    _write_study(first, 1)
+    second = str(tmp_path / "second")
+    shutil.copytree(first, second)
+    decode = Decoder()
+
+    VolumeCache(cache_dir, max_bytes=10 * VOLUME_BYTES).load(first, decode)
+    shutil.rmtree(first)
+    volume, ds, _ = VolumeCache(cache_dir, max_bytes=10 * VOLUME_BYTES).load(
+        second, decode
+    )
+    # Тот же том по хэшу содержимого, заголовок — из своего каталога
+    assert decode.calls == 1
+    assert ds.filename == os.path.join(second, "slice_0.dcm")
+    with open(f"{volume.filename}.json") as f:
+        assert "example_path" not in json.load(f)
+
+
+def test_evict_keeps_cache_under_budget(tmp_path, cache_dir):
+    decode = Decoder()
+    cache = VolumeCache(cache_dir, max_bytes=int(2.5 * VOLUME_BYTES))
+    volumes_dir = os.path.join(cache_dir, "volumes")
+
+    def volume_files():
+        return {
+            entry.path: entry.stat().st_size
+            for entry in os.scandir(volumes_dir)
+            if entry.name.endswith(".npy")
+        }
+
+    for seed in range(5):
+        study = str(tmp_path / f"study_{seed}")
+        _write_study(study, seed)
+        volume, _, _ = cache.load(study, decode)
+        files = volume_files()
+        assert sum(files.values()) <= cache._max_bytes
+        # Только что построенный том не удаляется
+        assert volume.filename in files
+
+
+def test_evict_never_removes_returned_volume(tmp_path, cache_dir):
+    # Лимит меньше одного тома: удаляется всё, кроме возвращаемого
+    cache = VolumeCache(cache_dir, max_bytes=VOLUME_BYTES // 2)
+    decode = Decoder()
+    for seed in range(3):
+        study = str(tmp_path / f"study_{seed}")
+        _write_study(study, seed)
+        volume, _, _ = cache.load(study, decode)
+        assert os.path.exists(volume.filename)
+        names = [n for n in os.listdir(os.path.join(cache_dir, "volumes")) if n.endswith(".npy")]
+        assert names == [os.path.basename(volume.filename)]
+
+
+def test_interrupted_build_is_never_loaded(tmp_path, cache_dir, monkeypatch):
+    study = str(tmp_path / "study")
+    _write_study(study, 1)
+    decode = Decoder()
+    volumes_dir = os.path.join(cache_dir, "volumes")
+    real_save = np.save
+
+    def failing_save(f, volume, allow_pickle=False):
+        real_save(f, volume[:1], allow_pickle=allow_pickle)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(volume_cache_module.np, "save", failing_save)
+    with pytest.raises(KeyboardInterrupt):
+        VolumeCache(cache_dir, max_bytes=10 * VOLUME_BYTES).load(study, decode)
+    assert os.listdir(volumes_dir) == []
+    monkeypatch.setattr(volume_cache_module.np, "save", real_save)
+
+    cache = VolumeCache(cache_dir, max_bytes=10 * VOLUME_BYTES)
+    volume, _, _ = cache.load(study, decode)
+    assert decode.calls == 2
+    assert volume.shape == (SLICES, SIZE, SIZE)
+
+    # Процесс убит после записи: остались недописанный .npy.tmp и .json без .npy
+    key = os.path.basename(volume.filename)[: -len(".npy")]
+    os.unlink(volume.filename)
+    with open(os.path.join(volumes_dir, f"{key}.npy.tmp"), "wb") as f:
+        f.write(b"\x93NUMPY partial")
+    rebuilt, _, _ = VolumeCache(cache_dir, max_bytes=10 * VOLUME_BYTES).load(study, decode)
+    assert decode.calls == 3
+    assert rebuilt.shape == (SLICES, SIZE, SIZE)
+    assert sorted(os.listdir(volumes_dir)) == [f"{key}.npy", f"{key}.npy.json"]